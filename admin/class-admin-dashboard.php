@@ -9,7 +9,17 @@ if (!defined('ABSPATH')) {
 
 class CAH_Admin_Dashboard {
     
+    private $audit_logger;
+    private $court_manager;
+    private $case_id_allocator;
+    private $case_repository;
+    
     public function __construct() {
+        $this->audit_logger = new CAH_Audit_Logger();
+        $this->court_manager = new CAH_Court_Manager();
+        $this->case_id_allocator = new CAH_Case_ID_Allocator();
+        $this->case_repository = new CAH_Case_Repository();
+        
         add_action('admin_menu', array($this, 'add_admin_menu'));
         add_action('admin_init', array($this, 'admin_init'));
     }
@@ -25,6 +35,12 @@ class CAH_Admin_Dashboard {
         // Handle CSV export EARLY before any output
         $this->handle_early_export();
         
+        // Handle document batch download EARLY before any output
+        $this->handle_early_document_download();
+        
+        // Handle evidence download EARLY before any output
+        $this->handle_early_evidence_download();
+        
         // Add AJAX handlers for file downloads
         add_action('wp_ajax_klage_download_template', array($this, 'ajax_download_template'));
         add_action('wp_ajax_klage_export_calculation', array($this, 'ajax_export_calculation'));
@@ -76,11 +92,62 @@ class CAH_Admin_Dashboard {
         }
     }
     
+    private function handle_early_document_download() {
+        if (isset($_GET['page']) && $_GET['page'] === 'klage-click-cases' && 
+            isset($_GET['action']) && $_GET['action'] === 'download_documents' && 
+            isset($_GET['_wpnonce'])) {
+            
+            $batch_id = isset($_GET['batch_id']) ? intval($_GET['batch_id']) : 0;
+            
+            if (!wp_verify_nonce($_GET['_wpnonce'], 'document_batch_' . $batch_id)) {
+                wp_die('Security check failed');
+            }
+            
+            if (!current_user_can('manage_options')) {
+                wp_die('Insufficient permissions');
+            }
+            
+            $document_generator = new CAH_Document_Generator();
+            $result = $document_generator->stream_archive($batch_id);
+            
+            if (is_wp_error($result)) {
+                wp_die(esc_html($result->get_error_message()));
+            }
+            exit; // Critical: Stop WordPress execution
+        }
+    }
+    
+    private function handle_early_evidence_download() {
+        if (isset($_GET['page']) && $_GET['page'] === 'klage-click-cases' && 
+            isset($_GET['action']) && $_GET['action'] === 'download_evidence' && 
+            isset($_GET['_wpnonce'])) {
+            
+            $case_id = isset($_GET['id']) ? intval($_GET['id']) : 0;
+            $blob_id = isset($_GET['blob_id']) ? intval($_GET['blob_id']) : 0;
+            
+            if (!wp_verify_nonce($_GET['_wpnonce'], 'evidence_' . $case_id . '_' . $blob_id)) {
+                wp_die('Security check failed');
+            }
+            
+            if (!current_user_can('manage_options')) {
+                wp_die('Insufficient permissions');
+            }
+            
+            $email_evidence = new CAH_Email_Evidence();
+            $result = $email_evidence->stream_case_payload($case_id, $blob_id);
+            
+            if (is_wp_error($result)) {
+                wp_die(esc_html($result->get_error_message()));
+            }
+            exit; // Critical: Stop WordPress execution
+        }
+    }
+    
     private function export_cases_csv() {
-        global $wpdb;
+        $db = CAH_Query_Router::reader('export_cases');
         
         // Get cases data
-        $cases = $wpdb->get_results("
+        $cases = $db->get_results("
             SELECT 
                 c.case_id,
                 c.case_status,
@@ -93,8 +160,8 @@ class CAH_Admin_Dashboard {
                 d.debtors_email,
                 d.debtors_company,
                 c.created_at
-            FROM {$wpdb->prefix}klage_cases c
-            LEFT JOIN {$wpdb->prefix}klage_debtors d ON c.debtor_id = d.id
+            FROM {$db->prefix}klage_cases c
+            LEFT JOIN {$db->prefix}klage_debtors d ON c.debtor_id = d.id
             ORDER BY c.created_at DESC
         ", ARRAY_A);
         
@@ -265,14 +332,14 @@ class CAH_Admin_Dashboard {
     }
     
     public function admin_page_dashboard() {
-        global $wpdb;
+        $db = CAH_Query_Router::reader('dashboard');
         
         // Get statistics
-        $total_cases = $wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases") ?? 0;
-        $pending_cases = $wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'pending'") ?? 0;
-        $processing_cases = $wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'processing'") ?? 0;
-        $completed_cases = $wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'completed'") ?? 0;
-        $total_value = $wpdb->get_var("SELECT SUM(total_amount) FROM {$wpdb->prefix}klage_cases") ?? 0;
+        $total_cases = $db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases") ?? 0;
+        $pending_cases = $db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'pending'") ?? 0;
+        $processing_cases = $db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'processing'") ?? 0;
+        $completed_cases = $db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'completed'") ?? 0;
+        $total_value = $db->get_var("SELECT SUM(total_amount) FROM {$db->prefix}klage_cases") ?? 0;
         
         ?>
         <div class="wrap">
@@ -384,8 +451,8 @@ class CAH_Admin_Dashboard {
                                     <th scope="row"><label for="case_id">Fall-ID</label></th>
                                     <td>
                                         <input type="text" id="case_id" name="case_id" class="regular-text" 
-                                               value="<?php echo esc_attr($form_data['case_id'] ?? 'SPAM-' . date('Y') . '-' . str_pad(wp_rand(1, 9999), 4, '0', STR_PAD_LEFT)); ?>" required>
-                                        <p class="description">Eindeutige Fall-Kennung</p>
+                                               value="<?php echo esc_attr($form_data['case_id'] ?? ''); ?>" placeholder="SPAM-<?php echo date('Y'); ?>-…">
+                                        <p class="description">Eindeutige Fall-Kennung – leer lassen für automatische Vergabe</p>
                                     </td>
                                 </tr>
                                 <tr>
@@ -674,6 +741,9 @@ class CAH_Admin_Dashboard {
                 $this->handle_get_priority_change($case_id);
                 $this->render_cases_list();
                 break;
+            case 'documents':
+                $this->render_document_batch(isset($_GET['batch_id']) ? intval($_GET['batch_id']) : 0);
+                break;
             default:
                 $this->render_cases_list();
                 break;
@@ -712,8 +782,11 @@ class CAH_Admin_Dashboard {
         
         $where_clause = implode(' AND ', $where_conditions);
         
+        // After bulk actions this is the primary (read-your-writes)
+        $db = CAH_Query_Router::reader('cases_list');
+        
         // Check if tables exist
-        $tables_exist = $wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_cases'");
+        $tables_exist = $db->get_var("SHOW TABLES LIKE '{$db->prefix}klage_cases'");
         
         if (!$tables_exist) {
             $cases = array();
@@ -727,26 +800,26 @@ class CAH_Admin_Dashboard {
                     c.case_priority,
                     c.total_amount,
                     e.emails_sender_email
-                FROM {$wpdb->prefix}klage_cases c
-                LEFT JOIN {$wpdb->prefix}klage_emails e ON c.id = e.case_id
+                FROM {$db->prefix}klage_cases c
+                LEFT JOIN {$db->prefix}klage_emails e ON c.id = e.case_id
                 WHERE {$where_clause}
                 ORDER BY c.case_creation_date DESC
                 LIMIT 50
             ";
             
             if (!empty($query_params)) {
-                $cases = $wpdb->get_results($wpdb->prepare($query, $query_params));
+                $cases = $db->get_results($db->prepare($query, $query_params));
             } else {
-                $cases = $wpdb->get_results($query);
+                $cases = $db->get_results($query);
             }
         }
         
         // Get statistics
-        $total_cases = $tables_exist ? ($wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases") ?? 0) : 0;
-        $draft_cases = $tables_exist ? ($wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'draft'") ?? 0) : 0;
-        $processing_cases = $tables_exist ? ($wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'processing'") ?? 0) : 0;
-        $completed_cases = $tables_exist ? ($wpdb->get_var("SELECT COUNT(*) FROM {$wpdb->prefix}klage_cases WHERE case_status = 'completed'") ?? 0) : 0;
-        $total_value = $tables_exist ? ($wpdb->get_var("SELECT SUM(total_amount) FROM {$wpdb->prefix}klage_cases") ?? 0) : 0;
+        $total_cases = $tables_exist ? ($db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases") ?? 0) : 0;
+        $draft_cases = $tables_exist ? ($db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'draft'") ?? 0) : 0;
+        $processing_cases = $tables_exist ? ($db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'processing'") ?? 0) : 0;
+        $completed_cases = $tables_exist ? ($db->get_var("SELECT COUNT(*) FROM {$db->prefix}klage_cases WHERE case_status = 'completed'") ?? 0) : 0;
+        $total_value = $tables_exist ? ($db->get_var("SELECT SUM(total_amount) FROM {$db->prefix}klage_cases") ?? 0) : 0;
         
         ?>
         <div class="wrap">
@@ -828,6 +901,7 @@ class CAH_Admin_Dashboard {
                             <option value="">Bulk-Aktionen</option>
                             <option value="status_processing">Status → In Bearbeitung</option>
                             <option value="status_completed">Status → Abgeschlossen</option>
+                            <option value="generate_documents">Gerichtsdokumente erzeugen (XJustiz)</option>
                             <option value="delete">Löschen</option>
                         </select>
                         <input type="submit" class="button action" value="Anwenden">
@@ -1060,6 +1134,36 @@ class CAH_Admin_Dashboard {
                 </div>
             </div>
             
+            <!-- Evidence Upload Form -->
+            <div class="postbox">
+                <h2 class="hndle">📧 E-Mail-Beweise importieren</h2>
+                <div class="inside" style="padding: 20px;">
+                    <form method="post" enctype="multipart/form-data">
+                        <input type="hidden" name="import_action" value="upload_evidence">
+                        <?php wp_nonce_field('csv_import_action', 'csv_import_nonce'); ?>
+                        
+                        <table class="form-table">
+                            <tr>
+                                <th scope="row"><label for="evidence_file">Archiv auswählen</label></th>
+                                <td>
+                                    <input type="file" id="evidence_file" name="evidence_file" accept=".mbox,.mbx,.eml,.zip" required>
+                                    <p class="description">
+                                        Unterstützte Formate: mbox, einzelne EML-Datei oder ZIP mit EML-/mbox-Dateien<br>
+                                        Doppelte E-Mails und Anhänge werden nur einmal gespeichert<br>
+                                        E-Mails werden über die Absenderadresse den Fällen zugeordnet (Schuldner-E-Mail)<br>
+                                        Maximale Dateigröße: <?php echo esc_html(size_format(wp_max_upload_size())); ?>
+                                    </p>
+                                </td>
+                            </tr>
+                        </table>
+                        
+                        <p class="submit">
+                            <input type="submit" class="button button-primary button-large" value="📧 Beweise hochladen & importieren">
+                        </p>
+                    </form>
+                </div>
+            </div>
+            
             <!-- Template Structure Info -->
             <div class="postbox" style="margin-top: 30px;">
                 <h2 class="hndle">📋 Forderungen.com Template-Struktur (17 Felder)</h2>
@@ -1441,7 +1545,43 @@ class CAH_Admin_Dashboard {
         
         if ($action === 'upload_csv') {
             $this->process_csv_upload();
+        } elseif ($action === 'upload_evidence') {
+            $this->process_evidence_upload();
+        }
+    }
+    
+    private function process_evidence_upload() {
+        if (!isset($_FILES['evidence_file']) || $_FILES['evidence_file']['error'] !== UPLOAD_ERR_OK) {
+            echo '<div class="notice notice-error"><p><strong>Fehler!</strong> Datei konnte nicht hochgeladen werden.</p></div>';
+            return;
+        }
+        
+        $file = $_FILES['evidence_file'];
+        
+        if (!in_array(strtolower(pathinfo($file['name'], PATHINFO_EXTENSION)), array('mbox', 'mbx', 'eml', 'zip'))) {
+            echo '<div class="notice notice-error"><p><strong>Fehler!</strong> Nur mbox-, EML- und ZIP-Dateien sind erlaubt.</p></div>';
+            return;
+        }
+        
+        // The archive is streamed from the upload, not read into memory
+        $email_evidence = new CAH_Email_Evidence();
+        $result = $email_evidence->ingest_file($file['tmp_name'], $file['name']);
+        
+        if (is_wp_error($result)) {
+            echo '<div class="notice notice-error"><p><strong>Fehler!</strong> ' . esc_html($result->get_error_message()) . '</p></div>';
+            return;
         }
+        
+        echo '<div class="notice notice-success"><p><strong>✅ Beweis-Import abgeschlossen!</strong> ';
+        echo intval($result['messages']) . ' E-Mails gelesen, ' . intval($result['imported']) . ' neu importiert, ' . intval($result['duplicates']) . ' Duplikate übersprungen, ';
+        echo intval($result['linked']) . ' Fall-Verknüpfungen erstellt.<br>';
+        echo 'Inhalte: ' . intval($result['payloads_stored']) . ' neu gespeichert (' . size_format($result['bytes_on_disk']) . ' als Datei), ' . intval($result['payloads_reused']) . ' wiederverwendet.</p></div>';
+        
+        foreach (array_slice($result['errors'], 0, 10) as $error) {
+            echo '<div class="notice notice-warning"><p>' . esc_html($error) . '</p></div>';
+        }
+        
+        $this->audit_logger->log_action(0, 'evidence_imported', 'E-Mail-Beweise importiert aus ' . sanitize_file_name($file['name']) . ': ' . intval($result['imported']) . ' neu, ' . intval($result['linked']) . ' verknüpft');
     }
     
     private function process_csv_upload() {
@@ -1483,22 +1623,10 @@ class CAH_Admin_Dashboard {
             $header = str_getcsv($lines[0], $delimiter);
             $data_rows = array_slice($lines, 1);
             
-            // Check for required Forderungen.com fields
-            $required_fields = array('Fall-ID (CSV)', 'Nachname');
-            $optional_forderungen_fields = array(
-                'Fall-Status', 'Brief-Status', 'Mandant', 'Schuldner', 'Einreichungsdatum', 'Beweise',
-                'Dokumente', 'Firmenname', 'Vorname', 'Adresse', 'Postleitzahl', 'Stadt', 'Land',
-                'E-Mail', 'Telefon', 'Rechtsform', 'Verfahrensart', 'Streitwert', 'Schadenersatz',
-                'Anwaltskosten', 'Gerichtskosten', 'Gesamtbetrag', 'Gericht zuständig', 'Erfolgsaussicht',
-                'Komplexität', 'Bearbeitungsstatus', 'Datenquelle'
-            );
+            $importer = new CAH_Forderungen_Importer();
             
-            $missing_required = array();
-            foreach ($required_fields as $field) {
-                if (!in_array($field, $header)) {
-                    $missing_required[] = $field;
-                }
-            }
+            // Check for required Forderungen.com fields
+            $missing_required = $importer->get_missing_required_fields($header);
             
             if (!empty($missing_required)) {
                 echo '<div class="notice notice-error"><p><strong>Fehler!</strong> Erforderliche Forderungen.com Felder fehlen: ' . implode(', ', $missing_required) . '</p></div>';
@@ -1506,19 +1634,37 @@ class CAH_Admin_Dashboard {
             }
             
             // Check if this looks like a Forderungen.com export
-            $forderungen_fields_found = 0;
-            foreach ($optional_forderungen_fields as $field) {
-                if (in_array($field, $header)) {
-                    $forderungen_fields_found++;
+            $is_forderungen_export = $importer->is_forderungen_export($header);
+            
+            // Reserve case IDs for rows without Fall-ID in one counter update
+            $case_id_index = array_search('Fall-ID (CSV)', $header);
+            $missing_case_ids = 0;
+            foreach ($data_rows as $line) {
+                $data = str_getcsv($line, $delimiter);
+                if (trim($line) !== '' && empty($data[$case_id_index])) {
+                    $missing_case_ids++;
                 }
             }
-            
-            $is_forderungen_export = $forderungen_fields_found >= 3;
+            $importer->prefetch_case_ids($missing_case_ids);
+            
+            // Resolve responsible courts for all debtors in one pass
+            $postal_code_index = array_search('Postleitzahl', $header);
+            if ($postal_code_index !== false) {
+                $postal_codes = array();
+                foreach ($data_rows as $line) {
+                    $data = str_getcsv($line, $delimiter);
+                    if (isset($data[$postal_code_index])) {
+                        $postal_codes[] = sanitize_text_field($data[$postal_code_index]);
+                    }
+                }
+                $importer->resolve_courts($postal_codes);
+            }
             
             // Process import
             $success_count = 0;
             $error_count = 0;
             $errors = array();
+            $created_case_ids = array();
             
             foreach ($data_rows as $line_num => $line) {
                 if (empty(trim($line))) continue;
@@ -1533,15 +1679,23 @@ class CAH_Admin_Dashboard {
                 $row_data = array_combine($header, $data);
                 
                 // Process this row with Forderungen.com mapping
-                $result = $this->import_single_forderungen_case($row_data, $import_mode, $is_forderungen_export);
+                $result = $importer->import_row($row_data, $import_mode, $is_forderungen_export);
                 if ($result['success']) {
                     $success_count++;
+                    if ($result['created']) {
+                        $created_case_ids[] = $result['case_id'];
+                    }
                 } else {
                     $error_count++;
                     $errors[] = "Zeile " . ($line_num + 2) . ": " . $result['error'];
                 }
             }
             
+            // Follow-up work for all new cases at once (e.g. financial templates)
+            if ($created_case_ids) {
+                do_action('cah_cases_imported', $created_case_ids);
+            }
+            
             // Show results
             if ($success_count > 0) {
                 echo '<div class="notice notice-success"><p><strong>✅ Import erfolgreich!</strong> ' . $success_count . ' Fälle aus Forderungen.com (17 Felder) wurden importiert und automatisch zu vollständigen Datensätzen erweitert.</p></div>';
@@ -1571,220 +1725,6 @@ class CAH_Admin_Dashboard {
         }
     }
     
-    private function import_single_forderungen_case($data, $import_mode, $is_forderungen_export) {
-        global $wpdb;
-        
-        try {
-            // Check if tables exist
-            if (!$wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_cases'")) {
-                return array('success' => false, 'error' => 'Datenbank-Tabellen fehlen');
-            }
-            
-            // Extract data with Forderungen.com 17-field mapping
-            $case_id = sanitize_text_field($data['Fall-ID (CSV)'] ?? $data['Fall-ID'] ?? '');
-            $case_status = sanitize_text_field($data['Fall-Status'] ?? 'draft');
-            $brief_status = sanitize_text_field($data['Brief-Status'] ?? 'pending');
-            $briefe = intval($data['Briefe'] ?? 1);
-            $mandant = sanitize_text_field($data['Mandant'] ?? '');
-            $schuldner = sanitize_text_field($data['Schuldner'] ?? '');
-            $submission_date = sanitize_text_field($data['Einreichungsdatum'] ?? '');
-            $beweise = sanitize_textarea_field($data['Beweise'] ?? '');
-            $dokumente = sanitize_text_field($data['Dokumente'] ?? '');
-            $document_links = sanitize_text_field($data['links zu Dokumenten'] ?? '');
-            
-            // Debtor information from Forderungen.com (17 fields)
-            $company_name = sanitize_text_field($data['Firmenname'] ?? '');
-            $first_name = sanitize_text_field($data['Vorname'] ?? '');
-            $last_name = sanitize_text_field($data['Nachname'] ?? '');
-            $address = sanitize_text_field($data['Adresse'] ?? '');
-            $postal_code = sanitize_text_field($data['Postleitzahl'] ?? '');
-            $city = sanitize_text_field($data['Stadt'] ?? '');
-            $country = sanitize_text_field($data['Land'] ?? 'Deutschland');
-            
-            // Validation
-            if (empty($case_id) || empty($last_name)) {
-                return array('success' => false, 'error' => 'Fall-ID und Nachname sind erforderlich');
-            }
-            
-            // Check if case exists
-            $existing_case = $wpdb->get_row($wpdb->prepare("
-                SELECT id FROM {$wpdb->prefix}klage_cases WHERE case_id = %s
-            ", $case_id));
-            
-            if ($existing_case && $import_mode === 'create_new') {
-                return array('success' => false, 'error' => 'Fall existiert bereits');
-            }
-            
-            if (!$existing_case && $import_mode === 'update_existing') {
-                return array('success' => false, 'error' => 'Fall existiert nicht');
-            }
-            
-            // Create debtor entry (map 17 fields to comprehensive structure)
-            $debtor_name = trim($first_name . ' ' . $last_name);
-            if (!empty($company_name)) {
-                $debtor_name = $company_name . ' (' . $debtor_name . ')';
-            }
-            
-            $debtor_id = null;
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_debtors'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_debtors',
-                    array(
-                        'debtors_name' => $debtor_name,
-                        'debtors_company' => $company_name,
-                        'debtors_first_name' => $first_name,
-                        'debtors_last_name' => $last_name,
-                        'debtors_address' => $address,
-                        'debtors_postal_code' => $postal_code,
-                        'debtors_city' => $city,
-                        'debtors_country' => $country,
-                        // Set defaults for fields not provided by Forderungen.com
-                        'rechtsform' => !empty($company_name) ? 'unternehmen' : 'natuerliche_person',
-                        'datenquelle' => 'forderungen_com',
-                        'letzte_aktualisierung' => current_time('mysql')
-                    ),
-                    array('%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s')
-                );
-                $debtor_id = $wpdb->insert_id;
-            }
-            
-            // Prepare date
-            $submission_date_mysql = $this->parse_date($submission_date);
-            
-            // Case data - map Forderungen.com fields to comprehensive structure
-            $case_data = array(
-                'case_status' => $case_status,
-                'brief_status' => $brief_status,
-                'briefe' => $briefe,
-                'mandant' => $mandant,
-                'schuldner' => $schuldner,
-                'submission_date' => $submission_date_mysql,
-                'beweise' => $beweise,
-                'dokumente' => $dokumente,
-                'links_zu_dokumenten' => $document_links,
-                'debtor_id' => $debtor_id,
-                'case_updated_date' => current_time('mysql'),
-                'import_source' => 'forderungen_com',
-                // Set defaults for internal fields not provided by Forderungen.com
-                'verfahrensart' => 'mahnverfahren',
-                'rechtsgrundlage' => 'DSGVO Art. 82',
-                'kategorie' => 'GDPR_SPAM',
-                'schadenhoehe' => 350.00,
-                'total_amount' => 548.11,
-                'verfahrenswert' => 548.11,
-                'erfolgsaussicht' => 'hoch',
-                'risiko_bewertung' => 'niedrig',
-                'komplexitaet' => 'standard',
-                'prioritaet_intern' => 'normal',
-                'bearbeitungsstatus' => 'neu',
-                'kommunikation_sprache' => 'de'
-            );
-            
-            if ($existing_case) {
-                // Update existing case
-                $wpdb->update(
-                    $wpdb->prefix . 'klage_cases',
-                    $case_data,
-                    array('id' => $existing_case->id),
-                    array('%s', '%s', '%d', '%s', '%s', '%s', '%s', '%s', '%s', '%d', '%s', '%s', '%s', '%s', '%s', '%f', '%f', '%f', '%s', '%s', '%s', '%s', '%s', '%s', '%s'),
-                    array('%d')
-                );
-                $case_internal_id = $existing_case->id;
-            } else {
-                // Create new case
-                $case_data['case_id'] = $case_id;
-                $case_data['case_creation_date'] = current_time('mysql');
-                $case_data['case_priority'] = 'medium';
-                
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_cases',
-                    $case_data,
-                    array('%s', '%s', '%s', '%s', '%s', '%d', '%s', '%s', '%s', '%s', '%s', '%s', '%d', '%s', '%s', '%s', '%s', '%s', '%f', '%f', '%f', '%s', '%s', '%s', '%s', '%s', '%s', '%s')
-                );
-                $case_internal_id = $wpdb->insert_id;
-            }
-            
-            // Create standard GDPR financial record
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_financial'")) {
-                // Check if financial record exists
-                $existing_financial = $wpdb->get_var($wpdb->prepare("
-                    SELECT id FROM {$wpdb->prefix}klage_financial WHERE case_id = %d
-                ", $case_internal_id));
-                
-                $financial_data = array(
-                    'streitwert' => 548.11,
-                    'schadenersatz' => 350.00,
-                    'anwaltskosten' => 96.90,
-                    'gerichtskosten' => 32.00,
-                    'nebenkosten' => 13.36,
-                    'total' => 548.11,
-                    'damages_loss' => 350.00,
-                    'partner_fees' => 96.90,
-                    'communication_fees' => 13.36,
-                    'vat' => 87.85,
-                    'court_fees' => 32.00
-                );
-                
-                if ($existing_financial) {
-                    // Update existing financial record
-                    $wpdb->update(
-                        $wpdb->prefix . 'klage_financial',
-                        $financial_data,
-                        array('id' => $existing_financial),
-                        array('%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f'),
-                        array('%d')
-                    );
-                } else {
-                    // Create new financial record
-                    $financial_data['case_id'] = $case_internal_id;
-                    $wpdb->insert(
-                        $wpdb->prefix . 'klage_financial',
-                        $financial_data,
-                        array('%d', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f')
-                    );
-                }
-            }
-            
-            // Create audit trail entry
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_internal_id,
-                        'action' => $existing_case ? 'case_updated' : 'case_created',
-                        'details' => 'Imported from Forderungen.com (17 fields) with automatic defaults',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
-            
-            return array('success' => true, 'case_id' => $case_internal_id);
-            
-        } catch (Exception $e) {
-            return array('success' => false, 'error' => 'Import-Fehler: ' . $e->getMessage());
-        }
-    }
-    
-    private function parse_date($date_string) {
-        if (empty($date_string)) {
-            return null;
-        }
-        
-        // Try Y-m-d format first
-        $date = DateTime::createFromFormat('Y-m-d', $date_string);
-        if (!$date) {
-            // Try d.m.Y format
-            $date = DateTime::createFromFormat('d.m.Y', $date_string);
-        }
-        if (!$date) {
-            // Try d/m/Y format
-            $date = DateTime::createFromFormat('d/m/Y', $date_string);
-        }
-        
-        return $date ? $date->format('Y-m-d') : null;
-    }
-    
     public function admin_page_help() {
         ?>
         <div class="wrap">
@@ -2003,6 +1943,14 @@ class CAH_Admin_Dashboard {
             }
         }
         
+        // Requeue failed N8N deliveries
+        if ($_SERVER['REQUEST_METHOD'] === 'POST' && isset($_POST['n8n_retry_nonce'])) {
+            if (wp_verify_nonce($_POST['n8n_retry_nonce'], 'n8n_retry_failed') && current_user_can('manage_options')) {
+                $retry_result = (new CAH_N8N_Connector())->retry_failed();
+                echo '<div class="notice notice-' . ($retry_result['success'] ? 'success' : 'error') . '"><p>' . esc_html($retry_result['message']) . '</p></div>';
+            }
+        }
+        
         ?>
         <div class="wrap">
             <h1><?php echo esc_html__('Klage.Click Hub Einstellungen', 'court-automation-hub'); ?></h1>
@@ -2069,6 +2017,28 @@ class CAH_Admin_Dashboard {
                 </div>
             </form>
             
+            <?php if (get_option('klage_click_n8n_url')): ?>
+                <?php $n8n_metrics = (new CAH_N8N_Connector())->get_queue_metrics(); ?>
+                <div class="postbox">
+                    <h2 class="hndle" style="padding: 15px 20px; margin: 0; background: #f9f9f9;">📤 N8N-Warteschlange</h2>
+                    <div class="inside" style="padding: 20px;">
+                        <table class="form-table">
+                            <tr><th scope="row">Ausstehend</th><td><?php echo intval($n8n_metrics['pending']); ?> (älteste: <?php echo intval($n8n_metrics['oldest_pending_seconds']); ?> s)</td></tr>
+                            <tr><th scope="row">In Bearbeitung</th><td><?php echo intval($n8n_metrics['processing']); ?></td></tr>
+                            <tr><th scope="row">Gesendet (letzte Stunde)</th><td><?php echo intval($n8n_metrics['sent_last_hour']); ?></td></tr>
+                            <tr><th scope="row">Fehlgeschlagen</th><td><?php echo intval($n8n_metrics['failed']); ?></td></tr>
+                            <tr><th scope="row">Abgewiesen (Rückstau)</th><td><?php echo intval($n8n_metrics['rejected']); ?></td></tr>
+                        </table>
+                        <?php if ($n8n_metrics['failed'] > 0): ?>
+                            <form method="post">
+                                <?php wp_nonce_field('n8n_retry_failed', 'n8n_retry_nonce'); ?>
+                                <input type="submit" class="button" value="🔁 Fehlgeschlagene erneut senden">
+                            </form>
+                        <?php endif; ?>
+                    </div>
+                </div>
+            <?php endif; ?>
+            
             <!-- System Information -->
             <div class="postbox">
                 <h2 class="hndle" style="padding: 15px 20px; margin: 0; background: #f9f9f9;">ℹ️ System-Information</h2>
@@ -2101,8 +2071,8 @@ class CAH_Admin_Dashboard {
         require_once CAH_PLUGIN_PATH . 'includes/class-database.php';
         $database = new CAH_Database();
         
-        // Try database creation
-        $results = $database->create_tables_direct();
+        // Try database creation (explicit maintenance run: indexes are built too)
+        $results = $database->create_tables_direct(true);
         
         if ($results['success']) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> ' . $results['message'] . '</p></div>';
@@ -2207,33 +2177,24 @@ class CAH_Admin_Dashboard {
     }
     
     private function render_edit_case_form($case_id) {
-        global $wpdb;
+        // Handle form submission (before loading, so the form shows the saved values)
+        if ($_SERVER['REQUEST_METHOD'] === 'POST' && isset($_POST['save_case'])) {
+            $this->handle_case_update($case_id, $_POST);
+        }
         
-        // Get case data
-        $case = $wpdb->get_row($wpdb->prepare("
-            SELECT * FROM {$wpdb->prefix}klage_cases WHERE id = %d
-        ", $case_id));
+        // Get case and debtor data
+        $entry = $this->case_repository->find($case_id);
         
-        if (!$case) {
+        if (!$entry) {
             echo '<div class="notice notice-error"><p>Fall nicht gefunden.</p></div>';
             return;
         }
         
-        // Get debtor data
-        $debtor = null;
-        if ($case->debtor_id) {
-            $debtor = $wpdb->get_row($wpdb->prepare("
-                SELECT * FROM {$wpdb->prefix}klage_debtors WHERE id = %d
-            ", $case->debtor_id));
-        }
+        $case = $entry['case'];
+        $debtor = $entry['debtor'];
         
         // Financial data handled by separate plugin
         
-        // Handle form submission
-        if ($_SERVER['REQUEST_METHOD'] === 'POST' && isset($_POST['save_case'])) {
-            $this->handle_case_update($case_id, $_POST);
-        }
-        
         ?>
         <div class="wrap">
             <h1>Fall bearbeiten: <?php echo esc_html($case->case_id); ?></h1>
@@ -2404,30 +2365,28 @@ class CAH_Admin_Dashboard {
     }
     
     private function render_view_case($case_id) {
-        global $wpdb;
+        // Get case, debtor and financial data
+        $entry = $this->case_repository->find($case_id);
         
-        // Get case data
-        $case = $wpdb->get_row($wpdb->prepare("
-            SELECT * FROM {$wpdb->prefix}klage_cases WHERE id = %d
-        ", $case_id));
-        
-        if (!$case) {
+        if (!$entry) {
             echo '<div class="notice notice-error"><p>Fall nicht gefunden.</p></div>';
             return;
         }
         
-        // Get debtor data
-        $debtor = null;
-        if ($case->debtor_id) {
-            $debtor = $wpdb->get_row($wpdb->prepare("
-                SELECT * FROM {$wpdb->prefix}klage_debtors WHERE id = %d
-            ", $case->debtor_id));
-        }
+        $case = $entry['case'];
+        $debtor = $entry['debtor'];
+        $financial = $entry['financial'];
         
-        // Get financial data
-        $financial = $wpdb->get_row($wpdb->prepare("
-            SELECT * FROM {$wpdb->prefix}klage_financial WHERE case_id = %d
-        ", $case_id));
+        // Email evidence linked by sender (only once evidence was imported)
+        $evidence = array();
+        $attachments = array();
+        if (get_option('cah_evidence_tables_version') !== false) {
+            $email_evidence = new CAH_Email_Evidence();
+            $evidence = $email_evidence->get_case_evidence($case_id);
+            foreach ($email_evidence->get_case_attachments($case_id) as $attachment) {
+                $attachments[$attachment->evidence_id][] = $attachment;
+            }
+        }
         
         ?>
         <div class="wrap">
@@ -2591,6 +2550,44 @@ class CAH_Admin_Dashboard {
             </div>
             <?php endif; ?>
             
+            <!-- Email Evidence -->
+            <?php if ($evidence): ?>
+            <div class="postbox" style="margin-top: 20px;">
+                <h2 class="hndle">📧 E-Mail-Evidenz (<?php echo count($evidence); ?>)</h2>
+                <div class="inside" style="padding: 20px;">
+                    <table class="wp-list-table widefat fixed striped">
+                        <thead>
+                            <tr>
+                                <th>Empfangen</th>
+                                <th>Absender</th>
+                                <th>Betreff</th>
+                                <th>Zuordnung</th>
+                                <th>Downloads</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            <?php foreach ($evidence as $message): ?>
+                            <tr>
+                                <td><?php echo $message->received_at ? esc_html(date('d.m.Y H:i', strtotime($message->received_at))) : '-'; ?></td>
+                                <td><?php echo esc_html($message->sender_email); ?></td>
+                                <td><?php echo esc_html($message->subject); ?></td>
+                                <td><?php echo $message->matched_by === 'debtor_email' ? 'Schuldner-E-Mail' : 'Fall-E-Mail'; ?></td>
+                                <td>
+                                    <?php if ($message->body_blob_id): ?>
+                                    <a href="<?php echo wp_nonce_url(admin_url('admin.php?page=klage-click-cases&action=download_evidence&id=' . $case_id . '&blob_id=' . $message->body_blob_id), 'evidence_' . $case_id . '_' . $message->body_blob_id); ?>">📄 Nachricht</a><br>
+                                    <?php endif; ?>
+                                    <?php foreach ($attachments[$message->id] ?? array() as $attachment): ?>
+                                    <a href="<?php echo wp_nonce_url(admin_url('admin.php?page=klage-click-cases&action=download_evidence&id=' . $case_id . '&blob_id=' . $attachment->blob_id), 'evidence_' . $case_id . '_' . $attachment->blob_id); ?>">📎 <?php echo esc_html($attachment->filename ?: 'Anhang'); ?></a> (<?php echo esc_html(size_format($attachment->size)); ?>)<br>
+                                    <?php endforeach; ?>
+                                </td>
+                            </tr>
+                            <?php endforeach; ?>
+                        </tbody>
+                    </table>
+                </div>
+            </div>
+            <?php endif; ?>
+            
             <!-- Actions -->
             <div style="margin-top: 20px;">
                 <a href="<?php echo admin_url('admin.php?page=klage-click-cases&action=edit&id=' . $case_id); ?>" class="button button-primary">✏️ Bearbeiten</a>
@@ -2608,6 +2605,76 @@ class CAH_Admin_Dashboard {
         <?php
     }
     
+    private function render_document_batch($batch_id) {
+        $document_generator = new CAH_Document_Generator();
+        
+        // Resume / delete
+        if ($_SERVER['REQUEST_METHOD'] === 'POST' && isset($_POST['document_batch_action'])) {
+            if (!wp_verify_nonce($_POST['document_batch_nonce'] ?? '', 'document_batch_' . $batch_id)) {
+                echo '<div class="notice notice-error"><p>Sicherheitsfehler.</p></div>';
+            } elseif ($_POST['document_batch_action'] === 'resume') {
+                $document_generator->resume_batch($batch_id);
+                echo '<div class="notice notice-success"><p>Stapel wird fortgesetzt.</p></div>';
+            } elseif ($_POST['document_batch_action'] === 'delete') {
+                $document_generator->delete_batch($batch_id);
+                $this->audit_logger->log_action(0, 'documents_batch_deleted', 'Dokumentenstapel #' . $batch_id . ' gelöscht');
+                echo '<div class="notice notice-success"><p>Stapel wurde gelöscht.</p></div>';
+                $this->render_cases_list();
+                return;
+            }
+        }
+        
+        $batch = $document_generator->get_batch($batch_id);
+        
+        if (!$batch) {
+            echo '<div class="notice notice-error"><p>Dokumentenstapel nicht gefunden.</p></div>';
+            return;
+        }
+        
+        $processed = $batch->done + $batch->failed;
+        $percent = $batch->total ? round($processed / $batch->total * 100) : 0;
+        $download_url = wp_nonce_url(
+            admin_url('admin.php?page=klage-click-cases&action=download_documents&batch_id=' . $batch->id),
+            'document_batch_' . $batch->id
+        );
+        
+        ?>
+        <div class="wrap">
+            <h1>Dokumentenstapel #<?php echo intval($batch->id); ?></h1>
+            
+            <div class="postbox" style="padding: 20px; margin-top: 20px;">
+                <p>
+                    <strong>Status:</strong> <?php echo $batch->status === 'running' ? '⏳ Läuft' : '✅ Abgeschlossen'; ?><br>
+                    <strong>Fortschritt:</strong> <?php echo $processed; ?> von <?php echo intval($batch->total); ?> Fällen (<?php echo $percent; ?>%)<br>
+                    <strong>Erzeugte Dokumente:</strong> <?php echo intval($batch->documents); ?><br>
+                    <strong>Fehlgeschlagen:</strong> <?php echo intval($batch->failed); ?><br>
+                    <strong>Durchsatz:</strong> <?php echo esc_html(number_format($batch->documents_per_second, 1, ',', '.')); ?> Dokumente/s (<?php echo esc_html(number_format($batch->elapsed_seconds, 1, ',', '.')); ?> s)
+                </p>
+                
+                <div style="background: #f0f0f1; height: 20px; border-radius: 3px; overflow: hidden;">
+                    <div style="background: #2271b1; height: 20px; width: <?php echo $percent; ?>%;"></div>
+                </div>
+                
+                <form method="post" style="margin-top: 20px;">
+                    <?php wp_nonce_field('document_batch_' . $batch->id, 'document_batch_nonce'); ?>
+                    <?php if ($batch->done > 0): ?>
+                        <a href="<?php echo esc_url($download_url); ?>" class="button button-primary">📦 ZIP herunterladen</a>
+                    <?php endif; ?>
+                    <?php if ($batch->failed > 0 || $batch->status === 'running'): ?>
+                        <button type="submit" name="document_batch_action" value="resume" class="button">▶️ Fortsetzen</button>
+                    <?php endif; ?>
+                    <button type="submit" name="document_batch_action" value="delete" class="button" onclick="return confirm('Stapel und erzeugte Dokumente löschen?');">🗑️ Löschen</button>
+                    <a href="<?php echo admin_url('admin.php?page=klage-click-cases'); ?>" class="button button-secondary">🔙 Zurück zur Liste</a>
+                </form>
+            </div>
+        </div>
+        <?php if ($batch->status === 'running'): ?>
+        <script>
+        setTimeout(function() { window.location.reload(); }, 3000);
+        </script>
+        <?php endif;
+    }
+    
     private function handle_delete_case($case_id) {
         global $wpdb;
         
@@ -2629,27 +2696,17 @@ class CAH_Admin_Dashboard {
         
         // Delete from related tables first
         $wpdb->delete($wpdb->prefix . 'klage_financial', array('case_id' => $case_id), array('%d'));
-        $wpdb->delete($wpdb->prefix . 'klage_audit', array('case_id' => $case_id), array('%d'));
+        $this->audit_logger->delete_case_history($case_id);
         
         // Delete main case
         $result = $wpdb->delete($wpdb->prefix . 'klage_cases', array('id' => $case_id), array('%d'));
+        CAH_Case_Repository::invalidate_case($case_id, $case->case_id);
         
         if ($result) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Fall "' . esc_html($case->case_id) . '" wurde gelöscht.</p></div>';
             
             // Log the deletion
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => 0, // Case no longer exists
-                        'action' => 'case_deleted',
-                        'details' => 'Fall "' . $case->case_id . '" wurde gelöscht',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action(0, 'case_deleted', 'Fall "' . $case->case_id . '" wurde gelöscht');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Fall konnte nicht gelöscht werden.</p></div>';
         }
@@ -2664,6 +2721,12 @@ class CAH_Admin_Dashboard {
             return;
         }
         
+        $entry = $this->case_repository->find($case_id);
+        if (!$entry) {
+            echo '<div class="notice notice-error"><p>Fall nicht gefunden.</p></div>';
+            return;
+        }
+        
         // Update case data
         $case_data = array(
             'case_status' => sanitize_text_field($post_data['case_status']),
@@ -2681,11 +2744,12 @@ class CAH_Admin_Dashboard {
             array('%s', '%s', '%s', '%s', '%s', '%s'),
             array('%d')
         );
+        CAH_Case_Repository::invalidate_case($case_id, $entry['case']->case_id);
         
         // Update debtor if exists
         if (isset($post_data['debtors_first_name'])) {
-            $case = $wpdb->get_row($wpdb->prepare("SELECT debtor_id FROM {$wpdb->prefix}klage_cases WHERE id = %d", $case_id));
-            if ($case && $case->debtor_id) {
+            $case = $entry['case'];
+            if ($case->debtor_id) {
                 $debtor_data = array(
                     'debtors_first_name' => sanitize_text_field($post_data['debtors_first_name']),
                     'debtors_last_name' => sanitize_text_field($post_data['debtors_last_name']),
@@ -2704,6 +2768,15 @@ class CAH_Admin_Dashboard {
                     array('%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s'),
                     array('%d')
                 );
+                CAH_Case_Repository::invalidate_debtor($case->debtor_id);
+                
+                // Evidence is linked by debtor email, for every case of this debtor
+                if ($entry['debtor'] && $entry['debtor']->debtors_email !== $debtor_data['debtors_email']) {
+                    $email_evidence = new CAH_Email_Evidence();
+                    $email_evidence->relink_cases($wpdb->get_col($wpdb->prepare("
+                        SELECT id FROM {$wpdb->prefix}klage_cases WHERE debtor_id = %d
+                    ", $case->debtor_id)));
+                }
             }
         }
         
@@ -2714,18 +2787,7 @@ class CAH_Admin_Dashboard {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Fall wurde aktualisiert.</p></div>';
             
             // Log the update
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_id,
-                        'action' => 'case_updated',
-                        'details' => 'Fall wurde über Admin-Interface bearbeitet',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action($case_id, 'case_updated', 'Fall wurde über Admin-Interface bearbeitet');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Fall konnte nicht aktualisiert werden.</p></div>';
         }
@@ -2808,10 +2870,6 @@ class CAH_Admin_Dashboard {
             // Validation with detailed error messages
             $errors = array();
             
-            if (empty($case_id)) {
-                $errors[] = 'Fall-ID ist erforderlich.';
-            }
-            
             // Check if we have meaningful data in either debtor or email fields
             $has_meaningful_debtor_data = !empty($debtors_last_name) && $debtors_last_name !== 'Unbekannt';
             $has_meaningful_email_data = !empty($sender_email);
@@ -2847,10 +2905,21 @@ class CAH_Admin_Dashboard {
                 return;
             }
             
-            // Check if case ID already exists
-            $existing_case = $wpdb->get_var($wpdb->prepare("
-                SELECT id FROM {$wpdb->prefix}klage_cases WHERE case_id = %s
-            ", $case_id));
+            // Allocate from the case ID sequence unless a manual ID was entered
+            $manual_case_id = !empty($case_id);
+            if (!$manual_case_id) {
+                $case_id = $this->case_id_allocator->next_case_id();
+                if (is_wp_error($case_id)) {
+                    echo '<div class="notice notice-error"><p><strong>Fehler:</strong> ' . esc_html($case_id->get_error_message()) . '</p></div>';
+                    return;
+                }
+                $existing_case = false;
+            } else {
+                // Manual IDs still need the uniqueness check
+                $existing_case = $wpdb->get_var($wpdb->prepare("
+                    SELECT id FROM {$wpdb->prefix}klage_cases WHERE case_id = %s
+                ", $case_id));
+            }
             
             if ($existing_case) {
                 echo '<div class="notice notice-error"><p><strong>Fehler:</strong> Fall-ID "' . esc_html($case_id) . '" existiert bereits.</p></div>';
@@ -2921,32 +2990,31 @@ class CAH_Admin_Dashboard {
                 'document_type' => 'mahnbescheid',
                 'document_language' => 'de'
             );
+            $case_formats = array('%s', '%s', '%s', '%s', '%d', '%f', '%s', '%d', '%s', '%s');
+            
+            // Assign responsible court from debtor postal code
+            if (!empty($debtors_postal_code)) {
+                $courts = $this->court_manager->resolve_courts(array($debtors_postal_code));
+                $court = $courts[$debtors_postal_code];
+                if ($court) {
+                    $case_data['gericht_zustaendig'] = $court->court_name;
+                    $case_formats[] = '%s';
+                }
+            }
             
-            $result = $wpdb->insert(
-                $wpdb->prefix . 'klage_cases',
-                $case_data,
-                array('%s', '%s', '%s', '%s', '%d', '%f', '%s', '%d', '%s', '%s')
-            );
+            // Allocated IDs are replaced by the next number if taken meanwhile
+            $result = $this->case_id_allocator->insert_case($case_data, $case_formats, !$manual_case_id);
             
-            if ($result) {
+            if (!is_wp_error($result)) {
                 $case_internal_id = $wpdb->insert_id;
+                $case_id = $result;
+                $case_data['case_id'] = $case_id;
                 
                 // Trigger WordPress hook for case creation (for financial calculator plugin integration)
                 do_action('cah_case_created', $case_internal_id, $case_data);
                 
                 // Create audit log entry
-                if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                    $wpdb->insert(
-                        $wpdb->prefix . 'klage_audit',
-                        array(
-                            'case_id' => $case_internal_id,
-                            'action' => 'case_created',
-                            'details' => 'Fall "' . $case_id . '" wurde manuell erstellt',
-                            'user_id' => get_current_user_id()
-                        ),
-                        array('%d', '%s', '%s', '%d')
-                    );
-                }
+                $this->audit_logger->log_action($case_internal_id, 'case_created', 'Fall "' . $case_id . '" wurde manuell erstellt');
                 
                 echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Fall "' . esc_html($case_id) . '" wurde erfolgreich erstellt' . ($has_email_fields ? ' (aus E-Mail)' : '') . '.</p></div>';
                 
@@ -2958,7 +3026,7 @@ class CAH_Admin_Dashboard {
                 </script>';
                 
             } else {
-                echo '<div class="notice notice-error"><p><strong>❌ Fehler:</strong> Fall konnte nicht erstellt werden. Datenbank-Fehler: ' . esc_html($wpdb->last_error) . '</p></div>';
+                echo '<div class="notice notice-error"><p><strong>❌ Fehler:</strong> Fall konnte nicht erstellt werden. ' . esc_html($result->get_error_message()) . '</p></div>';
             }
             
         } catch (Exception $e) {
@@ -3013,10 +3081,11 @@ class CAH_Admin_Dashboard {
                     
                     if ($case) {
                         // Delete from related tables first (excluding financial - handled by hooks)
-                        $wpdb->delete($wpdb->prefix . 'klage_audit', array('case_id' => $case_id), array('%d'));
+                        $this->audit_logger->delete_case_history($case_id);
                         
                         // Delete main case
                         $result = $wpdb->delete($wpdb->prefix . 'klage_cases', array('id' => $case_id), array('%d'));
+                        CAH_Case_Repository::invalidate_case($case_id, $case->case_id);
                         
                         if ($result) {
                             $success_count++;
@@ -3025,18 +3094,7 @@ class CAH_Admin_Dashboard {
                             do_action('cah_case_deleted', $case_id);
                             
                             // Log the deletion
-                            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                                $wpdb->insert(
-                                    $wpdb->prefix . 'klage_audit',
-                                    array(
-                                        'case_id' => 0,
-                                        'action' => 'case_deleted_bulk',
-                                        'details' => 'Fall "' . $case->case_id . '" wurde per Bulk-Aktion gelöscht',
-                                        'user_id' => get_current_user_id()
-                                    ),
-                                    array('%d', '%s', '%s', '%d')
-                                );
-                            }
+                            $this->audit_logger->log_action(0, 'case_deleted_bulk', 'Fall "' . $case->case_id . '" wurde per Bulk-Aktion gelöscht');
                         } else {
                             $error_count++;
                         }
@@ -3078,6 +3136,7 @@ class CAH_Admin_Dashboard {
                         array('%s', '%s'),
                         array('%d')
                     );
+                    CAH_Case_Repository::invalidate_case($case_id);
                     
                     if ($result !== false) {
                         $success_count++;
@@ -3086,18 +3145,7 @@ class CAH_Admin_Dashboard {
                         do_action('cah_case_updated', $case_id, array('case_status' => $new_status));
                         
                         // Log the status change
-                        if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                            $wpdb->insert(
-                                $wpdb->prefix . 'klage_audit',
-                                array(
-                                    'case_id' => $case_id,
-                                    'action' => 'case_status_changed_bulk',
-                                    'details' => 'Status zu "' . $new_status . '" geändert per Bulk-Aktion',
-                                    'user_id' => get_current_user_id()
-                                ),
-                                array('%d', '%s', '%s', '%d')
-                            );
-                        }
+                        $this->audit_logger->log_action($case_id, 'case_status_changed_bulk', 'Status zu "' . $new_status . '" geändert per Bulk-Aktion');
                     } else {
                         $error_count++;
                     }
@@ -3136,23 +3184,13 @@ class CAH_Admin_Dashboard {
                         array('%s', '%s'),
                         array('%d')
                     );
+                    CAH_Case_Repository::invalidate_case($case_id);
                     
                     if ($result !== false) {
                         $success_count++;
                         
                         // Log the priority change
-                        if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                            $wpdb->insert(
-                                $wpdb->prefix . 'klage_audit',
-                                array(
-                                    'case_id' => $case_id,
-                                    'action' => 'case_priority_changed_bulk',
-                                    'details' => 'Priorität zu "' . $new_priority . '" geändert per Bulk-Aktion',
-                                    'user_id' => get_current_user_id()
-                                ),
-                                array('%d', '%s', '%s', '%d')
-                            );
-                        }
+                        $this->audit_logger->log_action($case_id, 'case_priority_changed_bulk', 'Priorität zu "' . $new_priority . '" geändert per Bulk-Aktion');
                     } else {
                         $error_count++;
                     }
@@ -3166,6 +3204,22 @@ class CAH_Admin_Dashboard {
                 }
                 break;
                 
+            case 'generate_documents':
+                $document_generator = new CAH_Document_Generator();
+                $batch_id = $document_generator->create_batch($case_ids);
+                
+                if (is_wp_error($batch_id)) {
+                    echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> ' . esc_html($batch_id->get_error_message()) . '</p></div>';
+                    break;
+                }
+                
+                $document_generator->spawn_workers($batch_id);
+                $this->audit_logger->log_action(0, 'documents_batch_created', 'Dokumentenstapel #' . $batch_id . ' für ' . count($case_ids) . ' Fälle gestartet');
+                
+                echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Dokumente für ' . count($case_ids) . ' Fälle werden erzeugt. ';
+                echo '<a href="' . esc_url(admin_url('admin.php?page=klage-click-cases&action=documents&batch_id=' . $batch_id)) . '">Fortschritt anzeigen</a></p></div>';
+                break;
+                
             default:
                 echo '<div class="notice notice-error"><p><strong>Fehler:</strong> Unbekannte Aktion.</p></div>';
                 break;
@@ -3207,23 +3261,13 @@ class CAH_Admin_Dashboard {
             array('%s', '%s'),
             array('%d')
         );
+        CAH_Case_Repository::invalidate_case($case_id);
         
         if ($result !== false) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Status wurde geändert.</p></div>';
             
             // Log the change
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_id,
-                        'action' => 'status_changed',
-                        'details' => 'Status zu "' . $new_status . '" geändert',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action($case_id, 'status_changed', 'Status zu "' . $new_status . '" geändert');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Status konnte nicht geändert werden.</p></div>';
         }
@@ -3264,23 +3308,13 @@ class CAH_Admin_Dashboard {
             array('%s', '%s'),
             array('%d')
         );
+        CAH_Case_Repository::invalidate_case($case_id);
         
         if ($result !== false) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Priorität wurde geändert.</p></div>';
             
             // Log the change
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_id,
-                        'action' => 'priority_changed',
-                        'details' => 'Priorität zu "' . $new_priority . '" geändert',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action($case_id, 'priority_changed', 'Priorität zu "' . $new_priority . '" geändert');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Priorität konnte nicht geändert werden.</p></div>';
         }
@@ -3315,23 +3349,13 @@ class CAH_Admin_Dashboard {
             array('%s', '%s'),
             array('%d')
         );
+        CAH_Case_Repository::invalidate_case($case_id);
         
         if ($result !== false) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Status wurde geändert.</p></div>';
             
             // Log the change
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_id,
-                        'action' => 'status_changed',
-                        'details' => 'Status zu "' . $new_status . '" geändert',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action($case_id, 'status_changed', 'Status zu "' . $new_status . '" geändert');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Status konnte nicht geändert werden.</p></div>';
         }
@@ -3366,23 +3390,13 @@ class CAH_Admin_Dashboard {
             array('%s', '%s'),
             array('%d')
         );
+        CAH_Case_Repository::invalidate_case($case_id);
         
         if ($result !== false) {
             echo '<div class="notice notice-success"><p><strong>✅ Erfolg!</strong> Priorität wurde geändert.</p></div>';
             
             // Log the change
-            if ($wpdb->get_var("SHOW TABLES LIKE '{$wpdb->prefix}klage_audit'")) {
-                $wpdb->insert(
-                    $wpdb->prefix . 'klage_audit',
-                    array(
-                        'case_id' => $case_id,
-                        'action' => 'priority_changed',
-                        'details' => 'Priorität zu "' . $new_priority . '" geändert',
-                        'user_id' => get_current_user_id()
-                    ),
-                    array('%d', '%s', '%s', '%d')
-                );
-            }
+            $this->audit_logger->log_action($case_id, 'priority_changed', 'Priorität zu "' . $new_priority . '" geändert');
         } else {
             echo '<div class="notice notice-error"><p><strong>❌ Fehler!</strong> Priorität konnte nicht geändert werden.</p></div>';
         }
@@ -3429,16 +3443,8 @@ class CAH_Admin_Dashboard {
         
         $case_id = sanitize_text_field($_POST['case_id']);
         
-        global $wpdb;
-        $table_name = $wpdb->prefix . 'klage_cases';
-        
         // Check if case_id already exists
-        $existing = $wpdb->get_var($wpdb->prepare(
-            "SELECT COUNT(*) FROM $table_name WHERE case_id = %s",
-            $case_id
-        ));
-        
-        $is_unique = ($existing == 0);
+        $is_unique = !$this->case_repository->find_id_by_case_id($case_id);
         
         wp_send_json_success(array(
             'unique' => $is_unique,
@@ -11,8 +11,58 @@ class CAH_Rest_API {
     
     private $namespace = 'klage-click/v1';
     
+    // Maximum page size for collection endpoints
+    const MAX_PER_PAGE = 100;
+    
+    // Counter bumped after every request that wrote klage_cases (ETags);
+    // MAX(case_updated_date) and MAX(id) don't change when a case is deleted
+    const STATE_OPTION = 'cah_cases_state_version';
+    
+    // klage_cases was written in this request
+    private static $cases_written = false;
+    
+    private static $hooks_registered = false;
+    
     public function __construct() {
         add_action('rest_api_init', array($this, 'register_routes'));
+        add_action('cah_schema_updated', array($this, 'flush_column_cache'));
+    }
+    
+    /**
+     * Track case writes on every request (admin, imports, CLI, REST)
+     */
+    public static function register_hooks() {
+        if (self::$hooks_registered) {
+            return;
+        }
+        self::$hooks_registered = true;
+        
+        add_filter('query', array(__CLASS__, 'track_case_write'));
+    }
+    
+    /**
+     * Mark writes to the cases table (filter on every query)
+     */
+    public static function track_case_write($query) {
+        global $wpdb;
+        
+        if (!self::$cases_written
+            && preg_match('/^\s*(INSERT|UPDATE|DELETE|REPLACE|TRUNCATE)\b/i', $query)
+            && preg_match('/`?' . preg_quote($wpdb->prefix, '/') . 'klage_cases\b/i', $query)) {
+            self::$cases_written = true;
+            // Before the query router stores the user's write position (priority 10),
+            // so a replica that has the position also has the new state version
+            add_action('shutdown', array(__CLASS__, 'bump_state_version'), 5);
+        }
+        
+        return $query;
+    }
+    
+    /**
+     * Bump the state version once, after the request's last case write
+     */
+    public static function bump_state_version() {
+        update_option(self::STATE_OPTION, intval(get_option(self::STATE_OPTION, 0)) + 1, false);
     }
     
     /**
@@ -30,7 +80,35 @@ class CAH_Rest_API {
         register_rest_route($this->namespace, '/cases', array(
             'methods' => 'GET',
             'callback' => array($this, 'get_cases'),
-            'permission_callback' => array($this, 'check_permissions')
+            'permission_callback' => array($this, 'check_permissions'),
+            'args' => array(
+                'per_page' => array(
+                    'type' => 'integer',
+                    'default' => 10,
+                    'minimum' => 1,
+                    'maximum' => self::MAX_PER_PAGE
+                ),
+                'cursor' => array(
+                    'type' => 'string',
+                    'description' => 'Opaque cursor from the X-Next-Cursor header of the previous page'
+                ),
+                'status' => array(
+                    'type' => 'string',
+                    'description' => 'Comma-separated list of case_status values'
+                ),
+                'created_after' => array(
+                    'type' => 'string',
+                    'format' => 'date-time'
+                ),
+                'created_before' => array(
+                    'type' => 'string',
+                    'format' => 'date-time'
+                ),
+                'updated_after' => array(
+                    'type' => 'string',
+                    'format' => 'date-time'
+                )
+            )
         ));
     }
     
@@ -50,14 +128,208 @@ class CAH_Rest_API {
     }
     
     /**
-     * Get cases
+     * Get cases (cursor paginated, newest first)
      */
     public function get_cases($request) {
+        // State and page from the same connection, so ETags match the data
+        // (the router keeps users on the primary until their writes replicated)
+        $db = CAH_Query_Router::reader('rest_cases');
+        
+        $table_name = $db->prefix . 'klage_cases';
+        
+        // Conditional request handling - cheap for polling clients
+        $state = $this->get_cases_state($db);
+        $etag = '"' . md5($state['last_modified'] . '|' . $state['max_id'] . '|' . $state['version'] . '|' . wp_json_encode($request->get_query_params())) . '"';
+        $last_modified = $state['last_modified'] ? gmdate('D, d M Y H:i:s', strtotime(get_gmt_from_date($state['last_modified']))) . ' GMT' : null;
+        
+        $if_none_match = $request->get_header('if_none_match');
+        $if_modified_since = $request->get_header('if_modified_since');
+        
+        $not_modified = $if_none_match
+            ? in_array($etag, array_map('trim', explode(',', $if_none_match)), true)
+            : ($if_modified_since && $last_modified && strtotime($if_modified_since) >= strtotime($last_modified));
+        
+        if ($not_modified) {
+            $response = new WP_REST_Response(null, 304);
+            $response->header('ETag', $etag);
+            if ($last_modified) {
+                $response->header('Last-Modified', $last_modified);
+            }
+            return $response;
+        }
+        
+        $where = array('1=1');
+        $params = array();
+        
+        // Status filter
+        if ($request->get_param('status')) {
+            $statuses = array_filter(array_map('sanitize_key', explode(',', $request->get_param('status'))));
+            if (!empty($statuses)) {
+                $where[] = 'case_status IN (' . implode(', ', array_fill(0, count($statuses), '%s')) . ')';
+                $params = array_merge($params, $statuses);
+            }
+        }
+        
+        // Date filters
+        $date_filters = array(
+            'created_after' => 'case_creation_date >= %s',
+            'created_before' => 'case_creation_date < %s',
+            'updated_after' => 'case_updated_date >= %s'
+        );
+        
+        foreach ($date_filters as $param_name => $condition) {
+            if ($request->get_param($param_name)) {
+                // Columns hold site-local time (current_time('mysql')); dates
+                // without an offset are site-local as elsewhere in the REST API
+                $dates = rest_get_date_with_gmt($request->get_param($param_name));
+                if (!$dates) {
+                    return new WP_Error('invalid_date', 'Invalid date for ' . $param_name, array('status' => 400));
+                }
+                $where[] = $condition;
+                $params[] = $dates[0];
+            }
+        }
+        
+        // Total of the filtered result, without the cursor condition
+        $total = intval($db->get_var($params
+            ? $db->prepare("SELECT COUNT(*) FROM $table_name WHERE " . implode(' AND ', $where), $params)
+            : "SELECT COUNT(*) FROM $table_name"));
+        
+        // Keyset pagination on (case_creation_date, id)
+        if ($request->get_param('cursor')) {
+            $cursor = $this->decode_cursor($request->get_param('cursor'));
+            if (!$cursor) {
+                return new WP_Error('invalid_cursor', 'Invalid cursor', array('status' => 400));
+            }
+            $where[] = '(case_creation_date < %s OR (case_creation_date = %s AND id < %d))';
+            array_push($params, $cursor['date'], $cursor['date'], $cursor['id']);
+        }
+        
+        $per_page = min(self::MAX_PER_PAGE, max(1, intval($request->get_param('per_page'))));
+        $columns = $this->get_projection($request->get_param('_fields'));
+        
+        // Fetch one extra row to know whether another page exists
+        $sql = "SELECT " . implode(', ', $columns) . " FROM $table_name WHERE " . implode(' AND ', $where) . " ORDER BY case_creation_date DESC, id DESC LIMIT %d";
+        $params[] = $per_page + 1;
+        
+        $cases = $db->get_results($db->prepare($sql, $params));
+        
+        $has_more = count($cases) > $per_page;
+        if ($has_more) {
+            array_pop($cases);
+        }
+        
+        $response = rest_ensure_response($cases);
+        $response->header('ETag', $etag);
+        $response->header('X-WP-Total', $total);
+        if ($last_modified) {
+            $response->header('Last-Modified', $last_modified);
+        }
+        
+        if ($has_more) {
+            $last_case = end($cases);
+            $next_cursor = $this->encode_cursor($last_case->case_creation_date, $last_case->id);
+            $next_url = add_query_arg(array_merge($request->get_query_params(), array('cursor' => $next_cursor)), rest_url($this->namespace . '/cases'));
+            
+            $response->header('X-Next-Cursor', $next_cursor);
+            $response->link_header('next', $next_url);
+        }
+        
+        return $response;
+    }
+    
+    /**
+     * Get latest change state of the cases table (for ETag / Last-Modified)
+     */
+    private function get_cases_state($db) {
+        $table_name = $db->prefix . 'klage_cases';
+        
+        // MAX() on indexed columns is resolved from the index; the state
+        // version (bumped on case writes) catches deletions. The version is
+        // read in the same query, so a lagging replica reports its own state.
+        $row = $db->get_row($db->prepare(
+            "SELECT MAX(case_updated_date) AS updated, MAX(case_creation_date) AS created, MAX(id) AS max_id,
+                (SELECT option_value FROM {$db->options} WHERE option_name = %s) AS version
+             FROM $table_name",
+            self::STATE_OPTION
+        ));
+        
+        $last_modified = $row ? max((string) $row->updated, (string) $row->created) : '';
+        
+        return array(
+            'last_modified' => $last_modified,
+            'max_id' => $row ? intval($row->max_id) : 0,
+            'version' => $row ? intval($row->version) : 0
+        );
+    }
+    
+    /**
+     * Resolve _fields to a list of existing columns (cursor columns always included)
+     */
+    private function get_projection($fields) {
+        $available = $this->get_case_columns();
+        
+        if (empty($fields)) {
+            return array('*');
+        }
+        
+        if (!is_array($fields)) {
+            $fields = explode(',', $fields);
+        }
+        
+        // Nested fields (a.b) select their top-level column
+        $requested = array();
+        foreach ($fields as $field) {
+            $field = strtok(trim($field), '.');
+            if (in_array($field, $available, true)) {
+                $requested[] = $field;
+            }
+        }
+        
+        return array_values(array_unique(array_merge(array('id', 'case_creation_date'), $requested)));
+    }
+    
+    /**
+     * Get column names of the cases table
+     */
+    private function get_case_columns() {
         global $wpdb;
         
-        $cases = $wpdb->get_results("SELECT * FROM {$wpdb->prefix}klage_cases ORDER BY case_creation_date DESC LIMIT 10");
+        $columns = wp_cache_get('case_columns', 'cah_rest_api');
+        
+        if ($columns === false) {
+            $columns = $wpdb->get_col("SHOW COLUMNS FROM {$wpdb->prefix}klage_cases");
+            wp_cache_set('case_columns', $columns, 'cah_rest_api', HOUR_IN_SECONDS);
+        }
+        
+        return $columns;
+    }
+    
+    /**
+     * Flush cached column list after schema changes
+     */
+    public function flush_column_cache() {
+        wp_cache_delete('case_columns', 'cah_rest_api');
+    }
+    
+    /**
+     * Encode pagination cursor
+     */
+    private function encode_cursor($date, $id) {
+        return rtrim(strtr(base64_encode($date . '|' . $id), '+/', '-_'), '=');
+    }
+    
+    /**
+     * Decode pagination cursor
+     */
+    private function decode_cursor($cursor) {
+        $decoded = base64_decode(strtr($cursor, '-_', '+/'), true);
+        
+        if ($decoded === false || !preg_match('/^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\|(\d+)$/', $decoded, $matches)) {
+            return false;
+        }
         
-        return rest_ensure_response($cases);
+        return array('date' => $matches[1], 'id' => intval($matches[2]));
     }
     
     /**
@@ -27,16 +27,7 @@ jQuery(document).ready(function($) {
         evt.preventDefault();
     };
     
-    // Auto-generate case ID
-    $('#case_id').on('focus', function() {
-        if ($(this).val() === '') {
-            var timestamp = Date.now().toString().substr(-4);
-            var caseId = 'SPAM-' + new Date().getFullYear() + '-' + timestamp;
-            $(this).val(caseId);
-        }
-    });
-    
-    // Case ID uniqueness validation
+    // Case ID uniqueness validation (manual IDs only - empty IDs are allocated server-side)
     $('#case_id').on('blur', function() {
         var caseId = $(this).val();
         var currentCaseId = $('input[name="original_case_id"]').val(); // For edit forms
@@ -66,13 +57,6 @@ jQuery(document).ready(function($) {
         }
     });
     
-    // Helper function to generate case ID
-    function generateCaseId() {
-        var year = new Date().getFullYear();
-        var random = Math.floor(Math.random() * 9000) + 1000;
-        return 'SPAM-' + year + '-' + random;
-    }
-    
     // Show success/error messages
     function showNotice(message, type) {
         var noticeClass = 'notice-' + type;
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Bootstrap Benchmark for Court Automation Hub
+Measures plugin bootstrap time and memory per request type (front end,
+REST, admin page, admin-ajax) against a running WordPress site.
+
+The plugins report their own numbers in X-CAH-Bootstrap response headers
+when wp-config.php contains:
+    define('CAH_PROFILE_BOOTSTRAP', true);
+
+Usage:
+    python3 bootstrap_benchmark.py --url http://localhost:8080 --user admin --password secret
+    python3 bootstrap_benchmark.py --url http://localhost:8080 --requests 50 --output bench.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+# name => (method, path, data, needs_login)
+REQUEST_TYPES = {
+    'frontend': ('GET', '/', None, False),
+    'rest': ('GET', '/wp-json/klage-click/v1/status', None, False),
+    'admin': ('GET', '/wp-admin/admin.php?page=klage-click-hub', None, True),
+    'ajax': ('POST', '/wp-admin/admin-ajax.php', {'action': 'heartbeat', 'data': ''}, True),
+}
+
+
+def parse_profile(headers):
+    """X-CAH-Bootstrap headers -> {plugin: {init_ms, lazy_ms, memory_kb, services}, request: {...}}"""
+    profile = {}
+
+    for name, value in headers:
+        name = name.lower()
+        if name not in ('x-cah-bootstrap', 'x-cah-bootstrap-request'):
+            continue
+
+        parts = [part.strip() for part in value.split(';')]
+        if name == 'x-cah-bootstrap':
+            key, parts = parts[0], parts[1:]
+        else:
+            key = 'request'
+
+        entry = {}
+        for part in parts:
+            field, _, field_value = part.partition('=')
+            if field == 'services':
+                entry[field] = [service for service in field_value.split(',') if service]
+            else:
+                entry[field] = float(field_value)
+        profile[key] = entry
+
+    return profile
+
+
+def build_opener(base_url, user, password):
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+
+    if user:
+        # WordPress checks that the test cookie is set before accepting a login
+        opener.open(base_url + '/wp-login.php').read()
+        data = urllib.parse.urlencode({
+            'log': user,
+            'pwd': password,
+            'wp-submit': 'Log In',
+            'testcookie': '1'
+        }).encode()
+        opener.open(base_url + '/wp-login.php', data).read()
+
+        if not any(cookie.name.startswith('wordpress_logged_in') for cookie in cookies):
+            raise RuntimeError('Login failed for user ' + user)
+
+    return opener
+
+
+def run_request(opener, base_url, method, path, data):
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    request = urllib.request.Request(base_url + path, data=body, method=method)
+
+    started = time.perf_counter()
+    with opener.open(request) as response:
+        response.read()
+        headers = response.getheaders()
+    elapsed = (time.perf_counter() - started) * 1000
+
+    return elapsed, parse_profile(headers)
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples if key in sample]
+    if not values:
+        return None
+
+    return {
+        'median': round(statistics.median(values), 3),
+        'min': round(min(values), 3),
+        'max': round(max(values), 3)
+    }
+
+
+def benchmark_type(opener, base_url, request_type, count, warmup):
+    method, path, data, _ = REQUEST_TYPES[request_type]
+
+    for _ in range(warmup):
+        run_request(opener, base_url, method, path, data)
+
+    samples = {}
+    response_times = []
+
+    for _ in range(count):
+        elapsed, profile = run_request(opener, base_url, method, path, data)
+        response_times.append({'ms': elapsed})
+
+        for plugin, entry in profile.items():
+            samples.setdefault(plugin, []).append(entry)
+
+    if not samples:
+        return {'error': 'No X-CAH-Bootstrap headers (is CAH_PROFILE_BOOTSTRAP defined?)'}
+
+    result = {'response_ms': summarize(response_times, 'ms')}
+
+    for plugin, entries in samples.items():
+        if plugin == 'request':
+            result['request'] = {
+                'files': summarize(entries, 'files'),
+                'peak_kb': summarize(entries, 'peak_kb')
+            }
+        else:
+            result[plugin] = {
+                'init_ms': summarize(entries, 'init_ms'),
+                'lazy_ms': summarize(entries, 'lazy_ms'),
+                'memory_kb': summarize(entries, 'memory_kb'),
+                'services': entries[-1].get('services', [])
+            }
+
+    return result
+
+
+def print_results(results):
+    print(f"{'type':<10} {'plugin':<10} {'init ms':>9} {'lazy ms':>9} {'mem KB':>8}  services")
+    print('-' * 80)
+
+    for request_type, result in results.items():
+        if 'error' in result:
+            print(f"{request_type:<10} {result['error']}")
+            continue
+
+        for plugin, entry in result.items():
+            if plugin in ('response_ms', 'request'):
+                continue
+            print(f"{request_type:<10} {plugin:<10} {entry['init_ms']['median']:>9.3f} {entry['lazy_ms']['median']:>9.3f} "
+                  f"{entry['memory_kb']['median']:>8.0f}  {','.join(entry['services'])}")
+
+        request = result.get('request', {})
+        if request.get('files'):
+            print(f"{request_type:<10} {'request':<10} files={request['files']['median']:.0f} "
+                  f"peak_kb={request['peak_kb']['median']:.0f} response_ms={result['response_ms']['median']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure plugin bootstrap time and memory per request type')
+    parser.add_argument('--url', required=True, help='Site URL, e.g. http://localhost:8080')
+    parser.add_argument('--user', help='Admin user (required for admin and ajax)')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--requests', type=int, default=20, help='Measured requests per type')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per type (opcache)')
+    parser.add_argument('--types', default=','.join(REQUEST_TYPES), help='Comma separated request types')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    opener = build_opener(base_url, args.user, args.password)
+
+    results = {}
+    for request_type in [name.strip() for name in args.types.split(',') if name.strip()]:
+        if request_type not in REQUEST_TYPES:
+            parser.error('Unknown request type: ' + request_type)
+
+        if REQUEST_TYPES[request_type][3] and not args.user:
+            print(f"[SKIP] {request_type}: needs --user")
+            continue
+
+        results[request_type] = benchmark_type(opener, base_url, request_type, args.requests, args.warmup)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump({
+                'url': base_url,
+                'requests': args.requests,
+                'timestamp': datetime.now().isoformat(),
+                'results': results
+            }, handle, indent=2)
+            handle.write('\n')
+        print(f"Results written to {args.output}")
+
+    return 1 if any('error' in result for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,8 @@ jQuery(document).ready(function($) {
     let currentCaseId = null;
     let costItems = [];
     let currentTemplate = null;
+    let currentTotals = null; // Totals of the last local calculation
+    const engine = window.CAHFinancialEngine;
     
     // Initialize when financial tab is clicked
     $(document).on('click', 'a[href="#financial"]', function() {
@@ -56,6 +58,11 @@ jQuery(document).ready(function($) {
             hideCostItemModal();
         });
         
+        // Percentage base fields
+        $(document).on('change', '#item-is-percentage, #item-percentage-base', function() {
+            updatePercentageFields();
+        });
+        
         // Edit cost item
         $(document).on('click', '.edit-cost-item', function() {
             const itemIndex = $(this).data('index');
@@ -133,7 +140,7 @@ jQuery(document).ready(function($) {
                     costItems = response.data.items || [];
                     currentTemplate = templateId;
                     renderCostItems();
-                    updateCalculation(response.data.totals);
+                    recalculateTotals();
                     showNotice('Vorlage erfolgreich geladen', 'success');
                 } else {
                     showNotice('Fehler beim Laden der Vorlage', 'error');
@@ -169,7 +176,7 @@ jQuery(document).ready(function($) {
             const row = $('<tr>').html(
                 '<td><strong>' + escapeHtml(item.name) + '</strong></td>' +
                 '<td><span class="category-badge category-' + item.category + '">' + getCategoryName(item.category) + '</span></td>' +
-                '<td><strong>' + formatCurrency(item.amount) + '</strong></td>' +
+                '<td><strong>' + (parseInt(item.is_percentage) ? parseFloat(item.amount).toFixed(2).replace('.', ',') + ' %' : formatCurrency(item.amount)) + '</strong></td>' +
                 '<td>' + escapeHtml(item.description || '-') + '</td>' +
                 '<td>' +
                     '<button type="button" class="button button-small edit-cost-item" data-index="' + index + '">✏️</button> ' +
@@ -196,15 +203,48 @@ jQuery(document).ready(function($) {
             $('#item-category').val(item.category);
             $('#item-amount').val(item.amount);
             $('#item-description').val(item.description || '');
+            $('#item-is-percentage').prop('checked', !!parseInt(item.is_percentage));
+            $('#item-percentage-base').val(item.percentage_base || 'running');
         } else {
             // Add mode
             $('#modal-title').text('Kostenpunkt hinzufügen');
             $('#cost-item-id').val('');
+            $('#item-percentage-base').val('running');
         }
         
+        updatePercentageFields(editIndex !== null ? costItems[editIndex].base_ref : null);
         modal.show();
     }
     
+    function updatePercentageFields(selectedRef) {
+        const isPercentage = $('#item-is-percentage').is(':checked');
+        const base = $('#item-percentage-base').val();
+        const refSelect = $('#item-base-ref');
+        const current = selectedRef !== undefined && selectedRef !== null ? selectedRef : refSelect.val();
+        
+        $('.percentage-base-row').toggle(isPercentage);
+        $('.percentage-ref-row').toggle(isPercentage && (base === 'category' || base === 'item'));
+        
+        refSelect.empty();
+        if (base === 'category') {
+            $.each(['grundkosten', 'gerichtskosten', 'anwaltskosten', 'sonstige'], function(i, category) {
+                refSelect.append($('<option>', { value: category, text: getCategoryName(category) }));
+            });
+        } else if (base === 'item') {
+            // Items are referenced by name, so references survive template copies
+            const editIndex = $('#cost-item-id').val();
+            $.each(costItems, function(index, item) {
+                if (String(index) !== editIndex) {
+                    refSelect.append($('<option>', { value: item.name, text: item.name }));
+                }
+            });
+        }
+        
+        if (current) {
+            refSelect.val(current);
+        }
+    }
+    
     function hideCostItemModal() {
         $('#cost-item-modal').hide();
     }
@@ -218,10 +258,17 @@ jQuery(document).ready(function($) {
             category: $('#item-category').val(),
             amount: parseFloat($('#item-amount').val()),
             description: $('#item-description').val(),
-            is_percentage: false,
+            is_percentage: $('#item-is-percentage').is(':checked') ? 1 : 0,
+            percentage_base: null,
+            base_ref: null,
             sort_order: costItems.length
         };
         
+        if (item.is_percentage) {
+            item.percentage_base = $('#item-percentage-base').val();
+            item.base_ref = (item.percentage_base === 'category' || item.percentage_base === 'item') ? $('#item-base-ref').val() : null;
+        }
+        
         // Validate
         if (!item.name || !item.category || isNaN(item.amount)) {
             showNotice('Bitte füllen Sie alle erforderlichen Felder aus', 'error');
@@ -229,7 +276,9 @@ jQuery(document).ready(function($) {
         }
         
         if (editIndex !== '') {
-            // Edit existing item
+            // Edit existing item (keep id so the save updates instead of re-inserting)
+            item.id = costItems[parseInt(editIndex)].id;
+            item.sort_order = costItems[parseInt(editIndex)].sort_order;
             costItems[parseInt(editIndex)] = item;
         } else {
             // Add new item
@@ -254,26 +303,10 @@ jQuery(document).ready(function($) {
         showNotice('Kostenpunkt gelöscht', 'success');
     }
     
+    // Totals are calculated locally (financial-engine.js); the server recalculates on save
     function recalculateTotals() {
-        if (costItems.length === 0) {
-            updateCalculation({ subtotal: 0, vat_amount: 0, total_amount: 0, vat_rate: 19.00 });
-            return;
-        }
-        
-        $.ajax({
-            url: cah_case_financial.ajax_url,
-            type: 'POST',
-            data: {
-                action: 'calculate_financial_totals',
-                items: JSON.stringify(costItems),
-                nonce: cah_case_financial.nonce
-            },
-            success: function(response) {
-                if (response.success) {
-                    updateCalculation(response.data);
-                }
-            }
-        });
+        currentTotals = engine.calculateTotals(costItems, cah_case_financial.vat_rate);
+        updateCalculation(currentTotals);
     }
     
     function updateCalculation(totals) {
@@ -288,12 +321,7 @@ jQuery(document).ready(function($) {
             return;
         }
         
-        const totals = {
-            subtotal: parseFloat($('#calc-subtotal').text().replace(/[€\s,]/g, '').replace('.', '')/100),
-            vat_rate: 19.00,
-            vat_amount: parseFloat($('#calc-vat').text().replace(/[€\s,]/g, '').replace('.', '')/100),
-            total_amount: parseFloat($('#calc-total').text().replace(/[€\s,]/g, '').replace('.', '')/100)
-        };
+        const totals = currentTotals || engine.calculateTotals(costItems, cah_case_financial.vat_rate);
         
         showLoading();
         
@@ -305,13 +333,28 @@ jQuery(document).ready(function($) {
                 case_id: currentCaseId,
                 template_id: currentTemplate,
                 items: JSON.stringify(costItems),
-                totals: JSON.stringify(totals),
+                totals: JSON.stringify({
+                    subtotal: totals.subtotal,
+                    vat_rate: totals.vat_rate,
+                    vat_amount: totals.vat_amount,
+                    total_amount: totals.total_amount
+                }),
                 nonce: cah_case_financial.nonce
             },
             success: function(response) {
                 hideLoading();
                 
                 if (response.success) {
+                    // Adopt stored ids so the next save is a minimal diff
+                    if (response.data.items) {
+                        costItems = response.data.items;
+                        renderCostItems();
+                    }
+                    // Server totals are authoritative (identical unless the engines drifted)
+                    if (response.data.totals) {
+                        currentTotals = response.data.totals;
+                        updateCalculation(currentTotals);
+                    }
                     showNotice(cah_case_financial.strings.save_success, 'success');
                 } else {
                     showNotice(cah_case_financial.strings.save_error, 'error');
@@ -370,7 +413,7 @@ jQuery(document).ready(function($) {
     
     // Utility functions
     function formatCurrency(amount) {
-        return cah_case_financial.currency_symbol + ' ' + parseFloat(amount).toFixed(2).replace('.', ',');
+        return engine.formatCurrency(amount);
     }
     
     function getCategoryName(category) {
@@ -0,0 +1,189 @@
+/**
+ * Financial Calculation Engine (client side)
+ * Port of CAH_Financial_Calculation_Graph / CAH_Financial_Calculator_Engine
+ * so the case financial tab can show totals without a server round trip.
+ * Results must stay identical to PHP - see financial_parity_test.py.
+ */
+
+(function(root) {
+    'use strict';
+
+    const BASE_RUNNING = 'running';
+    const BASE_SUBTOTAL = 'subtotal';
+    const BASE_CATEGORY = 'category';
+    const BASE_ITEM = 'item';
+
+    const CATEGORIES = ['grundkosten', 'gerichtskosten', 'anwaltskosten', 'sonstige'];
+
+    // Same key as CAH_Financial_Calculation_Graph::node_key()
+    function nodeKey(item, index) {
+        return item.id && parseInt(item.id) ? 'id:' + parseInt(item.id) : 'row:' + index;
+    }
+
+    function isPercentage(item) {
+        return !!(item.is_percentage && item.is_percentage !== '0');
+    }
+
+    function toFloat(value) {
+        const number = parseFloat(value);
+        return isNaN(number) ? 0 : number;
+    }
+
+    // Same steps as CAH_Financial_Calculator_Engine::round_amount()
+    function roundAmount(value) {
+        value = toFloat(value);
+        const scaled = Number((Math.abs(value) * 100).toPrecision(15));
+        const rounded = Math.floor(scaled + 0.5) / 100;
+
+        if (rounded === 0) {
+            return 0;
+        }
+
+        return value < 0 ? -rounded : rounded;
+    }
+
+    function calculateTotals(costItems, vatRate) {
+        vatRate = toFloat(vatRate);
+
+        // Prototype-free maps, so names like "constructor" are plain keys
+        const items = Object.create(null);
+        const order = [];
+        const dependencies = Object.create(null);
+        const values = Object.create(null);
+        const evaluating = Object.create(null);
+        const errors = Object.create(null);
+
+        costItems.forEach(function(item, index) {
+            const key = nodeKey(item, index);
+            items[key] = item;
+            order.push(key);
+        });
+
+        // First item wins for duplicate names
+        const keysByName = Object.create(null);
+        order.forEach(function(key) {
+            const name = items[key].name === undefined || items[key].name === null ? '' : String(items[key].name);
+            if (!(name in keysByName)) {
+                keysByName[name] = key;
+            }
+        });
+
+        order.forEach(function(key, position) {
+            const item = items[key];
+            let deps = [];
+
+            if (isPercentage(item)) {
+                const base = item.percentage_base || BASE_RUNNING;
+                const baseRef = item.base_ref !== undefined && item.base_ref !== null ? String(item.base_ref) : '';
+
+                if (base === BASE_SUBTOTAL) {
+                    deps = order.filter(function(other) { return other !== key && !isPercentage(items[other]); });
+                } else if (base === BASE_CATEGORY) {
+                    deps = order.filter(function(other) { return other !== key && items[other].category === baseRef && !isPercentage(items[other]); });
+                } else if (base === BASE_ITEM) {
+                    const refKey = (baseRef in items) ? baseRef : (baseRef in keysByName ? keysByName[baseRef] : null);
+                    if (refKey === null || refKey === key) {
+                        errors[key] = 'Bezugsposition nicht gefunden: ' + baseRef;
+                    } else {
+                        deps = [refKey];
+                    }
+                } else {
+                    deps = order.slice(0, position);
+                }
+            }
+
+            dependencies[key] = deps;
+        });
+
+        function evaluate(key) {
+            if (key in values) {
+                return values[key];
+            }
+
+            if (evaluating[key]) {
+                errors[key] = 'Zirkulärer Bezug';
+                return 0;
+            }
+
+            evaluating[key] = true;
+
+            const item = items[key];
+            let amount = toFloat(item.amount);
+
+            if (isPercentage(item)) {
+                let baseAmount = 0;
+                dependencies[key].forEach(function(dependency) {
+                    baseAmount += evaluate(dependency);
+                });
+
+                amount = baseAmount * (amount / 100);
+            }
+
+            delete evaluating[key];
+
+            if (!(key in errors)) {
+                values[key] = amount;
+            }
+
+            return amount;
+        }
+
+        let subtotal = 0;
+        const groupedItems = {};
+        CATEGORIES.forEach(function(category) { groupedItems[category] = []; });
+
+        order.forEach(function(key) {
+            const item = items[key];
+            const amount = evaluate(key);
+
+            subtotal += amount;
+            (groupedItems[item.category] = groupedItems[item.category] || []).push({
+                id: item.id || null,
+                key: key,
+                name: item.name,
+                amount: amount,
+                is_percentage: item.is_percentage,
+                percentage_base: isPercentage(item) ? (item.percentage_base || BASE_RUNNING) : null,
+                base_ref: isPercentage(item) ? (item.base_ref || null) : null,
+                description: item.description || ''
+            });
+        });
+
+        const vatAmount = subtotal * (vatRate / 100);
+        const totalAmount = subtotal + vatAmount;
+
+        return {
+            subtotal: roundAmount(subtotal),
+            vat_rate: vatRate,
+            vat_amount: roundAmount(vatAmount),
+            total_amount: roundAmount(totalAmount),
+            grouped_items: groupedItems,
+            item_count: order.length,
+            values: values,
+            errors: errors
+        };
+    }
+
+    // Same output as CAH_Financial_Calculator_Engine::format_currency()
+    function formatCurrency(amount, includeSymbol) {
+        const rounded = roundAmount(amount);
+        const parts = Math.abs(rounded).toFixed(2).split('.');
+        const integer = parts[0].replace(/\B(?=(\d{3})+(?!\d))/g, '.');
+        const formatted = (rounded < 0 ? '-' : '') + integer + ',' + parts[1];
+
+        return includeSymbol === false ? formatted : '€ ' + formatted;
+    }
+
+    const engine = {
+        calculateTotals: calculateTotals,
+        formatCurrency: formatCurrency,
+        roundAmount: roundAmount,
+        nodeKey: nodeKey
+    };
+
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = engine;
+    } else {
+        root.CAHFinancialEngine = engine;
+    }
+})(typeof window !== 'undefined' ? window : this);
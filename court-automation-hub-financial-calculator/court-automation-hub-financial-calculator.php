@@ -24,6 +24,9 @@ define('CAH_FC_PLUGIN_VERSION', '1.0.6');
 // Main plugin class
 class CAH_Financial_Calculator_Plugin {
     
+    // Lazily created components (see init_components)
+    private $container;
+    
     public function __construct() {
         add_action('plugins_loaded', array($this, 'init'));
         register_activation_hook(__FILE__, array($this, 'activate'));
@@ -37,17 +40,24 @@ class CAH_Financial_Calculator_Plugin {
             return;
         }
         
+        $this->container = new CAH_Service_Container('financial');
+        
         // Load text domain
         load_plugin_textdomain('court-automation-hub-financial', false, dirname(plugin_basename(__FILE__)) . '/languages/');
         
-        // Include required files
-        $this->includes();
+        // Class autoloading
+        $this->register_autoloader();
+        
+        // Register component factories
+        $this->register_services();
         
         // Initialize components
         $this->init_components();
         
         // Add hooks
         $this->add_hooks();
+        
+        $this->container->finish_init();
     }
     
     private function is_core_plugin_active() {
@@ -62,26 +72,67 @@ class CAH_Financial_Calculator_Plugin {
         <?php
     }
     
-    private function includes() {
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-financial-db-manager.php';
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-financial-calculator.php';
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-financial-template-manager.php';
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-financial-admin.php';
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-financial-rest-api.php';
-        require_once CAH_FC_PLUGIN_PATH . 'includes/class-case-financial-integration.php';
+    /**
+     * Autoloader for the financial classes (loader class from the core plugin)
+     */
+    private function register_autoloader() {
+        static $registered = false;
+        
+        if ($registered) {
+            return;
+        }
+        $registered = true;
+        
+        $autoloader = new CAH_Autoloader('CAH_Financial_', CAH_FC_PLUGIN_PATH . 'includes', array(
+            'CAH_Financial_Calculator_Engine' => CAH_FC_PLUGIN_PATH . 'includes/class-financial-calculator.php',
+            'CAH_Case_Financial_Integration' => CAH_FC_PLUGIN_PATH . 'includes/class-case-financial-integration.php'
+        ));
+        $autoloader->register();
+    }
+    
+    private function register_services() {
+        $services = array(
+            'db_manager' => 'CAH_Financial_DB_Manager',
+            'calculator' => 'CAH_Financial_Calculator_Engine',
+            'template_manager' => 'CAH_Financial_Template_Manager',
+            'rollup' => 'CAH_Financial_Rollup',
+            'recompute_job' => 'CAH_Financial_Recompute_Job',
+            'admin' => 'CAH_Financial_Admin',
+            'rest_api' => 'CAH_Financial_REST_API',
+            'case_integration' => 'CAH_Case_Financial_Integration'
+        );
+        
+        foreach ($services as $id => $class) {
+            $this->container->set($id, function() use ($class) {
+                return new $class();
+            });
+        }
     }
     
     private function init_components() {
-        // Initialize database manager and create tables
-        $this->db_manager = new CAH_Financial_DB_Manager();
-        $this->db_manager->create_tables();
+        // Create or upgrade tables only when the schema version changed (was every request)
+        if (get_option('cah_financial_db_version') !== CAH_Financial_DB_Manager::DB_VERSION) {
+            $this->container->get('db_manager')->create_tables();
+        }
+        
+        // Components are created when the first hook they handle fires
+        $this->container->load_on(array('admin_menu', 'admin_init'), 'admin');
+        $this->container->load_on('rest_api_init', 'rest_api');
+        $this->container->load_on(array('admin_init', 'cah_case_created', 'cah_case_updated', 'cah_case_deleted', 'cah_cases_imported'), 'case_integration');
+        $this->container->load_on(array('cah_case_updated', 'cah_case_deleted', 'cah_financial_cases_changed', 'cah_financial_rollup_rebuild'), 'rollup');
+        $this->container->load_on('cah_financial_recompute_chunk', 'recompute_job');
         
-        // Initialize all components
-        $this->calculator = new CAH_Financial_Calculator_Engine();
-        $this->template_manager = new CAH_Financial_Template_Manager();
-        $this->admin = new CAH_Financial_Admin();
-        $this->rest_api = new CAH_Financial_REST_API();
-        $this->case_integration = new CAH_Case_Financial_Integration();
+        // Parallel recompute (wp cah recompute)
+        if (defined('WP_CLI') && WP_CLI) {
+            WP_CLI::add_command('cah recompute', 'CAH_Financial_Recompute_Command');
+        }
+    }
+    
+    /**
+     * Component (created on first access)
+     */
+    public function get_service($id) {
+        return $this->container ? $this->container->get($id) : null;
     }
     
     private function add_hooks() {
@@ -106,6 +157,8 @@ class CAH_Financial_Calculator_Plugin {
     }
     
     public function activate() {
+        $this->register_autoloader();
+        
         // Create database tables
         $db_manager = new CAH_Financial_DB_Manager();
         $db_manager->create_tables();
@@ -116,7 +169,9 @@ class CAH_Financial_Calculator_Plugin {
     }
     
     public function deactivate() {
-        // Clean up if needed
+        // Stop pending recompute and rollup rebuild chunks
+        wp_clear_scheduled_hook('cah_financial_recompute_chunk');
+        wp_clear_scheduled_hook('cah_financial_rollup_rebuild');
     }
 }
 
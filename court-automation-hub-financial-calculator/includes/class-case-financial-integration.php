@@ -12,11 +12,13 @@ class CAH_Case_Financial_Integration {
     private $db_manager;
     private $calculator;
     private $template_manager;
+    private $template_cache;
     
     public function __construct() {
         $this->db_manager = new CAH_Financial_DB_Manager();
         $this->calculator = new CAH_Financial_Calculator_Engine();
         $this->template_manager = new CAH_Financial_Template_Manager();
+        $this->template_cache = new CAH_Financial_Template_Cache();
         
         $this->init_hooks();
     }
@@ -26,6 +28,7 @@ class CAH_Case_Financial_Integration {
         add_action('cah_case_created', array($this, 'handle_case_created'));
         add_action('cah_case_updated', array($this, 'handle_case_updated'));
         add_action('cah_case_deleted', array($this, 'handle_case_deleted'));
+        add_action('cah_cases_imported', array($this, 'handle_cases_imported'));
         
         // AJAX handlers for financial tab
         add_action('wp_ajax_load_financial_templates', array($this, 'ajax_load_templates'));
@@ -47,14 +50,15 @@ class CAH_Case_Financial_Integration {
     public function enqueue_integration_scripts() {
         $screen = get_current_screen();
         if ($screen && strpos($screen->id, 'klage-click-cases') !== false) {
-            wp_enqueue_script('cah-case-financial', CAH_FC_PLUGIN_URL . 'assets/js/case-financial.js', array('jquery'), CAH_FC_PLUGIN_VERSION, true);
+            wp_enqueue_script('cah-financial-engine', CAH_FC_PLUGIN_URL . 'assets/js/financial-engine.js', array(), CAH_FC_PLUGIN_VERSION, true);
+            wp_enqueue_script('cah-case-financial', CAH_FC_PLUGIN_URL . 'assets/js/case-financial.js', array('jquery', 'cah-financial-engine'), CAH_FC_PLUGIN_VERSION, true);
             wp_enqueue_style('cah-case-financial', CAH_FC_PLUGIN_URL . 'assets/css/case-financial.css', array(), CAH_FC_PLUGIN_VERSION);
             
             wp_localize_script('cah-case-financial', 'cah_case_financial', array(
                 'ajax_url' => admin_url('admin-ajax.php'),
                 'nonce' => wp_create_nonce('cah_financial_nonce'),
                 'currency_symbol' => '€',
-                'vat_rate' => '19.00',
+                'vat_rate' => $this->calculator->get_vat_rate(),
                 'strings' => array(
                     'loading' => 'Laden...',
                     'error' => 'Fehler beim Laden',
@@ -162,6 +166,24 @@ class CAH_Case_Financial_Integration {
                                 <th><label for="item-amount">Betrag:</label></th>
                                 <td><input type="number" id="item-amount" step="0.01" min="0" required style="width: 100%;"></td>
                             </tr>
+                            <tr>
+                                <th><label for="item-is-percentage">Prozentual:</label></th>
+                                <td><label><input type="checkbox" id="item-is-percentage"> Betrag ist ein Prozentsatz</label></td>
+                            </tr>
+                            <tr class="percentage-base-row" style="display: none;">
+                                <th><label for="item-percentage-base">Berechnungsbasis:</label></th>
+                                <td>
+                                    <select id="item-percentage-base" style="width: 100%;">
+                                        <?php foreach (CAH_Financial_Calculation_Graph::get_base_types() as $base => $label): ?>
+                                        <option value="<?php echo esc_attr($base); ?>"><?php echo esc_html($label); ?></option>
+                                        <?php endforeach; ?>
+                                    </select>
+                                </td>
+                            </tr>
+                            <tr class="percentage-ref-row" style="display: none;">
+                                <th><label for="item-base-ref">Bezug:</label></th>
+                                <td><select id="item-base-ref" style="width: 100%;"></select></td>
+                            </tr>
                             <tr>
                                 <th><label for="item-description">Beschreibung:</label></th>
                                 <td><textarea id="item-description" rows="3" style="width: 100%;"></textarea></td>
@@ -228,7 +250,7 @@ class CAH_Case_Financial_Integration {
     public function ajax_load_templates() {
         check_ajax_referer('cah_financial_nonce', 'nonce');
         
-        $templates = $this->db_manager->get_templates();
+        $templates = $this->template_cache->get_templates();
         
         wp_send_json_success($templates);
     }
@@ -241,12 +263,15 @@ class CAH_Case_Financial_Integration {
             wp_send_json_error('Invalid template ID');
         }
         
-        $items = $this->db_manager->get_cost_items_by_template($template_id);
-        $totals = $this->calculator->calculate_totals($items);
+        // Items and totals are precomputed in the template cache
+        $entry = $this->template_cache->get_template_entry($template_id);
+        if (!$entry) {
+            wp_send_json_error('Invalid template ID');
+        }
         
         wp_send_json_success(array(
-            'items' => $items,
-            'totals' => $totals
+            'items' => $entry['items'],
+            'totals' => $entry['totals']
         ));
     }
     
@@ -265,7 +290,10 @@ class CAH_Case_Financial_Integration {
             $items[] = $item;
         }
         
-        $totals = $this->calculator->calculate_totals($items);
+        // With a case the stored items are reused and only edited items recomputed
+        $case_id = isset($_POST['case_id']) ? intval($_POST['case_id']) : 0;
+        
+        $totals = $this->calculator->recalculate_totals($case_id, $items);
         
         wp_send_json_success($totals);
     }
@@ -282,50 +310,23 @@ class CAH_Case_Financial_Integration {
             wp_send_json_error('Invalid case ID');
         }
         
-        // Save or update case financial record
-        $existing_financial = $this->db_manager->get_case_financial($case_id);
-        
-        if ($existing_financial) {
-            $this->db_manager->update_case_financial($case_id, array(
-                'template_id' => $template_id,
-                'subtotal' => $totals_data['subtotal'],
-                'vat_rate' => $totals_data['vat_rate'],
-                'vat_amount' => $totals_data['vat_amount'],
-                'total_amount' => $totals_data['total_amount']
-            ));
-        } else {
-            $this->db_manager->create_case_financial($case_id, $template_id);
-            $this->db_manager->update_case_financial($case_id, array(
-                'subtotal' => $totals_data['subtotal'],
-                'vat_rate' => $totals_data['vat_rate'],
-                'vat_amount' => $totals_data['vat_amount'],
-                'total_amount' => $totals_data['total_amount']
-            ));
-        }
+        // Totals are recalculated here; the client values are only a preview
+        $vat_rate = isset($totals_data['vat_rate']) && is_numeric($totals_data['vat_rate']) ? floatval($totals_data['vat_rate']) : null;
+        $totals = $this->calculator->calculate_totals($items_data ?: array(), $vat_rate);
         
-        // Delete existing case cost items and create new ones
-        $this->db_manager->wpdb->delete(
-            $this->db_manager->wpdb->prefix . 'cah_cost_items',
-            array('case_id' => $case_id),
-            array('%d')
-        );
+        // Diff against stored items, written in one transaction
+        $result = $this->db_manager->save_case_financial_diff($case_id, $template_id, $items_data ?: array(), $totals);
         
-        if ($items_data) {
-            foreach ($items_data as $item) {
-                $this->db_manager->create_cost_item(
-                    null,
-                    $case_id,
-                    $item['name'],
-                    $item['category'],
-                    $item['amount'],
-                    $item['description'] ?: '',
-                    false,
-                    $item['sort_order'] ?: 0
-                );
-            }
+        if (is_wp_error($result)) {
+            wp_send_json_error($result->get_error_message());
         }
         
-        wp_send_json_success('Financial data saved successfully');
+        wp_send_json_success(array(
+            'message' => 'Financial data saved successfully',
+            'changes' => $result,
+            'items' => $this->db_manager->get_cost_items_by_case($case_id),
+            'totals' => $totals
+        ));
     }
     
     public function ajax_save_as_template() {
@@ -369,4 +370,27 @@ class CAH_Case_Financial_Integration {
         // Clean up financial data when case is deleted
         $this->db_manager->delete_case_financial($case_id);
     }
+    
+    /**
+     * Apply the default template to newly imported cases (one INSERT ... SELECT per chunk)
+     */
+    public function handle_cases_imported($case_ids) {
+        $default_template = null;
+        foreach ($this->template_cache->get_templates() as $template) {
+            if ($template->is_default) {
+                $default_template = $template;
+                break;
+            }
+        }
+        
+        if (!$default_template || empty($case_ids)) {
+            return;
+        }
+        
+        $result = $this->calculator->copy_template_items_to_cases($default_template->id, $case_ids);
+        
+        if (is_wp_error($result) && get_option('klage_click_debug_mode')) {
+            error_log('Klage.Click financial template import failed: ' . $result->get_error_message());
+        }
+    }
 }
\ No newline at end of file
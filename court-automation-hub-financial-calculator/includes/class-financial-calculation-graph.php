@@ -0,0 +1,337 @@
+<?php
+/**
+ * Financial Calculation Graph - Dependency-aware evaluation of cost items
+ * Percentage items declare their base (running total, subtotal of fixed
+ * items, a category or a single item). Values are memoized per node; after
+ * an edit only the changed node and its transitive dependents are recomputed.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Financial_Calculation_Graph {
+
+    // Legacy: sum of all items before this one (order dependent)
+    const BASE_RUNNING = 'running';
+
+    // Sum of all fixed (non-percentage) items
+    const BASE_SUBTOTAL = 'subtotal';
+
+    // Sum of the fixed items of the category named in base_ref
+    const BASE_CATEGORY = 'category';
+
+    // Single item referenced by base_ref (item name or node key)
+    const BASE_ITEM = 'item';
+
+    // Node key => item object
+    private $items = array();
+
+    // Node keys in item order
+    private $order = array();
+
+    // Node key => array of node keys it depends on
+    private $dependencies = array();
+
+    // Node key => array(dependent node key => true)
+    private $dependents = array();
+
+    // Memoized node values
+    private $values = array();
+
+    // Nodes currently being evaluated (cycle detection)
+    private $evaluating = array();
+
+    // Node key => error message
+    private $errors = array();
+
+    // Nodes computed since the last get_totals()
+    private $evaluated = 0;
+
+    public function __construct($cost_items) {
+        foreach (array_values($cost_items) as $index => $item) {
+            $item = (object) $item;
+            $key = self::node_key($item, $index);
+
+            $this->items[$key] = $item;
+            $this->order[] = $key;
+        }
+
+        $this->build_edges();
+    }
+
+    /**
+     * Stable node key: stored items by id, unsaved items by row
+     */
+    public static function node_key($item, $index) {
+        return !empty($item->id) ? 'id:' . intval($item->id) : 'row:' . intval($index);
+    }
+
+    /**
+     * Allowed percentage bases
+     */
+    public static function get_base_types() {
+        return array(
+            self::BASE_RUNNING => 'Laufende Summe (vorherige Positionen)',
+            self::BASE_SUBTOTAL => 'Zwischensumme (feste Beträge)',
+            self::BASE_CATEGORY => 'Kategorie (feste Beträge)',
+            self::BASE_ITEM => 'Einzelne Position'
+        );
+    }
+
+    /**
+     * Resolve dependencies of all nodes
+     */
+    private function build_edges() {
+        $this->dependencies = array();
+        $this->dependents = array();
+        $this->errors = array();
+
+        // First item wins for duplicate names
+        $keys_by_name = array();
+        foreach ($this->order as $key) {
+            $name = (string) $this->items[$key]->name;
+            if (!isset($keys_by_name[$name])) {
+                $keys_by_name[$name] = $key;
+            }
+        }
+
+        foreach ($this->order as $position => $key) {
+            $item = $this->items[$key];
+            $dependencies = array();
+
+            if (!empty($item->is_percentage)) {
+                $base = !empty($item->percentage_base) ? $item->percentage_base : self::BASE_RUNNING;
+                $base_ref = isset($item->base_ref) ? (string) $item->base_ref : '';
+
+                switch ($base) {
+                    case self::BASE_SUBTOTAL:
+                        foreach ($this->order as $other) {
+                            if ($other !== $key && empty($this->items[$other]->is_percentage)) {
+                                $dependencies[] = $other;
+                            }
+                        }
+                        break;
+
+                    case self::BASE_CATEGORY:
+                        foreach ($this->order as $other) {
+                            // Percentage items of the category are left out, else two of them form a cycle
+                            if ($other !== $key && $this->items[$other]->category === $base_ref && empty($this->items[$other]->is_percentage)) {
+                                $dependencies[] = $other;
+                            }
+                        }
+                        break;
+
+                    case self::BASE_ITEM:
+                        $ref_key = isset($this->items[$base_ref]) ? $base_ref : ($keys_by_name[$base_ref] ?? null);
+                        if ($ref_key === null || $ref_key === $key) {
+                            $this->errors[$key] = 'Bezugsposition nicht gefunden: ' . $base_ref;
+                        } else {
+                            $dependencies[] = $ref_key;
+                        }
+                        break;
+
+                    default:
+                        $dependencies = array_slice($this->order, 0, $position);
+                }
+            }
+
+            $this->dependencies[$key] = $dependencies;
+
+            foreach ($dependencies as $dependency) {
+                $this->dependents[$dependency][$key] = true;
+            }
+        }
+    }
+
+    /**
+     * Evaluate a node (memoized)
+     */
+    public function evaluate($key) {
+        if (array_key_exists($key, $this->values)) {
+            return $this->values[$key];
+        }
+
+        if (!isset($this->items[$key])) {
+            return 0.0;
+        }
+
+        if (isset($this->evaluating[$key])) {
+            $this->errors[$key] = 'Zirkulärer Bezug';
+            return 0.0;
+        }
+
+        $this->evaluating[$key] = true;
+
+        $item = $this->items[$key];
+        $amount = floatval($item->amount);
+
+        if (!empty($item->is_percentage)) {
+            $base_amount = 0.0;
+            foreach ($this->dependencies[$key] as $dependency) {
+                $base_amount += $this->evaluate($dependency);
+            }
+
+            $amount = $base_amount * ($amount / 100);
+        }
+
+        unset($this->evaluating[$key]);
+
+        // Nodes on a cycle are not memoized as they may be incomplete
+        if (!isset($this->errors[$key])) {
+            $this->values[$key] = $amount;
+        }
+
+        $this->evaluated++;
+
+        return $amount;
+    }
+
+    /**
+     * Change one item; returns the node keys whose values were dropped
+     */
+    public function update_item($key, $item) {
+        $item = (object) $item;
+        $previous = $this->items[$key] ?? null;
+
+        if ($previous === null || !$this->item_changed($previous, $item)) {
+            return array();
+        }
+
+        // Dependents under the old edges
+        $invalidated = $this->invalidate(array($key));
+
+        $this->items[$key] = $item;
+
+        // Base, category, type or name changes move edges
+        if ($this->structure_changed($previous, $item)) {
+            $this->build_edges();
+            $invalidated = array_unique(array_merge($invalidated, $this->invalidate(array($key))));
+        }
+
+        return $invalidated;
+    }
+
+    /**
+     * Drop memoized values of the given nodes and all transitive dependents
+     */
+    public function invalidate($keys) {
+        $queue = array_values((array) $keys);
+        $invalidated = array();
+
+        while (!empty($queue)) {
+            $key = array_shift($queue);
+            if (isset($invalidated[$key])) {
+                continue;
+            }
+
+            $invalidated[$key] = true;
+            unset($this->values[$key]);
+
+            foreach (array_keys($this->dependents[$key] ?? array()) as $dependent) {
+                $queue[] = $dependent;
+            }
+        }
+
+        return array_keys($invalidated);
+    }
+
+    /**
+     * Node keys in item order
+     */
+    public function get_keys() {
+        return $this->order;
+    }
+    
+    /**
+     * Seed memo with values of a previous server-side evaluation of the same items
+     */
+    public function seed_values($values) {
+        foreach ((array) $values as $key => $value) {
+            if (isset($this->items[$key]) && is_numeric($value)) {
+                $this->values[$key] = floatval($value);
+            }
+        }
+    }
+
+    /**
+     * Whether an edit changes the node value or the graph shape
+     */
+    private function item_changed($previous, $item) {
+        return floatval($previous->amount ?? 0) !== floatval($item->amount ?? 0)
+            || $this->structure_changed($previous, $item);
+    }
+    
+    /**
+     * Whether an edit changes the graph shape
+     */
+    private function structure_changed($previous, $item) {
+        return self::shape($previous) !== self::shape($item);
+    }
+
+    /**
+     * Fields that define the edges of an item; empty and NULL bases are the
+     * same, and fixed items have none (stored "0"/"" vs submitted false/null)
+     */
+    private static function shape($item) {
+        $is_percentage = !empty($item->is_percentage);
+        $base_ref = $is_percentage && isset($item->base_ref) ? (string) $item->base_ref : '';
+
+        return array(
+            (string) ($item->name ?? ''),
+            (string) ($item->category ?? ''),
+            $is_percentage,
+            $is_percentage ? (!empty($item->percentage_base) ? (string) $item->percentage_base : self::BASE_RUNNING) : null,
+            $base_ref !== '' ? $base_ref : null
+        );
+    }
+
+    /**
+     * Evaluate all nodes and build totals (calculate_totals format)
+     */
+    public function get_totals($vat_rate) {
+        $subtotal = 0;
+        $grouped_items = array(
+            'grundkosten' => array(),
+            'gerichtskosten' => array(),
+            'anwaltskosten' => array(),
+            'sonstige' => array()
+        );
+
+        foreach ($this->order as $key) {
+            $item = $this->items[$key];
+            $amount = $this->evaluate($key);
+            $is_percentage = !empty($item->is_percentage);
+
+            $subtotal += $amount;
+            $grouped_items[$item->category][] = array(
+                'id' => $item->id ?? null,
+                'key' => $key,
+                'name' => $item->name,
+                'amount' => $amount,
+                'is_percentage' => $item->is_percentage,
+                'percentage_base' => $is_percentage ? (!empty($item->percentage_base) ? $item->percentage_base : self::BASE_RUNNING) : null,
+                'base_ref' => $is_percentage ? ($item->base_ref ?? null) : null,
+                'description' => $item->description ?? ''
+            );
+        }
+
+        $vat_amount = $subtotal * ($vat_rate / 100);
+        $total_amount = $subtotal + $vat_amount;
+
+        $evaluated = $this->evaluated;
+        $this->evaluated = 0;
+
+        return array(
+            'subtotal' => CAH_Financial_Calculator_Engine::round_amount($subtotal),
+            'vat_rate' => $vat_rate,
+            'vat_amount' => CAH_Financial_Calculator_Engine::round_amount($vat_amount),
+            'total_amount' => CAH_Financial_Calculator_Engine::round_amount($total_amount),
+            'grouped_items' => $grouped_items,
+            'item_count' => count($this->order),
+            'values' => $this->values,
+            'evaluated' => $evaluated,
+            'errors' => $this->errors
+        );
+    }
+}
@@ -11,8 +11,12 @@ class CAH_Financial_Calculator_Engine {
     
     private $vat_rate = 19.00; // Default German VAT rate
     
+    // Stored items of a case and their node values (see recalculate_totals)
+    const VALUES_CACHE_GROUP = 'cah_financial_values';
+    
     public function __construct() {
-        // Constructor
+        // Rate can be changed in one place (re-price with the recompute job)
+        $this->vat_rate = floatval(get_option('cah_financial_vat_rate', $this->vat_rate));
     }
     
     /**
@@ -23,81 +27,138 @@ class CAH_Financial_Calculator_Engine {
             $vat_rate = $this->vat_rate;
         }
         
-        $subtotal = 0;
-        $grouped_items = array(
-            'grundkosten' => array(),
-            'gerichtskosten' => array(),
-            'anwaltskosten' => array(),
-            'sonstige' => array()
-        );
+        $graph = new CAH_Financial_Calculation_Graph($cost_items);
         
-        foreach ($cost_items as $item) {
-            $amount = floatval($item->amount);
-            
-            // Handle percentage-based items
-            if ($item->is_percentage) {
-                // For percentage items, we need the base amount to calculate from
-                // This would typically be implemented based on business rules
-                $amount = $this->calculate_percentage_amount($amount, $subtotal);
-            }
-            
-            $subtotal += $amount;
-            $grouped_items[$item->category][] = array(
-                'id' => $item->id,
-                'name' => $item->name,
-                'amount' => $amount,
-                'is_percentage' => $item->is_percentage,
-                'description' => $item->description
-            );
+        return $graph->get_totals($vat_rate);
+    }
+    
+    /**
+     * Round to cents, half away from zero
+     * Scaled value is cut to 15 significant digits first so binary noise
+     * (1.005 * 100 = 100.49999...) doesn't flip the result. financial-engine.js
+     * and financial_calculator.py implement the same steps.
+     */
+    public static function round_amount($value) {
+        $value = floatval($value);
+        $scaled = (float) sprintf('%.15g', abs($value) * 100);
+        $rounded = floor($scaled + 0.5) / 100;
+        
+        if ($rounded == 0) {
+            return 0.0;
         }
         
-        $vat_amount = $subtotal * ($vat_rate / 100);
-        $total_amount = $subtotal + $vat_amount;
+        return $value < 0 ? -$rounded : $rounded;
+    }
+    
+    /**
+     * Default VAT rate
+     */
+    public function get_vat_rate() {
+        return $this->vat_rate;
+    }
+    
+    /**
+     * Recalculate edited items of a case, reusing the values of its stored items
+     * save_case_financial_diff remembers the saved items and their values under
+     * the case's items version; only edited items, matched by id, and their
+     * dependents are evaluated again. No memo, or added, removed or reordered
+     * items: full calculation (no database reads either way).
+     */
+    public function recalculate_totals($case_id, $cost_items, $vat_rate = null) {
+        if ($vat_rate === null) {
+            $vat_rate = $this->vat_rate;
+        }
         
-        return array(
-            'subtotal' => round($subtotal, 2),
-            'vat_rate' => $vat_rate,
-            'vat_amount' => round($vat_amount, 2),
-            'total_amount' => round($total_amount, 2),
-            'grouped_items' => $grouped_items,
-            'item_count' => count($cost_items)
-        );
+        $cost_items = array_values($cost_items);
+        $memo = $case_id ? self::get_case_memo($case_id) : null;
+        
+        if (!$memo) {
+            return $this->calculate_totals($cost_items, $vat_rate);
+        }
+        
+        $keys = array();
+        foreach ($cost_items as $index => $item) {
+            $keys[] = CAH_Financial_Calculation_Graph::node_key((object) $item, $index);
+        }
+        
+        $graph = new CAH_Financial_Calculation_Graph($memo['items']);
+        
+        if ($keys !== $graph->get_keys()) {
+            return $this->calculate_totals($cost_items, $vat_rate);
+        }
+        
+        $graph->seed_values($memo['values']);
+        
+        foreach ($cost_items as $index => $item) {
+            $graph->update_item($keys[$index], $item);
+        }
+        
+        return $graph->get_totals($vat_rate);
+    }
+    
+    /**
+     * Remember the stored items of a case and their node values (after a save)
+     */
+    public static function remember_case_items($case_id, $items) {
+        $graph = new CAH_Financial_Calculation_Graph($items);
+        $totals = $graph->get_totals(0);
+        
+        wp_cache_set('case_' . intval($case_id), array(
+            'version' => self::case_items_changed($case_id),
+            'items' => array_values($items),
+            'values' => $totals['values']
+        ), self::VALUES_CACHE_GROUP, HOUR_IN_SECONDS);
+    }
+    
+    /**
+     * Give cases whose stored items changed a new items version (orphans their memo)
+     * Returns the new version of the last case
+     */
+    public static function case_items_changed($case_ids) {
+        $version = null;
+        
+        foreach ((array) $case_ids as $case_id) {
+            $version = uniqid('', true);
+            wp_cache_set('version_' . intval($case_id), $version, self::VALUES_CACHE_GROUP);
+        }
+        
+        return $version;
     }
     
     /**
-     * Calculate percentage-based amount
+     * Memo of a case if it belongs to the current items version
      */
-    private function calculate_percentage_amount($percentage, $base_amount) {
-        return $base_amount * ($percentage / 100);
+    private static function get_case_memo($case_id) {
+        $case_id = intval($case_id);
+        $cached = wp_cache_get_multiple(array('case_' . $case_id, 'version_' . $case_id), self::VALUES_CACHE_GROUP);
+        
+        $memo = $cached['case_' . $case_id];
+        $version = $cached['version_' . $case_id];
+        
+        return $memo && $version !== false && $memo['version'] === $version ? $memo : null;
     }
     
     /**
-     * Create cost items from template
+     * Create cost items from template (case totals are updated)
+     * Returns array('ranges', 'count', 'totals') of the created items
      */
     public function copy_template_items_to_case($template_id, $case_id) {
-        $db_manager = new CAH_Financial_DB_Manager();
-        $template_items = $db_manager->get_cost_items_by_template($template_id);
-        
-        $copied_items = array();
-        
-        foreach ($template_items as $item) {
-            $new_item_id = $db_manager->create_cost_item(
-                null, // No template_id for case-specific items
-                $case_id,
-                $item->name,
-                $item->category,
-                $item->amount,
-                $item->description,
-                $item->is_percentage,
-                $item->sort_order
-            );
-            
-            if ($new_item_id) {
-                $copied_items[] = $new_item_id;
-            }
+        $results = $this->copy_template_items_to_cases($template_id, array($case_id));
+        
+        if (is_wp_error($results)) {
+            return $results;
         }
         
-        return $copied_items;
+        return $results[intval($case_id)] ?? array('ranges' => array(), 'count' => 0, 'totals' => null);
+    }
+    
+    /**
+     * Create cost items from template for a batch of cases (e.g. after an import)
+     * Returns array case_id => array('ranges', 'count', 'totals')
+     */
+    public function copy_template_items_to_cases($template_id, $case_ids) {
+        $db_manager = new CAH_Financial_DB_Manager();
+        return $db_manager->materialize_template_for_cases($template_id, $case_ids);
     }
     
     /**
@@ -158,6 +219,16 @@ class CAH_Financial_Calculator_Engine {
             $errors[] = 'Betrag muss eine positive Zahl sein';
         }
         
+        if (!empty($data['is_percentage']) && !empty($data['percentage_base'])) {
+            if (!array_key_exists($data['percentage_base'], CAH_Financial_Calculation_Graph::get_base_types())) {
+                $errors[] = 'Ungültige Berechnungsbasis';
+            } elseif ($data['percentage_base'] === CAH_Financial_Calculation_Graph::BASE_CATEGORY && !array_key_exists($data['base_ref'] ?? '', $this->get_category_names())) {
+                $errors[] = 'Ungültige Bezugskategorie';
+            } elseif ($data['percentage_base'] === CAH_Financial_Calculation_Graph::BASE_ITEM && empty($data['base_ref'])) {
+                $errors[] = 'Bezugsposition ist erforderlich';
+            }
+        }
+        
         return $errors;
     }
     
@@ -165,7 +236,7 @@ class CAH_Financial_Calculator_Engine {
      * Format currency for display
      */
     public function format_currency($amount, $include_symbol = true) {
-        $formatted = number_format($amount, 2, ',', '.');
+        $formatted = number_format(self::round_amount($amount), 2, ',', '.');
         return $include_symbol ? '€ ' . $formatted : $formatted;
     }
     
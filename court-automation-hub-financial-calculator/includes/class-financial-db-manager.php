@@ -11,6 +11,9 @@ class CAH_Financial_DB_Manager {
     
     private $wpdb;
     
+    // Bumped when existing tables need ALTERs (see upgrade_tables)
+    const DB_VERSION = '1.3.0';
+    
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
@@ -41,6 +44,8 @@ class CAH_Financial_DB_Manager {
                 amount decimal(10,2) NOT NULL DEFAULT 0.00,
                 description text,
                 is_percentage tinyint(1) DEFAULT 0,
+                percentage_base varchar(20) DEFAULT NULL,
+                base_ref varchar(255) DEFAULT NULL,
                 sort_order int(11) DEFAULT 0,
                 created_at datetime DEFAULT CURRENT_TIMESTAMP,
                 updated_at datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -66,6 +71,31 @@ class CAH_Financial_DB_Manager {
                 UNIQUE KEY unique_case (case_id),
                 INDEX idx_template_id (template_id),
                 FOREIGN KEY (template_id) REFERENCES {$this->wpdb->prefix}cah_financial_templates(id) ON DELETE SET NULL
+            ) $charset_collate",
+            
+            // Reporting cube (see CAH_Financial_Rollup); template_id 0 = no template
+            'cah_financial_rollup' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}cah_financial_rollup (
+                month char(7) NOT NULL,
+                template_id int(11) NOT NULL DEFAULT 0,
+                category varchar(20) NOT NULL,
+                case_status varchar(20) NOT NULL,
+                case_count int(11) NOT NULL DEFAULT 0,
+                item_count int(11) NOT NULL DEFAULT 0,
+                amount decimal(15,2) NOT NULL DEFAULT 0.00,
+                PRIMARY KEY (month, template_id, category, case_status),
+                INDEX idx_category_month (category, month)
+            ) $charset_collate",
+            
+            // Current contribution of each case to the cube
+            'cah_financial_rollup_cases' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}cah_financial_rollup_cases (
+                case_id int(11) NOT NULL,
+                category varchar(20) NOT NULL,
+                month char(7) NOT NULL,
+                template_id int(11) NOT NULL DEFAULT 0,
+                case_status varchar(20) NOT NULL,
+                item_count int(11) NOT NULL DEFAULT 0,
+                amount decimal(12,2) NOT NULL DEFAULT 0.00,
+                PRIMARY KEY (case_id, category)
             ) $charset_collate"
         );
         
@@ -74,11 +104,45 @@ class CAH_Financial_DB_Manager {
         foreach ($tables as $table_name => $sql) {
             dbDelta($sql);
         }
+        
+        $this->upgrade_tables();
+    }
+    
+    /**
+     * Add columns introduced after the initial release
+     */
+    private function upgrade_tables() {
+        $installed = get_option('cah_financial_db_version', '1.0.0');
+        
+        if (version_compare($installed, self::DB_VERSION, '>=')) {
+            return;
+        }
+        
+        $items_table = $this->wpdb->prefix . 'cah_cost_items';
+        $columns = $this->wpdb->get_col("SHOW COLUMNS FROM $items_table");
+        
+        // Percentage base for the calculation graph (1.1.0)
+        if ($columns && !in_array('percentage_base', $columns)) {
+            $this->wpdb->query("ALTER TABLE $items_table ADD COLUMN percentage_base varchar(20) DEFAULT NULL AFTER is_percentage, ADD COLUMN base_ref varchar(255) DEFAULT NULL AFTER percentage_base");
+        }
+        
+        // Empty percentage bases are stored as NULL (1.3.0)
+        if ($columns && version_compare($installed, '1.3.0', '<')) {
+            $this->wpdb->query("UPDATE $items_table SET percentage_base = NULLIF(percentage_base, ''), base_ref = NULLIF(base_ref, '') WHERE percentage_base = '' OR base_ref = ''");
+        }
+        
+        // Fill the reporting cube from existing cases (1.2.0)
+        if (version_compare($installed, '1.2.0', '<') && class_exists('CAH_Financial_Rollup')) {
+            $rollup = new CAH_Financial_Rollup();
+            $rollup->start_rebuild();
+        }
+        
+        update_option('cah_financial_db_version', self::DB_VERSION);
     }
     
     // Template CRUD operations
     public function create_template($name, $description = '', $is_default = false) {
-        return $this->wpdb->insert(
+        $result = $this->wpdb->insert(
             $this->wpdb->prefix . 'cah_financial_templates',
             array(
                 'name' => $name,
@@ -87,6 +151,14 @@ class CAH_Financial_DB_Manager {
             ),
             array('%s', '%s', '%d')
         );
+        
+        if (!$result) {
+            return false;
+        }
+        
+        $this->invalidate_template_cache(null, true);
+        
+        return $this->wpdb->insert_id;
     }
     
     public function get_template($id) {
@@ -106,13 +178,17 @@ class CAH_Financial_DB_Manager {
     }
     
     public function update_template($id, $data) {
-        return $this->wpdb->update(
+        $result = $this->wpdb->update(
             $this->wpdb->prefix . 'cah_financial_templates',
             $data,
             array('id' => $id),
             null,
             array('%d')
         );
+        
+        $this->invalidate_template_cache($id, true);
+        
+        return $result;
     }
     
     public function delete_template($id) {
@@ -124,16 +200,20 @@ class CAH_Financial_DB_Manager {
         );
         
         // Then delete template
-        return $this->wpdb->delete(
+        $result = $this->wpdb->delete(
             $this->wpdb->prefix . 'cah_financial_templates',
             array('id' => $id),
             array('%d')
         );
+        
+        $this->invalidate_template_cache($id, true);
+        
+        return $result;
     }
     
     // Cost Item CRUD operations
-    public function create_cost_item($template_id, $case_id, $name, $category, $amount, $description = '', $is_percentage = false, $sort_order = 0) {
-        return $this->wpdb->insert(
+    public function create_cost_item($template_id, $case_id, $name, $category, $amount, $description = '', $is_percentage = false, $sort_order = 0, $percentage_base = null, $base_ref = null) {
+        $result = $this->wpdb->insert(
             $this->wpdb->prefix . 'cah_cost_items',
             array(
                 'template_id' => $template_id,
@@ -143,9 +223,35 @@ class CAH_Financial_DB_Manager {
                 'amount' => $amount,
                 'description' => $description,
                 'is_percentage' => $is_percentage ? 1 : 0,
-                'sort_order' => $sort_order
+                'sort_order' => $sort_order,
+                'percentage_base' => $is_percentage && $percentage_base ? $percentage_base : null,
+                'base_ref' => $is_percentage && $percentage_base && (string) $base_ref !== '' ? $base_ref : null
             ),
-            array('%d', '%d', '%s', '%s', '%f', '%s', '%d', '%d')
+            array('%d', '%d', '%s', '%s', '%f', '%s', '%d', '%d', '%s', '%s')
+        );
+        
+        if (!$result) {
+            return false;
+        }
+        
+        // Case items are not part of the template cache
+        if ($template_id && !$case_id) {
+            $this->invalidate_template_cache($template_id);
+        }
+        
+        if ($case_id) {
+            $this->case_items_changed(array($case_id));
+        }
+        
+        return $this->wpdb->insert_id;
+    }
+    
+    public function get_cost_item($id) {
+        return $this->wpdb->get_row(
+            $this->wpdb->prepare(
+                "SELECT * FROM {$this->wpdb->prefix}cah_cost_items WHERE id = %d",
+                $id
+            )
         );
     }
     
@@ -168,21 +274,323 @@ class CAH_Financial_DB_Manager {
     }
     
     public function update_cost_item($id, $data) {
-        return $this->wpdb->update(
+        $owner = $this->get_item_owner($id);
+        
+        // Empty bases are stored as NULL
+        foreach (array('percentage_base', 'base_ref') as $field) {
+            if (array_key_exists($field, $data) && (string) $data[$field] === '') {
+                $data[$field] = null;
+            }
+        }
+        
+        $result = $this->wpdb->update(
             $this->wpdb->prefix . 'cah_cost_items',
             $data,
             array('id' => $id),
             null,
             array('%d')
         );
+        
+        $this->item_owner_changed($owner);
+        
+        return $result;
     }
     
     public function delete_cost_item($id) {
-        return $this->wpdb->delete(
+        $owner = $this->get_item_owner($id);
+        
+        $result = $this->wpdb->delete(
             $this->wpdb->prefix . 'cah_cost_items',
             array('id' => $id),
             array('%d')
         );
+        
+        $this->item_owner_changed($owner);
+        
+        return $result;
+    }
+    
+    /**
+     * Template or case a cost item belongs to (null for unknown items)
+     */
+    private function get_item_owner($item_id) {
+        return $this->wpdb->get_row($this->wpdb->prepare(
+            "SELECT template_id, case_id FROM {$this->wpdb->prefix}cah_cost_items WHERE id = %d",
+            $item_id
+        ));
+    }
+    
+    /**
+     * Invalidate the template cache or the case's calculation memo after an item write
+     */
+    private function item_owner_changed($owner) {
+        if (!$owner) {
+            return;
+        }
+        
+        if ($owner->case_id) {
+            $this->case_items_changed(array($owner->case_id));
+        } elseif ($owner->template_id) {
+            $this->invalidate_template_cache($owner->template_id);
+        }
+    }
+    
+    /**
+     * New items version for cases (see CAH_Financial_Calculator_Engine::recalculate_totals)
+     */
+    private function case_items_changed($case_ids) {
+        // Not loaded during activation
+        if (class_exists('CAH_Financial_Calculator_Engine')) {
+            CAH_Financial_Calculator_Engine::case_items_changed($case_ids);
+        }
+    }
+    
+    /**
+     * Drop cached template entry (and optionally the template list)
+     */
+    private function invalidate_template_cache($template_id, $catalog = false) {
+        // Not loaded during activation
+        if (!class_exists('CAH_Financial_Template_Cache')) {
+            return;
+        }
+        
+        if ($template_id) {
+            CAH_Financial_Template_Cache::invalidate_template($template_id);
+        }
+        
+        if ($catalog) {
+            CAH_Financial_Template_Cache::invalidate_catalog();
+        }
+    }
+    
+    /**
+     * Apply case changes to the reporting rollup
+     * $use_transaction = false joins the caller's open transaction.
+     */
+    public function refresh_rollup($case_ids, $use_transaction = true) {
+        // Not loaded during activation
+        if (!class_exists('CAH_Financial_Rollup')) {
+            return true;
+        }
+        
+        $rollup = new CAH_Financial_Rollup();
+        
+        return !is_wp_error($rollup->refresh_cases($case_ids, $use_transaction));
+    }
+    
+    // Bulk materialization (INSERT ... SELECT, no per-item round trips)
+    
+    /**
+     * Copy template items to many cases at once and store the new case totals
+     * Returns array case_id => array('ranges', 'count', 'totals'); ranges are
+     * array(first_id, last_id) pairs of the created items
+     */
+    public function materialize_template_for_cases($template_id, $case_ids, $chunk_size = 500) {
+        $case_ids = array_values(array_unique(array_filter(array_map('intval', (array) $case_ids))));
+        // Same order as the INSERT ... SELECT (targets.case_id)
+        sort($case_ids);
+        $items_table = $this->wpdb->prefix . 'cah_cost_items';
+        $financial_table = $this->wpdb->prefix . 'cah_case_financial';
+        $calculator = new CAH_Financial_Calculator_Engine();
+        $results = array();
+        
+        foreach (array_chunk($case_ids, max(1, intval($chunk_size))) as $chunk) {
+            $case_list = implode(',', $chunk);
+            
+            $this->wpdb->query('START TRANSACTION');
+            
+            // Existing items of the chunk; the locks also keep other inserts for
+            // these cases out until COMMIT, so every other row read back below is ours
+            $existing_ids = array_map('intval', $this->wpdb->get_col(
+                "SELECT id FROM $items_table WHERE case_id IN ($case_list) FOR UPDATE"
+            ));
+            
+            // Derived table of target cases, joined against the template items
+            $targets = array();
+            foreach ($chunk as $position => $case_id) {
+                $targets[] = $position === 0 ? "SELECT $case_id AS case_id" : "SELECT $case_id";
+            }
+            
+            $copied = $this->insert_items_select(
+                'NULL',
+                'targets.case_id',
+                "CROSS JOIN (" . implode(' UNION ALL ', $targets) . ") targets",
+                $this->wpdb->prepare('src.template_id = %d AND src.case_id IS NULL', $template_id),
+                'targets.case_id, src.sort_order, src.id'
+            );
+            
+            if ($copied === false) {
+                return $this->abort_materialize();
+            }
+            
+            if ($copied === 0) {
+                $this->wpdb->query('COMMIT');
+                continue;
+            }
+            
+            // First id of the statement; every case got the same number of items
+            $first_id = intval($this->wpdb->insert_id);
+            $per_case = intdiv($copied, count($chunk));
+            $consecutive = $this->has_consecutive_insert_ids();
+            
+            // All items of the chunk (ids are not consecutive with innodb_autoinc_lock_mode = 2)
+            $items_by_case = array();
+            $items = $this->wpdb->get_results(
+                "SELECT id, case_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order FROM $items_table
+                 WHERE case_id IN ($case_list) ORDER BY case_id, sort_order ASC, category ASC"
+            );
+            
+            foreach ($items as $item) {
+                $items_by_case[intval($item->case_id)][] = $item;
+            }
+            
+            // Stored VAT rate per case (default rate for cases without a record)
+            $vat_rates = array();
+            foreach ($this->wpdb->get_results("SELECT case_id, vat_rate FROM $financial_table WHERE case_id IN ($case_list)") as $row) {
+                $vat_rates[intval($row->case_id)] = floatval($row->vat_rate);
+            }
+            
+            $values = array();
+            
+            foreach ($chunk as $position => $case_id) {
+                $case_items = $items_by_case[$case_id] ?? array();
+                
+                if ($consecutive) {
+                    // The statement's ids are one block, in target order
+                    $first = $first_id + $position * $per_case;
+                    $ranges = array(array($first, $first + $per_case - 1));
+                } else {
+                    $ranges = $this->id_ranges(array_diff(array_map('intval', wp_list_pluck($case_items, 'id')), $existing_ids));
+                }
+                
+                $totals = $calculator->calculate_totals($case_items, $vat_rates[$case_id] ?? null);
+                
+                $results[$case_id] = array(
+                    'ranges' => $ranges,
+                    'count' => $per_case,
+                    'totals' => $totals
+                );
+                
+                $values[] = $this->wpdb->prepare(
+                    '(%d, %d, %f, %f, %f, %f)',
+                    $case_id, $template_id, $totals['subtotal'], $totals['vat_rate'], $totals['vat_amount'], $totals['total_amount']
+                );
+            }
+            
+            // Cases keep an assigned template; new records get this one
+            $ok = $this->wpdb->query(
+                "INSERT INTO $financial_table (case_id, template_id, subtotal, vat_rate, vat_amount, total_amount) VALUES " . implode(', ', $values) . "
+                 ON DUPLICATE KEY UPDATE template_id = COALESCE(template_id, VALUES(template_id)), subtotal = VALUES(subtotal),
+                 vat_rate = VALUES(vat_rate), vat_amount = VALUES(vat_amount), total_amount = VALUES(total_amount)"
+            ) !== false;
+            
+            // Rollup delta in the same transaction
+            if (!$ok || !$this->refresh_rollup($chunk, false)) {
+                return $this->abort_materialize();
+            }
+            
+            $this->wpdb->query('COMMIT');
+            $this->case_items_changed($chunk);
+        }
+        
+        return $results;
+    }
+    
+    /**
+     * Multi-row inserts get one block of ids (innodb_autoinc_lock_mode 0 or 1);
+     * with mode 2 (interleaved) concurrent inserts can take ids in between
+     */
+    private function has_consecutive_insert_ids() {
+        static $consecutive = null;
+        
+        if ($consecutive === null) {
+            $mode = $this->wpdb->get_var('SELECT @@innodb_autoinc_lock_mode');
+            $consecutive = $mode !== null && intval($mode) < 2;
+        }
+        
+        return $consecutive;
+    }
+    
+    /**
+     * Collapse ids to array(first_id, last_id) ranges
+     */
+    private function id_ranges($ids) {
+        $ids = array_values(array_unique(array_map('intval', $ids)));
+        sort($ids);
+        $ranges = array();
+        
+        foreach ($ids as $id) {
+            $last = count($ranges) - 1;
+            if ($last >= 0 && $ranges[$last][1] === $id - 1) {
+                $ranges[$last][1] = $id;
+            } else {
+                $ranges[] = array($id, $id);
+            }
+        }
+        
+        return $ranges;
+    }
+    
+    /**
+     * Roll back a failed materialization chunk
+     */
+    private function abort_materialize() {
+        $error = $this->wpdb->last_error;
+        $this->wpdb->query('ROLLBACK');
+        
+        return new WP_Error('materialize_failed', 'Fehler beim Übernehmen der Vorlage: ' . $error);
+    }
+    
+    /**
+     * Copy all items of one template into another template
+     */
+    public function copy_template_items_to_template($source_template_id, $target_template_id) {
+        $copied = $this->insert_items_select(
+            $this->wpdb->prepare('%d', $target_template_id),
+            'NULL',
+            '',
+            $this->wpdb->prepare('src.template_id = %d AND src.case_id IS NULL', $source_template_id),
+            'src.sort_order, src.id'
+        );
+        
+        $this->invalidate_template_cache($target_template_id);
+        
+        return $copied;
+    }
+    
+    /**
+     * Copy all items of a case into a template
+     */
+    public function copy_case_items_to_template($case_id, $target_template_id) {
+        $copied = $this->insert_items_select(
+            $this->wpdb->prepare('%d', $target_template_id),
+            'NULL',
+            '',
+            $this->wpdb->prepare('src.case_id = %d', $case_id),
+            'src.sort_order, src.id'
+        );
+        
+        $this->invalidate_template_cache($target_template_id);
+        
+        return $copied;
+    }
+    
+    /**
+     * Run one INSERT ... SELECT over cah_cost_items
+     * Returns the number of copied items or false on error
+     */
+    private function insert_items_select($template_expr, $case_expr, $join, $where, $order_by) {
+        $table = $this->wpdb->prefix . 'cah_cost_items';
+        
+        $result = $this->wpdb->query(
+            "INSERT INTO $table (template_id, case_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order)
+             SELECT $template_expr, $case_expr, src.name, src.category, src.amount, src.description, src.is_percentage, src.percentage_base, src.base_ref, src.sort_order
+             FROM $table src $join
+             WHERE $where
+             ORDER BY $order_by"
+        );
+        
+        return $result === false ? false : intval($result);
     }
     
     // Case Financial CRUD operations
@@ -216,6 +624,166 @@ class CAH_Financial_DB_Manager {
         );
     }
     
+    /**
+     * Save case items and totals as a diff against stored rows (one transaction)
+     * Items with an id belonging to the case are updated, others inserted,
+     * stored items missing from $items are deleted.
+     */
+    public function save_case_financial_diff($case_id, $template_id, $items, $totals) {
+        $items_table = $this->wpdb->prefix . 'cah_cost_items';
+        $financial_table = $this->wpdb->prefix . 'cah_case_financial';
+        
+        $this->wpdb->query('START TRANSACTION');
+        
+        // Lock the case's rows so concurrent autosaves serialize
+        $stored = $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT id, template_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order FROM $items_table WHERE case_id = %d FOR UPDATE",
+            $case_id
+        ), OBJECT_K);
+        
+        $inserts = array();
+        $updates = array();
+        $keep_ids = array();
+        
+        foreach ($items as $index => $item) {
+            $row = array(
+                'name' => sanitize_text_field($item['name'] ?? ''),
+                'category' => sanitize_text_field($item['category'] ?? 'grundkosten'),
+                'amount' => round(floatval($item['amount'] ?? 0), 2),
+                'description' => sanitize_textarea_field($item['description'] ?? ''),
+                'is_percentage' => !empty($item['is_percentage']) ? 1 : 0,
+                'percentage_base' => null,
+                'base_ref' => null,
+                'sort_order' => isset($item['sort_order']) ? intval($item['sort_order']) : $index
+            );
+            
+            // Empty bases are stored as NULL (as by create_cost_item)
+            if ($row['is_percentage'] && array_key_exists($item['percentage_base'] ?? '', CAH_Financial_Calculation_Graph::get_base_types())) {
+                $row['percentage_base'] = $item['percentage_base'];
+                $base_ref = sanitize_text_field($item['base_ref'] ?? '');
+                $row['base_ref'] = $base_ref !== '' ? $base_ref : null;
+            }
+            
+            $item_id = intval($item['id'] ?? 0);
+            
+            // Ids of template items (loaded from a template) are not ours - insert as new
+            if ($item_id && isset($stored[$item_id])) {
+                $keep_ids[$item_id] = true;
+                
+                if (!$this->cost_item_row_equals($stored[$item_id], $row)) {
+                    $updates[$item_id] = $row;
+                }
+            } else {
+                $inserts[] = $row;
+            }
+        }
+        
+        $delete_ids = array_diff(array_keys($stored), array_keys($keep_ids));
+        $ok = true;
+        
+        if (!empty($delete_ids)) {
+            $ok = $this->wpdb->query($this->wpdb->prepare(
+                "DELETE FROM $items_table WHERE case_id = %d AND id IN (" . implode(',', array_map('intval', $delete_ids)) . ")",
+                $case_id
+            )) !== false;
+        }
+        
+        // Changed rows in one statement, keyed by primary key
+        if ($ok && !empty($updates)) {
+            $values = array();
+            foreach ($updates as $item_id => $row) {
+                $values[] = $this->cost_item_values_sql($this->wpdb->prepare('%d', $item_id), $case_id, $row);
+            }
+            
+            $ok = $this->wpdb->query(
+                "INSERT INTO $items_table (id, case_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order) VALUES " . implode(', ', $values) . "
+                 ON DUPLICATE KEY UPDATE name = VALUES(name), category = VALUES(category), amount = VALUES(amount),
+                 description = VALUES(description), is_percentage = VALUES(is_percentage), percentage_base = VALUES(percentage_base),
+                 base_ref = VALUES(base_ref), sort_order = VALUES(sort_order)"
+            ) !== false;
+        }
+        
+        if ($ok && !empty($inserts)) {
+            $values = array();
+            foreach ($inserts as $row) {
+                $values[] = $this->cost_item_values_sql('NULL', $case_id, $row);
+            }
+            
+            $ok = $this->wpdb->query(
+                "INSERT INTO $items_table (template_id, case_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order) VALUES " . implode(', ', $values)
+            ) !== false;
+        }
+        
+        // Single upsert of the case financial record
+        if ($ok) {
+            $ok = $this->wpdb->query($this->wpdb->prepare(
+                "INSERT INTO $financial_table (case_id, template_id, subtotal, vat_rate, vat_amount, total_amount)
+                 VALUES (%d, " . ($template_id ? '%d' : 'NULL') . ", %f, %f, %f, %f)
+                 ON DUPLICATE KEY UPDATE template_id = VALUES(template_id), subtotal = VALUES(subtotal), vat_rate = VALUES(vat_rate),
+                 vat_amount = VALUES(vat_amount), total_amount = VALUES(total_amount)",
+                array_merge(
+                    array($case_id),
+                    $template_id ? array($template_id) : array(),
+                    array($totals['subtotal'] ?? 0, $totals['vat_rate'] ?? 19.00, $totals['vat_amount'] ?? 0, $totals['total_amount'] ?? 0)
+                )
+            )) !== false;
+        }
+        
+        // Rollup delta in the same transaction, so reports never see half a save
+        if ($ok) {
+            $ok = $this->refresh_rollup(array($case_id), false);
+        }
+        
+        if (!$ok) {
+            $error = $this->wpdb->last_error;
+            $this->wpdb->query('ROLLBACK');
+            return new WP_Error('financial_save_failed', 'Fehler beim Speichern der Finanzdaten: ' . $error);
+        }
+        
+        $this->wpdb->query('COMMIT');
+        
+        // Saved items and their values for recalculate_totals (new items version)
+        if (class_exists('CAH_Financial_Calculator_Engine')) {
+            CAH_Financial_Calculator_Engine::remember_case_items($case_id, $this->get_cost_items_by_case($case_id));
+        }
+        
+        return array(
+            'inserted' => count($inserts),
+            'updated' => count($updates),
+            'deleted' => count($delete_ids),
+            'unchanged' => count($keep_ids) - count($updates)
+        );
+    }
+    
+    /**
+     * VALUES tuple of a cost item row (NULL bases stay NULL, prepare() would write '')
+     * $id_sql: 'NULL' for new rows or the prepared id
+     */
+    private function cost_item_values_sql($id_sql, $case_id, $row) {
+        $nullable = function($value) {
+            return $value === null ? 'NULL' : $this->wpdb->prepare('%s', $value);
+        };
+        
+        return '(' . $id_sql . ', ' . $this->wpdb->prepare(
+            '%d, %s, %s, %f, %s, %d',
+            $case_id, $row['name'], $row['category'], $row['amount'], $row['description'], $row['is_percentage']
+        ) . ', ' . $nullable($row['percentage_base']) . ', ' . $nullable($row['base_ref']) . ', ' . intval($row['sort_order']) . ')';
+    }
+    
+    /**
+     * Compare stored cost item with submitted values ('' from older saves equals NULL)
+     */
+    private function cost_item_row_equals($stored, $row) {
+        return $stored->name === $row['name']
+            && $stored->category === $row['category']
+            && round(floatval($stored->amount), 2) === $row['amount']
+            && (string) $stored->description === $row['description']
+            && intval($stored->is_percentage) === $row['is_percentage']
+            && ((string) $stored->percentage_base !== '' ? $stored->percentage_base : null) === $row['percentage_base']
+            && ((string) $stored->base_ref !== '' ? $stored->base_ref : null) === $row['base_ref']
+            && intval($stored->sort_order) === $row['sort_order'];
+    }
+    
     public function delete_case_financial($case_id) {
         // First delete associated cost items
         $this->wpdb->delete(
@@ -225,10 +793,16 @@ class CAH_Financial_DB_Manager {
         );
         
         // Then delete case financial record
-        return $this->wpdb->delete(
+        $result = $this->wpdb->delete(
             $this->wpdb->prefix . 'cah_case_financial',
             array('case_id' => $case_id),
             array('%d')
         );
+        
+        $this->case_items_changed(array($case_id));
+        
+        $this->refresh_rollup(array($case_id));
+        
+        return $result;
     }
 }
\ No newline at end of file
@@ -0,0 +1,144 @@
+<?php
+/**
+ * Financial Recompute Command - Parallel recompute of case totals (wp cah recompute)
+ * Cases are split by case_id modulo the number of workers; every worker runs
+ * the chunk loop of CAH_Financial_Recompute_Job for its shard in a forked
+ * process (CAH_Parallel_Runner of the core plugin). The run holds the lock and
+ * state of the job, so the admin recompute can't start alongside it.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Financial_Recompute_Command {
+
+    const DEFAULT_WORKERS = 4;
+
+    /**
+     * Recalculate stored case totals with parallel workers.
+     *
+     * ## OPTIONS
+     *
+     * [--workers=<count>]
+     * : Number of worker processes.
+     * ---
+     * default: 4
+     * ---
+     *
+     * [--template=<id>]
+     * : Only cases using this template.
+     *
+     * [--vat-rate=<rate>]
+     * : VAT rate for all cases (default: the stored rate of each case).
+     *
+     * [--chunk-size=<size>]
+     * : Cases per chunk and worker.
+     * ---
+     * default: 500
+     * ---
+     *
+     * [--dry-run]
+     * : Only report the changes.
+     *
+     * ## EXAMPLES
+     *
+     *     wp cah recompute --workers=8 --vat-rate=19 --dry-run
+     */
+    public function __invoke($args, $assoc_args) {
+        $workers = intval(\WP_CLI\Utils\get_flag_value($assoc_args, 'workers', self::DEFAULT_WORKERS));
+        $template_id = \WP_CLI\Utils\get_flag_value($assoc_args, 'template');
+        $vat_rate = \WP_CLI\Utils\get_flag_value($assoc_args, 'vat-rate');
+        $chunk_size = intval(\WP_CLI\Utils\get_flag_value($assoc_args, 'chunk-size', CAH_Financial_Recompute_Job::DEFAULT_CHUNK_SIZE));
+        $dry_run = (bool) \WP_CLI\Utils\get_flag_value($assoc_args, 'dry-run', false);
+
+        $job = new CAH_Financial_Recompute_Job();
+        $state = $job->start_cli_run($template_id, $vat_rate, $dry_run, $chunk_size);
+
+        if (is_wp_error($state)) {
+            WP_CLI::error($state->get_error_message());
+        }
+
+        $runner = new CAH_Parallel_Runner();
+        $started = microtime(true);
+
+        try {
+            $results = $runner->run($workers, function($shard, $shards) use ($template_id, $vat_rate, $dry_run, $chunk_size) {
+                $job = new CAH_Financial_Recompute_Job();
+                return $job->run_shard($shard, $shards, $template_id, $vat_rate, $dry_run, $chunk_size);
+            });
+        } catch (Throwable $e) {
+            $job->finish_cli_run($state, array('error' => $e->getMessage()));
+            WP_CLI::error($e->getMessage());
+        }
+
+        $summary = array('processed' => 0, 'changed' => 0, 'total_amount_before' => 0, 'total_amount_after' => 0);
+        $workers_table = array();
+        $diff = array();
+        $failed = 0;
+
+        foreach ($results as $shard => $result) {
+            if (is_wp_error($result)) {
+                $result = array('status' => 'failed', 'error' => $result->get_error_message(), 'total' => 0, 'processed' => 0, 'changed' => 0, 'diff' => array());
+            }
+
+            if ($result['status'] !== 'completed') {
+                $failed++;
+                WP_CLI::warning('Worker ' . $shard . ': ' . $result['error']);
+            }
+
+            foreach (array_keys($summary) as $key) {
+                $summary[$key] += $result[$key] ?? 0;
+            }
+            $diff = array_merge($diff, $result['diff']);
+
+            $workers_table[] = array(
+                'worker' => $shard,
+                'total' => $result['total'],
+                'processed' => $result['processed'],
+                'changed' => $result['changed'],
+                'status' => $result['status']
+            );
+        }
+
+        usort($diff, function($a, $b) {
+            return $a['case_id'] - $b['case_id'];
+        });
+
+        $job->finish_cli_run($state, array_merge($summary, array(
+            'diff' => $diff,
+            'error' => $failed ? $failed . ' Worker fehlgeschlagen' : null
+        )));
+
+        \WP_CLI\Utils\format_items('table', $workers_table, array('worker', 'total', 'processed', 'changed', 'status'));
+
+        if ($dry_run && $diff) {
+            $rows = array();
+            foreach (array_slice($diff, 0, CAH_Financial_Recompute_Job::DIFF_LIMIT) as $entry) {
+                $rows[] = array(
+                    'case_id' => $entry['case_id'],
+                    'before' => number_format($entry['before']['total_amount'], 2, ',', '.'),
+                    'after' => number_format($entry['after']['total_amount'], 2, ',', '.')
+                );
+            }
+            \WP_CLI\Utils\format_items('table', $rows, array('case_id', 'before', 'after'));
+        }
+
+        $elapsed = microtime(true) - $started;
+        $message = sprintf(
+            '%d Fälle %s, %d geändert, Differenz %s € in %.1f s (%.0f Fälle/s)',
+            $summary['processed'],
+            $dry_run ? 'geprüft (Testlauf)' : 'neu berechnet',
+            $summary['changed'],
+            number_format($summary['total_amount_after'] - $summary['total_amount_before'], 2, ',', '.'),
+            $elapsed,
+            $elapsed > 0 ? $summary['processed'] / $elapsed : 0
+        );
+
+        if ($failed) {
+            WP_CLI::error($message . ', ' . $failed . ' Worker fehlgeschlagen');
+        }
+
+        WP_CLI::success($message);
+    }
+}
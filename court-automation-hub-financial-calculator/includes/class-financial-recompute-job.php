@@ -0,0 +1,372 @@
+<?php
+/**
+ * Financial Recompute Job - Re-prices stored case totals in the background
+ * Walks cah_case_financial in keyset-ordered chunks (one WP-Cron event per
+ * chunk), recalculates totals from the case items and writes changed rows
+ * in one statement per chunk. Dry runs only collect the diff.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Financial_Recompute_Job {
+
+    private $wpdb;
+    private $calculator;
+    private $rollup;
+
+    // Whether the cron hook is registered
+    private static $hooks_registered = false;
+
+    const CRON_HOOK = 'cah_financial_recompute_chunk';
+
+    // Job state (progress, cursor, diff)
+    const STATE_OPTION = 'cah_financial_recompute_job';
+
+    // Prevents two cron runs working on the same chunk (held for the whole WP-CLI run)
+    const LOCK_TRANSIENT = 'cah_financial_recompute_lock';
+
+    const DEFAULT_CHUNK_SIZE = 500;
+
+    // Diff entries kept for dry runs (counts and sums cover all cases)
+    const DIFF_LIMIT = 200;
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->calculator = new CAH_Financial_Calculator_Engine();
+        $this->rollup = new CAH_Financial_Rollup();
+
+        if (!self::$hooks_registered) {
+            self::$hooks_registered = true;
+            add_action(self::CRON_HOOK, array($this, 'run_chunk'));
+        }
+    }
+
+    /**
+     * Start a recompute job
+     * $vat_rate null keeps each case's stored VAT rate
+     */
+    public function start($template_id = null, $vat_rate = null, $dry_run = false, $chunk_size = self::DEFAULT_CHUNK_SIZE) {
+        $state = $this->get_status();
+        if ($state && in_array($state['status'], array('queued', 'running'), true)) {
+            return new WP_Error('recompute_running', 'Es läuft bereits eine Neuberechnung', array('status' => 409));
+        }
+
+        $state = $this->create_state($template_id, $vat_rate, $dry_run, $chunk_size);
+        update_option(self::STATE_OPTION, $state, false);
+
+        wp_schedule_single_event(time(), self::CRON_HOOK);
+
+        return $this->format_status($state);
+    }
+
+    /**
+     * Recalculate one shard of the cases (case_id modulo $shards) in this process
+     * Used by the parallel WP-CLI recompute; returns the final state of the shard.
+     */
+    public function run_shard($shard, $shards, $template_id = null, $vat_rate = null, $dry_run = false, $chunk_size = self::DEFAULT_CHUNK_SIZE) {
+        $state = $this->create_state($template_id, $vat_rate, $dry_run, $chunk_size, intval($shard), max(1, intval($shards)));
+        $state['status'] = 'running';
+
+        do {
+            $result = $this->process_chunk($state);
+        } while ($result && !is_wp_error($result));
+
+        $state['status'] = is_wp_error($result) ? 'failed' : 'completed';
+        $state['error'] = is_wp_error($result) ? $result->get_error_message() : null;
+        $state['finished_at'] = current_time('mysql');
+
+        return $state;
+    }
+
+    /**
+     * Mark a WP-CLI recompute as running, so start() and cron chunks wait for it
+     * Returns the state for finish_cli_run(), WP_Error if a job is running
+     */
+    public function start_cli_run($template_id = null, $vat_rate = null, $dry_run = false, $chunk_size = self::DEFAULT_CHUNK_SIZE) {
+        $state = $this->get_status();
+        if (($state && in_array($state['status'], array('queued', 'running'), true)) || get_transient(self::LOCK_TRANSIENT)) {
+            return new WP_Error('recompute_running', 'Es läuft bereits eine Neuberechnung', array('status' => 409));
+        }
+
+        set_transient(self::LOCK_TRANSIENT, 1, DAY_IN_SECONDS);
+
+        $state = $this->create_state($template_id, $vat_rate, $dry_run, $chunk_size);
+        $state['status'] = 'running';
+        $state['cli'] = true;
+        update_option(self::STATE_OPTION, $state, false);
+
+        return $state;
+    }
+
+    /**
+     * Store the result of a WP-CLI recompute and release the lock
+     * $summary: processed, changed, total_amount_before/after, diff (and error)
+     */
+    public function finish_cli_run($state, $summary) {
+        $current = $this->get_status();
+
+        // A cancel in the admin (e.g. after the run was killed) wins
+        if (!$current || $current['status'] !== 'cancelled') {
+            $state = array_merge($state, $summary);
+            $state['status'] = empty($summary['error']) ? 'completed' : 'failed';
+            $state['diff'] = array_slice($state['diff'], 0, self::DIFF_LIMIT);
+            $state['finished_at'] = current_time('mysql');
+            update_option(self::STATE_OPTION, $state, false);
+        }
+
+        delete_transient(self::LOCK_TRANSIENT);
+    }
+
+    /**
+     * Initial job state (counts the cases in scope)
+     */
+    private function create_state($template_id, $vat_rate, $dry_run, $chunk_size, $shard = 0, $shards = 1) {
+        $state = array(
+            'status' => 'queued',
+            'template_id' => $template_id ? intval($template_id) : null,
+            'vat_rate' => $vat_rate === null || $vat_rate === '' ? null : round(floatval($vat_rate), 2),
+            'dry_run' => (bool) $dry_run,
+            'chunk_size' => max(1, min(5000, intval($chunk_size))),
+            'shard' => $shard,
+            'shards' => $shards,
+            'cursor' => 0,
+            'total' => 0,
+            'processed' => 0,
+            'changed' => 0,
+            'total_amount_before' => 0,
+            'total_amount_after' => 0,
+            'diff' => array(),
+            'started_at' => current_time('mysql'),
+            'finished_at' => null,
+            'error' => null
+        );
+
+        $state['total'] = intval($this->wpdb->get_var(
+            "SELECT COUNT(*) FROM {$this->wpdb->prefix}cah_case_financial WHERE case_id > 0" . $this->scope_condition($state)
+        ));
+
+        return $state;
+    }
+
+    /**
+     * Cancel a queued or running job
+     */
+    public function cancel() {
+        $state = $this->get_status();
+        if (!$state || !in_array($state['status'], array('queued', 'running'), true)) {
+            return false;
+        }
+
+        $state['status'] = 'cancelled';
+        $state['finished_at'] = current_time('mysql');
+        update_option(self::STATE_OPTION, $state, false);
+
+        wp_clear_scheduled_hook(self::CRON_HOOK);
+
+        // Releases the lock of a killed WP-CLI run (a live run keeps going)
+        if (!empty($state['cli'])) {
+            delete_transient(self::LOCK_TRANSIENT);
+        }
+
+        return true;
+    }
+
+    /**
+     * Raw job state (null if no job has run)
+     */
+    public function get_status() {
+        $state = get_option(self::STATE_OPTION);
+        return is_array($state) ? $state : null;
+    }
+
+    /**
+     * Job state with progress percentage
+     */
+    public function format_status($state = null) {
+        $state = $state ?: $this->get_status();
+        if (!$state) {
+            return array('status' => 'idle');
+        }
+
+        $state['progress'] = $state['total'] > 0
+            ? round(min(100, $state['processed'] / $state['total'] * 100), 1)
+            : ($state['status'] === 'completed' ? 100 : 0);
+        $state['total_amount_delta'] = round($state['total_amount_after'] - $state['total_amount_before'], 2);
+
+        return $state;
+    }
+
+    /**
+     * Process one chunk and schedule the next (WP-Cron callback)
+     */
+    public function run_chunk() {
+        $state = $this->get_status();
+        if (!$state || !empty($state['cli']) || !in_array($state['status'], array('queued', 'running'), true)) {
+            return;
+        }
+
+        if (get_transient(self::LOCK_TRANSIENT)) {
+            return;
+        }
+        set_transient(self::LOCK_TRANSIENT, 1, 5 * MINUTE_IN_SECONDS);
+
+        $state['status'] = 'running';
+        $result = $this->process_chunk($state);
+
+        if (is_wp_error($result)) {
+            $state['status'] = 'failed';
+            $state['error'] = $result->get_error_message();
+            $state['finished_at'] = current_time('mysql');
+        } elseif ($result === 0) {
+            $state['status'] = 'completed';
+            $state['finished_at'] = current_time('mysql');
+        }
+
+        // A cancel during the chunk wins
+        $current = $this->get_status();
+        if ($current && $current['status'] === 'cancelled') {
+            $state['status'] = 'cancelled';
+            $state['finished_at'] = $current['finished_at'];
+        }
+
+        update_option(self::STATE_OPTION, $state, false);
+        delete_transient(self::LOCK_TRANSIENT);
+
+        if ($state['status'] === 'running') {
+            wp_schedule_single_event(time(), self::CRON_HOOK);
+        }
+    }
+
+    /**
+     * Recalculate one chunk of cases; returns number of cases read
+     */
+    private function process_chunk(&$state) {
+        $financial_table = $this->wpdb->prefix . 'cah_case_financial';
+        $items_table = $this->wpdb->prefix . 'cah_cost_items';
+
+        $rows = $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT case_id, template_id, subtotal, vat_rate, vat_amount, total_amount FROM $financial_table
+             WHERE case_id > %d" . $this->scope_condition($state) . "
+             ORDER BY case_id LIMIT %d",
+            $state['cursor'],
+            $state['chunk_size']
+        ));
+
+        if (empty($rows)) {
+            return 0;
+        }
+
+        // Items of the whole chunk in one query
+        $case_ids = array_map('intval', wp_list_pluck($rows, 'case_id'));
+        $items_by_case = array();
+
+        $items = $this->wpdb->get_results(
+            "SELECT id, case_id, name, category, amount, description, is_percentage, percentage_base, base_ref, sort_order FROM $items_table
+             WHERE case_id IN (" . implode(',', $case_ids) . ") ORDER BY case_id, sort_order ASC, category ASC"
+        );
+
+        foreach ($items as $item) {
+            $items_by_case[intval($item->case_id)][] = $item;
+        }
+
+        $updates = array();
+
+        foreach ($rows as $row) {
+            $case_id = intval($row->case_id);
+            $vat_rate = $state['vat_rate'] !== null ? $state['vat_rate'] : floatval($row->vat_rate);
+
+            $totals = $this->calculator->calculate_totals($items_by_case[$case_id] ?? array(), $vat_rate);
+
+            $before = round(floatval($row->total_amount), 2);
+            $state['total_amount_before'] += $before;
+            $state['total_amount_after'] += $totals['total_amount'];
+
+            if ($this->totals_changed($row, $totals)) {
+                $state['changed']++;
+                $updates[$case_id] = $totals;
+
+                if ($state['dry_run'] && count($state['diff']) < self::DIFF_LIMIT) {
+                    $state['diff'][] = array(
+                        'case_id' => $case_id,
+                        'template_id' => $row->template_id ? intval($row->template_id) : null,
+                        'before' => array(
+                            'subtotal' => round(floatval($row->subtotal), 2),
+                            'vat_rate' => round(floatval($row->vat_rate), 2),
+                            'vat_amount' => round(floatval($row->vat_amount), 2),
+                            'total_amount' => $before
+                        ),
+                        'after' => array(
+                            'subtotal' => $totals['subtotal'],
+                            'vat_rate' => round($vat_rate, 2),
+                            'vat_amount' => $totals['vat_amount'],
+                            'total_amount' => $totals['total_amount']
+                        )
+                    );
+                }
+            }
+        }
+
+        if (!$state['dry_run'] && !empty($updates)) {
+            $values = array();
+            foreach ($updates as $case_id => $totals) {
+                $values[] = $this->wpdb->prepare('(%d, %f, %f, %f, %f)', $case_id, $totals['subtotal'], $totals['vat_rate'], $totals['vat_amount'], $totals['total_amount']);
+            }
+
+            // Rows exist (read above), so this only ever updates
+            $result = $this->wpdb->query(
+                "INSERT INTO $financial_table (case_id, subtotal, vat_rate, vat_amount, total_amount) VALUES " . implode(', ', $values) . "
+                 ON DUPLICATE KEY UPDATE subtotal = VALUES(subtotal), vat_rate = VALUES(vat_rate),
+                 vat_amount = VALUES(vat_amount), total_amount = VALUES(total_amount)"
+            );
+
+            if ($result === false) {
+                return new WP_Error('recompute_failed', 'Fehler bei der Neuberechnung: ' . $this->wpdb->last_error);
+            }
+            
+            $refreshed = $this->rollup->refresh_cases(array_keys($updates));
+            
+            if (is_wp_error($refreshed)) {
+                return $refreshed;
+            }
+        }
+
+        $state['cursor'] = end($case_ids);
+        $state['processed'] += count($rows);
+
+        return count($rows);
+    }
+
+    /**
+     * Compare stored totals with recalculated ones (cent precision)
+     */
+    private function totals_changed($row, $totals) {
+        return round(floatval($row->subtotal), 2) !== round($totals['subtotal'], 2)
+            || round(floatval($row->vat_rate), 2) !== round(floatval($totals['vat_rate']), 2)
+            || round(floatval($row->vat_amount), 2) !== round($totals['vat_amount'], 2)
+            || round(floatval($row->total_amount), 2) !== round($totals['total_amount'], 2);
+    }
+
+    /**
+     * SQL condition for the template filter and the shard of a parallel run
+     */
+    private function scope_condition($state) {
+        $condition = $this->template_condition($state['template_id']);
+
+        // Jobs started before sharding existed have no shard keys
+        if (!empty($state['shards']) && $state['shards'] > 1) {
+            $condition .= $this->wpdb->prepare(' AND MOD(case_id, %d) = %d', $state['shards'], $state['shard']);
+        }
+
+        return $condition;
+    }
+
+    /**
+     * SQL condition for the optional template filter
+     */
+    private function template_condition($template_id) {
+        return $template_id ? $this->wpdb->prepare(' AND template_id = %d', $template_id) : '';
+    }
+}
@@ -12,11 +12,20 @@ class CAH_Financial_REST_API {
     private $db_manager;
     private $calculator;
     private $template_manager;
+    private $template_cache;
+    private $recompute_job;
+    private $rollup;
+    
+    // Maximum item sets per /calculate/batch request
+    const MAX_BATCH_SETS = 1000;
     
     public function __construct() {
         $this->db_manager = new CAH_Financial_DB_Manager();
         $this->calculator = new CAH_Financial_Calculator_Engine();
         $this->template_manager = new CAH_Financial_Template_Manager();
+        $this->template_cache = new CAH_Financial_Template_Cache();
+        $this->recompute_job = new CAH_Financial_Recompute_Job();
+        $this->rollup = new CAH_Financial_Rollup();
         
         add_action('rest_api_init', array($this, 'register_routes'));
     }
@@ -93,6 +102,58 @@ class CAH_Financial_REST_API {
             'permission_callback' => array($this, 'check_permissions')
         ));
         
+        register_rest_route($namespace, '/calculate/batch', array(
+            'methods' => 'POST',
+            'callback' => array($this, 'calculate_batch'),
+            'permission_callback' => array($this, 'check_permissions')
+        ));
+        
+        // Portfolio recompute job (start / progress / cancel)
+        register_rest_route($namespace, '/recompute', array(
+            array(
+                'methods' => 'POST',
+                'callback' => array($this, 'start_recompute'),
+                'permission_callback' => array($this, 'check_permissions'),
+                'args' => array(
+                    'template_id' => array('sanitize_callback' => 'absint'),
+                    'vat_rate' => array('validate_callback' => function($value) { return $value === null || $value === '' || (is_numeric($value) && $value >= 0 && $value <= 100); }),
+                    'dry_run' => array('default' => false, 'sanitize_callback' => 'rest_sanitize_boolean'),
+                    'chunk_size' => array('default' => CAH_Financial_Recompute_Job::DEFAULT_CHUNK_SIZE, 'sanitize_callback' => 'absint')
+                )
+            ),
+            array(
+                'methods' => 'GET',
+                'callback' => array($this, 'get_recompute_status'),
+                'permission_callback' => array($this, 'check_permissions')
+            ),
+            array(
+                'methods' => 'DELETE',
+                'callback' => array($this, 'cancel_recompute'),
+                'permission_callback' => array($this, 'check_permissions')
+            )
+        ));
+        
+        // Reporting cube (precomputed, independent of the number of cases)
+        register_rest_route($namespace, '/reports/rollup', array(
+            'methods' => 'GET',
+            'callback' => array($this, 'get_rollup_report'),
+            'permission_callback' => array($this, 'check_permissions'),
+            'args' => array(
+                'from' => array('validate_callback' => array($this, 'validate_month')),
+                'to' => array('validate_callback' => array($this, 'validate_month')),
+                'template_id' => array('sanitize_callback' => 'absint'),
+                'category' => array('sanitize_callback' => 'sanitize_key'),
+                'status' => array('sanitize_callback' => 'sanitize_key'),
+                'group_by' => array('default' => 'month')
+            )
+        ));
+        
+        register_rest_route($namespace, '/reports/rollup/rebuild', array(
+            'methods' => 'POST',
+            'callback' => array($this, 'rebuild_rollup'),
+            'permission_callback' => array($this, 'check_permissions')
+        ));
+        
         // Case financial endpoints
         register_rest_route($namespace, '/case-financial/(?P<case_id>\d+)', array(
             'methods' => 'GET',
@@ -113,7 +174,7 @@ class CAH_Financial_REST_API {
     
     // Template endpoints
     public function get_templates(WP_REST_Request $request) {
-        $templates = $this->db_manager->get_templates();
+        $templates = $this->template_cache->get_templates();
         
         return new WP_REST_Response($templates, 200);
     }
@@ -203,7 +264,7 @@ class CAH_Financial_REST_API {
     // Cost items endpoints
     public function get_template_cost_items(WP_REST_Request $request) {
         $template_id = $request->get_param('template_id');
-        $items = $this->db_manager->get_cost_items_by_template($template_id);
+        $items = $this->template_cache->get_template_items($template_id);
         
         return new WP_REST_Response($items, 200);
     }
@@ -224,6 +285,8 @@ class CAH_Financial_REST_API {
         $description = $request->get_param('description') ?: '';
         $is_percentage = $request->get_param('is_percentage') ?: false;
         $sort_order = $request->get_param('sort_order') ?: 0;
+        $percentage_base = $request->get_param('percentage_base') ?: null;
+        $base_ref = $request->get_param('base_ref') ?: null;
         
         // Validate required fields
         if (empty($name) || empty($category) || !is_numeric($amount)) {
@@ -236,6 +299,12 @@ class CAH_Financial_REST_API {
             return new WP_Error('invalid_category', 'Invalid category', array('status' => 400));
         }
         
+        // Validate percentage base
+        $errors = $this->calculator->validate_cost_item(compact('name', 'category', 'amount', 'is_percentage', 'percentage_base', 'base_ref'));
+        if (!empty($errors)) {
+            return new WP_Error('invalid_percentage_base', implode(', ', $errors), array('status' => 400));
+        }
+        
         $item_id = $this->db_manager->create_cost_item(
             $template_id,
             $case_id,
@@ -244,13 +313,19 @@ class CAH_Financial_REST_API {
             $amount,
             $description,
             $is_percentage,
-            $sort_order
+            $sort_order,
+            $percentage_base,
+            $base_ref
         );
         
         if (!$item_id) {
             return new WP_Error('create_failed', 'Failed to create cost item', array('status' => 500));
         }
         
+        if ($case_id) {
+            $this->rollup->refresh_case($case_id);
+        }
+        
         return new WP_REST_Response(array('id' => $item_id, 'message' => 'Cost item created successfully'), 201);
     }
     
@@ -258,7 +333,7 @@ class CAH_Financial_REST_API {
         $item_id = $request->get_param('id');
         
         $update_data = array();
-        $fields = array('name', 'category', 'amount', 'description', 'is_percentage', 'sort_order');
+        $fields = array('name', 'category', 'amount', 'description', 'is_percentage', 'percentage_base', 'base_ref', 'sort_order');
         
         foreach ($fields as $field) {
             $value = $request->get_param($field);
@@ -271,31 +346,41 @@ class CAH_Financial_REST_API {
             return new WP_Error('no_data', 'No data to update', array('status' => 400));
         }
         
+        $item = $this->db_manager->get_cost_item($item_id);
         $result = $this->db_manager->update_cost_item($item_id, $update_data);
         
         if ($result === false) {
             return new WP_Error('update_failed', 'Failed to update cost item', array('status' => 500));
         }
         
+        if ($item && $item->case_id) {
+            $this->rollup->refresh_case($item->case_id);
+        }
+        
         return new WP_REST_Response(array('message' => 'Cost item updated successfully'), 200);
     }
     
     public function delete_cost_item(WP_REST_Request $request) {
         $item_id = $request->get_param('id');
         
+        $item = $this->db_manager->get_cost_item($item_id);
         $result = $this->db_manager->delete_cost_item($item_id);
         
         if (!$result) {
             return new WP_Error('delete_failed', 'Failed to delete cost item', array('status' => 500));
         }
         
+        if ($item && $item->case_id) {
+            $this->rollup->refresh_case($item->case_id);
+        }
+        
         return new WP_REST_Response(array('message' => 'Cost item deleted successfully'), 200);
     }
     
     // Calculator endpoints
     public function calculate_totals(WP_REST_Request $request) {
         $items = $request->get_param('items');
-        $vat_rate = $request->get_param('vat_rate') ?: 19.00;
+        $vat_rate = $request->get_param('vat_rate') ?: null;
         
         if (!is_array($items)) {
             return new WP_Error('invalid_items', 'Items must be an array', array('status' => 400));
@@ -307,11 +392,121 @@ class CAH_Financial_REST_API {
             $cost_items[] = (object) $item;
         }
         
-        $totals = $this->calculator->calculate_totals($cost_items, $vat_rate);
+        // Optional case_id: its stored items are reused, only edited items are recomputed
+        $totals = $this->calculator->recalculate_totals(
+            intval($request->get_param('case_id')),
+            $cost_items,
+            $vat_rate
+        );
         
         return new WP_REST_Response($totals, 200);
     }
     
+    /**
+     * Calculate many item sets in one request
+     * Body: {"vat_rate": 19, "sets": [{"key": "case-1", "items": [...], "vat_rate": 7}, ...]}
+     */
+    public function calculate_batch(WP_REST_Request $request) {
+        $sets = $request->get_param('sets');
+        $default_vat_rate = $request->get_param('vat_rate') ?: null;
+        
+        if (!is_array($sets) || empty($sets)) {
+            return new WP_Error('invalid_sets', 'Sets must be a non-empty array', array('status' => 400));
+        }
+        
+        if (count($sets) > self::MAX_BATCH_SETS) {
+            return new WP_Error('too_many_sets', 'At most ' . self::MAX_BATCH_SETS . ' sets per request', array('status' => 413));
+        }
+        
+        $results = array();
+        $errors = array();
+        
+        foreach ($sets as $index => $set) {
+            $key = isset($set['key']) ? (string) $set['key'] : (string) $index;
+            
+            if (!isset($set['items']) || !is_array($set['items'])) {
+                $errors[$key] = 'Items must be an array';
+                continue;
+            }
+            
+            $cost_items = array();
+            foreach ($set['items'] as $item) {
+                $cost_items[] = (object) $item;
+            }
+            
+            $vat_rate = isset($set['vat_rate']) && is_numeric($set['vat_rate']) ? floatval($set['vat_rate']) : $default_vat_rate;
+            $results[$key] = $this->calculator->calculate_totals($cost_items, $vat_rate);
+        }
+        
+        return new WP_REST_Response(array(
+            'results' => $results,
+            'errors' => $errors,
+            'count' => count($results)
+        ), 200);
+    }
+    
+    // Recompute job endpoints
+    public function start_recompute(WP_REST_Request $request) {
+        $result = $this->recompute_job->start(
+            $request->get_param('template_id'),
+            $request->get_param('vat_rate'),
+            $request->get_param('dry_run'),
+            $request->get_param('chunk_size')
+        );
+        
+        if (is_wp_error($result)) {
+            return $result;
+        }
+        
+        return new WP_REST_Response($result, 202);
+    }
+    
+    public function get_recompute_status(WP_REST_Request $request) {
+        return new WP_REST_Response($this->recompute_job->format_status(), 200);
+    }
+    
+    public function cancel_recompute(WP_REST_Request $request) {
+        if (!$this->recompute_job->cancel()) {
+            return new WP_Error('no_running_job', 'No recompute job is running', array('status' => 404));
+        }
+        
+        return new WP_REST_Response($this->recompute_job->format_status(), 200);
+    }
+    
+    // Reporting endpoints
+    public function get_rollup_report(WP_REST_Request $request) {
+        $group_by = $request->get_param('group_by');
+        $group_by = is_array($group_by) ? $group_by : array_filter(array_map('trim', explode(',', (string) $group_by)));
+        
+        $invalid = array_diff($group_by, array_keys(CAH_Financial_Rollup::DIMENSIONS));
+        if (!empty($invalid)) {
+            return new WP_Error('invalid_group_by', 'Invalid group_by: ' . implode(', ', $invalid), array('status' => 400));
+        }
+        
+        $rows = $this->rollup->query(array(
+            'from' => $request->get_param('from'),
+            'to' => $request->get_param('to'),
+            'template_id' => $request->has_param('template_id') ? $request->get_param('template_id') : null,
+            'category' => $request->get_param('category'),
+            'status' => $request->get_param('status'),
+            'group_by' => $group_by
+        ));
+        
+        return new WP_REST_Response(array(
+            'rows' => $rows,
+            'group_by' => array_values($group_by),
+            'rebuild' => $this->rollup->get_rebuild_status()
+        ), 200);
+    }
+    
+    public function rebuild_rollup(WP_REST_Request $request) {
+        return new WP_REST_Response($this->rollup->start_rebuild(), 202);
+    }
+    
+    public function validate_month($value) {
+        return is_string($value) && preg_match('/^\d{4}-\d{2}$/', $value);
+    }
+    
     // Case financial endpoints
     public function get_case_financial(WP_REST_Request $request) {
         $case_id = $request->get_param('case_id');
@@ -391,11 +586,15 @@ class CAH_Financial_REST_API {
                     $item['amount'],
                     $item['description'] ?: '',
                     $item['is_percentage'] ?: false,
-                    $item['sort_order'] ?: 0
+                    $item['sort_order'] ?: 0,
+                    $item['percentage_base'] ?? null,
+                    $item['base_ref'] ?? null
                 );
             }
         }
         
+        $this->rollup->refresh_case($case_id);
+        
         return new WP_REST_Response(array('message' => 'Case financial data saved successfully'), 200);
     }
 }
\ No newline at end of file
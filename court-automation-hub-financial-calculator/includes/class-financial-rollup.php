@@ -0,0 +1,464 @@
+<?php
+/**
+ * Financial Rollup - Precomputed reporting cube across cases
+ * cah_financial_rollup holds sums per month (case creation), template,
+ * category and case status. cah_financial_rollup_cases keeps each case's
+ * current contribution, so a save only applies the difference to the cube
+ * instead of re-aggregating all cases.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Financial_Rollup {
+
+    private $wpdb;
+    private $calculator;
+
+    // Whether the case and cron hooks are registered
+    private static $hooks_registered = false;
+
+    // Pseudo categories next to the cost item categories
+    const CATEGORY_VAT = 'mwst';
+    const CATEGORY_TOTAL = 'gesamt';
+
+    const REBUILD_HOOK = 'cah_financial_rollup_rebuild';
+
+    // Rebuild progress (cursor over klage_cases)
+    const REBUILD_OPTION = 'cah_financial_rollup_rebuild';
+
+    const REBUILD_CHUNK_SIZE = 1000;
+
+    // group_by name => rollup column
+    const DIMENSIONS = array(
+        'month' => 'month',
+        'template' => 'template_id',
+        'category' => 'category',
+        'status' => 'case_status'
+    );
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->calculator = new CAH_Financial_Calculator_Engine();
+
+        if (!self::$hooks_registered) {
+            self::$hooks_registered = true;
+
+            // Status or creation date changes move the case to another cell
+            add_action('cah_case_updated', array($this, 'refresh_case'));
+
+            // After the integration removed the financial data
+            add_action('cah_case_deleted', array($this, 'refresh_case'), 20);
+
+            // For importers writing cases or items directly
+            add_action('cah_financial_cases_changed', array($this, 'refresh_cases'));
+
+            add_action(self::REBUILD_HOOK, array($this, 'run_rebuild_chunk'));
+        }
+    }
+
+    /**
+     * Update the cube for one case
+     */
+    public function refresh_case($case_id) {
+        return $this->refresh_cases(array($case_id));
+    }
+
+    /**
+     * Update the cube for the given cases; returns number of changed cases
+     * Pass $use_transaction = false when the caller already runs a transaction.
+     */
+    public function refresh_cases($case_ids, $use_transaction = true) {
+        $case_ids = array_values(array_unique(array_filter(array_map('intval', (array) $case_ids))));
+
+        if (empty($case_ids)) {
+            return 0;
+        }
+
+        if ($use_transaction) {
+            $this->wpdb->query('START TRANSACTION');
+        }
+
+        $changed = $this->apply_cases($case_ids);
+
+        if ($changed === false) {
+            $error = $this->wpdb->last_error;
+
+            if ($use_transaction) {
+                $this->wpdb->query('ROLLBACK');
+            }
+
+            return new WP_Error('rollup_failed', 'Fehler beim Aktualisieren der Auswertung: ' . $error);
+        }
+
+        if ($use_transaction) {
+            $this->wpdb->query('COMMIT');
+        }
+
+        return $changed;
+    }
+
+    /**
+     * Replace the stored contributions of the cases and apply the difference
+     */
+    private function apply_cases($case_ids) {
+        $ledger_table = $this->wpdb->prefix . 'cah_financial_rollup_cases';
+        $ids = implode(',', $case_ids);
+
+        // Locked so concurrent refreshes of a case serialize
+        $previous = array();
+        $rows = $this->wpdb->get_results(
+            "SELECT case_id, category, month, template_id, case_status, item_count, amount FROM $ledger_table
+             WHERE case_id IN ($ids) FOR UPDATE"
+        );
+
+        foreach ($rows as $row) {
+            $previous[intval($row->case_id)][$row->category] = array(
+                'month' => $row->month,
+                'template_id' => intval($row->template_id),
+                'case_status' => $row->case_status,
+                'item_count' => intval($row->item_count),
+                'cents' => self::to_cents($row->amount)
+            );
+        }
+
+        $current = $this->build_contributions($case_ids);
+        $deltas = array();
+        $changed = array();
+
+        foreach ($case_ids as $case_id) {
+            $before = $previous[$case_id] ?? array();
+            $after = $current[$case_id] ?? array();
+
+            if ($before == $after) {
+                continue;
+            }
+
+            $changed[] = $case_id;
+
+            foreach ($before as $category => $contribution) {
+                $this->add_delta($deltas, $category, $contribution, -1);
+            }
+
+            foreach ($after as $category => $contribution) {
+                $this->add_delta($deltas, $category, $contribution, 1);
+            }
+        }
+
+        if (empty($changed)) {
+            return 0;
+        }
+
+        if (!$this->write_deltas($deltas)) {
+            return false;
+        }
+
+        $result = $this->wpdb->query(
+            "DELETE FROM $ledger_table WHERE case_id IN (" . implode(',', $changed) . ")"
+        );
+
+        if ($result === false) {
+            return false;
+        }
+
+        $values = array();
+        foreach ($changed as $case_id) {
+            foreach ($current[$case_id] ?? array() as $category => $contribution) {
+                $values[] = $this->wpdb->prepare(
+                    '(%d, %s, %s, %d, %s, %d, %f)',
+                    $case_id, $category, $contribution['month'], $contribution['template_id'], $contribution['case_status'], $contribution['item_count'], $contribution['cents'] / 100
+                );
+            }
+        }
+
+        if (!empty($values)) {
+            $result = $this->wpdb->query(
+                "INSERT INTO $ledger_table (case_id, category, month, template_id, case_status, item_count, amount) VALUES " . implode(', ', $values)
+            );
+
+            if ($result === false) {
+                return false;
+            }
+        }
+
+        return count($changed);
+    }
+
+    /**
+     * Current contributions of the cases: category => cell and amounts
+     * Cases without financial record and items contribute nothing.
+     */
+    private function build_contributions($case_ids) {
+        $ids = implode(',', $case_ids);
+
+        $cases = $this->wpdb->get_results(
+            "SELECT c.id AS case_id, c.case_status, DATE_FORMAT(c.case_creation_date, '%Y-%m') AS month,
+                    f.id AS financial_id, f.template_id, f.vat_rate, f.vat_amount, f.total_amount
+             FROM {$this->wpdb->prefix}klage_cases c
+             LEFT JOIN {$this->wpdb->prefix}cah_case_financial f ON f.case_id = c.id
+             WHERE c.id IN ($ids)"
+        );
+
+        if (empty($cases)) {
+            return array();
+        }
+
+        // Items of all cases in one query
+        $items_by_case = array();
+        $items = $this->wpdb->get_results(
+            "SELECT id, case_id, name, category, amount, is_percentage, percentage_base, base_ref, sort_order
+             FROM {$this->wpdb->prefix}cah_cost_items
+             WHERE case_id IN ($ids) ORDER BY case_id, sort_order ASC, category ASC"
+        );
+
+        foreach ($items as $item) {
+            $items_by_case[intval($item->case_id)][] = $item;
+        }
+
+        $contributions = array();
+
+        foreach ($cases as $case) {
+            $case_id = intval($case->case_id);
+            $case_items = $items_by_case[$case_id] ?? array();
+            $has_financial = !empty($case->financial_id);
+
+            if (!$has_financial && empty($case_items)) {
+                continue;
+            }
+
+            $totals = $this->calculator->calculate_totals($case_items, $has_financial ? floatval($case->vat_rate) : null);
+
+            $cell = array(
+                'month' => $case->month ?: '0000-00',
+                'template_id' => intval($case->template_id),
+                'case_status' => $case->case_status ?: 'draft'
+            );
+
+            foreach ($totals['grouped_items'] as $category => $category_items) {
+                if (empty($category_items)) {
+                    continue;
+                }
+
+                $amount = 0;
+                foreach ($category_items as $item) {
+                    $amount += $item['amount'];
+                }
+
+                $contributions[$case_id][$category] = $cell + array(
+                    'item_count' => count($category_items),
+                    'cents' => self::to_cents(CAH_Financial_Calculator_Engine::round_amount($amount))
+                );
+            }
+
+            // Stored totals are what the case claims (the recompute job keeps them current)
+            $contributions[$case_id][self::CATEGORY_VAT] = $cell + array(
+                'item_count' => 0,
+                'cents' => self::to_cents($has_financial ? $case->vat_amount : $totals['vat_amount'])
+            );
+
+            $contributions[$case_id][self::CATEGORY_TOTAL] = $cell + array(
+                'item_count' => $totals['item_count'],
+                'cents' => self::to_cents($has_financial ? $case->total_amount : $totals['total_amount'])
+            );
+        }
+
+        return $contributions;
+    }
+
+    /**
+     * Add (or subtract) one contribution to the per-cell deltas
+     */
+    private function add_delta(&$deltas, $category, $contribution, $sign) {
+        $key = implode('|', array($contribution['month'], $contribution['template_id'], $category, $contribution['case_status']));
+
+        if (!isset($deltas[$key])) {
+            $deltas[$key] = array(
+                'month' => $contribution['month'],
+                'template_id' => $contribution['template_id'],
+                'category' => $category,
+                'case_status' => $contribution['case_status'],
+                'case_count' => 0,
+                'item_count' => 0,
+                'cents' => 0
+            );
+        }
+
+        $deltas[$key]['case_count'] += $sign;
+        $deltas[$key]['item_count'] += $sign * $contribution['item_count'];
+        $deltas[$key]['cents'] += $sign * $contribution['cents'];
+    }
+
+    /**
+     * Apply cell deltas in one upsert
+     */
+    private function write_deltas($deltas) {
+        // Same lock order in every transaction (no deadlocks between saves)
+        ksort($deltas);
+
+        $values = array();
+        foreach ($deltas as $delta) {
+            if ($delta['case_count'] === 0 && $delta['item_count'] === 0 && $delta['cents'] === 0) {
+                continue;
+            }
+
+            $values[] = $this->wpdb->prepare(
+                '(%s, %d, %s, %s, %d, %d, %f)',
+                $delta['month'], $delta['template_id'], $delta['category'], $delta['case_status'], $delta['case_count'], $delta['item_count'], $delta['cents'] / 100
+            );
+        }
+
+        if (empty($values)) {
+            return true;
+        }
+
+        return $this->wpdb->query(
+            "INSERT INTO {$this->wpdb->prefix}cah_financial_rollup (month, template_id, category, case_status, case_count, item_count, amount)
+             VALUES " . implode(', ', $values) . "
+             ON DUPLICATE KEY UPDATE case_count = case_count + VALUES(case_count),
+             item_count = item_count + VALUES(item_count), amount = amount + VALUES(amount)"
+        ) !== false;
+    }
+
+    /**
+     * Integer cents (exact sums, no float drift)
+     */
+    private static function to_cents($amount) {
+        return intval(round(floatval($amount) * 100));
+    }
+
+    /**
+     * Aggregate the cube
+     * $args: from, to (YYYY-MM), template_id, category, status, group_by (dimension names)
+     */
+    public function query($args = array()) {
+        $group_by = array_values(array_intersect(array_keys(self::DIMENSIONS), (array) ($args['group_by'] ?? array('month'))));
+        $columns = array_map(function($dimension) { return self::DIMENSIONS[$dimension]; }, $group_by);
+
+        $where = array('1=1');
+
+        if (!empty($args['from'])) {
+            $where[] = $this->wpdb->prepare('month >= %s', $args['from']);
+        }
+
+        if (!empty($args['to'])) {
+            $where[] = $this->wpdb->prepare('month <= %s', $args['to']);
+        }
+
+        if (isset($args['template_id']) && $args['template_id'] !== '' && $args['template_id'] !== null) {
+            $where[] = $this->wpdb->prepare('template_id = %d', $args['template_id']);
+        }
+
+        if (!empty($args['status'])) {
+            $where[] = $this->wpdb->prepare('case_status = %s', $args['status']);
+        }
+
+        // Each case has one gesamt row per cell; other categories would count it again
+        if (!empty($args['category'])) {
+            $where[] = $this->wpdb->prepare('category = %s', $args['category']);
+        } elseif (!in_array('category', $group_by, true)) {
+            $where[] = $this->wpdb->prepare('category = %s', self::CATEGORY_TOTAL);
+        }
+
+        $select = empty($columns) ? '' : implode(', ', $columns) . ', ';
+        $group = empty($columns) ? '' : ' GROUP BY ' . implode(', ', $columns) . ' ORDER BY ' . implode(', ', $columns);
+
+        $rows = $this->wpdb->get_results(
+            "SELECT {$select}SUM(case_count) AS case_count, SUM(item_count) AS item_count, SUM(amount) AS amount
+             FROM {$this->wpdb->prefix}cah_financial_rollup
+             WHERE " . implode(' AND ', $where) . $group,
+            ARRAY_A
+        );
+
+        $result = array();
+        foreach ($rows as $row) {
+            if (intval($row['case_count']) <= 0) {
+                continue;
+            }
+
+            foreach (array('template_id', 'case_count', 'item_count') as $field) {
+                if (isset($row[$field])) {
+                    $row[$field] = intval($row[$field]);
+                }
+            }
+            $row['amount'] = round(floatval($row['amount']), 2);
+
+            $result[] = $row;
+        }
+
+        return $result;
+    }
+
+    /**
+     * Rebuild the cube from scratch in the background (after install or upgrade)
+     * Incremental refreshes during the rebuild stay correct, as every refresh
+     * diffs against the stored contribution of the case.
+     */
+    public function start_rebuild() {
+        $this->wpdb->query("TRUNCATE TABLE {$this->wpdb->prefix}cah_financial_rollup_cases");
+        $this->wpdb->query("TRUNCATE TABLE {$this->wpdb->prefix}cah_financial_rollup");
+
+        $state = array(
+            'status' => 'running',
+            'cursor' => 0,
+            'processed' => 0,
+            'started_at' => current_time('mysql'),
+            'finished_at' => null,
+            'error' => null
+        );
+
+        update_option(self::REBUILD_OPTION, $state, false);
+
+        wp_clear_scheduled_hook(self::REBUILD_HOOK);
+        wp_schedule_single_event(time(), self::REBUILD_HOOK);
+
+        return $state;
+    }
+
+    /**
+     * Rebuild state (null if never rebuilt)
+     */
+    public function get_rebuild_status() {
+        $state = get_option(self::REBUILD_OPTION);
+        return is_array($state) ? $state : null;
+    }
+
+    /**
+     * Process one rebuild chunk and schedule the next (WP-Cron callback)
+     */
+    public function run_rebuild_chunk() {
+        $state = $this->get_rebuild_status();
+        if (!$state || $state['status'] !== 'running') {
+            return;
+        }
+
+        $case_ids = $this->wpdb->get_col($this->wpdb->prepare(
+            "SELECT id FROM {$this->wpdb->prefix}klage_cases WHERE id > %d ORDER BY id LIMIT %d",
+            $state['cursor'],
+            self::REBUILD_CHUNK_SIZE
+        ));
+
+        if (empty($case_ids)) {
+            $state['status'] = 'completed';
+            $state['finished_at'] = current_time('mysql');
+        } else {
+            $result = $this->refresh_cases($case_ids);
+
+            if (is_wp_error($result)) {
+                $state['status'] = 'failed';
+                $state['error'] = $result->get_error_message();
+                $state['finished_at'] = current_time('mysql');
+            } else {
+                $state['cursor'] = intval(end($case_ids));
+                $state['processed'] += count($case_ids);
+            }
+        }
+
+        update_option(self::REBUILD_OPTION, $state, false);
+
+        if ($state['status'] === 'running') {
+            wp_schedule_single_event(time(), self::REBUILD_HOOK);
+        }
+    }
+}
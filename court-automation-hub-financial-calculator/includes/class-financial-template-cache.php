@@ -0,0 +1,142 @@
+<?php
+/**
+ * Financial Template Cache - Cached template catalog with precomputed totals
+ * Each template is stored with its items, totals and category counts in the
+ * object cache (plus a request-local memo) and invalidated on template/item writes.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Financial_Template_Cache {
+
+    private $db_manager;
+    private $calculator;
+
+    // Request-local memo (catalog + template entries by id)
+    private static $catalog = null;
+    private static $entries = array();
+
+    const CACHE_GROUP = 'cah_financial';
+
+    public function __construct() {
+        $this->db_manager = new CAH_Financial_DB_Manager();
+        $this->calculator = new CAH_Financial_Calculator_Engine();
+    }
+
+    /**
+     * Get all templates (request memo -> object cache -> database)
+     */
+    public function get_templates() {
+        if (self::$catalog !== null) {
+            return self::$catalog;
+        }
+
+        $cache_key = self::cache_key('catalog');
+        $catalog = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+        if ($catalog === false) {
+            $catalog = $this->db_manager->get_templates();
+            wp_cache_set($cache_key, $catalog, self::CACHE_GROUP, DAY_IN_SECONDS);
+        }
+
+        self::$catalog = $catalog;
+
+        return $catalog;
+    }
+
+    /**
+     * Get template entry: array('template', 'items', 'totals', 'category_counts')
+     * Returns null for unknown templates
+     */
+    public function get_template_entry($template_id) {
+        $template_id = intval($template_id);
+
+        if (array_key_exists($template_id, self::$entries)) {
+            return self::$entries[$template_id];
+        }
+
+        $cache_key = self::cache_key('template_' . $template_id);
+        $entry = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+        if ($entry === false) {
+            $entry = $this->build_entry($template_id);
+
+            // Unknown ids are cached as well (stored as 0, the cache can't hold false)
+            wp_cache_set($cache_key, $entry ?: 0, self::CACHE_GROUP, DAY_IN_SECONDS);
+        }
+
+        $entry = $entry ?: null;
+        self::$entries[$template_id] = $entry;
+
+        return $entry;
+    }
+
+    /**
+     * Get template items
+     */
+    public function get_template_items($template_id) {
+        $entry = $this->get_template_entry($template_id);
+        return $entry ? $entry['items'] : array();
+    }
+
+    /**
+     * Load template, items and precomputed totals from the database
+     */
+    private function build_entry($template_id) {
+        $template = $this->db_manager->get_template($template_id);
+        if (!$template) {
+            return null;
+        }
+
+        $items = $this->db_manager->get_cost_items_by_template($template_id);
+
+        $category_counts = array_fill_keys(array_keys($this->calculator->get_category_names()), 0);
+        foreach ($items as $item) {
+            $category_counts[$item->category] = ($category_counts[$item->category] ?? 0) + 1;
+        }
+
+        return array(
+            'template' => $template,
+            'items' => $items,
+            'totals' => $this->calculator->calculate_totals($items),
+            'category_counts' => $category_counts
+        );
+    }
+
+    /**
+     * Invalidate one template (items or template row changed)
+     */
+    public static function invalidate_template($template_id) {
+        $template_id = intval($template_id);
+
+        wp_cache_delete(self::cache_key('template_' . $template_id), self::CACHE_GROUP);
+        unset(self::$entries[$template_id]);
+    }
+
+    /**
+     * Invalidate the template list (template created, renamed or deleted)
+     */
+    public static function invalidate_catalog() {
+        wp_cache_delete(self::cache_key('catalog'), self::CACHE_GROUP);
+        self::$catalog = null;
+    }
+
+    /**
+     * Invalidate everything (e.g. after bulk changes outside the DB manager)
+     */
+    public static function flush() {
+        update_option('cah_financial_cache_version', intval(get_option('cah_financial_cache_version', 0)) + 1);
+
+        self::$catalog = null;
+        self::$entries = array();
+    }
+
+    /**
+     * Versioned cache key (version bumped by flush)
+     */
+    private static function cache_key($key) {
+        return $key . '_' . get_option('cah_financial_cache_version', 0);
+    }
+}
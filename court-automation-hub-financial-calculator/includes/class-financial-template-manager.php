@@ -11,10 +11,12 @@ class CAH_Financial_Template_Manager {
     
     private $db_manager;
     private $calculator;
+    private $template_cache;
     
     public function __construct() {
         $this->db_manager = new CAH_Financial_DB_Manager();
         $this->calculator = new CAH_Financial_Calculator_Engine();
+        $this->template_cache = new CAH_Financial_Template_Cache();
     }
     
     /**
@@ -161,16 +163,15 @@ class CAH_Financial_Template_Manager {
      * Get template with calculated totals
      */
     public function get_template_with_totals($template_id) {
-        $template = $this->db_manager->get_template($template_id);
-        if (!$template) {
+        $entry = $this->template_cache->get_template_entry($template_id);
+        if (!$entry) {
             return null;
         }
         
-        $cost_items = $this->db_manager->get_cost_items_by_template($template_id);
-        $totals = $this->calculator->calculate_totals($cost_items);
-        
-        $template->cost_items = $cost_items;
-        $template->totals = $totals;
+        // Copy, so callers can't modify the cached row
+        $template = clone $entry['template'];
+        $template->cost_items = $entry['items'];
+        $template->totals = $entry['totals'];
         
         return $template;
     }
@@ -196,19 +197,7 @@ class CAH_Financial_Template_Manager {
         }
         
         // Copy cost items
-        $source_items = $this->db_manager->get_cost_items_by_template($source_template_id);
-        foreach ($source_items as $item) {
-            $this->db_manager->create_cost_item(
-                $new_template_id,
-                null,
-                $item->name,
-                $item->category,
-                $item->amount,
-                $item->description,
-                $item->is_percentage,
-                $item->sort_order
-            );
-        }
+        $this->db_manager->copy_template_items_to_template($source_template_id, $new_template_id);
         
         return $new_template_id;
     }
@@ -217,13 +206,6 @@ class CAH_Financial_Template_Manager {
      * Save case configuration as new template
      */
     public function save_case_as_template($case_id, $template_name, $template_description = '') {
-        // Get case cost items
-        $case_items = $this->db_manager->get_cost_items_by_case($case_id);
-        
-        if (empty($case_items)) {
-            return false;
-        }
-        
         // Create new template
         $template_id = $this->db_manager->create_template(
             $template_name,
@@ -236,17 +218,12 @@ class CAH_Financial_Template_Manager {
         }
         
         // Copy case items to template
-        foreach ($case_items as $item) {
-            $this->db_manager->create_cost_item(
-                $template_id,
-                null, // Template item, not case-specific
-                $item->name,
-                $item->category,
-                $item->amount,
-                $item->description,
-                $item->is_percentage,
-                $item->sort_order
-            );
+        $copied = $this->db_manager->copy_case_items_to_template($case_id, $template_id);
+        
+        // Case without items (or copy failed) - don't leave an empty template behind
+        if (!$copied) {
+            $this->db_manager->delete_template($template_id);
+            return false;
         }
         
         return $template_id;
@@ -256,17 +233,17 @@ class CAH_Financial_Template_Manager {
      * Get template statistics
      */
     public function get_template_stats($template_id) {
-        $template = $this->get_template_with_totals($template_id);
-        if (!$template) {
+        $entry = $this->template_cache->get_template_entry($template_id);
+        if (!$entry) {
             return null;
         }
         
         return array(
-            'total_items' => count($template->cost_items),
-            'categories' => array_count_values(array_column($template->cost_items, 'category')),
-            'subtotal' => $template->totals['subtotal'],
-            'total_amount' => $template->totals['total_amount'],
-            'last_updated' => $template->updated_at
+            'total_items' => count($entry['items']),
+            'categories' => array_filter($entry['category_counts']),
+            'subtotal' => $entry['totals']['subtotal'],
+            'total_amount' => $entry['totals']['total_amount'],
+            'last_updated' => $entry['template']->updated_at
         );
     }
 }
\ No newline at end of file
@@ -20,9 +20,21 @@ define('CAH_PLUGIN_URL', plugin_dir_url(__FILE__));
 define('CAH_PLUGIN_PATH', plugin_dir_path(__FILE__));
 define('CAH_PLUGIN_VERSION', '1.6.0');
 
+// Classes are loaded on first use (see CAH_Autoloader)
+require_once CAH_PLUGIN_PATH . 'includes/class-autoloader.php';
+$cah_autoloader = new CAH_Autoloader('CAH_', array(
+    CAH_PLUGIN_PATH . 'includes',
+    CAH_PLUGIN_PATH . 'admin',
+    CAH_PLUGIN_PATH . 'api'
+));
+$cah_autoloader->register();
+
 // Main plugin class
 class CourtAutomationHub {
     
+    // Lazily created components (see init_components)
+    private $container;
+    
     public function __construct() {
         add_action('plugins_loaded', array($this, 'init'));
         register_activation_hook(__FILE__, array($this, 'activate'));
@@ -30,60 +42,120 @@ class CourtAutomationHub {
     }
     
     public function init() {
+        $this->container = new CAH_Service_Container('core');
+        
         // Load text domain
         load_plugin_textdomain('court-automation-hub', false, dirname(plugin_basename(__FILE__)) . '/languages/');
         
-        // Include required files
-        $this->includes();
+        // Register component factories
+        $this->register_services();
         
         // Initialize components
         $this->init_components();
         
         // Add hooks
         $this->add_hooks();
+        
+        $this->container->finish_init();
     }
     
-    private function includes() {
-        require_once CAH_PLUGIN_PATH . 'includes/class-database.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-schema-manager.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-form-generator.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-import-export-manager.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-database-admin.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-case-manager.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-audit-logger.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-debtor-manager.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-email-evidence.php';
-        // Financial calculator removed in v1.4.7 - moved to separate plugin
-        require_once CAH_PLUGIN_PATH . 'includes/class-legal-framework.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-court-manager.php';
-        require_once CAH_PLUGIN_PATH . 'includes/class-n8n-connector.php';
-        require_once CAH_PLUGIN_PATH . 'admin/class-admin-dashboard.php';
-        require_once CAH_PLUGIN_PATH . 'api/class-rest-api.php';
+    private function register_services() {
+        $services = array(
+            'schema_manager' => 'CAH_Schema_Manager',
+            'database' => 'CAH_Database',
+            'admin_dashboard' => 'CAH_Admin_Dashboard',
+            'database_admin' => 'CAH_Database_Admin',
+            'rest_api' => 'CAH_REST_API',
+            'audit_logger' => 'CAH_Audit_Logger',
+            'case_manager' => 'CAH_Case_Manager',
+            'debtor_manager' => 'CAH_Debtor_Manager',
+            'email_evidence' => 'CAH_Email_Evidence',
+            // Financial calculator removed in v1.4.7 - moved to separate plugin
+            'legal_framework' => 'CAH_Legal_Framework',
+            'court_manager' => 'CAH_Court_Manager',
+            'n8n_connector' => 'CAH_N8N_Connector',
+            'document_generator' => 'CAH_Document_Generator'
+        );
+        
+        foreach ($services as $id => $class) {
+            $this->container->set($id, function() use ($class) {
+                return new $class();
+            });
+        }
     }
     
     private function init_components() {
-        // Initialize schema manager and auto-sync database
-        $schema_manager = new CAH_Schema_Manager();
-        $schema_manager->synchronize_all_tables();
-        
-        // Initialize all components
-        $this->database = new CAH_Database();
-        $this->admin_dashboard = new CAH_Admin_Dashboard();
-        $this->database_admin = new CAH_Database_Admin();
-        $this->rest_api = new CAH_REST_API();
-        $this->audit_logger = new CAH_Audit_Logger();
-        $this->case_manager = new CAH_Case_Manager();
-        $this->debtor_manager = new CAH_Debtor_Manager();
-        $this->email_evidence = new CAH_Email_Evidence();
-        // Financial calculator removed in v1.4.7 - moved to separate plugin
-        $this->legal_framework = new CAH_Legal_Framework();
-        $this->court_manager = new CAH_Court_Manager();
-        $this->n8n_connector = new CAH_N8N_Connector();
+        // Read replica routing (only with CAH_REPLICA_DB_HOST in wp-config.php)
+        if (defined('CAH_REPLICA_DB_HOST')) {
+            CAH_Query_Router::register_hooks();
+        }
+        
+        // Cases state version for REST ETags (bumped after case writes)
+        CAH_Rest_API::register_hooks();
+        
+        // Index advisor workload capture (only while enabled in the advisor)
+        if (defined('SAVEQUERIES') && SAVEQUERIES) {
+            CAH_Index_Advisor::register_hooks();
+        }
+        
+        // Auto-sync database schema once per plugin version (was every request);
+        // columns only, index builds wait for the database admin / wp cah sync-schema
+        if (get_option('cah_schema_sync_version') !== CAH_PLUGIN_VERSION) {
+            $this->container->get('schema_manager')->synchronize_all_tables();
+            update_option('cah_schema_sync_version', CAH_PLUGIN_VERSION);
+        }
+        
+        // Components are created when the first hook they handle fires,
+        // so front-end and REST requests never load the admin classes
+        $this->container->load_on('admin_init', 'database');
+        $this->container->load_on(array('admin_menu', 'admin_init'), 'admin_dashboard');
+        $this->container->load_on(array('admin_menu', 'admin_init'), 'database_admin');
+        $this->container->load_on(array('rest_api_init', 'cah_schema_updated'), 'rest_api');
+        $this->container->load_on(array('admin_init', 'cah_audit_maintenance'), 'audit_logger');
+        $this->container->load_on(array('admin_init', 'cron_schedules', 'cah_n8n_process_queue', 'cah_case_created', 'cah_case_updated'), 'n8n_connector');
+        $this->container->load_on(array('admin_init', 'cah_document_worker'), 'document_generator');
+        $this->container->load_on(array('cah_case_created', 'cah_cases_imported'), 'email_evidence');
+        
+        // Compiled forms are per schema version
+        add_action('cah_schema_updated', array('CAH_Form_Generator', 'flush_cache'));
+        add_action('cah_schema_updated', array('CAH_Case_Repository', 'flush'));
+        
+        // Parallel import/export (wp cah import|export)
+        if (defined('WP_CLI') && WP_CLI) {
+            WP_CLI::add_command('cah', 'CAH_CLI_Command');
+        }
     }
     
     private function add_hooks() {
         add_action('wp_enqueue_scripts', array($this, 'enqueue_scripts'));
         add_action('admin_enqueue_scripts', array($this, 'admin_enqueue_scripts'));
+        
+        // Bootstrap profile headers for bootstrap_benchmark.py
+        if (defined('CAH_PROFILE_BOOTSTRAP') && CAH_PROFILE_BOOTSTRAP) {
+            add_action('template_redirect', array($this, 'send_profile_headers'), PHP_INT_MAX);
+            add_action('admin_init', array($this, 'send_profile_headers'), PHP_INT_MAX);
+            add_filter('rest_pre_serve_request', array($this, 'send_profile_headers'), PHP_INT_MAX);
+        }
+    }
+    
+    /**
+     * Component (created on first access)
+     */
+    public function get_service($id) {
+        return $this->container ? $this->container->get($id) : null;
+    }
+    
+    /**
+     * Send bootstrap time and memory as response headers
+     */
+    public function send_profile_headers($value = null) {
+        if (!headers_sent()) {
+            foreach (CAH_Service_Container::get_profile_headers() as $header) {
+                header($header, false);
+            }
+        }
+        
+        return $value;
     }
     
     public function enqueue_scripts() {
@@ -103,9 +175,6 @@ class CourtAutomationHub {
     }
     
     public function activate() {
-        // Include database class for activation
-        require_once CAH_PLUGIN_PATH . 'includes/class-database.php';
-        
         // Create database tables
         $database = new CAH_Database();
         $database->create_tables_direct();
@@ -118,6 +187,12 @@ class CourtAutomationHub {
     }
     
     public function deactivate() {
+        // Stop audit retention job
+        CAH_Audit_Logger::unschedule_maintenance();
+        
+        // Stop N8N delivery worker
+        CAH_N8N_Connector::unschedule_worker();
+        
         // Flush rewrite rules
         flush_rewrite_rules();
     }
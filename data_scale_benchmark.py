@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+Data-Scale Benchmark for Court Automation Hub
+Seeds a local WordPress/MariaDB install with deterministic synthetic data
+(klage_* and cah_* tables) at several sizes and times the heavy plugin
+paths inside WordPress through WP-CLI:
+
+    process_csv_upload, render_cases_list, admin_page_dashboard,
+    export_cases_csv, export_table_data and the financial save path
+    (CAH_Financial_DB_Manager::save_case_financial_diff)
+
+Results are appended to a JSON history and compared with the previous run
+of the same size, so regressions show up release over release.
+
+The benchmark TRUNCATES the plugin tables - use a dedicated test site.
+Seeding uses LOAD DATA LOCAL INFILE (local_infile must be enabled).
+
+Usage:
+    python3 data_scale_benchmark.py --wp-path /var/www/bench --sizes 1000,10000,100000 --yes
+    python3 data_scale_benchmark.py --wp-path /var/www/bench --sizes 1000000 --repeat 3 --ops render_cases_list --yes
+    python3 data_scale_benchmark.py --generate-csv forderungen.csv --rows 5000   # CSV only, no WordPress
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+import financial_calculator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(BASE_DIR, 'data_scale_history.json')
+
+OPERATIONS = [
+    'admin_page_dashboard',
+    'render_cases_list',
+    'render_cases_list_search',
+    'export_cases_csv',
+    'export_table_data',
+    'financial_save',
+    'process_csv_upload'
+]
+
+# Operations below this median difference (ms) are never reported as regressions
+NOISE_FLOOR_MS = 5.0
+
+# Forderungen.com export columns (same order as the plugin's template download)
+FORDERUNGEN_HEADER = [
+    'Fall-ID (CSV)', 'Fall-Status', 'Brief-Status', 'Briefe', 'Mandant', 'Schuldner',
+    'Einreichungsdatum', 'Beweise', 'Dokumente', 'links zu Dokumenten', 'Firmenname',
+    'Vorname', 'Nachname', 'Adresse', 'Postleitzahl', 'Stadt', 'Land'
+]
+
+FIRST_NAMES = [
+    'Max', 'Anna', 'Lukas', 'Sophie', 'Jonas', 'Marie', 'Felix', 'Laura', 'Paul', 'Lea',
+    'Tim', 'Julia', 'Leon', 'Hannah', 'Niklas', 'Lena', 'David', 'Sarah', 'Jan', 'Katharina',
+    'Moritz', 'Johanna', 'Tobias', 'Clara', 'Sebastian', 'Emma', 'Florian', 'Mia', 'Alexander', 'Nina'
+]
+LAST_NAMES = [
+    'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz', 'Hoffmann',
+    'Schäfer', 'Koch', 'Bauer', 'Richter', 'Klein', 'Wolf', 'Schröder', 'Neumann', 'Schwarz', 'Zimmermann',
+    'Braun', 'Krüger', 'Hofmann', 'Hartmann', 'Lange', 'Schmitt', 'Werner', 'Schmitz', 'Krause', 'Meier',
+    'Lehmann', 'Köhler', 'Maier', 'Herrmann', 'König', 'Walter', 'Mayer', 'Huber', 'Kaiser', 'Fuchs'
+]
+STREETS = [
+    'Hauptstraße', 'Bahnhofstraße', 'Gartenstraße', 'Schulstraße', 'Dorfstraße', 'Bergstraße',
+    'Lindenstraße', 'Kirchstraße', 'Waldstraße', 'Ringstraße', 'Mühlenweg', 'Am Markt',
+    'Goethestraße', 'Schillerstraße', 'Friedrichstraße'
+]
+CITIES = [
+    (10115, 'Berlin'), (20095, 'Hamburg'), (80331, 'München'), (50667, 'Köln'),
+    (60311, 'Frankfurt am Main'), (70173, 'Stuttgart'), (40213, 'Düsseldorf'), (44135, 'Dortmund'),
+    (45127, 'Essen'), (4109, 'Leipzig'), (28195, 'Bremen'), (1067, 'Dresden'), (30159, 'Hannover'),
+    (90402, 'Nürnberg'), (47051, 'Duisburg'), (44787, 'Bochum'), (42103, 'Wuppertal'),
+    (33602, 'Bielefeld'), (53111, 'Bonn'), (48143, 'Münster')
+]
+COMPANY_WORDS = ['Media', 'Marketing', 'Direkt', 'Online', 'Handel', 'Service', 'Digital', 'Vertrieb', 'Consulting', 'Versand']
+COMPANY_FORMS = ['GmbH', 'AG', 'UG (haftungsbeschränkt)', 'GmbH & Co. KG', 'e.K.']
+MANDANTEN = [
+    'Kanzlei Berger & Partner', 'Rechtsanwälte Schuster', 'Datenschutz Kanzlei Nord',
+    'Klage.Click Mandant', 'RA Dr. Vogel', 'Kanzlei am Rathaus', 'Anwaltsbüro Kessler', 'DSGVO Recht GmbH'
+]
+SUBJECTS = [
+    'Ihr exklusives Angebot wartet', 'Nur heute: 50% Rabatt', 'Newsletter März', 'Gewinnspiel - Sie haben gewonnen!',
+    'Letzte Chance auf Ihren Gutschein', 'Neue Kollektion eingetroffen', 'Ihre Rechnung (Werbung)', 'Kostenloses Webinar'
+]
+# (value, weight)
+CASE_STATUSES = [('draft', 30), ('pending', 20), ('processing', 25), ('completed', 20), ('cancelled', 5)]
+BRIEF_STATUSES = [('pending', 45), ('sent', 35), ('delivered', 15), ('failed', 5)]
+
+FINANCIAL_TEMPLATES = [
+    ('DSGVO Standard', 'Standard-Kostenstruktur für DSGVO-Verstöße', [
+        {'name': 'Grundschaden', 'category': 'grundkosten', 'amount': 350.00},
+        {'name': 'Anwaltskosten', 'category': 'anwaltskosten', 'amount': 96.90},
+        {'name': 'Kommunikationskosten', 'category': 'sonstige', 'amount': 13.36},
+        {'name': 'Gerichtskosten', 'category': 'gerichtskosten', 'amount': 32.00}
+    ]),
+    ('DSGVO Erhöht', 'Wiederholte Verstöße', [
+        {'name': 'Grundschaden', 'category': 'grundkosten', 'amount': 500.00},
+        {'name': 'Anwaltskosten', 'category': 'anwaltskosten', 'amount': 120.50},
+        {'name': 'Auslagenpauschale', 'category': 'sonstige', 'amount': 20, 'is_percentage': 1,
+         'percentage_base': 'category', 'base_ref': 'anwaltskosten'},
+        {'name': 'Gerichtskosten', 'category': 'gerichtskosten', 'amount': 38.00}
+    ]),
+    ('Mahnverfahren', 'Gerichtliches Mahnverfahren', [
+        {'name': 'Hauptforderung', 'category': 'grundkosten', 'amount': 250.00},
+        {'name': 'Mahngebühr', 'category': 'gerichtskosten', 'amount': 36.00},
+        {'name': 'Verzugszinsen', 'category': 'sonstige', 'amount': 5, 'is_percentage': 1,
+         'percentage_base': 'running', 'base_ref': ''}
+    ])
+]
+
+FIRST_DATE = date(2019, 1, 1)
+LAST_DATE = date(2025, 12, 31)
+
+
+def weighted(rng, choices):
+    total = sum(weight for _, weight in choices)
+    pick = rng.random() * total
+    for value, weight in choices:
+        pick -= weight
+        if pick < 0:
+            return value
+    return choices[-1][0]
+
+
+def slug(text):
+    text = text.lower()
+    for umlaut, replacement in (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')):
+        text = text.replace(umlaut, replacement)
+    return re.sub(r'[^a-z0-9]+', '-', text).strip('-')
+
+
+def person(index):
+    """Debtor identity for a pool index (pure arithmetic: fast and order independent)"""
+    first_name = FIRST_NAMES[(index * 7) % len(FIRST_NAMES)]
+    last_name = LAST_NAMES[(index * 13 + index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    postal_base, city = CITIES[(index * 17) % len(CITIES)]
+    is_company = (index * 31) % 100 < 35
+
+    company = ''
+    if is_company:
+        company = '%s %s %s' % (last_name, COMPANY_WORDS[(index * 3) % len(COMPANY_WORDS)],
+                                COMPANY_FORMS[(index * 11) % len(COMPANY_FORMS)])
+
+    domain = slug(company) + '.de' if company else ('web.de', 'gmx.de', 't-online.de', 'gmail.com')[index % 4]
+    local = 'info' if company else '%s.%s%d' % (slug(first_name), slug(last_name), index % 97)
+
+    return {
+        'first_name': first_name,
+        'last_name': last_name,
+        'company': company,
+        'address': '%s %d' % (STREETS[(index * 5) % len(STREETS)], index % 180 + 1),
+        'postal_code': '%05d' % (postal_base + index % 40),
+        'city': city,
+        'country': 'Deutschland',
+        'email': '%s@%s' % (local, domain)
+    }
+
+
+def vary(debtor, rng):
+    """Small spelling variations seen when the same debtor is exported again"""
+    debtor = dict(debtor)
+    variation = rng.randrange(4)
+    if variation == 0:
+        debtor['last_name'] = debtor['last_name'].upper()
+    elif variation == 1:
+        debtor['address'] = debtor['address'].replace('straße', 'str.')
+    elif variation == 2:
+        debtor['first_name'] = ' ' + debtor['first_name'] + ' '
+    else:
+        debtor['city'] = debtor['city'].lower()
+    return debtor
+
+
+class SyntheticData:
+    """
+    Deterministic Forderungen.com-shaped cases for a seed
+    Debtors come from a pool smaller than the number of cases with a skewed
+    pick, so some debtors have many cases (repeat spammers) and most have one.
+    """
+
+    def __init__(self, seed, rows, debtor_ratio=0.55):
+        self.seed = seed
+        self.rows = rows
+        self.pool_size = max(1, int(rows * debtor_ratio))
+        self.day_span = (LAST_DATE - FIRST_DATE).days
+
+    def cases(self, id_prefix='SPAM', missing_id_rate=0.0):
+        rng = random.Random(self.seed)
+        seen = {}
+
+        for number in range(1, self.rows + 1):
+            person_index = int(self.pool_size * rng.random() ** 2.2)
+            occurrence = seen.get(person_index, 0)
+            seen[person_index] = occurrence + 1
+
+            debtor = person(person_index)
+            if occurrence and rng.random() < 0.3:
+                debtor = vary(debtor, rng)
+
+            # Skewed towards recent dates
+            submitted = FIRST_DATE + timedelta(days=int(self.day_span * rng.random() ** 0.6))
+            created = datetime.combine(submitted, datetime.min.time()) + timedelta(
+                days=rng.randrange(0, 10), seconds=rng.randrange(8 * 3600, 19 * 3600))
+            received = datetime.combine(submitted, datetime.min.time()) - timedelta(
+                days=rng.randrange(1, 60), seconds=-rng.randrange(0, 86400))
+            mandant = MANDANTEN[min(int(len(MANDANTEN) * rng.random() ** 1.8), len(MANDANTEN) - 1)]
+            subject = SUBJECTS[rng.randrange(len(SUBJECTS))]
+            recipient = 'kontakt@%s.de' % slug(mandant)
+
+            case_id = '%s-%d-%06d' % (id_prefix, submitted.year, number)
+            if missing_id_rate and rng.random() < missing_id_rate:
+                case_id = ''
+
+            yield {
+                'number': number,
+                'person_index': person_index,
+                'occurrence': occurrence,
+                'case_id': case_id,
+                'status': weighted(rng, CASE_STATUSES),
+                'brief_status': weighted(rng, BRIEF_STATUSES),
+                'briefe': 1 + int(3 * rng.random() ** 3),
+                'mandant': mandant,
+                'debtor': debtor,
+                'submitted': submitted,
+                'created': created,
+                'received': received,
+                'subject': subject,
+                'recipient': recipient,
+                'beweise': self.beweise(rng, debtor, received, subject, recipient),
+                'dokumente': ', '.join(rng.sample(['E-Mail Screenshot', 'Header-Analyse', 'Widerspruch',
+                                                   'Opt-In Nachweis', 'Abmahnung'], rng.randrange(1, 4))),
+                'links': 'https://dokumente.example.com/%s/%d.pdf' % (slug(mandant), number),
+                'template': rng.randrange(len(FINANCIAL_TEMPLATES)),
+                'has_financial': rng.random() < 0.85,
+                'extra_item': rng.random() < 0.2,
+                'damage_variation': rng.choice((0, 0, 0, 50, 100, 150)),
+                'has_email': rng.random() < 0.9
+            }
+
+    @staticmethod
+    def beweise(rng, debtor, received, subject, recipient):
+        lines = [
+            'E-Mail vom %s %s Uhr an %s' % (received.strftime('%d.%m.%Y'), received.strftime('%H:%M'), recipient),
+            'Betreff: %s' % subject,
+            'Absender: %s' % debtor['email'],
+            'Keine Einwilligung (Art. 6 DSGVO), kein Double-Opt-In',
+            'Widerspruch am %s ignoriert' % (received + timedelta(days=rng.randrange(2, 20))).strftime('%d.%m.%Y')
+        ]
+        return '\n'.join(lines[:rng.randrange(1, len(lines) + 1)])
+
+
+def format_csv_date(value, rng):
+    """Mostly German dates, some ISO (both accepted by the importer)"""
+    return value.strftime('%Y-%m-%d') if rng.random() < 0.25 else value.strftime('%d.%m.%Y')
+
+
+def write_forderungen_csv(path, data, id_prefix='SPAM', missing_id_rate=0.02):
+    """Forderungen.com export: BOM, ';' delimited, multi-line Beweise quoted"""
+    rng = random.Random(data.seed + 1)
+
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        handle.write('\ufeff')
+        writer = csv.writer(handle, delimiter=';', lineterminator='\n')
+        writer.writerow(FORDERUNGEN_HEADER)
+
+        for case in data.cases(id_prefix, missing_id_rate):
+            debtor = case['debtor']
+            name = debtor['company'] or ('%s %s' % (debtor['first_name'].strip(), debtor['last_name']))
+            writer.writerow([
+                case['case_id'], case['status'], case['brief_status'], case['briefe'], case['mandant'], name,
+                format_csv_date(case['submitted'], rng), case['beweise'], case['dokumente'], case['links'],
+                debtor['company'], debtor['first_name'], debtor['last_name'], debtor['address'],
+                debtor['postal_code'], debtor['city'], debtor['country']
+            ])
+
+
+def tsv_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class TsvTable:
+    def __init__(self, directory, table, columns):
+        self.table = table
+        self.columns = columns
+        self.path = os.path.join(directory, table + '.tsv')
+        self.handle = open(self.path, 'w', encoding='utf-8', newline='')
+        self.rows = 0
+
+    def write(self, *values):
+        self.handle.write('\t'.join(tsv_value(value) for value in values) + '\n')
+        self.rows += 1
+
+    def close(self):
+        self.handle.close()
+
+    def load_sql(self, prefix):
+        return ("LOAD DATA LOCAL INFILE '%s' INTO TABLE %s%s CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s);\n"
+                % (self.path.replace('\\', '/'), prefix, self.table, ', '.join(self.columns)))
+
+
+def case_items(case):
+    items = [dict(item) for item in FINANCIAL_TEMPLATES[case['template']][2]]
+    items[0]['amount'] += case['damage_variation']
+    if case['extra_item']:
+        items.append({'name': 'Sonstige Auslagen', 'category': 'sonstige', 'amount': 12.50 + case['number'] % 40})
+    return items
+
+
+def write_seed_files(directory, data):
+    """TSV files for all seeded tables; ids are assigned here so rows can reference each other"""
+    debtors = TsvTable(directory, 'klage_debtors', [
+        'id', 'debtors_name', 'debtors_company', 'debtors_first_name', 'debtors_last_name', 'debtors_email',
+        'debtors_address', 'debtors_postal_code', 'debtors_city', 'debtors_country', 'rechtsform',
+        'datenquelle', 'letzte_aktualisierung'])
+    cases = TsvTable(directory, 'klage_cases', [
+        'id', 'case_id', 'case_creation_date', 'case_updated_date', 'case_status', 'case_priority',
+        'brief_status', 'submission_date', 'mandant', 'debtor_id', 'total_amount', 'import_source',
+        'briefe', 'schuldner', 'beweise', 'dokumente', 'links_zu_dokumenten', 'created_at'])
+    emails = TsvTable(directory, 'klage_emails', [
+        'case_id', 'emails_received_date', 'emails_received_time', 'emails_sender_email',
+        'emails_user_email', 'emails_subject', 'emails_content'])
+    templates = TsvTable(directory, 'cah_financial_templates', ['id', 'name', 'description', 'is_default'])
+    items = TsvTable(directory, 'cah_cost_items', [
+        'template_id', 'case_id', 'name', 'category', 'amount', 'description', 'is_percentage',
+        'percentage_base', 'base_ref', 'sort_order'])
+    financials = TsvTable(directory, 'cah_case_financial', [
+        'case_id', 'template_id', 'subtotal', 'vat_rate', 'vat_amount', 'total_amount'])
+
+    def write_item(template_id, case_id, item, sort_order):
+        items.write(template_id, case_id, item['name'], item['category'], '%.2f' % item['amount'], '',
+                    item.get('is_percentage', 0), item.get('percentage_base'), item.get('base_ref'), sort_order)
+
+    for template_id, (name, description, template_items) in enumerate(FINANCIAL_TEMPLATES, 1):
+        templates.write(template_id, name, description, 1 if template_id == 1 else 0)
+        for sort_order, item in enumerate(template_items):
+            write_item(template_id, None, item, sort_order)
+
+    debtor_ids = {}
+    rng = random.Random(data.seed + 2)
+    sample_case_ids = []
+
+    for case in data.cases():
+        debtor = case['debtor']
+
+        # Repeat debtors mostly share a row; some were imported again as duplicates
+        debtor_id = debtor_ids.get(case['person_index'])
+        if debtor_id is None or rng.random() < 0.3:
+            debtor_id = debtors.rows + 1
+            debtor_ids.setdefault(case['person_index'], debtor_id)
+
+            full_name = ('%s %s' % (debtor['first_name'].strip(), debtor['last_name'])).strip()
+            debtors.write(
+                debtor_id, '%s (%s)' % (debtor['company'], full_name) if debtor['company'] else full_name,
+                debtor['company'], debtor['first_name'].strip(), debtor['last_name'], debtor['email'],
+                debtor['address'], debtor['postal_code'], debtor['city'], debtor['country'],
+                'unternehmen' if debtor['company'] else 'natuerliche_person', 'forderungen_com',
+                case['created'].strftime('%Y-%m-%d %H:%M:%S'))
+
+        case_pk = case['number']
+        total = 0.0
+
+        if case['has_financial']:
+            template_id = case['template'] + 1
+            case_item_list = case_items(case)
+            totals = financial_calculator.calculate_totals(case_item_list, 19.00)
+            total = totals['total_amount']
+
+            for sort_order, item in enumerate(case_item_list):
+                write_item(None, case_pk, item, sort_order)
+            financials.write(case_pk, template_id, '%.2f' % totals['subtotal'], '19.00',
+                             '%.2f' % totals['vat_amount'], '%.2f' % totals['total_amount'])
+
+            if len(sample_case_ids) < 200 and case_pk % 7 == 0:
+                sample_case_ids.append(case_pk)
+
+        created = case['created'].strftime('%Y-%m-%d %H:%M:%S')
+        updated = (case['created'] + timedelta(days=case_pk % 30)).strftime('%Y-%m-%d %H:%M:%S')
+        schuldner = debtor['company'] or ('%s %s' % (debtor['first_name'].strip(), debtor['last_name']))
+
+        cases.write(case_pk, case['case_id'], created, updated, case['status'], 'medium', case['brief_status'],
+                    case['submitted'].isoformat(), case['mandant'], debtor_id, '%.2f' % total, 'forderungen_com',
+                    case['briefe'], schuldner, case['beweise'], case['dokumente'], case['links'], created)
+
+        if case['has_email']:
+            emails.write(case_pk, case['received'].date().isoformat(), case['received'].strftime('%H:%M:%S'),
+                         debtor['email'], case['recipient'], case['subject'],
+                         'Werbe-E-Mail ohne Einwilligung.\n' + case['beweise'])
+
+    tables = [templates, debtors, cases, emails, items, financials]
+    for table in tables:
+        table.close()
+
+    return tables, sample_case_ids
+
+
+class WordPress:
+    def __init__(self, wp_cli, path, user):
+        self.command = [wp_cli, '--path=' + path]
+        self.user = user
+
+    def run(self, args, stdin=None, user=False):
+        command = self.command + args + (['--user=' + self.user] if user else [])
+        output = subprocess.run(command, input=stdin, capture_output=True, text=True)
+        if output.returncode != 0:
+            raise RuntimeError('%s failed: %s' % (' '.join(args[:2]), output.stderr.strip() or output.stdout.strip()))
+        return output.stdout
+
+    def table_prefix(self):
+        return self.run(['config', 'get', 'table_prefix']).strip()
+
+    def query(self, sql):
+        return self.run(['db', 'query', '--local-infile=1'], stdin=sql)
+
+
+SEED_TABLES = [
+    'klage_cases', 'klage_debtors', 'klage_emails', 'cah_cost_items', 'cah_case_financial',
+    'cah_financial_templates', 'cah_financial_rollup', 'cah_financial_rollup_cases'
+]
+
+
+def seed_database(wp, prefix, data, work_dir):
+    tables, sample_case_ids = write_seed_files(work_dir, data)
+
+    sql = 'SET FOREIGN_KEY_CHECKS = 0;\nSET UNIQUE_CHECKS = 0;\n'
+    sql += ''.join('TRUNCATE TABLE %s%s;\n' % (prefix, table) for table in SEED_TABLES)
+    sql += ''.join(table.load_sql(prefix) for table in tables)
+    sql += 'SET UNIQUE_CHECKS = 1;\nSET FOREIGN_KEY_CHECKS = 1;\n'
+    sql += ''.join('ANALYZE TABLE %s%s;\n' % (prefix, table) for table in SEED_TABLES)
+
+    wp.query(sql)
+
+    return {table.table: table.rows for table in tables}, sample_case_ids
+
+
+# Runs inside WordPress: wp eval-file <runner> <config.json>
+PHP_RUNNER = r"""<?php
+$config = json_decode(file_get_contents($args[0]), true);
+require_once ABSPATH . 'wp-admin/includes/admin.php';
+
+global $wpdb;
+
+function cah_bench_samples($callback, $repeat) {
+    global $wpdb;
+
+    $samples = array();
+    for ($run = 0; $run < $repeat; $run++) {
+        if (function_exists('memory_reset_peak_usage')) {
+            memory_reset_peak_usage();
+        }
+        $queries = $wpdb->num_queries;
+        $level = ob_get_level();
+        $bytes = 0;
+
+        // Count output instead of printing it; the inner level is for code that cleans the buffer
+        ob_start(function($buffer) use (&$bytes) { $bytes += strlen($buffer); return ''; }, 65536);
+        ob_start();
+
+        $started = microtime(true);
+        call_user_func($callback, $run);
+        $elapsed = microtime(true) - $started;
+
+        while (ob_get_level() > $level) {
+            ob_end_flush();
+        }
+
+        $samples[] = array(
+            'ms' => $elapsed * 1000,
+            'queries' => $wpdb->num_queries - $queries,
+            'output_bytes' => $bytes,
+            'peak_kb' => intval(memory_get_peak_usage() / 1024)
+        );
+    }
+
+    return $samples;
+}
+
+function cah_bench_private($object, $method) {
+    $reflection = new ReflectionMethod($object, $method);
+    $reflection->setAccessible(true);
+    return function() use ($reflection, $object) {
+        $reflection->invoke($object);
+    };
+}
+
+$dashboard = new CAH_Admin_Dashboard();
+$_SERVER['REQUEST_METHOD'] = 'GET';
+
+$operations = array(
+    'admin_page_dashboard' => function() use ($dashboard) {
+        $dashboard->admin_page_dashboard();
+    },
+    'render_cases_list' => function() use ($dashboard) {
+        $_GET = array();
+        call_user_func(cah_bench_private($dashboard, 'render_cases_list'));
+    },
+    'render_cases_list_search' => function() use ($dashboard, $config) {
+        $_GET = array('search' => $config['search']);
+        call_user_func(cah_bench_private($dashboard, 'render_cases_list'));
+        $_GET = array();
+    },
+    'export_cases_csv' => cah_bench_private($dashboard, 'export_cases_csv'),
+    'export_table_data' => function() {
+        $manager = new CAH_Import_Export_Manager();
+        echo $manager->export_table_data('klage_cases');
+    },
+    'financial_save' => function($run) use ($config) {
+        // Same steps as the case form autosave (ajax_save_case_financial)
+        $db_manager = new CAH_Financial_DB_Manager();
+        $calculator = new CAH_Financial_Calculator_Engine();
+        $case_id = $config['financial_case_ids'][$run % count($config['financial_case_ids'])];
+
+        $items = array();
+        foreach ($db_manager->get_cost_items_by_case($case_id) as $item) {
+            $items[] = (array) $item;
+        }
+        if (!empty($items)) {
+            $items[0]['amount'] = floatval($items[0]['amount']) + ($run % 2 ? -0.01 : 0.01);
+        }
+
+        $financial = $db_manager->get_case_financial($case_id);
+        $totals = $calculator->calculate_totals($items, 19.00);
+        $db_manager->save_case_financial_diff($case_id, $financial ? $financial->template_id : null, $items, $totals);
+        $db_manager->get_cost_items_by_case($case_id);
+    },
+    'process_csv_upload' => function($run) use ($dashboard, $config) {
+        $file = $config['import_files'][$run % count($config['import_files'])];
+        $_FILES = array('csv_file' => array(
+            'name' => basename($file),
+            'tmp_name' => $file,
+            'error' => UPLOAD_ERR_OK,
+            'size' => filesize($file)
+        ));
+        $_POST = array('delimiter' => ';', 'import_mode' => 'create_new');
+        call_user_func(cah_bench_private($dashboard, 'process_csv_upload'));
+        $_FILES = array();
+        $_POST = array();
+    }
+);
+
+$results = array();
+foreach ($config['operations'] as $operation) {
+    if ($operation === 'financial_save' && (!class_exists('CAH_Financial_DB_Manager') || empty($config['financial_case_ids']))) {
+        $results[$operation] = array('skipped' => 'financial calculator plugin not active');
+        continue;
+    }
+    $results[$operation] = cah_bench_samples($operations[$operation], $config['repeat']);
+}
+
+echo "\nCAH_BENCH_RESULT " . wp_json_encode(array(
+    'php' => PHP_VERSION,
+    'mysql' => $wpdb->db_version(),
+    'plugin_version' => defined('CAH_PLUGIN_VERSION') ? CAH_PLUGIN_VERSION : null,
+    'financial_version' => defined('CAH_FC_PLUGIN_VERSION') ? CAH_FC_PLUGIN_VERSION : null,
+    'results' => $results
+)) . "\n";
+"""
+
+
+def run_operations(wp, work_dir, operations, repeat, sample_case_ids, import_files, search):
+    runner_path = os.path.join(work_dir, 'runner.php')
+    config_path = os.path.join(work_dir, 'config.json')
+
+    with open(runner_path, 'w', encoding='utf-8') as handle:
+        handle.write(PHP_RUNNER)
+    with open(config_path, 'w', encoding='utf-8') as handle:
+        json.dump({
+            'operations': operations,
+            'repeat': repeat,
+            'financial_case_ids': sample_case_ids,
+            'import_files': import_files,
+            'search': search
+        }, handle)
+
+    output = wp.run(['eval-file', runner_path, config_path], user=True)
+    marker = output.rfind('CAH_BENCH_RESULT ')
+    if marker < 0:
+        raise RuntimeError('No benchmark result in output: ' + output[-500:])
+
+    return json.loads(output[marker + len('CAH_BENCH_RESULT '):].splitlines()[0])
+
+
+def summarize(samples):
+    if isinstance(samples, dict):
+        return samples
+
+    times = [sample['ms'] for sample in samples]
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'max_ms': round(max(times), 3),
+        'queries': int(statistics.median(sample['queries'] for sample in samples)),
+        'output_bytes': int(statistics.median(sample['output_bytes'] for sample in samples)),
+        'peak_kb': max(sample['peak_kb'] for sample in samples)
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def find_regressions(history, run, threshold):
+    """Compare with the latest earlier run that has the same seed, size and operation"""
+    regressions = []
+
+    for size, size_result in run['sizes'].items():
+        for operation, result in size_result['operations'].items():
+            if 'median_ms' not in result:
+                continue
+
+            for previous in reversed(history):
+                before = previous.get('sizes', {}).get(size, {}).get('operations', {}).get(operation)
+                if previous.get('seed') != run['seed'] or not before or 'median_ms' not in before:
+                    continue
+
+                difference = result['median_ms'] - before['median_ms']
+                if difference > NOISE_FLOOR_MS and result['median_ms'] > before['median_ms'] * (1 + threshold):
+                    regressions.append({
+                        'size': size,
+                        'operation': operation,
+                        'before_ms': before['median_ms'],
+                        'after_ms': result['median_ms'],
+                        'before_version': previous.get('plugin_version'),
+                        'change': round(difference / before['median_ms'] * 100, 1)
+                    })
+                break
+
+    return regressions
+
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', '-C', BASE_DIR, 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, timeout=10)
+        return output.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_size(size, seeded, operations):
+    print(f"\n=== {size:,} cases ({seeded.get('klage_debtors', 0):,} debtors, "
+          f"{seeded.get('cah_cost_items', 0):,} cost items) ===")
+    print(f"{'operation':<26} {'median ms':>11} {'min ms':>10} {'max ms':>10} {'queries':>8} {'peak KB':>9}")
+    print('-' * 78)
+    for operation, result in operations.items():
+        if 'skipped' in result:
+            print(f"{operation:<26} skipped: {result['skipped']}")
+            continue
+        print(f"{operation:<26} {result['median_ms']:>11.1f} {result['min_ms']:>10.1f} {result['max_ms']:>10.1f} "
+              f"{result['queries']:>8} {result['peak_kb']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark plugin paths at several data sizes')
+    parser.add_argument('--wp-path', help='WordPress install of a dedicated benchmark site')
+    parser.add_argument('--wp-cli', default='wp', help='WP-CLI executable')
+    parser.add_argument('--user', default='admin', help='Administrator the operations run as')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated case counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs per operation')
+    parser.add_argument('--ops', default=','.join(OPERATIONS), help='Comma separated operations')
+    parser.add_argument('--import-rows', type=int, default=1000,
+                        help='Rows per process_csv_upload run (the importer rejects files over 10MB)')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file results are appended to')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Median slowdown reported as regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with 1 if a regression was found')
+    parser.add_argument('--yes', action='store_true', help='Confirm that the plugin tables may be truncated')
+    parser.add_argument('--generate-csv', metavar='PATH', help='Only write a Forderungen.com CSV and exit')
+    parser.add_argument('--rows', type=int, default=1000, help='Rows for --generate-csv')
+    args = parser.parse_args()
+
+    if args.generate_csv:
+        write_forderungen_csv(args.generate_csv, SyntheticData(args.seed, args.rows))
+        print(f"{args.rows:,} rows written to {args.generate_csv}")
+        return 0
+
+    if not args.wp_path:
+        parser.error('--wp-path is required (or use --generate-csv)')
+    if not args.yes:
+        parser.error('the benchmark truncates the klage_*/cah_* tables of --wp-path; pass --yes to confirm')
+    if not shutil.which(args.wp_cli):
+        parser.error('WP-CLI not found: ' + args.wp_cli)
+
+    operations = [name.strip() for name in args.ops.split(',') if name.strip()]
+    for operation in operations:
+        if operation not in OPERATIONS:
+            parser.error('Unknown operation: ' + operation)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    wp = WordPress(args.wp_cli, args.wp_path, args.user)
+    prefix = wp.table_prefix()
+
+    run = {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': git_commit(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'sizes': {}
+    }
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix='cah-bench-') as work_dir:
+            print(f"Seeding {size:,} cases ...")
+            seeded, sample_case_ids = seed_database(wp, prefix, SyntheticData(args.seed, size), work_dir)
+
+            # Each import run gets its own Fall-IDs, so 'create_new' never hits existing cases
+            import_files = []
+            if 'process_csv_upload' in operations:
+                for run_number in range(args.repeat):
+                    path = os.path.join(work_dir, 'import_%d.csv' % run_number)
+                    write_forderungen_csv(path, SyntheticData(args.seed + 100 + run_number, args.import_rows),
+                                          id_prefix='IMP%d' % run_number)
+                    import_files.append(path)
+
+            # process_csv_upload adds cases, so it runs last
+            ordered = [operation for operation in operations if operation != 'process_csv_upload']
+            ordered += [operation for operation in operations if operation == 'process_csv_upload']
+
+            result = run_operations(wp, work_dir, ordered, args.repeat, sample_case_ids, import_files,
+                                    search='SPAM-%d' % LAST_DATE.year)
+
+        run['plugin_version'] = result['plugin_version']
+        run['financial_version'] = result['financial_version']
+        run['php'] = result['php']
+        run['mysql'] = result['mysql']
+
+        summary = {operation: summarize(samples) for operation, samples in result['results'].items()}
+        run['sizes'][str(size)] = {'seeded': seeded, 'import_rows': args.import_rows, 'operations': summary}
+        print_size(size, seeded, summary)
+
+    history = load_history(args.history)
+    regressions = find_regressions(history, run, args.threshold)
+    run['regressions'] = regressions
+
+    history.append(run)
+    with open(args.history, 'w', encoding='utf-8') as handle:
+        json.dump(history, handle, indent=2)
+        handle.write('\n')
+    print(f"\nResults appended to {args.history} ({len(history)} runs)")
+
+    for regression in regressions:
+        print(f"[REGRESSION] {regression['operation']} @ {int(regression['size']):,}: "
+              f"{regression['before_ms']:.1f} ms ({regression['before_version']}) -> "
+              f"{regression['after_ms']:.1f} ms (+{regression['change']}%)")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
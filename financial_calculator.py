@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Reference implementation of the financial calculator in Python
+Mirrors CAH_Financial_Calculation_Graph / CAH_Financial_Calculator_Engine
+(PHP) and assets/js/financial-engine.js for offline tools and benchmarks.
+All three are checked against financial_calculation_vectors.json by
+financial_parity_test.py.
+"""
+
+import math
+import re
+
+BASE_RUNNING = 'running'
+BASE_SUBTOTAL = 'subtotal'
+BASE_CATEGORY = 'category'
+BASE_ITEM = 'item'
+
+CATEGORIES = ['grundkosten', 'gerichtskosten', 'anwaltskosten', 'sonstige']
+
+NUMBER_PREFIX = re.compile(r'\s*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?')
+
+
+def to_float(value):
+    """floatval() semantics for values coming from JSON (leading number, else 0)"""
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value is None:
+        return 0.0
+
+    match = NUMBER_PREFIX.match(str(value))
+    return float(match.group(0)) if match else 0.0
+
+
+def is_percentage(item):
+    value = item.get('is_percentage')
+    return bool(value) and value != '0'
+
+
+def node_key(item, index):
+    """Same key as CAH_Financial_Calculation_Graph::node_key()"""
+    item_id = int(to_float(item.get('id'))) if item.get('id') else 0
+    return 'id:%d' % item_id if item_id else 'row:%d' % index
+
+
+def round_amount(value):
+    """Same steps as CAH_Financial_Calculator_Engine::round_amount()"""
+    value = to_float(value)
+    scaled = float('%.15g' % (abs(value) * 100))
+    rounded = math.floor(scaled + 0.5) / 100
+
+    if rounded == 0:
+        return 0.0
+
+    return -rounded if value < 0 else rounded
+
+
+def calculate_totals(cost_items, vat_rate=19.00):
+    vat_rate = to_float(vat_rate)
+
+    items = {}
+    order = []
+    for index, item in enumerate(cost_items):
+        key = node_key(item, index)
+        items[key] = item
+        order.append(key)
+
+    # First item wins for duplicate names
+    keys_by_name = {}
+    for key in order:
+        name = items[key].get('name')
+        keys_by_name.setdefault('' if name is None else str(name), key)
+
+    dependencies = {}
+    errors = {}
+
+    for position, key in enumerate(order):
+        item = items[key]
+        deps = []
+
+        if is_percentage(item):
+            base = item.get('percentage_base') or BASE_RUNNING
+            base_ref = '' if item.get('base_ref') is None else str(item.get('base_ref'))
+
+            if base == BASE_SUBTOTAL:
+                deps = [other for other in order if other != key and not is_percentage(items[other])]
+            elif base == BASE_CATEGORY:
+                deps = [other for other in order
+                        if other != key and items[other].get('category') == base_ref and not is_percentage(items[other])]
+            elif base == BASE_ITEM:
+                ref_key = base_ref if base_ref in items else keys_by_name.get(base_ref)
+                if ref_key is None or ref_key == key:
+                    errors[key] = 'Bezugsposition nicht gefunden: ' + base_ref
+                else:
+                    deps = [ref_key]
+            else:
+                deps = order[:position]
+
+        dependencies[key] = deps
+
+    values = {}
+    evaluating = set()
+
+    def evaluate(key):
+        if key in values:
+            return values[key]
+
+        if key in evaluating:
+            errors[key] = 'Zirkulärer Bezug'
+            return 0.0
+
+        evaluating.add(key)
+
+        item = items[key]
+        amount = to_float(item.get('amount'))
+
+        if is_percentage(item):
+            base_amount = 0.0
+            for dependency in dependencies[key]:
+                base_amount += evaluate(dependency)
+
+            amount = base_amount * (amount / 100)
+
+        evaluating.discard(key)
+
+        if key not in errors:
+            values[key] = amount
+
+        return amount
+
+    subtotal = 0.0
+    grouped_items = {category: [] for category in CATEGORIES}
+
+    for key in order:
+        item = items[key]
+        amount = evaluate(key)
+
+        subtotal += amount
+        grouped_items.setdefault(item.get('category'), []).append({
+            'id': item.get('id'),
+            'key': key,
+            'name': item.get('name'),
+            'amount': amount,
+            'is_percentage': item.get('is_percentage'),
+            'description': item.get('description') or ''
+        })
+
+    vat_amount = subtotal * (vat_rate / 100)
+    total_amount = subtotal + vat_amount
+
+    return {
+        'subtotal': round_amount(subtotal),
+        'vat_rate': vat_rate,
+        'vat_amount': round_amount(vat_amount),
+        'total_amount': round_amount(total_amount),
+        'grouped_items': grouped_items,
+        'item_count': len(order),
+        'values': values,
+        'errors': errors
+    }
+
+
+def format_currency(amount, include_symbol=True):
+    """Same output as CAH_Financial_Calculator_Engine::format_currency()"""
+    rounded = round_amount(amount)
+    integer, decimals = ('%.2f' % abs(rounded)).split('.')
+    integer = '{:,}'.format(int(integer)).replace(',', '.')
+    formatted = ('-' if rounded < 0 else '') + integer + ',' + decimals
+
+    return '€ ' + formatted if include_symbol else formatted
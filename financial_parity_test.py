@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Financial Calculator Parity Test
+Runs financial_calculation_vectors.json through the Python reference
+implementation, the JavaScript engine (node) and the PHP engine (php CLI)
+and checks that all of them produce exactly the expected strings.
+
+Usage:
+    python3 financial_parity_test.py
+    python3 financial_parity_test.py --write-expected   # after an intended change
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import financial_calculator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VECTORS_FILE = os.path.join(BASE_DIR, 'financial_calculation_vectors.json')
+PLUGIN_DIR = os.path.join(BASE_DIR, 'court-automation-hub-financial-calculator')
+JS_ENGINE = os.path.join(PLUGIN_DIR, 'assets', 'js', 'financial-engine.js')
+
+# Every runner emits the same canonical shape: money as "%.2f" strings,
+# item amounts as "key=amount" in grouped order, error keys sorted.
+JS_RUNNER = r"""
+const fs = require('fs');
+const engine = require(process.argv[2]);
+const vectors = JSON.parse(fs.readFileSync(process.argv[3], 'utf8'));
+
+const calculations = vectors.calculations.map(function(vector) {
+    const result = engine.calculateTotals(vector.items, vector.vat_rate);
+    const items = [];
+    Object.keys(result.grouped_items).forEach(function(category) {
+        result.grouped_items[category].forEach(function(item) {
+            items.push(item.key + '=' + engine.roundAmount(item.amount).toFixed(2));
+        });
+    });
+    return {
+        subtotal: result.subtotal.toFixed(2),
+        vat_amount: result.vat_amount.toFixed(2),
+        total_amount: result.total_amount.toFixed(2),
+        total_formatted: engine.formatCurrency(result.total_amount),
+        items: items,
+        errors: Object.keys(result.errors).sort()
+    };
+});
+
+const formatted = vectors.format_currency.map(function(vector) {
+    return engine.formatCurrency(vector.amount, vector.include_symbol);
+});
+
+process.stdout.write(JSON.stringify({ calculations: calculations, format_currency: formatted }));
+"""
+
+PHP_RUNNER = r"""<?php
+define('ABSPATH', __DIR__);
+if (!function_exists('get_option')) {
+    function get_option($name, $default = false) { return $default; }
+}
+require $argv[1] . '/includes/class-financial-calculation-graph.php';
+require $argv[1] . '/includes/class-financial-calculator.php';
+
+$engine = new CAH_Financial_Calculator_Engine();
+$vectors = json_decode(file_get_contents($argv[2]), true);
+
+$calculations = array();
+foreach ($vectors['calculations'] as $vector) {
+    $result = $engine->calculate_totals($vector['items'], $vector['vat_rate']);
+    $items = array();
+    foreach ($result['grouped_items'] as $category_items) {
+        foreach ($category_items as $item) {
+            $items[] = $item['key'] . '=' . sprintf('%.2f', CAH_Financial_Calculator_Engine::round_amount($item['amount']));
+        }
+    }
+    $errors = array_keys($result['errors']);
+    sort($errors, SORT_STRING);
+    $calculations[] = array(
+        'subtotal' => sprintf('%.2f', $result['subtotal']),
+        'vat_amount' => sprintf('%.2f', $result['vat_amount']),
+        'total_amount' => sprintf('%.2f', $result['total_amount']),
+        'total_formatted' => $engine->format_currency($result['total_amount']),
+        'items' => $items,
+        'errors' => $errors
+    );
+}
+
+$formatted = array();
+foreach ($vectors['format_currency'] as $vector) {
+    $formatted[] = $engine->format_currency($vector['amount'], $vector['include_symbol']);
+}
+
+echo json_encode(array('calculations' => $calculations, 'format_currency' => $formatted));
+"""
+
+
+def run_python(vectors):
+    calculations = []
+    for vector in vectors['calculations']:
+        result = financial_calculator.calculate_totals(vector['items'], vector['vat_rate'])
+        items = []
+        for category_items in result['grouped_items'].values():
+            for item in category_items:
+                items.append('%s=%.2f' % (item['key'], financial_calculator.round_amount(item['amount'])))
+        calculations.append({
+            'subtotal': '%.2f' % result['subtotal'],
+            'vat_amount': '%.2f' % result['vat_amount'],
+            'total_amount': '%.2f' % result['total_amount'],
+            'total_formatted': financial_calculator.format_currency(result['total_amount']),
+            'items': items,
+            'errors': sorted(result['errors'])
+        })
+
+    formatted = [financial_calculator.format_currency(vector['amount'], vector['include_symbol'])
+                 for vector in vectors['format_currency']]
+
+    return {'calculations': calculations, 'format_currency': formatted}
+
+
+def run_external(command, runner_source, suffix):
+    with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as handle:
+        handle.write(runner_source)
+        runner_path = handle.name
+
+    try:
+        output = subprocess.run(command(runner_path), capture_output=True, text=True, timeout=60)
+    finally:
+        os.unlink(runner_path)
+
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip() or output.stdout.strip())
+
+    return json.loads(output.stdout)
+
+
+def compare(label, vectors, actual):
+    failures = 0
+
+    for vector, result in zip(vectors['calculations'], actual['calculations']):
+        expected = json.dumps(vector['expected'], sort_keys=True, ensure_ascii=False)
+        got = json.dumps(result, sort_keys=True, ensure_ascii=False)
+        if expected != got:
+            failures += 1
+            print(f"[FAIL] {label} {vector['name']}")
+            print(f"    expected: {expected}")
+            print(f"    got:      {got}")
+
+    for vector, result in zip(vectors['format_currency'], actual['format_currency']):
+        if vector['expected'] != result:
+            failures += 1
+            print(f"[FAIL] {label} format_currency({vector['amount']!r}, {vector['include_symbol']}): "
+                  f"expected {vector['expected']!r}, got {result!r}")
+
+    total = len(vectors['calculations']) + len(vectors['format_currency'])
+    print(f"[{'PASS' if failures == 0 else 'FAIL'}] {label}: {total - failures}/{total} vectors")
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check PHP/JS/Python financial calculator parity')
+    parser.add_argument('--write-expected', action='store_true',
+                        help='Store the Python results as expected values (review the diff!)')
+    args = parser.parse_args()
+
+    with open(VECTORS_FILE, encoding='utf-8') as handle:
+        vectors = json.load(handle)
+
+    python_results = run_python(vectors)
+
+    if args.write_expected:
+        for vector, result in zip(vectors['calculations'], python_results['calculations']):
+            vector['expected'] = result
+        for vector, result in zip(vectors['format_currency'], python_results['format_currency']):
+            vector['expected'] = result
+        with open(VECTORS_FILE, 'w', encoding='utf-8') as handle:
+            json.dump(vectors, handle, ensure_ascii=False, indent=2)
+            handle.write('\n')
+        print(f"Expected values written to {VECTORS_FILE}")
+        return 0
+
+    failures = compare('python', vectors, python_results)
+
+    node = shutil.which('node')
+    if node:
+        failures += compare('javascript', vectors, run_external(
+            lambda runner: [node, runner, JS_ENGINE, VECTORS_FILE], JS_RUNNER, '.js'))
+    else:
+        print('[SKIP] javascript: node not found')
+
+    php = shutil.which('php')
+    if php:
+        failures += compare('php', vectors, run_external(
+            lambda runner: [php, runner, PLUGIN_DIR, VECTORS_FILE], PHP_RUNNER, '.php'))
+    else:
+        print('[SKIP] php: php CLI not found')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 <?php
 /**
- * Audit Logger class - Simplified version
+ * Audit Logger class - Buffered audit trail writer
+ * Entries are collected per request and written as multi-row inserts.
+ * Old entries are moved to a rolling archive table by a daily maintenance job.
  */
 
 if (!defined('ABSPATH')) {
@@ -8,24 +10,329 @@ if (!defined('ABSPATH')) {
 }
 
 class CAH_Audit_Logger {
-    
+
     private $wpdb;
-    
+
+    // Entries waiting to be written (shared by all instances of the request)
+    private static $buffer = array();
+
+    // Whether shutdown flush and maintenance hooks are registered
+    private static $hooks_registered = false;
+
+    // Whether klage_audit exists (checked once per request)
+    private static $table_exists = null;
+
+    // Flush early once this many entries are buffered (keeps large imports bounded)
+    const FLUSH_THRESHOLD = 500;
+
+    // Rows moved per statement by the maintenance job
+    const MAINTENANCE_CHUNK = 5000;
+
+    // Storage layout version (archive table + composite index)
+    const STORAGE_VERSION = '1.0.1';
+
+    // Daily maintenance cron hook
+    const MAINTENANCE_HOOK = 'cah_audit_maintenance';
+
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
+
+        if (!self::$hooks_registered) {
+            self::$hooks_registered = true;
+
+            add_action('shutdown', array($this, 'flush'));
+            add_action(self::MAINTENANCE_HOOK, array($this, 'run_maintenance'));
+
+            if (!wp_next_scheduled(self::MAINTENANCE_HOOK)) {
+                wp_schedule_event(time(), 'daily', self::MAINTENANCE_HOOK);
+            }
+
+            if (is_admin() && get_option('cah_audit_storage_version') !== self::STORAGE_VERSION) {
+                $this->ensure_storage();
+            }
+        }
     }
-    
+
     /**
-     * Log an action
+     * Log an action (buffered until flush)
      */
     public function log_action($case_id, $action_type, $action_details) {
-        $current_user = wp_get_current_user();
-        $user_identifier = $current_user->ID > 0 ? $current_user->user_login : 'system';
-        
-        // Simple logging (could be expanded with proper audit table)
-        error_log("Klage.Click Audit: Case $case_id - $action_type - $action_details - User: $user_identifier");
-        
+        self::$buffer[] = array(
+            'case_id' => intval($case_id),
+            'action' => substr($action_type, 0, 50),
+            'details' => $action_details,
+            'user_id' => get_current_user_id(),
+            'created_at' => current_time('mysql')
+        );
+
+        if (count(self::$buffer) >= self::FLUSH_THRESHOLD) {
+            $this->flush();
+        }
+
         return true;
     }
-}
\ No newline at end of file
+
+    /**
+     * Write all buffered entries as one multi-row insert
+     */
+    public function flush() {
+        if (empty(self::$buffer)) {
+            return 0;
+        }
+
+        $entries = self::$buffer;
+        self::$buffer = array();
+
+        $table_name = $this->wpdb->prefix . 'klage_audit';
+
+        if (self::$table_exists === null) {
+            self::$table_exists = (bool) $this->wpdb->get_var("SHOW TABLES LIKE '$table_name'");
+        }
+
+        if (!self::$table_exists) {
+            $this->log_to_error_log($entries);
+            return 0;
+        }
+
+        $placeholders = array();
+        $values = array();
+
+        foreach ($entries as $entry) {
+            $placeholders[] = '(%d, %s, %s, %d, %s)';
+            array_push($values, $entry['case_id'], $entry['action'], $entry['details'], $entry['user_id'], $entry['created_at']);
+        }
+
+        $sql = "INSERT INTO $table_name (case_id, action, details, user_id, created_at) VALUES " . implode(', ', $placeholders);
+        $result = $this->wpdb->query($this->wpdb->prepare($sql, $values));
+
+        if ($result === false) {
+            // Never lose audit entries silently
+            $this->log_to_error_log($entries);
+            return 0;
+        }
+
+        return count($entries);
+    }
+
+    /**
+     * Drop buffered entries without writing them (a forked worker starts with
+     * a copy of the parent's buffer, which the parent writes itself)
+     */
+    public static function discard_buffer() {
+        self::$buffer = array();
+    }
+
+    /**
+     * Get number of entries waiting to be written
+     */
+    public function get_buffer_size() {
+        return count(self::$buffer);
+    }
+
+    /**
+     * Fallback when the audit table is unavailable
+     */
+    private function log_to_error_log($entries) {
+        foreach ($entries as $entry) {
+            error_log("Klage.Click Audit: Case {$entry['case_id']} - {$entry['action']} - {$entry['details']} - User: {$entry['user_id']}");
+        }
+    }
+
+    /**
+     * Create archive table and composite (case_id, created_at) indexes
+     */
+    public function ensure_storage() {
+        $table_name = $this->wpdb->prefix . 'klage_audit';
+        $archive_table = $this->wpdb->prefix . 'klage_audit_archive';
+        $charset_collate = $this->wpdb->get_charset_collate();
+
+        if (!$this->wpdb->get_var("SHOW TABLES LIKE '$table_name'")) {
+            return false;
+        }
+
+        $index_exists = $this->wpdb->get_var("SHOW INDEX FROM $table_name WHERE Key_name = 'case_created'");
+        if (!$index_exists) {
+            $this->wpdb->query("ALTER TABLE $table_name ADD INDEX case_created (case_id, created_at)");
+        }
+
+        // Single-column case_id index is a prefix of case_created
+        if ($this->wpdb->get_var("SHOW INDEX FROM $table_name WHERE Key_name = 'case_id'")) {
+            $this->wpdb->query("ALTER TABLE $table_name DROP INDEX case_id");
+        }
+
+        // Archive keeps the original ids, so no AUTO_INCREMENT
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS $archive_table (
+            id bigint(20) unsigned NOT NULL,
+            case_id bigint(20) unsigned NOT NULL,
+            action varchar(50) NOT NULL,
+            details text,
+            user_id bigint(20) unsigned NOT NULL,
+            created_at datetime DEFAULT NULL,
+            PRIMARY KEY (id),
+            KEY case_created (case_id, created_at),
+            KEY created_at (created_at)
+        ) $charset_collate");
+
+        update_option('cah_audit_storage_version', self::STORAGE_VERSION);
+
+        return true;
+    }
+
+    /**
+     * Retention and compaction job (runs daily via WP-Cron)
+     */
+    public function run_maintenance() {
+        $this->ensure_storage();
+
+        $retention_months = intval(get_option('cah_audit_retention_months', 12));
+        $archive_retention_months = intval(get_option('cah_audit_archive_retention_months', 120));
+
+        $results = array(
+            'archived' => 0,
+            'purged' => 0
+        );
+
+        if ($retention_months > 0) {
+            $cutoff = date('Y-m-01 00:00:00', strtotime(current_time('mysql') . " -$retention_months months"));
+            $results['archived'] = $this->archive_entries_before($cutoff);
+        }
+
+        if ($archive_retention_months > 0) {
+            $cutoff = date('Y-m-01 00:00:00', strtotime(current_time('mysql') . " -$archive_retention_months months"));
+            $results['purged'] = $this->purge_archive_before($cutoff);
+        }
+
+        update_option('cah_audit_last_maintenance', array_merge($results, array('run_at' => current_time('mysql'))), false);
+
+        return $results;
+    }
+
+    /**
+     * Move entries older than cutoff into the archive table in chunks
+     */
+    private function archive_entries_before($cutoff) {
+        $table_name = $this->wpdb->prefix . 'klage_audit';
+        $archive_table = $this->wpdb->prefix . 'klage_audit_archive';
+        $archived = 0;
+
+        do {
+            // Upper id bound of this chunk, so copy and delete touch the same rows
+            $max_id = $this->wpdb->get_var($this->wpdb->prepare(
+                "SELECT MAX(id) FROM (SELECT id FROM $table_name WHERE created_at < %s ORDER BY id LIMIT %d) chunk",
+                $cutoff,
+                self::MAINTENANCE_CHUNK
+            ));
+
+            if (!$max_id) {
+                break;
+            }
+
+            $this->wpdb->query('START TRANSACTION');
+
+            $copied = $this->wpdb->query($this->wpdb->prepare(
+                "INSERT IGNORE INTO $archive_table (id, case_id, action, details, user_id, created_at)
+                 SELECT id, case_id, action, details, user_id, created_at FROM $table_name WHERE id <= %d AND created_at < %s",
+                $max_id,
+                $cutoff
+            ));
+
+            $deleted = $copied === false ? false : $this->wpdb->query($this->wpdb->prepare(
+                "DELETE FROM $table_name WHERE id <= %d AND created_at < %s",
+                $max_id,
+                $cutoff
+            ));
+
+            if ($deleted === false) {
+                $this->wpdb->query('ROLLBACK');
+                error_log('Klage.Click Audit: archiving failed - ' . $this->wpdb->last_error);
+                break;
+            }
+
+            $this->wpdb->query('COMMIT');
+            $archived += $deleted;
+
+        } while ($deleted >= self::MAINTENANCE_CHUNK);
+
+        return $archived;
+    }
+
+    /**
+     * Purge archived entries older than cutoff in chunks
+     */
+    private function purge_archive_before($cutoff) {
+        $archive_table = $this->wpdb->prefix . 'klage_audit_archive';
+        $purged = 0;
+
+        do {
+            $deleted = $this->wpdb->query($this->wpdb->prepare(
+                "DELETE FROM $archive_table WHERE created_at < %s LIMIT %d",
+                $cutoff,
+                self::MAINTENANCE_CHUNK
+            ));
+
+            if ($deleted === false) {
+                break;
+            }
+
+            $purged += $deleted;
+
+        } while ($deleted >= self::MAINTENANCE_CHUNK);
+
+        // Reclaim space after large purges
+        if ($purged >= self::MAINTENANCE_CHUNK) {
+            $this->wpdb->query("OPTIMIZE TABLE $archive_table");
+        }
+
+        return $purged;
+    }
+
+    /**
+     * Get audit entries for a case from live and archived storage
+     */
+    public function get_case_history($case_id, $limit = 100) {
+        $this->flush();
+
+        $table_name = $this->wpdb->prefix . 'klage_audit';
+        $archive_table = $this->wpdb->prefix . 'klage_audit_archive';
+
+        $columns = 'id, case_id, action, details, user_id, created_at';
+        $sql = "SELECT $columns FROM $table_name WHERE case_id = %d";
+
+        if ($this->wpdb->get_var("SHOW TABLES LIKE '$archive_table'")) {
+            $sql = "($sql) UNION ALL (SELECT $columns FROM $archive_table WHERE case_id = %d)";
+            $sql = $this->wpdb->prepare("$sql ORDER BY created_at DESC LIMIT %d", $case_id, $case_id, $limit);
+        } else {
+            $sql = $this->wpdb->prepare("$sql ORDER BY created_at DESC LIMIT %d", $case_id, $limit);
+        }
+
+        return $this->wpdb->get_results($sql);
+    }
+
+    /**
+     * Delete all audit entries of a case from live and archived storage
+     */
+    public function delete_case_history($case_id) {
+        $this->flush();
+
+        $archive_table = $this->wpdb->prefix . 'klage_audit_archive';
+
+        $deleted = $this->wpdb->delete($this->wpdb->prefix . 'klage_audit', array('case_id' => $case_id), array('%d'));
+
+        if ($this->wpdb->get_var("SHOW TABLES LIKE '$archive_table'")) {
+            $this->wpdb->delete($archive_table, array('case_id' => $case_id), array('%d'));
+        }
+
+        return $deleted;
+    }
+
+    /**
+     * Unschedule maintenance job (plugin deactivation)
+     */
+    public static function unschedule_maintenance() {
+        $timestamp = wp_next_scheduled(self::MAINTENANCE_HOOK);
+        if ($timestamp) {
+            wp_unschedule_event($timestamp, self::MAINTENANCE_HOOK);
+        }
+    }
+}
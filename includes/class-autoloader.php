@@ -0,0 +1,84 @@
+<?php
+/**
+ * Class Autoloader - Loads plugin classes on first use
+ * PSR-4 style mapping of a class prefix to base directories, using the
+ * WordPress file naming of this plugin: CAH_Case_Manager lives in
+ * class-case-manager.php. Also used by the financial calculator plugin.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Autoloader {
+
+    // Class name prefix handled by this loader
+    private $prefix;
+
+    // Base directories, searched in order
+    private $directories;
+
+    // Class name => file for classes not following the naming rule
+    private $class_map;
+
+    // Files loaded by any loader (bootstrap profile)
+    private static $loaded_files = array();
+
+    public function __construct($prefix, $directories, $class_map = array()) {
+        $this->prefix = $prefix;
+        $this->directories = array_map('trailingslashit', (array) $directories);
+        $this->class_map = $class_map;
+    }
+
+    /**
+     * Add the loader to the SPL autoload stack
+     */
+    public function register() {
+        spl_autoload_register(array($this, 'load'));
+        return $this;
+    }
+
+    /**
+     * Load the file of a class (SPL autoload callback)
+     */
+    public function load($class) {
+        if (isset($this->class_map[$class])) {
+            return $this->require_file($this->class_map[$class]);
+        }
+
+        if (strpos($class, $this->prefix) !== 0) {
+            return false;
+        }
+
+        $file = self::file_name($class);
+
+        foreach ($this->directories as $directory) {
+            if (is_file($directory . $file)) {
+                return $this->require_file($directory . $file);
+            }
+        }
+
+        return false;
+    }
+
+    /**
+     * File name for a class: vendor prefix dropped, lower case, dashes
+     */
+    public static function file_name($class) {
+        $name = preg_replace('/^[A-Za-z0-9]+_/', '', $class);
+        return 'class-' . strtolower(str_replace('_', '-', $name)) . '.php';
+    }
+
+    /**
+     * Files loaded so far in this request
+     */
+    public static function get_loaded_files() {
+        return self::$loaded_files;
+    }
+
+    private function require_file($file) {
+        require_once $file;
+        self::$loaded_files[] = $file;
+        return true;
+    }
+}
@@ -0,0 +1,228 @@
+<?php
+/**
+ * Case ID Allocator - Collision-free case ID sequence
+ * Numbers come from an atomic per-year counter row (LAST_INSERT_ID), so
+ * concurrent requests and imports never hand out the same case ID.
+ * Manually entered IDs in the SPAM-YYYY-NNNN format move the counter past
+ * them; klage_cases.case_id is unique, and inserts of allocated IDs retry
+ * with the next number if one was taken anyway.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Case_ID_Allocator {
+
+    private $wpdb;
+    private $table_name;
+
+    // Numbers reserved by this request but not handed out yet (per year)
+    private static $pool = array();
+
+    const PREFIX = 'SPAM';
+
+    // Minimum digits of the sequence part (grows beyond automatically)
+    const MIN_DIGITS = 4;
+
+    // Inserts of an allocated ID before giving up on duplicates
+    const MAX_INSERT_ATTEMPTS = 5;
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->table_name = $wpdb->prefix . 'klage_sequences';
+    }
+
+    /**
+     * Get next case ID (uses the request pool before touching the counter)
+     */
+    public function next_case_id($year = null) {
+        $year = $year ? intval($year) : intval(date('Y'));
+
+        if (empty(self::$pool[$year])) {
+            $block = $this->reserve_block(1, $year);
+            if (!$block['success']) {
+                return new WP_Error('case_id_allocation_failed', $block['message']);
+            }
+            self::$pool[$year] = range($block['first'], $block['last']);
+        }
+
+        return $this->format_case_id($year, array_shift(self::$pool[$year]));
+    }
+
+    /**
+     * Reserve a block of case IDs in one counter update (e.g. 1000 for an import)
+     */
+    public function reserve_case_ids($count, $year = null) {
+        $year = $year ? intval($year) : intval(date('Y'));
+        $count = max(1, intval($count));
+
+        $block = $this->reserve_block($count, $year);
+        if (!$block['success']) {
+            return new WP_Error('case_id_allocation_failed', $block['message']);
+        }
+
+        $case_ids = array();
+        for ($number = $block['first']; $number <= $block['last']; $number++) {
+            $case_ids[] = $this->format_case_id($year, $number);
+        }
+
+        return $case_ids;
+    }
+
+    /**
+     * Prefetch a block into the request pool so next_case_id() needs no further queries
+     */
+    public function prefetch($count, $year = null) {
+        $year = $year ? intval($year) : intval(date('Y'));
+
+        $block = $this->reserve_block($count, $year);
+        if ($block['success']) {
+            self::$pool[$year] = array_merge(self::$pool[$year] ?? array(), range($block['first'], $block['last']));
+        }
+
+        return $block;
+    }
+
+    /**
+     * Atomically advance the counter by $count and return the reserved range
+     */
+    public function reserve_block($count, $year) {
+        $sequence_name = 'case_id_' . $year;
+        $count = max(1, intval($count));
+
+        // Fast path: counter row exists
+        $updated = $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->table_name} SET sequence_value = LAST_INSERT_ID(sequence_value + %d) WHERE sequence_name = %s",
+            $count,
+            $sequence_name
+        ));
+
+        if ($updated === false) {
+            // Table missing on installs that predate the allocator
+            $this->create_table();
+            $updated = 0;
+        }
+
+        if ($updated === 0) {
+            // First allocation this year: continue after existing (random) IDs
+            $seed = $this->get_highest_existing_number($year);
+
+            // ON DUPLICATE KEY covers a concurrent request creating the row first
+            $inserted = $this->wpdb->query($this->wpdb->prepare(
+                "INSERT INTO {$this->table_name} (sequence_name, sequence_value) VALUES (%s, LAST_INSERT_ID(%d))
+                 ON DUPLICATE KEY UPDATE sequence_value = LAST_INSERT_ID(sequence_value + %d)",
+                $sequence_name,
+                $seed + $count,
+                $count
+            ));
+
+            if ($inserted === false) {
+                return array('success' => false, 'message' => 'Fall-ID konnte nicht reserviert werden: ' . $this->wpdb->last_error);
+            }
+        }
+
+        $last = intval($this->wpdb->get_var('SELECT LAST_INSERT_ID()'));
+
+        return array(
+            'success' => true,
+            'first' => $last - $count + 1,
+            'last' => $last
+        );
+    }
+
+    /**
+     * Insert a case row, returns the case ID that was stored or WP_Error
+     * $allocated: the case ID came from the sequence and may be replaced by the
+     * next number on a duplicate; manual IDs are never replaced, only reconciled.
+     */
+    public function insert_case($case_data, $formats, $allocated = true) {
+        $table_name = $this->wpdb->prefix . 'klage_cases';
+
+        for ($attempt = 1; $attempt <= self::MAX_INSERT_ATTEMPTS; $attempt++) {
+            if ($this->wpdb->insert($table_name, $case_data, $formats)) {
+                if (!$allocated) {
+                    $this->reconcile($case_data['case_id']);
+                }
+                return $case_data['case_id'];
+            }
+
+            if (stripos($this->wpdb->last_error, 'Duplicate entry') === false) {
+                break;
+            }
+
+            // Manual IDs can no longer be given twice (case_id is unique)
+            if (!$allocated) {
+                return new WP_Error('duplicate_case_id', 'Fall-ID "' . $case_data['case_id'] . '" ist bereits vergeben');
+            }
+
+            // Taken by a manual ID entered after the number was reserved
+            $this->reconcile($case_data['case_id']);
+            $case_data['case_id'] = $this->next_case_id();
+            if (is_wp_error($case_data['case_id'])) {
+                return $case_data['case_id'];
+            }
+        }
+
+        return new WP_Error('creation_failed', 'Fall konnte nicht gespeichert werden: ' . $this->wpdb->last_error);
+    }
+
+    /**
+     * Move the counter past a manually entered case ID in the sequence format
+     * The counter row of a year without allocations is seeded on first use.
+     */
+    public function reconcile($case_id) {
+        if (!preg_match('/^' . self::PREFIX . '-(\d{4})-(\d+)$/', (string) $case_id, $matches)) {
+            return;
+        }
+
+        $year = intval($matches[1]);
+        $number = intval($matches[2]);
+
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->table_name} SET sequence_value = GREATEST(sequence_value, %d) WHERE sequence_name = %s",
+            $number,
+            'case_id_' . $year
+        ));
+
+        // Numbers of the request pool at or below the manual one are used up
+        if (!empty(self::$pool[$year])) {
+            self::$pool[$year] = array_values(array_filter(self::$pool[$year], function($pooled) use ($number) {
+                return $pooled > $number;
+            }));
+        }
+    }
+
+    /**
+     * Format sequence number as case ID
+     */
+    public function format_case_id($year, $number) {
+        return self::PREFIX . '-' . $year . '-' . str_pad($number, self::MIN_DIGITS, '0', STR_PAD_LEFT);
+    }
+
+    /**
+     * Highest numeric suffix already used for a year
+     */
+    private function get_highest_existing_number($year) {
+        $pattern = $this->wpdb->esc_like(self::PREFIX . '-' . $year . '-') . '%';
+
+        return intval($this->wpdb->get_var($this->wpdb->prepare(
+            "SELECT MAX(CAST(SUBSTRING_INDEX(case_id, '-', -1) AS UNSIGNED)) FROM {$this->wpdb->prefix}klage_cases WHERE case_id LIKE %s",
+            $pattern
+        )));
+    }
+
+    /**
+     * Create counter table
+     */
+    public function create_table() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$this->table_name} (
+            sequence_name varchar(50) NOT NULL,
+            sequence_value bigint(20) unsigned NOT NULL DEFAULT 0,
+            PRIMARY KEY (sequence_name)
+        ) $charset_collate");
+    }
+}
@@ -10,32 +10,40 @@ if (!defined('ABSPATH')) {
 class CAH_Case_Manager {
     
     private $wpdb;
+    private $case_id_allocator;
     
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
+        $this->case_id_allocator = new CAH_Case_ID_Allocator();
     }
     
     /**
      * Create a new GDPR spam case
      */
     public function create_case($case_data) {
+        $allocated = empty($case_data['case_id']);
+        $case_id = $allocated ? $this->generate_case_id() : $case_data['case_id'];
+        if (is_wp_error($case_id)) {
+            return $case_id;
+        }
+        
         // Basic case creation
         $case_insert_data = array(
-            'case_id' => $case_data['case_id'] ?? $this->generate_case_id(),
+            'case_id' => $case_id,
             'case_creation_date' => current_time('mysql'),
             'case_status' => 'draft',
             'case_priority' => $case_data['case_priority'] ?? 'medium',
             'total_amount' => 548.11 // Standard GDPR amount
         );
         
-        $result = $this->wpdb->insert(
-            $this->wpdb->prefix . 'klage_cases',
+        $result = $this->case_id_allocator->insert_case(
             $case_insert_data,
-            array('%s', '%s', '%s', '%s', '%f')
+            array('%s', '%s', '%s', '%s', '%f'),
+            $allocated
         );
         
-        if ($result === false) {
+        if (is_wp_error($result)) {
             return new WP_Error('creation_failed', 'Fehler beim Erstellen des Falls');
         }
         
@@ -43,9 +51,9 @@ class CAH_Case_Manager {
     }
     
     /**
-     * Generate case ID
+     * Generate case ID (unique, from the case ID sequence)
      */
     public function generate_case_id() {
-        return 'SPAM-' . date('Y') . '-' . str_pad(wp_rand(1, 9999), 4, '0', STR_PAD_LEFT);
+        return $this->case_id_allocator->next_case_id();
     }
 }
\ No newline at end of file
@@ -0,0 +1,284 @@
+<?php
+/**
+ * Case Repository - Cached case lookups for the admin views
+ * A case is loaded with its debtor and (legacy) financial row in one joined
+ * query, kept in a request-local identity map and in the object cache.
+ * Every write path invalidates the affected case or debtor.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Case_Repository {
+
+    private $wpdb;
+
+    // Request-local identity map (case entries and debtors by id, ids by case_id)
+    private static $cases = array();
+    private static $debtors = array();
+    private static $case_ids = array();
+
+    // klage_financial exists (removed in v1.4.7, still present on old installs)
+    private static $has_financial_table = null;
+
+    // Cache version used since a table_changed() in this request; stored once
+    // by flush_pending() (shutdown or end of a bulk operation)
+    private static $pending_version = null;
+
+    const CACHE_GROUP = 'cah_cases';
+
+    // Tables whose rows end up in cached entries
+    const TABLES = array('klage_cases', 'klage_debtors', 'klage_financial');
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+    }
+
+    /**
+     * Get case entry: array('case', 'debtor', 'financial') or null for unknown ids
+     * The same id returns the same objects for the rest of the request.
+     */
+    public function find($id) {
+        $id = intval($id);
+
+        if (array_key_exists($id, self::$cases)) {
+            return self::$cases[$id];
+        }
+
+        $entry = wp_cache_get(self::cache_key('case_' . $id), self::CACHE_GROUP);
+
+        if ($entry === false) {
+            $entry = $this->load($id);
+        }
+
+        if ($entry) {
+            $entry['debtor'] = $this->find_debtor($entry['case']->debtor_id);
+        }
+
+        // Unknown ids are not cached: new cases don't always go through an invalidation
+        $entry = $entry ?: null;
+        self::$cases[$id] = $entry;
+
+        return $entry;
+    }
+
+    /**
+     * Get debtor by id (null if unknown)
+     */
+    public function find_debtor($debtor_id) {
+        $debtor_id = intval($debtor_id);
+
+        if (!$debtor_id) {
+            return null;
+        }
+
+        if (array_key_exists($debtor_id, self::$debtors)) {
+            return self::$debtors[$debtor_id];
+        }
+
+        $debtor = wp_cache_get(self::cache_key('debtor_' . $debtor_id), self::CACHE_GROUP);
+
+        if ($debtor === false) {
+            $debtor = $this->wpdb->get_row($this->wpdb->prepare("
+                SELECT * FROM {$this->wpdb->prefix}klage_debtors WHERE id = %d
+            ", $debtor_id));
+
+            if ($debtor) {
+                wp_cache_set(self::cache_key('debtor_' . $debtor_id), $debtor, self::CACHE_GROUP, DAY_IN_SECONDS);
+            }
+        }
+
+        $debtor = $debtor ?: null;
+        self::$debtors[$debtor_id] = $debtor;
+
+        return $debtor;
+    }
+
+    /**
+     * Get internal id for a case_id (0 if the case_id is not used)
+     */
+    public function find_id_by_case_id($case_id) {
+        $case_id = (string) $case_id;
+
+        if (isset(self::$case_ids[$case_id])) {
+            return self::$case_ids[$case_id];
+        }
+
+        $cache_key = self::cache_key('case_id_' . md5($case_id));
+        $id = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+        if ($id === false) {
+            $id = intval($this->wpdb->get_var($this->wpdb->prepare("
+                SELECT id FROM {$this->wpdb->prefix}klage_cases WHERE case_id = %s LIMIT 1
+            ", $case_id)));
+
+            // Only used ids are cached (imports and the REST API create cases too)
+            if ($id) {
+                wp_cache_set($cache_key, $id, self::CACHE_GROUP, DAY_IN_SECONDS);
+            }
+        }
+
+        self::$case_ids[$case_id] = intval($id);
+
+        return self::$case_ids[$case_id];
+    }
+
+    /**
+     * Load case, debtor and financial row with one query
+     * Always reads the primary: a lagging replica would put stale rows into the cache.
+     */
+    private function load($id) {
+        $with_financial = $this->has_financial_table();
+
+        $row = $this->wpdb->get_row($this->wpdb->prepare("
+            SELECT c.*, d.*" . ($with_financial ? ", f.*" : "") . "
+            FROM {$this->wpdb->prefix}klage_cases c
+            LEFT JOIN {$this->wpdb->prefix}klage_debtors d ON d.id = c.debtor_id
+            " . ($with_financial ? "LEFT JOIN {$this->wpdb->prefix}klage_financial f ON f.case_id = c.id" : "") . "
+            WHERE c.id = %d
+            LIMIT 1
+        ", $id), ARRAY_N);
+
+        if (!$row) {
+            return null;
+        }
+
+        // Split the columns by table alias (the tables share column names like id)
+        $tables = $this->wpdb->get_col_info('table');
+        $names = $this->wpdb->get_col_info('name');
+        $parts = array('c' => array(), 'd' => array(), 'f' => array());
+
+        foreach ($row as $index => $value) {
+            $parts[$tables[$index]][$names[$index]] = $value;
+        }
+
+        $case = (object) $parts['c'];
+        $debtor = isset($parts['d']['id']) ? (object) $parts['d'] : null;
+        $financial = isset($parts['f']['id']) ? (object) $parts['f'] : null;
+
+        wp_cache_set(self::cache_key('case_' . $id), array(
+            'case' => $case,
+            'financial' => $financial
+        ), self::CACHE_GROUP, DAY_IN_SECONDS);
+
+        if ($debtor) {
+            wp_cache_set(self::cache_key('debtor_' . $debtor->id), $debtor, self::CACHE_GROUP, DAY_IN_SECONDS);
+            self::$debtors[intval($debtor->id)] = $debtor;
+        }
+
+        return array(
+            'case' => $case,
+            'financial' => $financial
+        );
+    }
+
+    private function has_financial_table() {
+        if (self::$has_financial_table === null) {
+            self::$has_financial_table = (bool) $this->wpdb->get_var("SHOW TABLES LIKE '{$this->wpdb->prefix}klage_financial'");
+        }
+
+        return self::$has_financial_table;
+    }
+
+    /**
+     * Invalidate one case (case row or its financial row changed, case deleted)
+     * Pass the case_id when the caller has it: its id lookup is dropped even if
+     * the entry itself is not cached.
+     */
+    public static function invalidate_case($id, $case_id = null) {
+        $id = intval($id);
+
+        $case_ids = (string) $case_id !== '' ? array((string) $case_id) : array();
+
+        $entry = self::$cases[$id] ?? wp_cache_get(self::cache_key('case_' . $id), self::CACHE_GROUP);
+        if ($entry) {
+            $case_ids[] = (string) $entry['case']->case_id;
+        }
+
+        foreach (array_unique($case_ids) as $stale_case_id) {
+            wp_cache_delete(self::cache_key('case_id_' . md5($stale_case_id)), self::CACHE_GROUP);
+            unset(self::$case_ids[$stale_case_id]);
+        }
+
+        wp_cache_delete(self::cache_key('case_' . $id), self::CACHE_GROUP);
+        unset(self::$cases[$id]);
+    }
+
+    /**
+     * Invalidate one debtor (shared by all cases referencing it)
+     */
+    public static function invalidate_debtor($debtor_id) {
+        $debtor_id = intval($debtor_id);
+
+        wp_cache_delete(self::cache_key('debtor_' . $debtor_id), self::CACHE_GROUP);
+        unset(self::$debtors[$debtor_id]);
+
+        // Entries in the identity map hold the debtor object
+        foreach (self::$cases as $id => $entry) {
+            if ($entry && intval($entry['case']->debtor_id) === $debtor_id) {
+                unset(self::$cases[$id]);
+            }
+        }
+    }
+
+    /**
+     * Invalidate after writes that don't say which rows changed
+     * (database admin, generic CSV import)
+     * Only marks the cache dirty: this request moves to fresh keys right away,
+     * the version option is written once by flush_pending().
+     */
+    public static function table_changed($table_name) {
+        if (!in_array($table_name, self::TABLES, true)) {
+            return;
+        }
+
+        if (self::$pending_version === null) {
+            add_action('shutdown', array(__CLASS__, 'flush_pending'));
+        }
+
+        // Entries cached after an earlier write of this request are stale too
+        self::$pending_version = max(self::$pending_version ?? 0, self::get_stored_version()) + 1;
+
+        self::$cases = array();
+        self::$debtors = array();
+        self::$case_ids = array();
+    }
+
+    /**
+     * Store the version bump of table_changed() calls (shutdown, end of a bulk operation)
+     */
+    public static function flush_pending() {
+        if (self::$pending_version === null) {
+            return;
+        }
+
+        update_option('cah_case_cache_version', max(self::$pending_version, self::get_stored_version() + 1));
+        self::$pending_version = null;
+    }
+
+    /**
+     * Invalidate everything (schema updates, bulk changes)
+     */
+    public static function flush() {
+        update_option('cah_case_cache_version', max(self::$pending_version ?? 0, self::get_stored_version()) + 1);
+        self::$pending_version = null;
+
+        self::$cases = array();
+        self::$debtors = array();
+        self::$case_ids = array();
+        self::$has_financial_table = null;
+    }
+
+    private static function get_stored_version() {
+        return intval(get_option('cah_case_cache_version', 0));
+    }
+
+    /**
+     * Versioned cache key (version bumped by flush and table_changed)
+     */
+    private static function cache_key($key) {
+        return $key . '_' . (self::$pending_version ?? self::get_stored_version());
+    }
+}
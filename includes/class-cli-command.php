@@ -0,0 +1,600 @@
+<?php
+/**
+ * CLI Command - Parallel case import and export (wp cah ...)
+ * The input is split into shards (CSV byte ranges for imports, contiguous
+ * case id ranges for exports) that run in forked workers with their own DB connections,
+ * see CAH_Parallel_Runner. Worker error reports are merged by the parent.
+ * wp cah sync-schema is the maintenance path for index builds.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_CLI_Command {
+
+    const DEFAULT_WORKERS = 4;
+
+    // Error details kept per worker (counts cover all rows)
+    const ERROR_LIMIT = 10000;
+
+    // Progress line every n rows per worker
+    const PROGRESS_INTERVAL = 5000;
+
+    const EXPORT_BATCH_SIZE = 1000;
+
+    const IMPORT_MODES = array('create_new', 'update_existing', 'create_and_update');
+
+    // Export columns (Forderungen.com headers, so exports can be imported again)
+    const EXPORT_COLUMNS = array(
+        'Fall-ID (CSV)' => 'c.case_id',
+        'Fall-Status' => 'c.case_status',
+        'Brief-Status' => 'c.brief_status',
+        'Briefe' => 'c.briefe',
+        'Mandant' => 'c.mandant',
+        'Schuldner' => 'c.schuldner',
+        'Einreichungsdatum' => 'c.submission_date',
+        'Beweise' => 'c.beweise',
+        'Dokumente' => 'c.dokumente',
+        'Firmenname' => 'd.debtors_company',
+        'Vorname' => 'd.debtors_first_name',
+        'Nachname' => 'd.debtors_last_name',
+        'Adresse' => 'd.debtors_address',
+        'Postleitzahl' => 'd.debtors_postal_code',
+        'Stadt' => 'd.debtors_city',
+        'Land' => 'd.debtors_country',
+        'E-Mail' => 'd.debtors_email',
+        'Gericht zuständig' => 'c.gericht_zustaendig',
+        'Gesamtbetrag' => 'c.total_amount'
+    );
+
+    /**
+     * Import a Forderungen.com CSV export with parallel workers.
+     *
+     * A pre-scan reads the file record by record and splits it into one byte
+     * range of whole records per worker, so quoted fields may contain line
+     * breaks. A Fall-ID occurring more than once is imported from its first
+     * row; the later rows are reported as duplicates.
+     *
+     * ## OPTIONS
+     *
+     * <file>
+     * : CSV file (Forderungen.com export or import template).
+     *
+     * [--workers=<count>]
+     * : Number of worker processes.
+     * ---
+     * default: 4
+     * ---
+     *
+     * [--mode=<mode>]
+     * : Import mode.
+     * ---
+     * default: create_new
+     * options:
+     *   - create_new
+     *   - update_existing
+     *   - create_and_update
+     * ---
+     *
+     * [--delimiter=<delimiter>]
+     * : Field delimiter (\t for tab).
+     * ---
+     * default: ;
+     * ---
+     *
+     * [--errors=<file>]
+     * : Write the merged error report as CSV.
+     *
+     * ## EXAMPLES
+     *
+     *     wp cah import forderungen.csv --workers=8 --mode=create_and_update --errors=fehler.csv
+     */
+    public function import($args, $assoc_args) {
+        list($file) = $args;
+
+        $workers = intval(\WP_CLI\Utils\get_flag_value($assoc_args, 'workers', self::DEFAULT_WORKERS));
+        $mode = \WP_CLI\Utils\get_flag_value($assoc_args, 'mode', 'create_new');
+        $delimiter = \WP_CLI\Utils\get_flag_value($assoc_args, 'delimiter', ';');
+        $delimiter = $delimiter === '\t' ? "\t" : $delimiter;
+
+        if (!in_array($mode, self::IMPORT_MODES, true)) {
+            WP_CLI::error('Unbekannter Import-Modus: ' . $mode);
+        }
+
+        $handle = @fopen($file, 'rb');
+        if (!$handle) {
+            WP_CLI::error('Datei konnte nicht gelesen werden: ' . $file);
+        }
+
+        $header = fgetcsv($handle, 0, $delimiter);
+        $data_start = ftell($handle);
+        fclose($handle);
+
+        if (!$header) {
+            WP_CLI::error('CSV-Datei ist leer.');
+        }
+
+        // UTF-8 BOM of Excel exports and our templates
+        $header[0] = preg_replace('/^\xEF\xBB\xBF/', '', $header[0]);
+        $header = array_map('trim', $header);
+
+        $importer = new CAH_Forderungen_Importer();
+        $missing_required = $importer->get_missing_required_fields($header);
+
+        if (!empty($missing_required)) {
+            WP_CLI::error('Erforderliche Forderungen.com Felder fehlen: ' . implode(', ', $missing_required));
+        }
+
+        $is_forderungen_export = $importer->is_forderungen_export($header);
+        $scan = $this->scan_file($file, $data_start, $workers, $header, $delimiter);
+        $ranges = $scan['ranges'];
+        $duplicates = $scan['duplicates'];
+        unset($scan);
+
+        if (empty($ranges)) {
+            WP_CLI::success('Keine Datenzeilen gefunden.');
+            return;
+        }
+
+        WP_CLI::log(sprintf('Importiere %s mit %d Worker(n)...', $file, count($ranges)));
+
+        $runner = new CAH_Parallel_Runner();
+        $started = microtime(true);
+
+        $results = $runner->run(count($ranges), function($shard) use ($runner, $file, $ranges, $duplicates, $header, $delimiter, $mode, $is_forderungen_export) {
+            return $this->import_range($runner, $file, $ranges[$shard], $duplicates, $header, $delimiter, $mode, $is_forderungen_export);
+        });
+
+        $report = $this->merge_results($results);
+
+        // Cases were written by other processes
+        CAH_Case_Repository::flush();
+
+        $this->print_report($report, array('worker', 'rows', 'imported', 'failed'), $report['imported'] . ' Fälle importiert', microtime(true) - $started);
+        $this->write_error_report($report['errors'], \WP_CLI\Utils\get_flag_value($assoc_args, 'errors'));
+
+        $audit_logger = new CAH_Audit_Logger();
+        $audit_logger->log_action(0, 'cli_import', 'WP-CLI Import aus ' . basename($file) . ': ' . $report['imported'] . ' Fälle, ' . $report['failed'] . ' Fehler, ' . count($ranges) . ' Worker');
+
+        if ($report['failed'] > 0) {
+            WP_CLI::halt(1);
+        }
+    }
+
+    /**
+     * Export cases with debtor data as Forderungen.com CSV, one shard per worker.
+     *
+     * Workers read one contiguous range of case ids each (split between the
+     * lowest and highest id up front) into part files that are appended to
+     * the target file in range order, so rows come out sorted by id.
+     *
+     * ## OPTIONS
+     *
+     * <file>
+     * : Target CSV file.
+     *
+     * [--workers=<count>]
+     * : Number of worker processes.
+     * ---
+     * default: 4
+     * ---
+     *
+     * [--status=<status>]
+     * : Only export cases with this case status.
+     *
+     * ## EXAMPLES
+     *
+     *     wp cah export faelle.csv --workers=8 --status=processing
+     */
+    public function export($args, $assoc_args) {
+        list($file) = $args;
+
+        $workers = intval(\WP_CLI\Utils\get_flag_value($assoc_args, 'workers', self::DEFAULT_WORKERS));
+        $status = \WP_CLI\Utils\get_flag_value($assoc_args, 'status');
+
+        $output = @fopen($file, 'wb');
+        if (!$output) {
+            WP_CLI::error('Datei konnte nicht geschrieben werden: ' . $file);
+        }
+
+        // Add BOM for UTF-8 Excel compatibility
+        fwrite($output, "\xEF\xBB\xBF");
+        fputcsv($output, array_keys(self::EXPORT_COLUMNS), ';');
+
+        $ranges = $this->id_ranges($workers, $status);
+        $runner = new CAH_Parallel_Runner();
+        $started = microtime(true);
+
+        $results = empty($ranges) ? array() : $runner->run(count($ranges), function($shard) use ($file, $ranges, $status) {
+            return $this->export_shard($file . '.part' . $shard, $shard, $ranges[$shard], $status);
+        });
+
+        // Append the worker files in shard order
+        foreach ($results as $shard => $result) {
+            $part = $file . '.part' . $shard;
+            $input = @fopen($part, 'rb');
+
+            if ($input) {
+                stream_copy_to_stream($input, $output);
+                fclose($input);
+            }
+            @unlink($part);
+        }
+        fclose($output);
+
+        $report = $this->merge_results($results);
+        $this->print_report($report, array('worker', 'rows', 'failed'), $report['rows'] . ' Fälle exportiert nach ' . $file, microtime(true) - $started);
+
+        if ($report['failed'] > 0) {
+            WP_CLI::halt(1);
+        }
+    }
+
+    /**
+     * Bring the plugin tables up to date, including index builds.
+     *
+     * Maintenance run: missing indexes (skipped during normal requests) are
+     * built, and ALTERs the server can't run online fall back to the
+     * blocking algorithm. Run it at a quiet time.
+     *
+     * ## OPTIONS
+     *
+     * [--dry-run]
+     * : Only show the planned ALTER statements.
+     *
+     * ## EXAMPLES
+     *
+     *     wp cah sync-schema --dry-run
+     *     wp cah sync-schema
+     */
+    public function sync_schema($args, $assoc_args) {
+        $dry_run = (bool) \WP_CLI\Utils\get_flag_value($assoc_args, 'dry-run', false);
+
+        // Table creation also converts case_id to a unique key
+        if (!$dry_run) {
+            $database = new CAH_Database();
+            $created = $database->create_tables_direct(true);
+            foreach ($created['details'] as $detail) {
+                WP_CLI::log($detail);
+            }
+        }
+
+        $schema_manager = new CAH_Schema_Manager();
+        $results = $schema_manager->synchronize_all_tables($dry_run, true);
+        $failed = 0;
+
+        foreach ($results as $table_name => $result) {
+            if (!$result['success']) {
+                $failed++;
+                WP_CLI::warning($table_name . ': ' . $result['message']);
+                continue;
+            }
+
+            WP_CLI::log($table_name . ': ' . $result['message']);
+            foreach ($result['plan']['statements'] ?? array() as $statement) {
+                WP_CLI::log('  ' . $statement['sql'] . ' (' . $statement['cost'] . ')');
+            }
+        }
+
+        if ($failed > 0) {
+            WP_CLI::error($failed . ' Tabellen konnten nicht synchronisiert werden');
+        }
+
+        WP_CLI::success($dry_run ? 'Plan erstellt' : 'Schema synchronisiert');
+    }
+
+    /**
+     * Import the rows of one byte range (runs in a worker)
+     * $duplicates: record offset => line of the first row with the same Fall-ID
+     */
+    private function import_range($runner, $file, $range, $duplicates, $header, $delimiter, $mode, $is_forderungen_export) {
+        $worker = $runner->get_worker();
+        $importer = new CAH_Forderungen_Importer();
+        $result = array('worker' => $worker, 'rows' => 0, 'imported' => 0, 'failed' => 0, 'errors' => array());
+        $created_case_ids = array();
+
+        $handle = fopen($file, 'rb');
+        $case_id_index = array_search('Fall-ID (CSV)', $header);
+        $postal_code_index = array_search('Postleitzahl', $header);
+
+        // First pass: reserve case IDs and resolve courts for this range
+        $missing_case_ids = 0;
+        $postal_codes = array();
+
+        fseek($handle, $range['start']);
+        while (ftell($handle) < $range['end'] && ($data = fgetcsv($handle, 0, $delimiter)) !== false) {
+            if ($data === array(null)) {
+                continue;
+            }
+            if (empty($data[$case_id_index])) {
+                $missing_case_ids++;
+            }
+            if ($postal_code_index !== false && isset($data[$postal_code_index])) {
+                $postal_codes[] = sanitize_text_field($data[$postal_code_index]);
+            }
+        }
+
+        $importer->prefetch_case_ids($missing_case_ids);
+        if ($postal_code_index !== false) {
+            $importer->resolve_courts($postal_codes);
+        }
+
+        fseek($handle, $range['start']);
+        $line = $range['line'];
+
+        while (($offset = ftell($handle)) < $range['end'] && ($data = fgetcsv($handle, 0, $delimiter)) !== false) {
+            $line_num = $line;
+            $line += 1 + substr_count(implode('', $data), "\n");
+
+            if ($data === array(null)) {
+                continue;
+            }
+
+            $result['rows']++;
+
+            if ($result['rows'] % self::PROGRESS_INTERVAL === 0) {
+                WP_CLI::log(sprintf('Worker %d: %d Zeilen', $worker, $result['rows']));
+            }
+
+            if (count($data) !== count($header)) {
+                $this->add_error($result, $line_num, '', 'Spaltenanzahl stimmt nicht überein');
+                continue;
+            }
+
+            $row_data = array_combine($header, $data);
+            $case_id = sanitize_text_field($row_data['Fall-ID (CSV)']);
+
+            // Duplicates were resolved by the pre-scan: the first row in the file wins
+            if (isset($duplicates[$offset])) {
+                $this->add_error($result, $line_num, $case_id, 'Fall-ID doppelt in der Datei (bereits in Zeile ' . $duplicates[$offset] . ')');
+                continue;
+            }
+
+            // Another import running at the same time may hold the Fall-ID
+            if ($case_id !== '' && !$runner->claim('case:' . $case_id)) {
+                $this->add_error($result, $line_num, $case_id, 'Fall-ID wird von einem anderen Import verarbeitet');
+                continue;
+            }
+
+            $import_result = $importer->import_row($row_data, $mode, $is_forderungen_export);
+
+            if ($import_result['success']) {
+                $result['imported']++;
+                if ($import_result['created']) {
+                    $created_case_ids[] = $import_result['case_id'];
+                }
+            } else {
+                $this->add_error($result, $line_num, $case_id, $import_result['error']);
+            }
+        }
+
+        fclose($handle);
+
+        // Follow-up work for all new cases of the range at once (e.g. financial templates)
+        if ($created_case_ids) {
+            do_action('cah_cases_imported', $created_case_ids);
+        }
+
+        return $result;
+    }
+
+    /**
+     * Split the case ids (MIN to MAX, optionally of one status) into up to
+     * $parts contiguous ranges, array(first, last) each
+     */
+    private function id_ranges($parts, $status) {
+        $db = CAH_Query_Router::reader('cli_export');
+
+        $where = $status ? $db->prepare('WHERE case_status = %s', $status) : '';
+        $bounds = $db->get_row("SELECT MIN(id) AS first_id, MAX(id) AS last_id FROM {$db->prefix}klage_cases $where");
+
+        if (!$bounds || $bounds->first_id === null) {
+            return array();
+        }
+
+        $first = intval($bounds->first_id);
+        $last = intval($bounds->last_id);
+        $parts = max(1, min(intval($parts), $last - $first + 1));
+        $size = intdiv($last - $first + $parts, $parts);
+
+        $ranges = array();
+        for ($start = $first; $start <= $last; $start += $size) {
+            $ranges[] = array($start, min($last, $start + $size - 1));
+        }
+
+        return $ranges;
+    }
+
+    /**
+     * Write the cases of one id range to a part file (runs in a worker),
+     * keyset-paginated by id
+     */
+    private function export_shard($part_file, $shard, $range, $status) {
+        $db = CAH_Query_Router::reader('cli_export');
+        $result = array('worker' => $shard, 'rows' => 0, 'failed' => 0, 'errors' => array());
+
+        $output = @fopen($part_file, 'wb');
+        if (!$output) {
+            $this->add_error($result, 0, '', 'Datei konnte nicht geschrieben werden: ' . $part_file);
+            return $result;
+        }
+
+        $conditions = $db->prepare('c.id <= %d', $range[1]);
+        if ($status) {
+            $conditions .= $db->prepare(' AND c.case_status = %s', $status);
+        }
+
+        $last_id = $range[0] - 1;
+
+        do {
+            $rows = $db->get_results($db->prepare("
+                SELECT c.id, " . implode(', ', self::EXPORT_COLUMNS) . "
+                FROM {$db->prefix}klage_cases c
+                LEFT JOIN {$db->prefix}klage_debtors d ON d.id = c.debtor_id
+                WHERE c.id > %d AND $conditions
+                ORDER BY c.id
+                LIMIT %d
+            ", $last_id, self::EXPORT_BATCH_SIZE), ARRAY_N);
+
+            if ($rows === null || $db->last_error) {
+                $this->add_error($result, 0, '', 'Datenbankfehler: ' . $db->last_error);
+                break;
+            }
+
+            foreach ($rows as $row) {
+                $last_id = intval(array_shift($row));
+                fputcsv($output, $row, ';');
+                $result['rows']++;
+            }
+        } while (count($rows) === self::EXPORT_BATCH_SIZE);
+
+        fclose($output);
+
+        return $result;
+    }
+
+    /**
+     * Pre-scan the data part of a file record by record (fgetcsv)
+     * Returns 'ranges': up to $parts byte ranges of whole records, array(start,
+     * end, line) each (line = file line number of start), and 'duplicates':
+     * record offset => line of the first row with the same Fall-ID.
+     */
+    private function scan_file($file, $data_start, $parts, $header, $delimiter) {
+        $size = filesize($file);
+        $handle = fopen($file, 'rb');
+        $case_id_index = array_search('Fall-ID (CSV)', $header);
+        $parts = max(1, min(CAH_Parallel_Runner::MAX_WORKERS, intval($parts)));
+
+        $ranges = array();
+        $duplicates = array();
+        $first_lines = array();
+        $next_split = $data_start;
+        $line = 2;
+
+        fseek($handle, $data_start);
+
+        while (($offset = ftell($handle)) < $size && ($data = fgetcsv($handle, 0, $delimiter)) !== false) {
+            // Ranges start at the first record past each split point
+            if ($offset >= $next_split && count($ranges) < $parts) {
+                if ($ranges) {
+                    $ranges[count($ranges) - 1]['end'] = $offset;
+                }
+                $ranges[] = array('start' => $offset, 'end' => $size, 'line' => $line);
+                $next_split = $data_start + intval(($size - $data_start) * count($ranges) / $parts);
+            }
+
+            // Same line count as import_range()
+            $line_num = $line;
+            $line += 1 + substr_count(implode('', $data), "\n");
+
+            // Rows import_range() rejects anyway don't claim a Fall-ID
+            if ($data === array(null) || count($data) !== count($header) || $case_id_index === false) {
+                continue;
+            }
+
+            $case_id = sanitize_text_field($data[$case_id_index]);
+            if ($case_id === '') {
+                continue;
+            }
+
+            if (isset($first_lines[$case_id])) {
+                $duplicates[$offset] = $first_lines[$case_id];
+            } else {
+                $first_lines[$case_id] = $line_num;
+            }
+        }
+
+        fclose($handle);
+
+        return array('ranges' => $ranges, 'duplicates' => $duplicates);
+    }
+
+    private function add_error(&$result, $line, $case_id, $message) {
+        $result['failed']++;
+
+        if (count($result['errors']) < self::ERROR_LIMIT) {
+            $result['errors'][] = array(
+                'line' => $line,
+                'worker' => $result['worker'],
+                'case_id' => $case_id,
+                'message' => $message
+            );
+        }
+    }
+
+    /**
+     * Merge worker results: counters are summed, errors sorted by line
+     */
+    private function merge_results($results) {
+        $report = array('workers' => array(), 'rows' => 0, 'imported' => 0, 'failed' => 0, 'errors' => array());
+
+        foreach ($results as $shard => $result) {
+            if (is_wp_error($result)) {
+                $report['failed']++;
+                $report['errors'][] = array('line' => 0, 'worker' => $shard, 'case_id' => '', 'message' => $result->get_error_message());
+                $report['workers'][] = array('worker' => $shard, 'rows' => 0, 'imported' => 0, 'failed' => 1);
+                continue;
+            }
+
+            $report['rows'] += $result['rows'];
+            $report['imported'] += $result['imported'] ?? 0;
+            $report['failed'] += $result['failed'];
+            $report['errors'] = array_merge($report['errors'], $result['errors']);
+            $report['workers'][] = array(
+                'worker' => $shard,
+                'rows' => $result['rows'],
+                'imported' => $result['imported'] ?? 0,
+                'failed' => $result['failed']
+            );
+        }
+
+        usort($report['errors'], function($a, $b) {
+            return $a['line'] - $b['line'];
+        });
+
+        return $report;
+    }
+
+    private function print_report($report, $fields, $summary, $elapsed) {
+        \WP_CLI\Utils\format_items('table', $report['workers'], $fields);
+
+        foreach (array_slice($report['errors'], 0, 20) as $error) {
+            WP_CLI::warning(($error['line'] ? 'Zeile ' . $error['line'] . ': ' : 'Worker ' . $error['worker'] . ': ') . ($error['case_id'] ? $error['case_id'] . ': ' : '') . $error['message']);
+        }
+        if (count($report['errors']) > 20) {
+            WP_CLI::warning('... und ' . ($report['failed'] - 20) . ' weitere Fehler');
+        }
+
+        $message = sprintf('%s in %.1f s (%.0f Zeilen/s)', $summary, $elapsed, $elapsed > 0 ? $report['rows'] / $elapsed : 0);
+
+        if ($report['failed'] > 0) {
+            WP_CLI::warning($message . ', ' . $report['failed'] . ' Fehler');
+        } else {
+            WP_CLI::success($message);
+        }
+    }
+
+    /**
+     * Merged error report as CSV (line;worker;case_id;message)
+     */
+    private function write_error_report($errors, $file) {
+        if (!$file) {
+            return;
+        }
+
+        $output = @fopen($file, 'wb');
+        if (!$output) {
+            WP_CLI::warning('Fehlerbericht konnte nicht geschrieben werden: ' . $file);
+            return;
+        }
+
+        fputcsv($output, array('Zeile', 'Worker', 'Fall-ID', 'Fehler'), ';');
+        foreach ($errors as $error) {
+            fputcsv($output, array($error['line'], $error['worker'], $error['case_id'], $error['message']), ';');
+        }
+        fclose($output);
+
+        WP_CLI::log('Fehlerbericht: ' . $file);
+    }
+}
@@ -1,6 +1,8 @@
 <?php
 /**
- * Court Manager class - Simplified version
+ * Court Manager class - PLZ to Amtsgericht resolution
+ * Postal code ranges are stored in klage_court_postal_ranges and resolved
+ * through a sorted range list cached in the object cache (binary search).
  */
 
 if (!defined('ABSPATH')) {
@@ -8,36 +10,329 @@ if (!defined('ABSPATH')) {
 }
 
 class CAH_Court_Manager {
-    
+
     private $wpdb;
-    
+
+    // In-process lookup structure (parallel sorted arrays)
+    private static $lookup = null;
+
+    // Courts by id
+    private static $courts = null;
+
+    const CACHE_GROUP = 'cah_courts';
+
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
     }
-    
+
     /**
      * Get court by postal code
      */
     public function get_court_by_postal_code($postal_code) {
-        // Simple court assignment based on postal code
-        $court_mapping = array(
-            '60' => 'Amtsgericht Frankfurt am Main', // Frankfurt
-            '80' => 'Amtsgericht München',           // München
-            '10' => 'Amtsgericht Berlin-Mitte',     // Berlin
-            '20' => 'Amtsgericht Hamburg',          // Hamburg
-        );
-        
-        $postal_prefix = substr($postal_code, 0, 2);
-        $court_name = isset($court_mapping[$postal_prefix]) ? 
-                      $court_mapping[$postal_prefix] : 
-                      'Amtsgericht Frankfurt am Main'; // Default
-        
+        $courts = $this->resolve_courts(array($postal_code));
+        $court = reset($courts);
+
+        if ($court) {
+            return $court;
+        }
+
+        // No range data for this postal code - keep legacy default
         return (object) array(
             'id' => 1,
-            'court_name' => $court_name,
+            'court_name' => 'Amtsgericht Frankfurt am Main',
             'court_address' => 'Gerichtsstraße 2, 60313 Frankfurt am Main',
             'court_egvp_id' => 'AG.FFM.001'
         );
     }
-}
\ No newline at end of file
+
+    /**
+     * Resolve many postal codes at once (no query per postal code)
+     * Returns array postal_code => court object (null if unknown)
+     */
+    public function resolve_courts(array $postal_codes) {
+        $lookup = $this->get_lookup();
+        $courts = $this->get_courts();
+
+        $resolved = array();
+
+        foreach ($postal_codes as $postal_code) {
+            $key = (string) $postal_code;
+            if (array_key_exists($key, $resolved)) {
+                continue;
+            }
+
+            $normalized = $this->normalize_postal_code($postal_code);
+            $court_id = $normalized === null ? null : $this->find_court_id($lookup, intval($normalized));
+
+            $resolved[$key] = ($court_id && isset($courts[$court_id])) ? $courts[$court_id] : null;
+        }
+
+        return $resolved;
+    }
+
+    /**
+     * Normalize German postal code to 5 digits (null if invalid)
+     */
+    private function normalize_postal_code($postal_code) {
+        $digits = preg_replace('/\D/', '', (string) $postal_code);
+
+        // Leading zeros are often lost in spreadsheet exports (e.g. 1067 for 01067)
+        if (strlen($digits) === 4) {
+            $digits = '0' . $digits;
+        }
+
+        return strlen($digits) === 5 ? $digits : null;
+    }
+
+    /**
+     * Binary search for the range containing the postal code
+     */
+    private function find_court_id($lookup, $postal_code) {
+        $low = 0;
+        $high = count($lookup['starts']) - 1;
+        $match = -1;
+
+        // Last range starting at or before the postal code
+        while ($low <= $high) {
+            $mid = ($low + $high) >> 1;
+            if ($lookup['starts'][$mid] <= $postal_code) {
+                $match = $mid;
+                $low = $mid + 1;
+            } else {
+                $high = $mid - 1;
+            }
+        }
+
+        if ($match >= 0 && $lookup['ends'][$match] >= $postal_code) {
+            return $lookup['court_ids'][$match];
+        }
+
+        return null;
+    }
+
+    /**
+     * Get sorted range list (request memo -> object cache -> database)
+     */
+    private function get_lookup() {
+        if (self::$lookup !== null) {
+            return self::$lookup;
+        }
+
+        $cache_key = 'postal_ranges_' . get_option('cah_postal_ranges_version', 0);
+        $lookup = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+        if ($lookup === false) {
+            $lookup = array(
+                'starts' => array(),
+                'ends' => array(),
+                'court_ids' => array()
+            );
+
+            $table_name = $this->wpdb->prefix . 'klage_court_postal_ranges';
+
+            if ($this->wpdb->get_var("SHOW TABLES LIKE '$table_name'")) {
+                $rows = $this->wpdb->get_results("SELECT plz_from, plz_to, court_id FROM $table_name ORDER BY plz_from, plz_to", ARRAY_N);
+
+                foreach ($rows as $row) {
+                    $lookup['starts'][] = intval($row[0]);
+                    $lookup['ends'][] = intval($row[1]);
+                    $lookup['court_ids'][] = intval($row[2]);
+                }
+            }
+
+            wp_cache_set($cache_key, $lookup, self::CACHE_GROUP, DAY_IN_SECONDS);
+        }
+
+        self::$lookup = $lookup;
+
+        return $lookup;
+    }
+
+    /**
+     * Get all courts indexed by id
+     */
+    private function get_courts() {
+        if (self::$courts !== null) {
+            return self::$courts;
+        }
+
+        $cache_key = 'courts_' . get_option('cah_postal_ranges_version', 0);
+        $courts = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+        if ($courts === false) {
+            $courts = array();
+            $rows = $this->wpdb->get_results("SELECT id, court_name, court_address, court_egvp_id FROM {$this->wpdb->prefix}klage_courts");
+
+            foreach ((array) $rows as $row) {
+                $courts[intval($row->id)] = $row;
+            }
+
+            wp_cache_set($cache_key, $courts, self::CACHE_GROUP, DAY_IN_SECONDS);
+        }
+
+        self::$courts = $courts;
+
+        return $courts;
+    }
+
+    /**
+     * Import postal code ranges from CSV
+     * Format: plz_from;plz_to;court_name;court_address;court_egvp_id
+     */
+    public function import_postal_code_ranges($file_path, $delimiter = ';') {
+        if (!is_readable($file_path)) {
+            return array('success' => false, 'message' => 'Datei nicht lesbar: ' . $file_path);
+        }
+
+        $this->create_postal_ranges_table();
+
+        $handle = fopen($file_path, 'r');
+        if (!$handle) {
+            return array('success' => false, 'message' => 'Datei konnte nicht geöffnet werden: ' . $file_path);
+        }
+
+        // Existing courts by name, so re-imports reuse ids
+        $court_ids = array();
+        foreach ($this->wpdb->get_results("SELECT id, court_name FROM {$this->wpdb->prefix}klage_courts") as $court) {
+            $court_ids[$court->court_name] = intval($court->id);
+        }
+
+        $table_name = $this->wpdb->prefix . 'klage_court_postal_ranges';
+
+        // The old ranges stay in place until the new ones are committed
+        $this->wpdb->query('START TRANSACTION');
+
+        if ($this->wpdb->query("DELETE FROM $table_name") === false) {
+            return $this->abort_range_import($handle, 'PLZ-Bereiche konnten nicht gelöscht werden');
+        }
+
+        $batch = array();
+        $imported = 0;
+        $skipped = 0;
+
+        while (($row = fgetcsv($handle, 0, $delimiter)) !== false) {
+            if (count($row) < 3) {
+                $skipped++;
+                continue;
+            }
+
+            $plz_from = $this->normalize_postal_code($row[0]);
+            $plz_to = $this->normalize_postal_code($row[1]);
+            $court_name = sanitize_text_field($row[2]);
+
+            // Header line or invalid range
+            if ($plz_from === null || $plz_to === null || $plz_from > $plz_to || $court_name === '') {
+                $skipped++;
+                continue;
+            }
+
+            if (!isset($court_ids[$court_name])) {
+                $inserted = $this->wpdb->insert(
+                    $this->wpdb->prefix . 'klage_courts',
+                    array(
+                        'court_name' => $court_name,
+                        'court_address' => sanitize_text_field($row[3] ?? ''),
+                        'court_egvp_id' => sanitize_text_field($row[4] ?? '')
+                    ),
+                    array('%s', '%s', '%s')
+                );
+
+                if (!$inserted || !$this->wpdb->insert_id) {
+                    return $this->abort_range_import($handle, 'Gericht "' . $court_name . '" konnte nicht angelegt werden');
+                }
+                $court_ids[$court_name] = intval($this->wpdb->insert_id);
+            }
+
+            $batch[] = $this->wpdb->prepare('(%s, %s, %d)', $plz_from, $plz_to, $court_ids[$court_name]);
+
+            if (count($batch) >= 1000) {
+                $result = $this->insert_range_batch($batch);
+                if ($result === false) {
+                    return $this->abort_range_import($handle, 'PLZ-Bereiche konnten nicht gespeichert werden');
+                }
+                $imported += $result;
+                $batch = array();
+            }
+        }
+
+        $result = $this->insert_range_batch($batch);
+        if ($result === false) {
+            return $this->abort_range_import($handle, 'PLZ-Bereiche konnten nicht gespeichert werden');
+        }
+        $imported += $result;
+
+        fclose($handle);
+
+        if ($this->wpdb->query('COMMIT') === false) {
+            return $this->abort_range_import(null, 'PLZ-Bereiche konnten nicht übernommen werden');
+        }
+
+        $this->flush_lookup_cache();
+
+        return array(
+            'success' => true,
+            'message' => $imported . ' PLZ-Bereiche importiert, ' . $skipped . ' Zeilen übersprungen',
+            'imported' => $imported,
+            'skipped' => $skipped
+        );
+    }
+
+    /**
+     * Insert a batch of prepared range tuples (false on error)
+     */
+    private function insert_range_batch($batch) {
+        if (empty($batch)) {
+            return 0;
+        }
+
+        $table_name = $this->wpdb->prefix . 'klage_court_postal_ranges';
+
+        return $this->wpdb->query("INSERT INTO $table_name (plz_from, plz_to, court_id) VALUES " . implode(', ', $batch));
+    }
+
+    /**
+     * Roll back a failed range import (old ranges and courts stay unchanged)
+     */
+    private function abort_range_import($handle, $message) {
+        $error = $this->wpdb->last_error;
+
+        $this->wpdb->query('ROLLBACK');
+
+        if ($handle) {
+            fclose($handle);
+        }
+
+        return array(
+            'success' => false,
+            'message' => $message . ($error ? ': ' . $error : '')
+        );
+    }
+
+    /**
+     * Create postal range table (fresh installs and on first import)
+     */
+    public function create_postal_ranges_table() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_court_postal_ranges (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            plz_from char(5) NOT NULL,
+            plz_to char(5) NOT NULL,
+            court_id bigint(20) unsigned NOT NULL,
+            PRIMARY KEY (id),
+            KEY plz_range (plz_from, plz_to),
+            KEY court_id (court_id)
+        ) $charset_collate");
+    }
+
+    /**
+     * Invalidate cached lookup structure
+     */
+    public function flush_lookup_cache() {
+        update_option('cah_postal_ranges_version', intval(get_option('cah_postal_ranges_version', 0)) + 1);
+
+        self::$lookup = null;
+        self::$courts = null;
+    }
+}
@@ -13,11 +13,15 @@ class CAH_Database_Admin {
     private $schema_manager;
     private $form_generator;
     private $import_export_manager;
+    private $index_advisor;
+    private $court_manager;
     
     public function __construct() {
         $this->schema_manager = new CAH_Schema_Manager();
         $this->form_generator = new CAH_Form_Generator();
         $this->import_export_manager = new CAH_Import_Export_Manager();
+        $this->index_advisor = new CAH_Index_Advisor();
+        $this->court_manager = new CAH_Court_Manager();
         
         add_action('admin_menu', array($this, 'add_admin_menu'));
         add_action('admin_init', array($this, 'handle_admin_actions'));
@@ -50,7 +54,8 @@ class CAH_Database_Admin {
         // Handle schema synchronization
         if (isset($_POST['action']) && $_POST['action'] === 'sync_schema') {
             if (wp_verify_nonce($_POST['_wpnonce'], 'sync_schema')) {
-                $results = $this->schema_manager->synchronize_all_tables();
+                // Explicit maintenance run: builds indexes, may block writes
+                $results = $this->schema_manager->synchronize_all_tables(false, true);
                 
                 $success_count = 0;
                 $error_count = 0;
@@ -75,6 +80,17 @@ class CAH_Database_Admin {
             }
         }
         
+        // Handle schema sync preview (dry run)
+        if (isset($_POST['action']) && $_POST['action'] === 'plan_schema') {
+            if (wp_verify_nonce($_POST['_wpnonce'], 'sync_schema')) {
+                $results = $this->schema_manager->synchronize_all_tables(true, true);
+                
+                add_action('admin_notices', function() use ($results) {
+                    $this->render_sync_plan($results);
+                });
+            }
+        }
+        
         // Handle add column
         if (isset($_POST['action']) && $_POST['action'] === 'add_column') {
             if (wp_verify_nonce($_POST['_wpnonce'], 'add_column')) {
@@ -136,6 +152,7 @@ class CAH_Database_Admin {
                     }
                     
                     if ($result['success']) {
+                        $this->index_advisor->invalidate_analysis();
                         add_action('admin_notices', function() use ($index_name, $index_type) {
                             echo '<div class="notice notice-success"><p><strong>' . ucfirst($index_type) . ' "' . $index_name . '" added successfully!</strong></p>';
                             echo '<p>✅ Database table updated with new ' . $index_type . '<br>';
@@ -159,6 +176,7 @@ class CAH_Database_Admin {
             $result = $this->schema_manager->drop_index($table_name, $index_name);
             
             if ($result['success']) {
+                $this->index_advisor->invalidate_analysis();
                 add_action('admin_notices', function() use ($index_name) {
                     echo '<div class="notice notice-success"><p>Index "' . $index_name . '" dropped successfully.</p></div>';
                 });
@@ -169,6 +187,53 @@ class CAH_Database_Admin {
             }
         }
         
+        // Handle index advisor recommendation (one-click apply)
+        if (isset($_POST['action']) && $_POST['action'] === 'apply_index_recommendation') {
+            if (wp_verify_nonce($_POST['_wpnonce'], 'apply_index_recommendation')) {
+                $table_name = sanitize_text_field($_POST['table_name']);
+                $index_name = sanitize_text_field($_POST['index_name']);
+                $columns = array_map('sanitize_text_field', explode(',', $_POST['index_columns'] ?? ''));
+                
+                $result = $this->index_advisor->apply_recommendation($table_name, $index_name, $columns);
+                
+                if ($result['success']) {
+                    add_action('admin_notices', function() use ($index_name, $table_name) {
+                        echo '<div class="notice notice-success"><p>Recommended index "' . esc_html($index_name) . '" added to ' . esc_html($table_name) . '.</p></div>';
+                    });
+                } else {
+                    add_action('admin_notices', function() use ($result) {
+                        echo '<div class="notice notice-error"><p>Error applying recommendation: ' . esc_html($result['message']) . '</p></div>';
+                    });
+                }
+            }
+        }
+        
+        // Handle index advisor workload management
+        if (isset($_POST['action']) && $_POST['action'] === 'index_advisor_workload') {
+            if (wp_verify_nonce($_POST['_wpnonce'], 'index_advisor_workload')) {
+                $operation = sanitize_text_field($_POST['operation'] ?? '');
+                
+                if ($operation === 'enable_capture' || $operation === 'disable_capture') {
+                    $this->index_advisor->set_capture_enabled($operation === 'enable_capture');
+                    $result = array('success' => true, 'message' => 'Query capture ' . ($operation === 'enable_capture' ? 'enabled' : 'disabled') . '.');
+                } elseif ($operation === 'clear') {
+                    $result = $this->index_advisor->clear_workload();
+                } elseif ($operation === 'refresh') {
+                    $this->index_advisor->invalidate_analysis();
+                    $result = array('success' => true, 'message' => 'Index analysis will be recalculated.');
+                } elseif ($operation === 'import_log') {
+                    $result = $this->index_advisor->import_query_log(sanitize_text_field($_POST['log_path'] ?? ''));
+                } else {
+                    $result = array('success' => false, 'message' => 'Unknown operation');
+                }
+                
+                add_action('admin_notices', function() use ($result) {
+                    $class = $result['success'] ? 'notice-success' : 'notice-error';
+                    echo '<div class="notice ' . $class . '"><p>' . esc_html($result['message']) . '</p></div>';
+                });
+            }
+        }
+        
         // Handle CSV import
         if (isset($_POST['action']) && $_POST['action'] === 'import_csv') {
             if (wp_verify_nonce($_POST['_wpnonce'], 'import_csv')) {
@@ -189,6 +254,22 @@ class CAH_Database_Admin {
             }
         }
         
+        // Handle PLZ -> Amtsgericht directory import
+        if (isset($_POST['action']) && $_POST['action'] === 'import_court_ranges') {
+            if (wp_verify_nonce($_POST['_wpnonce'], 'import_court_ranges')) {
+                if (!isset($_FILES['court_ranges_file']) || $_FILES['court_ranges_file']['error'] !== UPLOAD_ERR_OK) {
+                    $result = array('success' => false, 'message' => 'File upload failed');
+                } else {
+                    $result = $this->court_manager->import_postal_code_ranges($_FILES['court_ranges_file']['tmp_name']);
+                }
+                
+                add_action('admin_notices', function() use ($result) {
+                    $class = $result['success'] ? 'notice-success' : 'notice-error';
+                    echo '<div class="notice ' . $class . '"><p>' . esc_html($result['message']) . '</p></div>';
+                });
+            }
+        }
+        
         // Handle data insert/update
         if (isset($_POST['action']) && $_POST['action'] === 'save_data') {
             if (wp_verify_nonce($_POST['_wpnonce'], 'save_data')) {
@@ -238,6 +319,16 @@ class CAH_Database_Admin {
         echo '<div class="wrap">';
         echo '<h1>Database Management</h1>';
         
+        // Index builds are left to an explicit sync (not run during normal requests)
+        $pending_indexes = get_option('cah_schema_pending_indexes');
+        if (!empty($pending_indexes)) {
+            $list = array();
+            foreach ($pending_indexes as $table_name => $index_names) {
+                $list[] = esc_html($table_name . ': ' . implode(', ', $index_names));
+            }
+            echo '<div class="notice notice-warning"><p><strong>Missing indexes</strong> (' . implode('; ', $list) . '). Build them with "Synchronize All Schemas" or <code>wp cah sync-schema</code> at a quiet time.</p></div>';
+        }
+        
         // Tab navigation
         echo '<nav class="nav-tab-wrapper">';
         echo '<a href="?page=klage-click-database&tab=schema" class="nav-tab ' . ($tab === 'schema' ? 'nav-tab-active' : '') . '">Schema Management</a>';
@@ -297,6 +388,7 @@ class CAH_Database_Admin {
         echo '<a href="?page=klage-click-database&tab=schema&table=' . $table_name . '&action=indexes" class="button ' . ($action === 'indexes' ? 'button-primary' : '') . '">Indexes & Keys</a>';
         echo '<a href="?page=klage-click-database&tab=schema&table=' . $table_name . '&action=add_column" class="button ' . ($action === 'add_column' ? 'button-primary' : '') . '">Add Column</a>';
         echo '<a href="?page=klage-click-database&tab=schema&table=' . $table_name . '&action=add_index" class="button ' . ($action === 'add_index' ? 'button-primary' : '') . '">Add Index/Key</a>';
+        echo '<a href="?page=klage-click-database&tab=schema&table=' . $table_name . '&action=index_advisor" class="button ' . ($action === 'index_advisor' ? 'button-primary' : '') . '">Index Advisor</a>';
         echo '</div>';
         
         if ($action === 'status') {
@@ -309,6 +401,8 @@ class CAH_Database_Admin {
             $this->render_add_column_form($table_name);
         } elseif ($action === 'add_index') {
             $this->render_add_index_form($table_name);
+        } elseif ($action === 'index_advisor') {
+            $this->render_index_advisor($table_name);
         }
         
         echo '</div>';
@@ -378,6 +472,64 @@ class CAH_Database_Admin {
         echo '<input type="hidden" name="action" value="sync_schema">';
         echo '<button type="submit" class="button button-primary">Synchronize All Schemas</button>';
         echo '</form>';
+        echo '<form method="post" style="display: inline-block; margin-left: 10px;">';
+        wp_nonce_field('sync_schema');
+        echo '<input type="hidden" name="action" value="plan_schema">';
+        echo '<button type="submit" class="button">Preview Sync Plan</button>';
+        echo '</form>';
+        echo '</div>';
+    }
+    
+    /**
+     * Render the dry-run result of synchronize_all_tables()
+     */
+    private function render_sync_plan($results) {
+        echo '<div class="notice notice-info"><p><strong>Schema sync plan (dry run - no changes made)</strong></p>';
+        
+        $has_changes = false;
+        
+        foreach ($results as $table => $result) {
+            if (!$result['success']) {
+                echo '<p><strong>' . esc_html($table) . ':</strong> ' . esc_html($result['message']) . '</p>';
+                continue;
+            }
+            
+            if (empty($result['plan'])) {
+                continue;
+            }
+            
+            $has_changes = true;
+            $plan = $result['plan'];
+            
+            if (!empty($plan['create_table'])) {
+                echo '<p><strong>' . esc_html($table) . ':</strong> table will be created</p>';
+                continue;
+            }
+            
+            echo '<p><strong>' . esc_html($table) . ':</strong> ' . number_format($plan['rows']) . ' rows, '
+                . size_format($plan['data_bytes'] + $plan['index_bytes']) . ', '
+                . intval($plan['rebuilds']) . ' rebuild(s) on ' . esc_html($plan['server']) . '</p>';
+            
+            echo '<table class="wp-list-table widefat fixed striped" style="margin-bottom: 10px;">';
+            echo '<thead><tr><th style="width: 90px;">Algorithm</th><th style="width: 70px;">Lock</th><th style="width: 180px;">Cost</th><th style="width: 90px;">Bytes</th><th>Statement</th></tr></thead><tbody>';
+            
+            foreach ($plan['statements'] as $statement) {
+                echo '<tr>';
+                echo '<td>' . esc_html($statement['algorithm']) . '</td>';
+                echo '<td>' . esc_html($statement['lock']) . '</td>';
+                echo '<td>' . esc_html($statement['cost']) . '</td>';
+                echo '<td>' . esc_html(size_format($statement['estimated_bytes'])) . '</td>';
+                echo '<td><code>' . esc_html($statement['sql']) . '</code></td>';
+                echo '</tr>';
+            }
+            
+            echo '</tbody></table>';
+        }
+        
+        if (!$has_changes) {
+            echo '<p>All schemas are up to date.</p>';
+        }
+        
         echo '</div>';
     }
     
@@ -626,6 +778,141 @@ class CAH_Database_Admin {
         echo '</div>';
     }
     
+    /**
+     * Render workload-driven index advisor
+     */
+    private function render_index_advisor($table_name) {
+        echo '<h2>Index Advisor</h2>';
+        
+        $workload = $this->index_advisor->get_workload();
+        $capture_enabled = $this->index_advisor->is_capture_enabled();
+        
+        // Workload sources
+        echo '<div class="unique-keys-info" style="background: #e7f3ff; padding: 15px; margin: 20px 0; border-radius: 5px; border-left: 4px solid #0073aa;">';
+        echo '<h4>📊 Captured Workload</h4>';
+        echo '<p><strong>Query fingerprints:</strong> ' . count($workload) . '</p>';
+        echo '<p><strong>SAVEQUERIES capture:</strong> ' . ($capture_enabled ? 'enabled (every ' . CAH_Index_Advisor::CAPTURE_SAMPLE_RATE . '. request)' : 'disabled');
+        if ($capture_enabled && (!defined('SAVEQUERIES') || !SAVEQUERIES)) {
+            echo ' <span class="description">(define SAVEQUERIES in wp-config.php to record queries)</span>';
+        }
+        echo '</p>';
+        
+        echo '<form method="post" style="display: inline-block; margin-right: 10px;">';
+        wp_nonce_field('index_advisor_workload');
+        echo '<input type="hidden" name="action" value="index_advisor_workload">';
+        echo '<input type="hidden" name="operation" value="' . ($capture_enabled ? 'disable_capture' : 'enable_capture') . '">';
+        echo '<input type="submit" class="button" value="' . ($capture_enabled ? 'Disable Capture' : 'Enable Capture') . '">';
+        echo '</form>';
+        
+        echo '<form method="post" style="display: inline-block; margin-right: 10px;">';
+        wp_nonce_field('index_advisor_workload');
+        echo '<input type="hidden" name="action" value="index_advisor_workload">';
+        echo '<input type="hidden" name="operation" value="clear">';
+        echo '<input type="submit" class="button" value="Clear Workload" onclick="return confirm(\'Clear all captured query fingerprints?\')">';
+        echo '</form>';
+        
+        echo '<form method="post" style="display: inline-block; margin-right: 10px;">';
+        wp_nonce_field('index_advisor_workload');
+        echo '<input type="hidden" name="action" value="index_advisor_workload">';
+        echo '<input type="hidden" name="operation" value="refresh">';
+        echo '<input type="submit" class="button" value="Refresh Analysis">';
+        echo '</form>';
+        
+        echo '<form method="post" style="margin-top: 10px;">';
+        wp_nonce_field('index_advisor_workload');
+        echo '<input type="hidden" name="action" value="index_advisor_workload">';
+        echo '<input type="hidden" name="operation" value="import_log">';
+        echo '<input type="text" name="log_path" class="regular-text" placeholder="mysql-slow.log"> ';
+        echo '<span class="description">Path relative to ' . esc_html(wp_upload_dir(null, false)['basedir']) . '</span> ';
+        echo '<input type="submit" class="button" value="Import Query Log">';
+        echo '</form>';
+        echo '</div>';
+        
+        if (empty($workload)) {
+            echo '<p>No workload captured yet. Enable capture or import a MySQL general/slow query log.</p>';
+            return;
+        }
+        
+        // Cached analysis, limited to the selected table
+        $analysis = $this->index_advisor->analyze($table_name);
+        echo '<p class="description">Showing results for ' . esc_html($table_name) . '.</p>';
+        
+        // Composite index recommendations
+        echo '<h3>Recommended Indexes</h3>';
+        
+        if (empty($analysis['recommendations'])) {
+            echo '<p>✅ No missing indexes detected for the captured workload.</p>';
+        } else {
+            echo '<table class="wp-list-table widefat fixed striped">';
+            echo '<thead><tr><th>Table</th><th>Index</th><th>Executions</th><th>Rows Examined (before → after)</th><th>Estimated Savings</th><th>Actions</th></tr></thead>';
+            echo '<tbody>';
+            
+            foreach ($analysis['recommendations'] as $recommendation) {
+                echo '<tr>';
+                echo '<td>' . esc_html($recommendation['table']) . '</td>';
+                echo '<td><code>' . esc_html($recommendation['index_name']) . ' (' . esc_html(implode(', ', $recommendation['columns'])) . ')</code>';
+                echo '<br><small>' . esc_html(implode(' | ', $recommendation['fingerprints'])) . '</small></td>';
+                echo '<td>' . number_format($recommendation['executions']) . '</td>';
+                echo '<td>' . number_format($recommendation['rows_examined_before']) . ' → ' . number_format($recommendation['rows_examined_after']) . '</td>';
+                echo '<td><strong>' . number_format($recommendation['estimated_savings']) . ' rows</strong></td>';
+                echo '<td>';
+                echo '<form method="post">';
+                wp_nonce_field('apply_index_recommendation');
+                echo '<input type="hidden" name="action" value="apply_index_recommendation">';
+                echo '<input type="hidden" name="table_name" value="' . esc_attr($recommendation['table']) . '">';
+                echo '<input type="hidden" name="index_name" value="' . esc_attr($recommendation['index_name']) . '">';
+                echo '<input type="hidden" name="index_columns" value="' . esc_attr(implode(',', $recommendation['columns'])) . '">';
+                echo '<input type="submit" class="button button-primary button-small" value="Apply">';
+                echo '</form>';
+                echo '</td>';
+                echo '</tr>';
+            }
+            
+            echo '</tbody>';
+            echo '</table>';
+        }
+        
+        // Redundant and unused indexes
+        echo '<h3>Redundant Indexes</h3>';
+        $this->render_index_advisor_drop_list($analysis['redundant_indexes'], 'covered_by');
+        
+        echo '<h3>Unused Indexes</h3>';
+        $this->render_index_advisor_drop_list($analysis['unused_indexes'], 'source');
+        
+        if (!empty($analysis['explain_errors'])) {
+            echo '<p class="description">' . count($analysis['explain_errors']) . ' captured queries could not be explained and were skipped.</p>';
+        }
+    }
+    
+    /**
+     * Render redundant/unused index list with drop links
+     */
+    private function render_index_advisor_drop_list($indexes, $reason_key) {
+        if (empty($indexes)) {
+            echo '<p>✅ None found.</p>';
+            return;
+        }
+        
+        echo '<table class="wp-list-table widefat fixed striped">';
+        echo '<thead><tr><th>Table</th><th>Index</th><th>Columns</th><th>Reason</th><th>Actions</th></tr></thead>';
+        echo '<tbody>';
+        
+        foreach ($indexes as $index) {
+            $reason = $reason_key === 'covered_by' ? 'Left prefix of ' . $index['covered_by'] : 'Not used by ' . ($index['source'] === 'workload' ? 'captured workload' : 'server statistics');
+            
+            echo '<tr>';
+            echo '<td>' . esc_html($index['table']) . '</td>';
+            echo '<td><strong>' . esc_html($index['index_name']) . '</strong></td>';
+            echo '<td>' . esc_html(implode(', ', $index['columns'])) . '</td>';
+            echo '<td>' . esc_html($reason) . '</td>';
+            echo '<td><a href="?page=klage-click-database&tab=schema&table=' . esc_attr($index['table']) . '&action=drop_index&index=' . esc_attr($index['index_name']) . '" class="button button-small button-link-delete" onclick="return confirm(\'Are you sure you want to drop this index?\')">Drop</a></td>';
+            echo '</tr>';
+        }
+        
+        echo '</tbody>';
+        echo '</table>';
+    }
+    
     /**
      * Render add index form
      */
@@ -902,6 +1189,18 @@ class CAH_Database_Admin {
         
         echo '</div>';
         
+        // Court directory import section
+        echo '<div class="csv-import">';
+        echo '<h3>Import Court Directory (PLZ → Amtsgericht)</h3>';
+        echo '<p class="description">CSV with semicolon separator: <code>plz_from;plz_to;court_name;court_address;court_egvp_id</code>. Replaces all existing postal code ranges.</p>';
+        echo '<form method="post" enctype="multipart/form-data">';
+        wp_nonce_field('import_court_ranges');
+        echo '<input type="hidden" name="action" value="import_court_ranges">';
+        echo '<input type="file" name="court_ranges_file" accept=".csv"> ';
+        echo '<button type="submit" class="button button-primary">Import Court Directory</button>';
+        echo '</form>';
+        echo '</div>';
+        
         // Data export section
         echo '<div class="data-export">';
         echo '<h3>Export Data</h3>';
@@ -1119,7 +1418,8 @@ class CAH_Database_Admin {
         
         check_ajax_referer('sync_schema', 'nonce');
         
-        $results = $this->schema_manager->synchronize_all_tables();
+        // dry_run=1 only returns the ALTER plan per table
+        $results = $this->schema_manager->synchronize_all_tables(!empty($_POST['dry_run']), true);
         
         wp_send_json_success($results);
     }
@@ -12,12 +12,37 @@ class CAH_Database {
     
     private $wpdb;
     
+    // Explicit maintenance run (table creation from the admin): index builds
+    // and ALTERs that can't run with LOCK=NONE are allowed
+    private $maintenance = false;
+    
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
         
         // Run upgrade check on admin init
         add_action('admin_init', array($this, 'check_and_upgrade_schema'));
+        add_action('admin_notices', array($this, 'duplicate_case_ids_notice'));
+    }
+    
+    /**
+     * Warn while duplicate case IDs block the UNIQUE key on klage_cases.case_id
+     */
+    public function duplicate_case_ids_notice() {
+        $duplicates = get_option('cah_case_id_duplicates');
+        
+        if (empty($duplicates) || !current_user_can('manage_options')) {
+            return;
+        }
+        
+        $list = array();
+        foreach (array_slice($duplicates, 0, 10, true) as $case_id => $count) {
+            $list[] = esc_html($case_id) . ' (' . intval($count) . 'x)';
+        }
+        
+        echo '<div class="notice notice-warning"><p><strong>Klage.Click:</strong> Doppelte Fall-IDs gefunden: ' . implode(', ', $list)
+            . (count($duplicates) > 10 ? ' …' : '')
+            . '. Bitte die Fall-IDs anpassen und danach die Tabellen erneut erstellen; erst dann wird die Fall-ID eindeutig.</p></div>';
     }
     
     /**
@@ -31,7 +56,7 @@ class CAH_Database {
         
         // Check if we need to upgrade
         $version_option = get_option('cah_database_version', '1.0.0');
-        $current_version = '1.3.3';
+        $current_version = '1.3.4';
         
         if (version_compare($version_option, $current_version, '<')) {
             $this->upgrade_existing_tables();
@@ -117,7 +142,7 @@ class CAH_Database {
     /**
      * Upgrade existing tables to fix schema issues
      */
-    private function upgrade_existing_tables() {
+    private function upgrade_existing_tables($include_cases = true) {
         $table_name = $this->wpdb->prefix . 'klage_debtors';
         
         // Check if table exists
@@ -145,138 +170,193 @@ class CAH_Database {
             $this->add_missing_columns_to_debtors_table($table_name);
         }
         
-        // Also upgrade cases table
-        $this->upgrade_cases_table();
+        // Also upgrade cases table (table creation sends it with the case_id fixes)
+        if ($include_cases) {
+            $this->upgrade_cases_table();
+        }
+        $this->upgrade_emails_table();
+    }
+    
+    /**
+     * Index the sender of case emails (evidence is linked by sender)
+     * Index builds only in maintenance runs
+     */
+    private function upgrade_emails_table() {
+        $table_name = $this->wpdb->prefix . 'klage_emails';
+        
+        if ($this->maintenance
+            && $this->wpdb->get_var("SHOW TABLES LIKE '$table_name'")
+            && !$this->wpdb->get_var("SHOW INDEX FROM $table_name WHERE Key_name = 'emails_sender_email'")) {
+            $this->alter_table('klage_emails', array('ADD INDEX emails_sender_email (emails_sender_email(191))'));
+        }
     }
     
     /**
      * Upgrade cases table to add missing columns
      */
     private function upgrade_cases_table() {
+        $this->alter_table('klage_cases', $this->get_cases_upgrade_clauses());
+    }
+    
+    /**
+     * ALTER clauses for missing columns (and, in maintenance runs, indexes) of the cases table
+     */
+    private function get_cases_upgrade_clauses() {
         $table_name = $this->wpdb->prefix . 'klage_cases';
         
         // Check if table exists
-        $table_exists = $this->wpdb->get_var("SHOW TABLES LIKE '$table_name'");
-        
-        if ($table_exists) {
-            $this->add_missing_columns_to_cases_table($table_name);
+        if (!$this->wpdb->get_var("SHOW TABLES LIKE '$table_name'")) {
+            return array();
         }
+        
+        return array_merge(
+            $this->get_missing_column_clauses($table_name, $this->get_required_cases_columns()),
+            $this->maintenance ? $this->get_missing_index_clauses($table_name) : array()
+        );
     }
     
     /**
-     * Add missing columns to existing cases table
+     * ADD INDEX clauses for indexes used by REST pagination and change detection
      */
-    private function add_missing_columns_to_cases_table($table_name) {
-        // Define columns that should exist in cases table
-        $required_columns = array(
-            'mandant' => "ALTER TABLE $table_name ADD COLUMN mandant varchar(100) DEFAULT NULL",
-            'brief_status' => "ALTER TABLE $table_name ADD COLUMN brief_status varchar(20) DEFAULT 'pending'",
-            'briefe' => "ALTER TABLE $table_name ADD COLUMN briefe int(3) DEFAULT 1",
-            'schuldner' => "ALTER TABLE $table_name ADD COLUMN schuldner varchar(200) DEFAULT NULL",
-            'beweise' => "ALTER TABLE $table_name ADD COLUMN beweise text DEFAULT NULL",
-            'dokumente' => "ALTER TABLE $table_name ADD COLUMN dokumente text DEFAULT NULL",
-            'links_zu_dokumenten' => "ALTER TABLE $table_name ADD COLUMN links_zu_dokumenten text DEFAULT NULL",
-            'verfahrensart' => "ALTER TABLE $table_name ADD COLUMN verfahrensart varchar(50) DEFAULT 'mahnverfahren'",
-            'rechtsgrundlage' => "ALTER TABLE $table_name ADD COLUMN rechtsgrundlage varchar(100) DEFAULT 'DSGVO Art. 82'",
-            'zeitraum_von' => "ALTER TABLE $table_name ADD COLUMN zeitraum_von date DEFAULT NULL",
-            'zeitraum_bis' => "ALTER TABLE $table_name ADD COLUMN zeitraum_bis date DEFAULT NULL",
-            'anzahl_verstoesse' => "ALTER TABLE $table_name ADD COLUMN anzahl_verstoesse int(5) DEFAULT 1",
-            'schadenhoehe' => "ALTER TABLE $table_name ADD COLUMN schadenhoehe decimal(10,2) DEFAULT 548.11",
-            'anwaltsschreiben_status' => "ALTER TABLE $table_name ADD COLUMN anwaltsschreiben_status varchar(20) DEFAULT 'pending'",
-            'mahnung_status' => "ALTER TABLE $table_name ADD COLUMN mahnung_status varchar(20) DEFAULT 'pending'",
-            'klage_status' => "ALTER TABLE $table_name ADD COLUMN klage_status varchar(20) DEFAULT 'pending'",
-            'vollstreckung_status' => "ALTER TABLE $table_name ADD COLUMN vollstreckung_status varchar(20) DEFAULT 'pending'",
-            'egvp_aktenzeichen' => "ALTER TABLE $table_name ADD COLUMN egvp_aktenzeichen varchar(50) DEFAULT NULL",
-            'xjustiz_uuid' => "ALTER TABLE $table_name ADD COLUMN xjustiz_uuid varchar(100) DEFAULT NULL",
-            'gericht_zustaendig' => "ALTER TABLE $table_name ADD COLUMN gericht_zustaendig varchar(100) DEFAULT NULL",
-            'verfahrenswert' => "ALTER TABLE $table_name ADD COLUMN verfahrenswert decimal(10,2) DEFAULT 548.11",
-            'deadline_antwort' => "ALTER TABLE $table_name ADD COLUMN deadline_antwort date DEFAULT NULL",
-            'deadline_zahlung' => "ALTER TABLE $table_name ADD COLUMN deadline_zahlung date DEFAULT NULL",
-            'mahnung_datum' => "ALTER TABLE $table_name ADD COLUMN mahnung_datum date DEFAULT NULL",
-            'klage_datum' => "ALTER TABLE $table_name ADD COLUMN klage_datum date DEFAULT NULL",
-            'erfolgsaussicht' => "ALTER TABLE $table_name ADD COLUMN erfolgsaussicht varchar(20) DEFAULT 'hoch'",
-            'risiko_bewertung' => "ALTER TABLE $table_name ADD COLUMN risiko_bewertung varchar(20) DEFAULT 'niedrig'",
-            'komplexitaet' => "ALTER TABLE $table_name ADD COLUMN komplexitaet varchar(20) DEFAULT 'standard'",
-            'kommunikation_sprache' => "ALTER TABLE $table_name ADD COLUMN kommunikation_sprache varchar(5) DEFAULT 'de'",
-            'bevorzugter_kontakt' => "ALTER TABLE $table_name ADD COLUMN bevorzugter_kontakt varchar(20) DEFAULT 'email'",
-            'kategorie' => "ALTER TABLE $table_name ADD COLUMN kategorie varchar(50) DEFAULT 'GDPR_SPAM'",
-            'prioritaet_intern' => "ALTER TABLE $table_name ADD COLUMN prioritaet_intern varchar(20) DEFAULT 'medium'",
-            'bearbeitungsstatus' => "ALTER TABLE $table_name ADD COLUMN bearbeitungsstatus varchar(20) DEFAULT 'neu'",
-            'import_source' => "ALTER TABLE $table_name ADD COLUMN import_source varchar(50) DEFAULT 'manual'"
+    private function get_missing_index_clauses($table_name) {
+        $required_indexes = array(
+            'creation_cursor' => 'ADD INDEX creation_cursor (case_creation_date, id)',
+            'case_updated_date' => 'ADD INDEX case_updated_date (case_updated_date)'
         );
         
-        // Get existing columns
-        $existing_columns = $this->wpdb->get_results("SHOW COLUMNS FROM $table_name");
-        $existing_column_names = array();
+        $existing_indexes = $this->wpdb->get_col("SHOW INDEX FROM $table_name", 2);
+        $clauses = array();
         
-        foreach ($existing_columns as $column) {
-            $existing_column_names[] = $column->Field;
-        }
-        
-        // Add missing columns
-        foreach ($required_columns as $column_name => $alter_sql) {
-            if (!in_array($column_name, $existing_column_names)) {
-                $this->wpdb->query($alter_sql);
+        foreach ($required_indexes as $index_name => $clause) {
+            if (!in_array($index_name, $existing_indexes)) {
+                $clauses[] = $clause;
             }
         }
+        
+        return $clauses;
+    }
+    
+    /**
+     * Columns that should exist in cases table (name => definition)
+     */
+    private function get_required_cases_columns() {
+        return array(
+            'mandant' => "varchar(100) DEFAULT NULL",
+            'brief_status' => "varchar(20) DEFAULT 'pending'",
+            'briefe' => "int(3) DEFAULT 1",
+            'schuldner' => "varchar(200) DEFAULT NULL",
+            'beweise' => "text DEFAULT NULL",
+            'dokumente' => "text DEFAULT NULL",
+            'links_zu_dokumenten' => "text DEFAULT NULL",
+            'verfahrensart' => "varchar(50) DEFAULT 'mahnverfahren'",
+            'rechtsgrundlage' => "varchar(100) DEFAULT 'DSGVO Art. 82'",
+            'zeitraum_von' => "date DEFAULT NULL",
+            'zeitraum_bis' => "date DEFAULT NULL",
+            'anzahl_verstoesse' => "int(5) DEFAULT 1",
+            'schadenhoehe' => "decimal(10,2) DEFAULT 548.11",
+            'anwaltsschreiben_status' => "varchar(20) DEFAULT 'pending'",
+            'mahnung_status' => "varchar(20) DEFAULT 'pending'",
+            'klage_status' => "varchar(20) DEFAULT 'pending'",
+            'vollstreckung_status' => "varchar(20) DEFAULT 'pending'",
+            'egvp_aktenzeichen' => "varchar(50) DEFAULT NULL",
+            'xjustiz_uuid' => "varchar(100) DEFAULT NULL",
+            'gericht_zustaendig' => "varchar(100) DEFAULT NULL",
+            'verfahrenswert' => "decimal(10,2) DEFAULT 548.11",
+            'deadline_antwort' => "date DEFAULT NULL",
+            'deadline_zahlung' => "date DEFAULT NULL",
+            'mahnung_datum' => "date DEFAULT NULL",
+            'klage_datum' => "date DEFAULT NULL",
+            'erfolgsaussicht' => "varchar(20) DEFAULT 'hoch'",
+            'risiko_bewertung' => "varchar(20) DEFAULT 'niedrig'",
+            'komplexitaet' => "varchar(20) DEFAULT 'standard'",
+            'kommunikation_sprache' => "varchar(5) DEFAULT 'de'",
+            'bevorzugter_kontakt' => "varchar(20) DEFAULT 'email'",
+            'kategorie' => "varchar(50) DEFAULT 'GDPR_SPAM'",
+            'prioritaet_intern' => "varchar(20) DEFAULT 'medium'",
+            'bearbeitungsstatus' => "varchar(20) DEFAULT 'neu'",
+            'import_source' => "varchar(50) DEFAULT 'manual'"
+        );
     }
     
     /**
      * Add missing columns to existing debtors table
      */
     private function add_missing_columns_to_debtors_table($table_name) {
-        // Define columns that should exist
+        // Define columns that should exist (name => definition)
         $required_columns = array(
-            'datenquelle' => "ALTER TABLE $table_name ADD COLUMN datenquelle varchar(50) DEFAULT 'manual'",
-            'letzte_aktualisierung' => "ALTER TABLE $table_name ADD COLUMN letzte_aktualisierung datetime DEFAULT NULL",
-            'website' => "ALTER TABLE $table_name ADD COLUMN website varchar(255)",
-            'social_media' => "ALTER TABLE $table_name ADD COLUMN social_media text",
-            'zahlungsverhalten' => "ALTER TABLE $table_name ADD COLUMN zahlungsverhalten varchar(20) DEFAULT 'unbekannt'",
-            'bonität' => "ALTER TABLE $table_name ADD COLUMN bonität varchar(20) DEFAULT 'unbekannt'",
-            'insolvenz_status' => "ALTER TABLE $table_name ADD COLUMN insolvenz_status varchar(20) DEFAULT 'nein'",
-            'pfändung_status' => "ALTER TABLE $table_name ADD COLUMN pfändung_status varchar(20) DEFAULT 'nein'",
-            'bevorzugte_sprache' => "ALTER TABLE $table_name ADD COLUMN bevorzugte_sprache varchar(5) DEFAULT 'de'",
-            'kommunikation_email' => "ALTER TABLE $table_name ADD COLUMN kommunikation_email tinyint(1) DEFAULT 1",
-            'kommunikation_post' => "ALTER TABLE $table_name ADD COLUMN kommunikation_post tinyint(1) DEFAULT 1",
-            'verifiziert' => "ALTER TABLE $table_name ADD COLUMN verifiziert tinyint(1) DEFAULT 0"
+            'datenquelle' => "varchar(50) DEFAULT 'manual'",
+            'letzte_aktualisierung' => "datetime DEFAULT NULL",
+            'website' => "varchar(255)",
+            'social_media' => "text",
+            'zahlungsverhalten' => "varchar(20) DEFAULT 'unbekannt'",
+            'bonität' => "varchar(20) DEFAULT 'unbekannt'",
+            'insolvenz_status' => "varchar(20) DEFAULT 'nein'",
+            'pfändung_status' => "varchar(20) DEFAULT 'nein'",
+            'bevorzugte_sprache' => "varchar(5) DEFAULT 'de'",
+            'kommunikation_email' => "tinyint(1) DEFAULT 1",
+            'kommunikation_post' => "tinyint(1) DEFAULT 1",
+            'verifiziert' => "tinyint(1) DEFAULT 0"
         );
         
-        // Get existing columns
-        $existing_columns = $this->wpdb->get_results("SHOW COLUMNS FROM $table_name");
-        $existing_column_names = array();
-        
-        foreach ($existing_columns as $column) {
-            $existing_column_names[] = $column->Field;
-        }
+        $this->alter_table('klage_debtors', $this->get_missing_column_clauses($table_name, $required_columns));
+    }
+    
+    /**
+     * ADD COLUMN clauses for required columns missing from a table
+     */
+    private function get_missing_column_clauses($table_name, $required_columns) {
+        $existing_column_names = $this->wpdb->get_col("SHOW COLUMNS FROM $table_name");
+        $clauses = array();
         
-        // Add missing columns
-        foreach ($required_columns as $column_name => $alter_sql) {
+        foreach ($required_columns as $column_name => $column_definition) {
             if (!in_array($column_name, $existing_column_names)) {
-                $this->wpdb->query($alter_sql);
+                $clauses[] = "ADD COLUMN $column_name $column_definition";
             }
         }
+        
+        return $clauses;
+    }
+    
+    /**
+     * Apply ALTER clauses as combined online DDL (see CAH_Schema_Manager::alter_table)
+     */
+    private function alter_table($table, $clauses) {
+        if (empty($clauses)) {
+            return;
+        }
+        
+        $schema_manager = new CAH_Schema_Manager();
+        $result = $schema_manager->alter_table($table, $clauses, false, $this->maintenance);
+        
+        if (!$result['success'] && get_option('klage_click_debug_mode')) {
+            error_log('Klage.Click schema upgrade failed for ' . $table . ': ' . $result['message']);
+        }
     }
     
     /**
      * Direct table creation method (bypasses dbDelta issues)
+     * $maintenance: explicit run from the admin, also builds missing indexes
      */
-    public function create_tables_direct() {
+    public function create_tables_direct($maintenance = false) {
         $results = array(
             'success' => true,
             'message' => '',
             'details' => array()
         );
         
+        $this->maintenance = $maintenance;
         $charset_collate = $this->wpdb->get_charset_collate();
         
-        // First, handle existing table updates
-        $this->upgrade_existing_tables();
+        // First, handle existing table updates (cases table below)
+        $this->upgrade_existing_tables(false);
         
         // Ensure debtors table has correct schema
         $this->ensure_debtors_table_schema();
         
-        // Fix missing columns in cases table
-        $this->fix_missing_columns();
+        // All changes to an existing cases table as one planned ALTER
+        $case_fixes = $this->fix_missing_columns();
+        $results['details'] = array_merge($results['details'], $case_fixes['details']);
+        $this->alter_table('klage_cases', array_unique(array_merge($case_fixes['clauses'], $this->get_cases_upgrade_clauses())));
         
         // Define all tables with simpler SQL
         $tables = array(
@@ -347,10 +427,12 @@ class CAH_Database {
                 
                 created_at datetime DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (id),
-                KEY case_id (case_id),
+                UNIQUE KEY case_id (case_id),
                 KEY case_status (case_status),
                 KEY debtor_id (debtor_id),
-                KEY submission_date (submission_date)
+                KEY submission_date (submission_date),
+                KEY creation_cursor (case_creation_date, id),
+                KEY case_updated_date (case_updated_date)
             ) $charset_collate",
             
             'klage_clients' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_clients (
@@ -373,7 +455,8 @@ class CAH_Database {
                 emails_subject varchar(200),
                 emails_content text,
                 created_at datetime DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (id)
+                PRIMARY KEY (id),
+                KEY emails_sender_email (emails_sender_email(191))
             ) $charset_collate",
             
             // Financial tables moved to separate plugin
@@ -388,6 +471,12 @@ class CAH_Database {
                 PRIMARY KEY (id)
             ) $charset_collate",
             
+            'klage_sequences' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_sequences (
+                sequence_name varchar(50) NOT NULL,
+                sequence_value bigint(20) unsigned NOT NULL DEFAULT 0,
+                PRIMARY KEY (sequence_name)
+            ) $charset_collate",
+            
             'klage_audit' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_audit (
                 id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
                 case_id bigint(20) unsigned NOT NULL,
@@ -395,7 +484,8 @@ class CAH_Database {
                 details text,
                 user_id bigint(20) unsigned NOT NULL,
                 created_at datetime DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (id)
+                PRIMARY KEY (id),
+                KEY case_created (case_id, created_at)
             ) $charset_collate",
             
             'klage_debtors' => "CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_debtors (
@@ -558,6 +648,26 @@ class CAH_Database {
             }
         }
         
+        // N8N outbox (defined by the connector, also created on first enqueue)
+        $n8n_connector = new CAH_N8N_Connector();
+        $n8n_connector->create_table();
+        
+        // PLZ ranges (defined by the court manager, also created on first import)
+        $court_manager = new CAH_Court_Manager();
+        $court_manager->create_postal_ranges_table();
+        
+        // Evidence import tables (defined by the importer, also created on first import)
+        $email_evidence = new CAH_Email_Evidence();
+        $email_evidence->create_tables();
+        
+        // Document batch tables (also created on first batch)
+        $document_generator = new CAH_Document_Generator();
+        $document_generator->create_tables();
+        
+        // Lock table of the parallel WP-CLI commands (also created on first run)
+        $parallel_runner = new CAH_Parallel_Runner();
+        $parallel_runner->create_tables();
+        
         // Insert default courts if courts table was created
         if ($created_count > 0) {
             $this->insert_default_courts();
@@ -646,7 +756,8 @@ class CAH_Database {
             emails_subject varchar(200),
             emails_content text,
             created_at datetime DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (id)
+            PRIMARY KEY (id),
+            KEY emails_sender_email (emails_sender_email(191))
         ) $charset_collate;";
         
         // Financial table removed in v1.4.7 - moved to separate plugin
@@ -743,12 +854,19 @@ class CAH_Database {
         return $status;
     }
     
+    /**
+     * Fix case_id column and constraints of an existing cases table
+     * Returns array('clauses' => ALTER clauses for the caller, 'details' => report messages)
+     */
     private function fix_missing_columns() {
         // Fix missing case_id column in klage_cases table
         $table_name = $this->wpdb->prefix . 'klage_cases';
+        $clauses = array();
+        $details = array();
         
-        // Check if case_id column exists
-        $columns = $this->wpdb->get_results("SHOW COLUMNS FROM $table_name LIKE 'case_id'");
+        if (!$this->wpdb->get_var("SHOW TABLES LIKE '$table_name'")) {
+            return array('clauses' => $clauses, 'details' => $details);
+        }
         
         // Check if case_id column exists and fix its constraints
         $columns = $this->wpdb->get_results("SHOW COLUMNS FROM $table_name LIKE 'case_id'");
@@ -764,26 +882,61 @@ class CAH_Database {
                 $this->wpdb->update($table_name, array('case_id' => $case_id), array('id' => $row->id));
             }
         } else {
-            // Remove UNIQUE constraint if it exists (case_id should be editable)
-            $this->wpdb->query("ALTER TABLE $table_name DROP INDEX case_id");
-            $this->wpdb->query("ALTER TABLE $table_name ADD INDEX case_id (case_id)");
+            // Unique case_id (the case ID allocator retries on collisions). Tables
+            // with duplicates from the old random IDs keep the plain index until
+            // the duplicates are renamed; they are reported, never renamed here.
+            // Index builds only in maintenance runs.
+            $case_id_index = $this->maintenance ? $this->wpdb->get_row("SHOW INDEX FROM $table_name WHERE Key_name = 'case_id'") : null;
+            
+            if (!$this->maintenance) {
+                $details[] = 'ℹ️ klage_cases: Indizes werden bei der nächsten Wartung geprüft (Tabellen erstellen oder wp cah sync-schema)';
+            } elseif (!$case_id_index || $case_id_index->Non_unique) {
+                $duplicates = $this->find_duplicate_case_ids($table_name);
+                
+                if (empty($duplicates)) {
+                    if ($case_id_index) {
+                        $clauses[] = 'DROP INDEX case_id';
+                    }
+                    $clauses[] = 'ADD UNIQUE KEY case_id (case_id)';
+                    delete_option('cah_case_id_duplicates');
+                } else {
+                    if (!$case_id_index) {
+                        $clauses[] = 'ADD INDEX case_id (case_id)';
+                    }
+                    update_option('cah_case_id_duplicates', $duplicates, false);
+                    $details[] = '⚠️ klage_cases: ' . count($duplicates) . ' doppelte Fall-IDs (' . implode(', ', array_slice(array_keys($duplicates), 0, 10)) . '), Fall-ID bleibt vorerst nicht eindeutig';
+                }
+            } else {
+                delete_option('cah_case_id_duplicates');
+            }
         }
         
         // Add other missing columns as needed
-        $this->add_missing_column($table_name, 'case_creation_date', 'datetime NOT NULL DEFAULT CURRENT_TIMESTAMP');
-        $this->add_missing_column($table_name, 'case_status', "enum('draft','pending','processing','completed','cancelled') DEFAULT 'draft'");
-        $this->add_missing_column($table_name, 'case_priority', "enum('low','medium','high','urgent') DEFAULT 'medium'");
-        $this->add_missing_column($table_name, 'processing_complexity', "enum('simple','standard','complex') DEFAULT 'standard'");
-        $this->add_missing_column($table_name, 'processing_risk_score', 'tinyint(3) unsigned DEFAULT 3');
-        $this->add_missing_column($table_name, 'document_type', "enum('mahnbescheid','klage') DEFAULT 'mahnbescheid'");
-        $this->add_missing_column($table_name, 'document_language', "varchar(2) DEFAULT 'de'");
-        $this->add_missing_column($table_name, 'total_amount', 'decimal(10,2) DEFAULT 0.00');
+        $clauses = array_merge($clauses, $this->get_missing_column_clauses($table_name, array(
+            'case_creation_date' => 'datetime NOT NULL DEFAULT CURRENT_TIMESTAMP',
+            'case_status' => "enum('draft','pending','processing','completed','cancelled') DEFAULT 'draft'",
+            'case_priority' => "enum('low','medium','high','urgent') DEFAULT 'medium'",
+            'processing_complexity' => "enum('simple','standard','complex') DEFAULT 'standard'",
+            'processing_risk_score' => 'tinyint(3) unsigned DEFAULT 3',
+            'document_type' => "enum('mahnbescheid','klage') DEFAULT 'mahnbescheid'",
+            'document_language' => "varchar(2) DEFAULT 'de'",
+            'total_amount' => 'decimal(10,2) DEFAULT 0.00'
+        )));
+        
+        return array('clauses' => $clauses, 'details' => $details);
     }
     
-    private function add_missing_column($table_name, $column_name, $column_definition) {
-        $columns = $this->wpdb->get_results("SHOW COLUMNS FROM $table_name LIKE '$column_name'");
-        if (empty($columns)) {
-            $this->wpdb->query("ALTER TABLE $table_name ADD COLUMN $column_name $column_definition");
+    /**
+     * Case IDs used by more than one case (case_id => number of cases)
+     */
+    private function find_duplicate_case_ids($table_name) {
+        $rows = $this->wpdb->get_results("SELECT case_id, COUNT(*) AS cases FROM $table_name GROUP BY case_id HAVING COUNT(*) > 1 ORDER BY case_id LIMIT 100");
+        $duplicates = array();
+        
+        foreach ($rows as $row) {
+            $duplicates[(string) $row->case_id] = intval($row->cases);
         }
+        
+        return $duplicates;
     }
 }
\ No newline at end of file
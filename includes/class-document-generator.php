@@ -0,0 +1,774 @@
+<?php
+/**
+ * Document Generator - Batched XJustiz/court document generation
+ * Selected cases become a batch of work items. Workers (non-blocking loopback
+ * requests to admin-ajax.php, WP-Cron as fallback) claim chunks of cases,
+ * render every case with templates compiled once per request and write the
+ * documents into one ZIP part per chunk. Finished items are never redone,
+ * so a batch can be resumed after crashes. The download streams a single ZIP
+ * assembled from the parts without recompressing.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Document_Generator {
+
+    private $wpdb;
+    private $court_manager;
+    private $legal_framework;
+
+    // Compiled templates of this request (template id => segments)
+    private static $compiled = array();
+
+    private static $hooks_registered = false;
+    private static $tables_checked = false;
+
+    const WORKER_ACTION = 'cah_document_worker';
+    const CACHE_GROUP = 'cah_documents';
+    const CHUNK_SIZE = 25;
+    const DEFAULT_WORKERS = 4;
+
+    // Seconds a worker request runs before handing over to a fresh request
+    const TIME_LIMIT = 20;
+
+    // Chunks claimed by a worker that died are released after this many seconds
+    const LOCK_TIMEOUT = 300;
+
+    // Keeps the download below the ZIP entry limit (two documents per case)
+    const MAX_CASES = 20000;
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+
+        if (self::$hooks_registered) {
+            return;
+        }
+        self::$hooks_registered = true;
+
+        // Loopback workers run without the user's cookies, the batch token authorizes them
+        add_action('wp_ajax_' . self::WORKER_ACTION, array($this, 'handle_worker_request'));
+        add_action('wp_ajax_nopriv_' . self::WORKER_ACTION, array($this, 'handle_worker_request'));
+        add_action(self::WORKER_ACTION, array($this, 'run_worker'));
+    }
+
+    /**
+     * Document templates (id => file, filename in the case folder, format)
+     */
+    public function get_templates() {
+        return apply_filters('cah_document_templates', array(
+            'xjustiz' => array(
+                'file' => CAH_PLUGIN_PATH . 'templates/documents/xjustiz.xml',
+                'filename' => 'xjustiz.xml',
+                'format' => 'xml'
+            ),
+            'anschreiben' => array(
+                'file' => CAH_PLUGIN_PATH . 'templates/documents/anschreiben.html',
+                'filename' => 'anschreiben.html',
+                'format' => 'html'
+            )
+        ));
+    }
+
+    /**
+     * Create a batch for the given case ids, returns the batch id or WP_Error
+     */
+    public function create_batch($case_ids) {
+        $this->ensure_tables();
+
+        $case_ids = array_values(array_unique(array_filter(array_map('intval', (array) $case_ids))));
+
+        if (empty($case_ids)) {
+            return new WP_Error('documents_no_cases', 'Keine Fälle ausgewählt');
+        }
+
+        if (count($case_ids) > self::MAX_CASES) {
+            return new WP_Error('documents_too_many_cases', 'Maximal ' . self::MAX_CASES . ' Fälle pro Stapel');
+        }
+
+        $this->wpdb->insert(
+            $this->wpdb->prefix . 'klage_document_batches',
+            array(
+                'status' => 'running',
+                'token' => wp_generate_password(32, false),
+                'total' => count($case_ids),
+                'created_by' => get_current_user_id(),
+                'created_at' => current_time('mysql')
+            ),
+            array('%s', '%s', '%d', '%d', '%s')
+        );
+        $batch_id = intval($this->wpdb->insert_id);
+
+        if (!$batch_id) {
+            return new WP_Error('documents_batch_failed', 'Stapel konnte nicht angelegt werden: ' . $this->wpdb->last_error);
+        }
+
+        foreach (array_chunk($case_ids, 1000) as $chunk) {
+            $values = array();
+            foreach ($chunk as $case_id) {
+                $values[] = $this->wpdb->prepare('(%d, %d)', $batch_id, $case_id);
+            }
+            $this->wpdb->query("INSERT INTO {$this->wpdb->prefix}klage_document_items (batch_id, case_id) VALUES " . implode(', ', $values));
+        }
+
+        return $batch_id;
+    }
+
+    /**
+     * Start worker requests for a running batch (count defaults to option cah_document_workers)
+     */
+    public function spawn_workers($batch_id, $count = null) {
+        $batch = $this->get_batch($batch_id);
+        if (!$batch || $batch->status !== 'running') {
+            return 0;
+        }
+
+        $count = $count ?: max(1, intval(get_option('cah_document_workers', self::DEFAULT_WORKERS)));
+
+        for ($worker = 0; $worker < $count; $worker++) {
+            wp_remote_post(admin_url('admin-ajax.php'), array(
+                'blocking' => false,
+                'timeout' => 0.01,
+                'sslverify' => apply_filters('https_local_ssl_verify', false),
+                'body' => array(
+                    'action' => self::WORKER_ACTION,
+                    'batch_id' => $batch->id,
+                    'token' => $batch->token
+                )
+            ));
+        }
+
+        $this->schedule_fallback($batch->id, MINUTE_IN_SECONDS);
+
+        return $count;
+    }
+
+    /**
+     * WP-Cron worker for sites that block loopback requests (and for dead workers)
+     */
+    private function schedule_fallback($batch_id, $delay) {
+        $args = array(intval($batch_id));
+
+        if (!wp_next_scheduled(self::WORKER_ACTION, $args)) {
+            wp_schedule_single_event(time() + $delay, self::WORKER_ACTION, $args);
+        }
+    }
+
+    /**
+     * admin-ajax.php entry point of loopback workers
+     */
+    public function handle_worker_request() {
+        $batch = $this->get_batch(intval($_POST['batch_id'] ?? 0));
+
+        if (!$batch || !hash_equals($batch->token, (string) ($_POST['token'] ?? ''))) {
+            wp_die('', '', array('response' => 403));
+        }
+
+        // The spawning request does not wait for the response
+        ignore_user_abort(true);
+
+        $this->run_worker($batch->id);
+
+        wp_die();
+    }
+
+    /**
+     * Process chunks of a batch until TIME_LIMIT, returns the number of processed cases
+     */
+    public function run_worker($batch_id) {
+        $this->ensure_tables();
+
+        $batch_id = intval($batch_id);
+        $batch = $this->get_batch($batch_id);
+
+        if (!$batch || $batch->status !== 'running') {
+            return 0;
+        }
+
+        $started = microtime(true);
+        $worker = wp_generate_uuid4();
+        $processed = 0;
+
+        $this->release_stale_items($batch_id);
+
+        // The first worker sets the start of the throughput measurement
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_batches SET started_ts = %f WHERE id = %d AND started_ts IS NULL",
+            $started,
+            $batch_id
+        ));
+
+        while (microtime(true) - $started < self::TIME_LIMIT) {
+            $items = $this->claim_items($batch_id, $worker);
+            if (empty($items)) {
+                break;
+            }
+
+            $this->process_items($batch_id, $worker, $items);
+            $processed += count($items);
+        }
+
+        $open = $this->count_open_items($batch_id);
+
+        if ($open['pending'] > 0 && microtime(true) - $started >= self::TIME_LIMIT) {
+            // Time is up: continue in a fresh request
+            $this->spawn_workers($batch_id, 1);
+        } elseif ($open['pending'] + $open['processing'] === 0) {
+            $this->complete_batch($batch_id);
+        } else {
+            // Other workers hold the remaining chunks; cron picks them up if they die
+            $this->schedule_fallback($batch_id, self::LOCK_TIMEOUT + MINUTE_IN_SECONDS);
+        }
+
+        return $processed;
+    }
+
+    /**
+     * Claim the next chunk of pending items for this worker
+     */
+    private function claim_items($batch_id, $worker) {
+        $table_name = $this->wpdb->prefix . 'klage_document_items';
+
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE $table_name SET status = 'processing', worker = %s, locked_at = %s
+             WHERE batch_id = %d AND status = 'pending'
+             ORDER BY id
+             LIMIT %d",
+            $worker,
+            current_time('mysql'),
+            $batch_id,
+            self::CHUNK_SIZE
+        ));
+
+        return $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT id, case_id FROM $table_name WHERE batch_id = %d AND worker = %s AND status = 'processing' ORDER BY id",
+            $batch_id,
+            $worker
+        ));
+    }
+
+    /**
+     * Render the documents of claimed items into one ZIP part
+     */
+    private function process_items($batch_id, $worker, $items) {
+        $templates = $this->get_compiled_templates();
+        $results = array();
+        $documents = 0;
+
+        if (is_wp_error($templates)) {
+            foreach ($items as $item) {
+                $results[$item->id] = array('status' => 'failed', 'part' => '', 'entries' => '', 'error' => $templates->get_error_message());
+            }
+            $this->save_results($batch_id, $worker, $results, 0);
+            return;
+        }
+
+        $cases = $this->load_cases(wp_list_pluck($items, 'case_id'));
+        $courts = $this->court_manager()->resolve_courts(array_filter(wp_list_pluck($cases, 'debtors_postal_code')));
+
+        $part = 'part-' . $items[0]->id . '-' . $worker . '.zip';
+        $handle = $this->open_part_file($batch_id, $part);
+
+        if (!$handle) {
+            // Storage not writable: items go back to the queue
+            $this->release_items($batch_id, $worker);
+            return;
+        }
+
+        $zip = new CAH_Zip_Stream_Writer($handle);
+        $shared_values = array(
+            'datum' => date_i18n('d.m.Y'),
+            'erstellungszeitpunkt' => current_time('Y-m-d\TH:i:s')
+        );
+
+        foreach ($items as $item) {
+            if (!isset($cases[$item->case_id])) {
+                $results[$item->id] = array('status' => 'failed', 'part' => '', 'entries' => '', 'error' => 'Fall nicht gefunden');
+                continue;
+            }
+
+            $case = $cases[$item->case_id];
+            $values = $this->get_document_values($case, $courts) + $shared_values;
+            $folder = sanitize_file_name($case->case_id ?: 'fall-' . $case->id);
+
+            $entries = array();
+            foreach ($templates as $template) {
+                $entries[] = $zip->add_file($folder . '/' . $template['filename'], $this->render($template, $values));
+            }
+            $documents += count($entries);
+
+            $results[$item->id] = array('status' => 'done', 'part' => $part, 'entries' => wp_json_encode($entries), 'error' => '');
+        }
+
+        $zip->finish();
+        fclose($handle);
+
+        $this->save_results($batch_id, $worker, $results, $documents);
+    }
+
+    /**
+     * Store item results and update the batch counters
+     */
+    private function save_results($batch_id, $worker, $results, $documents) {
+        $done = 0;
+        $failed = 0;
+
+        foreach ($results as $item_id => $result) {
+            // The worker check skips items released to another worker in the meantime
+            $updated = $this->wpdb->query($this->wpdb->prepare(
+                "UPDATE {$this->wpdb->prefix}klage_document_items
+                 SET status = %s, part = %s, entries = %s, error = %s, locked_at = NULL
+                 WHERE id = %d AND worker = %s",
+                $result['status'],
+                $result['part'],
+                $result['entries'],
+                $result['error'],
+                $item_id,
+                $worker
+            ));
+
+            if ($updated) {
+                $result['status'] === 'done' ? $done++ : $failed++;
+            }
+        }
+
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_batches
+             SET done = done + %d, failed = failed + %d, documents = documents + %d, progress_ts = %f
+             WHERE id = %d",
+            $done,
+            $failed,
+            $documents,
+            microtime(true),
+            $batch_id
+        ));
+    }
+
+    /**
+     * Cases with debtor data for one chunk (one query), id => row
+     */
+    private function load_cases($case_ids) {
+        if (empty($case_ids)) {
+            return array();
+        }
+
+        $prefix = $this->wpdb->prefix;
+        $ids = implode(', ', array_map('intval', $case_ids));
+
+        $cases = $this->wpdb->get_results("
+            SELECT c.id, c.case_id, c.mandant, c.egvp_aktenzeichen, c.xjustiz_uuid, c.gericht_zustaendig,
+                   c.verfahrensart, c.kategorie, c.rechtsgrundlage, c.total_amount, c.verfahrenswert,
+                   c.schadenhoehe, c.beweise,
+                   d.debtors_name, d.debtors_company, d.debtors_address, d.debtors_postal_code,
+                   d.debtors_city, d.debtors_country, d.debtors_email
+            FROM {$prefix}klage_cases c
+            LEFT JOIN {$prefix}klage_debtors d ON d.id = c.debtor_id
+            WHERE c.id IN ($ids)
+        ", OBJECT_K);
+
+        $this->assign_xjustiz_uuids($cases);
+
+        return $cases;
+    }
+
+    /**
+     * Give cases without XJustiz UUID a permanent one (one UPDATE per chunk)
+     */
+    private function assign_xjustiz_uuids($cases) {
+        $cases_sql = array();
+        $ids = array();
+
+        foreach ($cases as $case) {
+            if (empty($case->xjustiz_uuid)) {
+                $case->xjustiz_uuid = wp_generate_uuid4();
+                $cases_sql[] = $this->wpdb->prepare('WHEN %d THEN %s', $case->id, $case->xjustiz_uuid);
+                $ids[intval($case->id)] = $case->case_id;
+            }
+        }
+
+        if (empty($ids)) {
+            return;
+        }
+
+        $this->wpdb->query("
+            UPDATE {$this->wpdb->prefix}klage_cases
+            SET xjustiz_uuid = CASE id " . implode(' ', $cases_sql) . " END
+            WHERE id IN (" . implode(', ', array_keys($ids)) . ") AND (xjustiz_uuid IS NULL OR xjustiz_uuid = '')
+        ");
+
+        foreach ($ids as $id => $case_id) {
+            CAH_Case_Repository::invalidate_case($id, $case_id);
+        }
+    }
+
+    /**
+     * Template values of one case (filter cah_document_values)
+     */
+    private function get_document_values($case, $courts) {
+        $legal_basis = $this->legal_framework()->get_gdpr_legal_basis($case);
+        $court = $courts[(string) $case->debtors_postal_code] ?? null;
+
+        // Court address only if the resolved court is the one on file
+        if ($court && $case->gericht_zustaendig && $case->gericht_zustaendig !== $court->court_name) {
+            $court = null;
+        }
+
+        $amount = floatval($case->verfahrenswert ?: $case->total_amount);
+
+        return apply_filters('cah_document_values', array(
+            'fall_id' => $case->case_id,
+            'xjustiz_uuid' => $case->xjustiz_uuid,
+            'nachrichten_id' => wp_generate_uuid4(),
+            'aktenzeichen' => $case->egvp_aktenzeichen ?: $case->case_id,
+            'gericht' => $case->gericht_zustaendig ?: ($court ? $court->court_name : ''),
+            'gericht_anschrift' => $court ? $court->court_address : '',
+            'gericht_egvp_id' => $court ? $court->court_egvp_id : '',
+            'mandant' => $case->mandant,
+            'kategorie' => $case->kategorie,
+            'verfahrensart' => $case->verfahrensart,
+            'streitwert' => number_format($amount, 2, '.', ''),
+            'streitwert_de' => number_format($amount, 2, ',', '.'),
+            'schadenhoehe_de' => number_format(floatval($case->schadenhoehe), 2, ',', '.'),
+            'schuldner_name' => $case->debtors_name,
+            'schuldner_firma' => $case->debtors_company,
+            'schuldner_strasse' => $case->debtors_address,
+            'schuldner_plz' => $case->debtors_postal_code,
+            'schuldner_ort' => $case->debtors_city,
+            'schuldner_land' => $case->debtors_country,
+            'schuldner_email' => $case->debtors_email,
+            'rechtsgrundlage' => $case->rechtsgrundlage ?: $legal_basis['primary']['article'],
+            'rechtsgrundlage_sekundaer' => $legal_basis['secondary']['article'],
+            'beweise' => $case->beweise
+        ), $case);
+    }
+
+    /**
+     * Templates split into literal/placeholder segments (request memo -> object cache -> file)
+     * Returns id => template with 'segments', or WP_Error for unreadable files
+     */
+    private function get_compiled_templates() {
+        $compiled_templates = array();
+
+        foreach ($this->get_templates() as $template_id => $template) {
+            $cache_key = 'template_' . md5($template['file'] . '|' . @filemtime($template['file']));
+
+            if (!isset(self::$compiled[$cache_key])) {
+                $segments = wp_cache_get($cache_key, self::CACHE_GROUP);
+
+                if ($segments === false) {
+                    $source = @file_get_contents($template['file']);
+                    if ($source === false) {
+                        return new WP_Error('documents_template_missing', 'Vorlage nicht lesbar: ' . $template['file']);
+                    }
+
+                    // Odd segments are placeholder names
+                    $segments = preg_split('/\{\{\s*([a-z0-9_]+)\s*\}\}/', $source, -1, PREG_SPLIT_DELIM_CAPTURE);
+                    wp_cache_set($cache_key, $segments, self::CACHE_GROUP, DAY_IN_SECONDS);
+                }
+
+                self::$compiled[$cache_key] = $segments;
+            }
+
+            $compiled_templates[$template_id] = $template + array('segments' => self::$compiled[$cache_key]);
+        }
+
+        return $compiled_templates;
+    }
+
+    private function render($template, $values) {
+        $flags = $template['format'] === 'xml' ? ENT_QUOTES | ENT_XML1 : ENT_QUOTES | ENT_HTML5;
+        $output = '';
+
+        foreach ($template['segments'] as $index => $segment) {
+            $output .= $index % 2 ? htmlspecialchars((string) ($values[$segment] ?? ''), $flags, 'UTF-8') : $segment;
+        }
+
+        return $output;
+    }
+
+    /**
+     * Stream the documents of a batch as one ZIP (parts are copied, not recompressed)
+     */
+    public function stream_archive($batch_id) {
+        $batch = $this->get_batch($batch_id);
+        if (!$batch) {
+            return new WP_Error('documents_batch_missing', 'Stapel nicht gefunden');
+        }
+
+        $directory = $this->get_batch_dir($batch->id);
+        $items_table = $this->wpdb->prefix . 'klage_document_items';
+
+        // Clean any output buffer
+        while (ob_get_level()) {
+            ob_end_clean();
+        }
+
+        header('Content-Type: application/zip');
+        header('Content-Disposition: attachment; filename="dokumente-stapel-' . $batch->id . '.zip"');
+        header('Pragma: no-cache');
+        header('Expires: 0');
+
+        $output = fopen('php://output', 'wb');
+        $zip = new CAH_Zip_Stream_Writer($output);
+
+        $last_id = 0;
+        $part_name = null;
+        $part = null;
+        $missing = array();
+
+        do {
+            $items = $this->wpdb->get_results($this->wpdb->prepare(
+                "SELECT id, part, entries FROM $items_table WHERE batch_id = %d AND status = 'done' AND id > %d ORDER BY id LIMIT 500",
+                $batch->id,
+                $last_id
+            ));
+
+            foreach ($items as $item) {
+                $last_id = $item->id;
+
+                if ($item->part !== $part_name) {
+                    if ($part) {
+                        fclose($part);
+                    }
+                    $part_name = $item->part;
+                    $part = @fopen($directory . '/' . $part_name, 'rb');
+                }
+
+                foreach (json_decode($item->entries, true) ?: array() as $entry) {
+                    if (!$part || !$zip->add_raw_entry($entry, $part)) {
+                        $missing[] = $entry['name'];
+                    }
+                }
+            }
+        } while (count($items) === 500);
+
+        if ($part) {
+            fclose($part);
+        }
+
+        // Failed cases are listed in the archive
+        $failed = $this->wpdb->get_results($this->wpdb->prepare("
+            SELECT c.case_id, i.case_id AS id, i.error
+            FROM $items_table i
+            LEFT JOIN {$this->wpdb->prefix}klage_cases c ON c.id = i.case_id
+            WHERE i.batch_id = %d AND i.status = 'failed'
+        ", $batch->id));
+
+        if ($failed || $missing) {
+            $report = "Fall-ID;ID;Fehler\n";
+            foreach ($failed as $row) {
+                $report .= $row->case_id . ';' . $row->id . ';' . $row->error . "\n";
+            }
+            // Documents whose part file is missing or truncated
+            foreach ($missing as $name) {
+                $report .= ';;Dokument fehlt im Teilarchiv: ' . $name . "\n";
+            }
+            $zip->add_file('fehler.csv', $report);
+        }
+
+        $zip->finish();
+        fclose($output);
+
+        return true;
+    }
+
+    /**
+     * Batch with progress and throughput (documents_per_second), null if unknown
+     */
+    public function get_batch($batch_id) {
+        $this->ensure_tables();
+
+        $batch = $this->wpdb->get_row($this->wpdb->prepare(
+            "SELECT * FROM {$this->wpdb->prefix}klage_document_batches WHERE id = %d",
+            $batch_id
+        ));
+
+        if (!$batch) {
+            return null;
+        }
+
+        $elapsed = $batch->started_ts && $batch->progress_ts ? floatval($batch->progress_ts) - floatval($batch->started_ts) : 0;
+        $batch->elapsed_seconds = round($elapsed, 1);
+        $batch->documents_per_second = $elapsed > 0 ? round($batch->documents / $elapsed, 1) : 0;
+
+        return $batch;
+    }
+
+    /**
+     * Continue a batch: failed items are retried, workers restarted
+     */
+    public function resume_batch($batch_id) {
+        $batch_id = intval($batch_id);
+
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_items SET status = 'pending', worker = NULL, error = '' WHERE batch_id = %d AND status = 'failed'",
+            $batch_id
+        ));
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_batches SET status = 'running', failed = 0, finished_at = NULL WHERE id = %d",
+            $batch_id
+        ));
+
+        $this->release_stale_items($batch_id);
+
+        return $this->spawn_workers($batch_id);
+    }
+
+    /**
+     * Delete batch, items and generated files
+     */
+    public function delete_batch($batch_id) {
+        $batch_id = intval($batch_id);
+        $directory = $this->get_batch_dir($batch_id);
+
+        foreach (glob($directory . '/*.zip') ?: array() as $file) {
+            @unlink($file);
+        }
+        @rmdir($directory);
+
+        $this->wpdb->delete($this->wpdb->prefix . 'klage_document_items', array('batch_id' => $batch_id), array('%d'));
+        $this->wpdb->delete($this->wpdb->prefix . 'klage_document_batches', array('id' => $batch_id), array('%d'));
+
+        wp_clear_scheduled_hook(self::WORKER_ACTION, array($batch_id));
+    }
+
+    private function count_open_items($batch_id) {
+        $counts = $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT status, COUNT(*) AS total FROM {$this->wpdb->prefix}klage_document_items
+             WHERE batch_id = %d AND status IN ('pending', 'processing') GROUP BY status",
+            $batch_id
+        ), OBJECT_K);
+
+        return array(
+            'pending' => isset($counts['pending']) ? intval($counts['pending']->total) : 0,
+            'processing' => isset($counts['processing']) ? intval($counts['processing']->total) : 0
+        );
+    }
+
+    private function complete_batch($batch_id) {
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_batches SET status = 'completed', finished_at = %s WHERE id = %d AND status = 'running'",
+            current_time('mysql'),
+            $batch_id
+        ));
+
+        wp_clear_scheduled_hook(self::WORKER_ACTION, array(intval($batch_id)));
+    }
+
+    /**
+     * Put chunks of workers that stopped responding back into the queue
+     */
+    private function release_stale_items($batch_id) {
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_items SET status = 'pending', worker = NULL, locked_at = NULL
+             WHERE batch_id = %d AND status = 'processing' AND locked_at < %s",
+            $batch_id,
+            date('Y-m-d H:i:s', strtotime(current_time('mysql')) - self::LOCK_TIMEOUT)
+        ));
+    }
+
+    private function release_items($batch_id, $worker) {
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->wpdb->prefix}klage_document_items SET status = 'pending', worker = NULL, locked_at = NULL
+             WHERE batch_id = %d AND worker = %s AND status = 'processing'",
+            $batch_id,
+            $worker
+        ));
+    }
+
+    /**
+     * Open a new ZIP part in the batch directory (false if not writable)
+     */
+    private function open_part_file($batch_id, $part) {
+        $root = self::get_storage_dir();
+        $directory = $this->get_batch_dir($batch_id);
+
+        if (!wp_mkdir_p($directory)) {
+            return false;
+        }
+
+        // Generated documents contain personal data
+        if (!file_exists($root . '/.htaccess')) {
+            file_put_contents($root . '/.htaccess', "Require all denied\nDeny from all\n");
+            file_put_contents($root . '/index.php', "<?php\n// Silence is golden.\n");
+        }
+
+        return @fopen($directory . '/' . $part, 'wb');
+    }
+
+    private function get_batch_dir($batch_id) {
+        return self::get_storage_dir() . '/batch-' . intval($batch_id);
+    }
+
+    public static function get_storage_dir() {
+        $upload_dir = wp_upload_dir(null, false);
+        return trailingslashit($upload_dir['basedir']) . 'cah-documents';
+    }
+
+    private function court_manager() {
+        if (!$this->court_manager) {
+            $this->court_manager = new CAH_Court_Manager();
+        }
+        return $this->court_manager;
+    }
+
+    private function legal_framework() {
+        if (!$this->legal_framework) {
+            $this->legal_framework = new CAH_Legal_Framework();
+        }
+        return $this->legal_framework;
+    }
+
+    /**
+     * Create batch tables on installs that predate the generator
+     */
+    private function ensure_tables() {
+        if (!self::$tables_checked) {
+            if (!$this->wpdb->get_var("SHOW TABLES LIKE '{$this->wpdb->prefix}klage_document_items'")) {
+                $this->create_tables();
+            }
+            self::$tables_checked = true;
+        }
+    }
+
+    /**
+     * Create batch tables
+     */
+    public function create_tables() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+        $prefix = $this->wpdb->prefix;
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_document_batches (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            status varchar(20) NOT NULL DEFAULT 'running',
+            token varchar(64) NOT NULL,
+            total int(10) unsigned NOT NULL DEFAULT 0,
+            done int(10) unsigned NOT NULL DEFAULT 0,
+            failed int(10) unsigned NOT NULL DEFAULT 0,
+            documents int(10) unsigned NOT NULL DEFAULT 0,
+            created_by bigint(20) unsigned NOT NULL DEFAULT 0,
+            created_at datetime NOT NULL,
+            started_ts double DEFAULT NULL,
+            progress_ts double DEFAULT NULL,
+            finished_at datetime DEFAULT NULL,
+            PRIMARY KEY (id)
+        ) $charset_collate");
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_document_items (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            batch_id bigint(20) unsigned NOT NULL,
+            case_id bigint(20) unsigned NOT NULL,
+            status varchar(20) NOT NULL DEFAULT 'pending',
+            worker char(36) DEFAULT NULL,
+            locked_at datetime DEFAULT NULL,
+            part varchar(100) NOT NULL DEFAULT '',
+            entries text,
+            error varchar(255) NOT NULL DEFAULT '',
+            PRIMARY KEY (id),
+            KEY batch_status (batch_id, status),
+            KEY worker (worker)
+        ) $charset_collate");
+    }
+}
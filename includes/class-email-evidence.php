@@ -1,6 +1,10 @@
 <?php
 /**
- * Email Evidence class - Simplified version
+ * Email Evidence class - Spam evidence from mbox/EML archives
+ * Archives are parsed as a stream (CAH_Mail_Stream_Parser). Bodies and
+ * attachments are stored once per SHA-256 content hash: small payloads in
+ * klage_evidence_blobs, large ones as files outside the database. Messages
+ * are inserted and linked to cases by sender email in batches.
  */
 
 if (!defined('ABSPATH')) {
@@ -8,14 +12,46 @@ if (!defined('ABSPATH')) {
 }
 
 class CAH_Email_Evidence {
-    
+
     private $wpdb;
-    
+
+    // Blob ids by content hash (known in this import, bounded)
+    private $blob_ids = array();
+
+    // Parsed messages waiting for the next batch insert (message hash => row)
+    private $pending = array();
+
+    // Counters of the running import
+    private $stats = array();
+
+    // Whether the evidence tables are known to exist in this request
+    private static $tables_checked = false;
+
+    private static $hooks_registered = false;
+
+    // Payloads above this size are stored as files
+    const INLINE_LIMIT = 65536;
+    const BATCH_SIZE = 200;
+    const MAX_KNOWN_BLOBS = 10000;
+
+    // Layout of the evidence tables (1.1: charset of text payloads)
+    const TABLE_VERSION = '1.1';
+
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
+
+        if (self::$hooks_registered) {
+            return;
+        }
+        self::$hooks_registered = true;
+
+        // Cases are created after the evidence was imported
+        // (debtor email changes call relink_cases() directly)
+        add_action('cah_case_created', array($this, 'relink_cases'));
+        add_action('cah_cases_imported', array($this, 'relink_cases'));
     }
-    
+
     /**
      * Process email evidence
      */
@@ -29,4 +65,568 @@ class CAH_Email_Evidence {
             'gdpr_violation' => true
         );
     }
-}
\ No newline at end of file
+
+    /**
+     * Import a mbox, EML or ZIP file
+     * Returns import statistics or WP_Error
+     */
+    public function ingest_file($path, $name = '') {
+        $this->ensure_tables();
+
+        $this->stats = array(
+            'messages' => 0,
+            'imported' => 0,
+            'duplicates' => 0,
+            'payloads_stored' => 0,
+            'payloads_reused' => 0,
+            'bytes_on_disk' => 0,
+            'linked' => 0,
+            'errors' => array()
+        );
+
+        $parser = new CAH_Mail_Stream_Parser();
+        $result = $parser->parse_file($path, array($this, 'ingest_message'), $name);
+
+        $this->flush_pending();
+        $this->blob_ids = array();
+
+        if (is_wp_error($result)) {
+            return $result;
+        }
+
+        return $this->stats;
+    }
+
+    /**
+     * Store payloads of one parsed message and queue the message row (parser callback)
+     */
+    public function ingest_message($message) {
+        $this->stats['messages']++;
+
+        $headers = $message['headers'];
+        $body = null;
+        $attachments = array();
+
+        // Body: first inline text/plain part, else first inline text part;
+        // the HTML alternative of a plain text body is not stored
+        foreach ($message['parts'] as $part) {
+            $is_plain = $part['content_type'] === 'text/plain';
+            
+            if ($part['attachment'] || strpos($part['content_type'], 'text/') !== 0) {
+                $attachments[] = $part;
+            } elseif (!$body || ($is_plain && $body['content_type'] === 'text/html')) {
+                $body = $part;
+            } elseif ($is_plain || $body['content_type'] !== 'text/plain' || $part['content_type'] !== 'text/html') {
+                $attachments[] = $part;
+            }
+        }
+
+        $body_blob_id = $body ? $this->store_blob($body) : 0;
+
+        $attachment_rows = array();
+        $attachment_hashes = array();
+        foreach ($attachments as $part) {
+            $blob_id = $this->store_blob($part);
+            if ($blob_id) {
+                $attachment_rows[] = array($blob_id, $part['filename'], $part['content_type']);
+                $attachment_hashes[] = $part['sha256'];
+            }
+        }
+        sort($attachment_hashes);
+
+        $message_id = trim($headers['message-id'] ?? '', " <>");
+        $sender_email = $this->extract_email($headers['from'] ?? '');
+        $subject = CAH_Mail_Stream_Parser::decode_header($headers['subject'] ?? '');
+        $timestamp = isset($headers['date']) ? strtotime($headers['date']) : false;
+
+        // Same message in another archive (or mbox vs. EML export) -> same hash
+        $message_hash = hash('sha256', implode("\n", array(
+            $message_id,
+            $sender_email,
+            $timestamp ?: '',
+            $subject,
+            $body ? $body['sha256'] : '',
+            implode(',', $attachment_hashes)
+        )));
+
+        if (isset($this->pending[$message_hash])) {
+            $this->stats['duplicates']++;
+            return;
+        }
+
+        $this->pending[$message_hash] = array(
+            'message_id' => substr($message_id, 0, 255),
+            'sender_email' => $sender_email,
+            'recipient_email' => $this->extract_email($headers['to'] ?? ''),
+            'subject' => mb_substr($subject, 0, 255),
+            'received_at' => $timestamp ? get_date_from_gmt(gmdate('Y-m-d H:i:s', $timestamp)) : null,
+            'body_blob_id' => $body_blob_id,
+            'source' => substr($message['source'], 0, 255),
+            'attachments' => $attachment_rows
+        );
+
+        if (count($this->pending) >= self::BATCH_SIZE) {
+            $this->flush_pending();
+        }
+    }
+
+    /**
+     * Store a decoded part once per content hash, returns the blob id (0 on error)
+     */
+    private function store_blob($part) {
+        $hash = $part['sha256'];
+
+        if (isset($this->blob_ids[$hash])) {
+            $this->stats['payloads_reused']++;
+            return $this->blob_ids[$hash];
+        }
+
+        $table_name = $this->wpdb->prefix . 'klage_evidence_blobs';
+        $blob_id = intval($this->wpdb->get_var($this->wpdb->prepare("SELECT id FROM $table_name WHERE sha256 = %s", $hash)));
+
+        if ($blob_id) {
+            $this->stats['payloads_reused']++;
+        } else {
+            $storage_path = '';
+            $content = '';
+
+            if ($part['size'] > self::INLINE_LIMIT) {
+                $storage_path = $this->write_payload_file($hash, $part['stream']);
+                if ($storage_path === false) {
+                    $this->stats['errors'][] = 'Anhang konnte nicht gespeichert werden: ' . ($part['filename'] ?: $hash);
+                    return 0;
+                }
+                $this->stats['bytes_on_disk'] += $part['size'];
+            } else {
+                $content = stream_get_contents($part['stream']);
+            }
+
+            // INSERT IGNORE: a parallel import may store the same payload
+            $this->wpdb->query($this->wpdb->prepare(
+                "INSERT IGNORE INTO $table_name (sha256, size, content_type, charset, storage_path, content, created_at) VALUES (%s, %d, %s, %s, %s, %s, %s)",
+                $hash,
+                $part['size'],
+                substr($part['content_type'], 0, 100),
+                substr($part['charset'], 0, 40),
+                $storage_path,
+                $content,
+                current_time('mysql')
+            ));
+
+            $blob_id = intval($this->wpdb->insert_id) ?: intval($this->wpdb->get_var($this->wpdb->prepare("SELECT id FROM $table_name WHERE sha256 = %s", $hash)));
+            $this->stats['payloads_stored']++;
+        }
+
+        if (count($this->blob_ids) >= self::MAX_KNOWN_BLOBS) {
+            $this->blob_ids = array();
+        }
+        $this->blob_ids[$hash] = $blob_id;
+
+        return $blob_id;
+    }
+
+    /**
+     * Write a payload to <storage dir>/ab/cd/<hash>, returns the relative path or false
+     */
+    private function write_payload_file($hash, $stream) {
+        $relative_path = substr($hash, 0, 2) . '/' . substr($hash, 2, 2) . '/' . $hash;
+        $file = self::get_storage_dir() . '/' . $relative_path;
+
+        // Content addressed: an existing file has the same content
+        if (file_exists($file)) {
+            return $relative_path;
+        }
+
+        if (!$this->prepare_storage_dir() || !wp_mkdir_p(dirname($file))) {
+            return false;
+        }
+
+        // Write to a temporary file first so a crashed import never leaves half a payload
+        $temp_file = $file . '.' . uniqid('', true);
+        $target = @fopen($temp_file, 'wb');
+
+        if (!$target) {
+            return false;
+        }
+
+        $written = stream_copy_to_stream($stream, $target);
+        fclose($target);
+
+        if ($written === false || !@rename($temp_file, $file)) {
+            @unlink($temp_file);
+            return false;
+        }
+
+        return $relative_path;
+    }
+
+    /**
+     * Create the storage directory and block web access to it
+     */
+    private function prepare_storage_dir() {
+        $directory = self::get_storage_dir();
+
+        if (file_exists($directory . '/.htaccess')) {
+            return true;
+        }
+
+        if (!wp_mkdir_p($directory)) {
+            return false;
+        }
+
+        file_put_contents($directory . '/.htaccess', "Require all denied\nDeny from all\n");
+        file_put_contents($directory . '/index.php', "<?php\n// Silence is golden.\n");
+
+        return true;
+    }
+
+    /**
+     * Payload directory (define CAH_EVIDENCE_DIR to keep evidence outside the web root)
+     */
+    public static function get_storage_dir() {
+        if (defined('CAH_EVIDENCE_DIR') && CAH_EVIDENCE_DIR) {
+            return untrailingslashit(CAH_EVIDENCE_DIR);
+        }
+
+        $upload_dir = wp_upload_dir(null, false);
+        return trailingslashit($upload_dir['basedir']) . 'cah-evidence';
+    }
+
+    /**
+     * Insert queued messages and their attachments, then link them to cases
+     */
+    private function flush_pending() {
+        if (empty($this->pending)) {
+            return;
+        }
+
+        $messages_table = $this->wpdb->prefix . 'klage_evidence_messages';
+        $hashes = array_keys($this->pending);
+        $placeholders = implode(', ', array_fill(0, count($hashes), '%s'));
+
+        // Messages imported before
+        $existing = $this->wpdb->get_col($this->wpdb->prepare("SELECT message_hash FROM $messages_table WHERE message_hash IN ($placeholders)", $hashes));
+        foreach ($existing as $hash) {
+            unset($this->pending[$hash]);
+            $this->stats['duplicates']++;
+        }
+
+        if (empty($this->pending)) {
+            return;
+        }
+
+        $now = current_time('mysql');
+        $values = array();
+
+        foreach ($this->pending as $hash => $row) {
+            $values[] = $this->wpdb->prepare(
+                '(%s, %s, %s, %s, %s, ' . ($row['received_at'] ? '%s' : 'NULL') . ', %d, %d, %s, %s)',
+                array_merge(
+                    array($hash, $row['message_id'], $row['sender_email'], $row['recipient_email'], $row['subject']),
+                    $row['received_at'] ? array($row['received_at']) : array(),
+                    array($row['body_blob_id'], count($row['attachments']), $row['source'], $now)
+                )
+            );
+        }
+
+        $this->wpdb->query("INSERT IGNORE INTO $messages_table
+            (message_hash, message_id, sender_email, recipient_email, subject, received_at, body_blob_id, attachment_count, source, created_at)
+            VALUES " . implode(', ', $values));
+
+        $hashes = array_keys($this->pending);
+        $placeholders = implode(', ', array_fill(0, count($hashes), '%s'));
+        $evidence_ids = $this->wpdb->get_results($this->wpdb->prepare("SELECT message_hash, id FROM $messages_table WHERE message_hash IN ($placeholders)", $hashes), OBJECT_K);
+
+        $attachment_values = array();
+        foreach ($this->pending as $hash => $row) {
+            if (!isset($evidence_ids[$hash])) {
+                continue;
+            }
+            foreach ($row['attachments'] as $attachment) {
+                $attachment_values[] = $this->wpdb->prepare('(%d, %d, %s, %s)', $evidence_ids[$hash]->id, $attachment[0], substr($attachment[1], 0, 255), substr($attachment[2], 0, 100));
+            }
+        }
+
+        if ($attachment_values) {
+            $this->wpdb->query("INSERT IGNORE INTO {$this->wpdb->prefix}klage_evidence_attachments (evidence_id, blob_id, filename, content_type) VALUES " . implode(', ', $attachment_values));
+        }
+
+        $ids = wp_list_pluck($evidence_ids, 'id');
+        $this->stats['imported'] += count($ids);
+        $this->stats['linked'] += $this->link_by_sender($ids);
+
+        $this->pending = array();
+    }
+
+    /**
+     * Link evidence to cases whose debtor email or case email sender matches
+     * the sender (all evidence if $evidence_ids is null, all cases if
+     * $case_ids is null). Returns new links.
+     */
+    public function link_by_sender($evidence_ids = null, $case_ids = null) {
+        $this->ensure_tables();
+
+        $filter = '';
+        if ($evidence_ids !== null) {
+            if (empty($evidence_ids)) {
+                return 0;
+            }
+            $filter = 'AND m.id IN (' . implode(', ', array_map('intval', $evidence_ids)) . ')';
+        }
+
+        $debtor_filter = '';
+        $email_filter = '';
+        if ($case_ids !== null) {
+            if (empty($case_ids)) {
+                return 0;
+            }
+            $case_list = implode(', ', array_map('intval', $case_ids));
+            $debtor_filter = "AND c.id IN ($case_list)";
+            $email_filter = "AND e.case_id IN ($case_list)";
+        }
+
+        $prefix = $this->wpdb->prefix;
+        $now = current_time('mysql');
+
+        $linked = $this->wpdb->query($this->wpdb->prepare("
+            INSERT IGNORE INTO {$prefix}klage_evidence_links (case_id, evidence_id, matched_by, created_at)
+            SELECT c.id, m.id, 'debtor_email', %s
+            FROM {$prefix}klage_evidence_messages m
+            INNER JOIN {$prefix}klage_debtors d ON d.debtors_email = m.sender_email
+            INNER JOIN {$prefix}klage_cases c ON c.debtor_id = d.id
+            WHERE m.sender_email <> '' $filter $debtor_filter
+        ", $now));
+
+        $linked += $this->wpdb->query($this->wpdb->prepare("
+            INSERT IGNORE INTO {$prefix}klage_evidence_links (case_id, evidence_id, matched_by, created_at)
+            SELECT e.case_id, m.id, 'case_email', %s
+            FROM {$prefix}klage_evidence_messages m
+            INNER JOIN {$prefix}klage_emails e ON e.emails_sender_email = m.sender_email
+            WHERE m.sender_email <> '' $filter $email_filter
+        ", $now));
+
+        return intval($linked);
+    }
+
+    /**
+     * Rebuild the evidence links of created cases or cases whose debtor
+     * email changed
+     */
+    public function relink_cases($case_ids) {
+        // No evidence was ever imported on this site
+        if (get_option('cah_evidence_tables_version') === false) {
+            return;
+        }
+
+        $case_ids = array_filter(array_map('intval', (array) $case_ids));
+        if (empty($case_ids)) {
+            return;
+        }
+
+        // Links of an old debtor email must not survive the change
+        $this->wpdb->query("DELETE FROM {$this->wpdb->prefix}klage_evidence_links WHERE case_id IN (" . implode(', ', $case_ids) . ")");
+
+        $this->link_by_sender(null, $case_ids);
+    }
+
+    /**
+     * Evidence linked to a case (newest first)
+     */
+    public function get_case_evidence($case_id) {
+        $this->ensure_tables();
+
+        $prefix = $this->wpdb->prefix;
+
+        return $this->wpdb->get_results($this->wpdb->prepare("
+            SELECT m.*, l.matched_by
+            FROM {$prefix}klage_evidence_links l
+            INNER JOIN {$prefix}klage_evidence_messages m ON m.id = l.evidence_id
+            WHERE l.case_id = %d
+            ORDER BY m.received_at DESC
+        ", $case_id));
+    }
+
+    /**
+     * Attachments of the evidence linked to a case
+     */
+    public function get_case_attachments($case_id) {
+        $this->ensure_tables();
+
+        $prefix = $this->wpdb->prefix;
+
+        return $this->wpdb->get_results($this->wpdb->prepare("
+            SELECT a.evidence_id, a.blob_id, a.filename, a.content_type, b.size
+            FROM {$prefix}klage_evidence_links l
+            INNER JOIN {$prefix}klage_evidence_attachments a ON a.evidence_id = l.evidence_id
+            INNER JOIN {$prefix}klage_evidence_blobs b ON b.id = a.blob_id
+            WHERE l.case_id = %d
+            ORDER BY a.evidence_id, a.id
+        ", $case_id));
+    }
+
+    /**
+     * Send a message body or attachment of a case's evidence as a download
+     * (WP_Error if the payload is not linked to the case)
+     */
+    public function stream_case_payload($case_id, $blob_id) {
+        $prefix = $this->wpdb->prefix;
+
+        $payload = $this->wpdb->get_row($this->wpdb->prepare("
+            SELECT b.content_type, b.charset, m.id AS evidence_id, a.filename
+            FROM {$prefix}klage_evidence_links l
+            INNER JOIN {$prefix}klage_evidence_messages m ON m.id = l.evidence_id
+            LEFT JOIN {$prefix}klage_evidence_attachments a ON a.evidence_id = m.id AND a.blob_id = %d
+            INNER JOIN {$prefix}klage_evidence_blobs b ON b.id = %d
+            WHERE l.case_id = %d AND (m.body_blob_id = %d OR a.blob_id IS NOT NULL)
+            LIMIT 1
+        ", $blob_id, $blob_id, $case_id, $blob_id));
+
+        if (!$payload) {
+            return new WP_Error('evidence_not_found', 'Evidenz nicht gefunden.');
+        }
+
+        $stream = $this->open_payload($blob_id);
+        if (!$stream) {
+            return new WP_Error('evidence_missing', 'Die gespeicherte Datei fehlt.');
+        }
+
+        if ($payload->filename !== null && $payload->filename !== '') {
+            $filename = sanitize_file_name($payload->filename);
+            $content_type = $payload->content_type ?: 'application/octet-stream';
+        } else {
+            $filename = 'nachricht-' . $payload->evidence_id . '.txt';
+            $content_type = ($payload->content_type ?: 'text/plain') . ($payload->charset ? '; charset=' . $payload->charset : '');
+        }
+
+        while (ob_get_level()) {
+            ob_end_clean();
+        }
+
+        header('Content-Type: ' . $content_type);
+        header('Content-Disposition: attachment; filename="' . $filename . '"');
+        header('X-Content-Type-Options: nosniff');
+        header('Pragma: no-cache');
+        header('Expires: 0');
+
+        fpassthru($stream);
+        fclose($stream);
+
+        return true;
+    }
+
+    /**
+     * Open a stored payload for reading (false if missing)
+     */
+    public function open_payload($blob_id) {
+        $blob = $this->wpdb->get_row($this->wpdb->prepare("
+            SELECT storage_path, content FROM {$this->wpdb->prefix}klage_evidence_blobs WHERE id = %d
+        ", $blob_id));
+
+        if (!$blob) {
+            return false;
+        }
+
+        if ($blob->storage_path !== '') {
+            return @fopen(self::get_storage_dir() . '/' . $blob->storage_path, 'rb');
+        }
+
+        $stream = fopen('php://temp', 'w+b');
+        fwrite($stream, $blob->content);
+        rewind($stream);
+
+        return $stream;
+    }
+
+    /**
+     * First address of an address header, lowercased
+     */
+    private function extract_email($header) {
+        if (preg_match('/[A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,}/i', CAH_Mail_Stream_Parser::decode_header($header), $match)) {
+            return strtolower(substr($match[0], 0, 255));
+        }
+
+        return '';
+    }
+
+    /**
+     * Create or upgrade evidence tables on installs that predate the current layout
+     */
+    private function ensure_tables() {
+        if (self::$tables_checked) {
+            return;
+        }
+        self::$tables_checked = true;
+
+        if (get_option('cah_evidence_tables_version') === self::TABLE_VERSION) {
+            return;
+        }
+
+        $this->create_tables();
+
+        $blobs_table = $this->wpdb->prefix . 'klage_evidence_blobs';
+        if (!$this->wpdb->get_var("SHOW COLUMNS FROM $blobs_table LIKE 'charset'")) {
+            $this->wpdb->query("ALTER TABLE $blobs_table ADD COLUMN charset varchar(40) NOT NULL DEFAULT '' AFTER content_type");
+        }
+
+        update_option('cah_evidence_tables_version', self::TABLE_VERSION);
+    }
+
+    /**
+     * Create evidence tables
+     */
+    public function create_tables() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+        $prefix = $this->wpdb->prefix;
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_evidence_blobs (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            sha256 char(64) NOT NULL,
+            size bigint(20) unsigned NOT NULL DEFAULT 0,
+            content_type varchar(100) NOT NULL DEFAULT '',
+            charset varchar(40) NOT NULL DEFAULT '',
+            storage_path varchar(255) NOT NULL DEFAULT '',
+            content longblob,
+            created_at datetime NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE KEY sha256 (sha256)
+        ) $charset_collate");
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_evidence_messages (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            message_hash char(64) NOT NULL,
+            message_id varchar(255) NOT NULL DEFAULT '',
+            sender_email varchar(255) NOT NULL DEFAULT '',
+            recipient_email varchar(255) NOT NULL DEFAULT '',
+            subject varchar(255) NOT NULL DEFAULT '',
+            received_at datetime DEFAULT NULL,
+            body_blob_id bigint(20) unsigned NOT NULL DEFAULT 0,
+            attachment_count int(5) NOT NULL DEFAULT 0,
+            source varchar(255) NOT NULL DEFAULT '',
+            created_at datetime NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE KEY message_hash (message_hash),
+            KEY sender_email (sender_email(191)),
+            KEY body_blob_id (body_blob_id)
+        ) $charset_collate");
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_evidence_attachments (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            evidence_id bigint(20) unsigned NOT NULL,
+            blob_id bigint(20) unsigned NOT NULL,
+            filename varchar(255) NOT NULL DEFAULT '',
+            content_type varchar(100) NOT NULL DEFAULT '',
+            PRIMARY KEY (id),
+            UNIQUE KEY evidence_blob (evidence_id, blob_id),
+            KEY blob_id (blob_id)
+        ) $charset_collate");
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$prefix}klage_evidence_links (
+            case_id bigint(20) unsigned NOT NULL,
+            evidence_id bigint(20) unsigned NOT NULL,
+            matched_by varchar(20) NOT NULL DEFAULT '',
+            created_at datetime NOT NULL,
+            PRIMARY KEY (case_id, evidence_id),
+            KEY evidence_id (evidence_id)
+        ) $charset_collate");
+    }
+}
@@ -0,0 +1,338 @@
+<?php
+/**
+ * Forderungen.com Importer - Imports rows of a Forderungen.com CSV export
+ * Shared by the CSV upload of the admin dashboard and the parallel
+ * WP-CLI import (wp cah import), so both create identical cases.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Forderungen_Importer {
+
+    private $audit_logger;
+    private $court_manager;
+    private $case_id_allocator;
+
+    // Courts resolved in bulk for the running import (postal code => court)
+    private $resolved_courts = array();
+
+    // Plugin tables present, checked once per importer (i.e. per import or worker)
+    private $tables = null;
+
+    const REQUIRED_FIELDS = array('Fall-ID (CSV)', 'Nachname');
+
+    const FORDERUNGEN_FIELDS = array(
+        'Fall-Status', 'Brief-Status', 'Mandant', 'Schuldner', 'Einreichungsdatum', 'Beweise',
+        'Dokumente', 'Firmenname', 'Vorname', 'Adresse', 'Postleitzahl', 'Stadt', 'Land',
+        'E-Mail', 'Telefon', 'Rechtsform', 'Verfahrensart', 'Streitwert', 'Schadenersatz',
+        'Anwaltskosten', 'Gerichtskosten', 'Gesamtbetrag', 'Gericht zuständig', 'Erfolgsaussicht',
+        'Komplexität', 'Bearbeitungsstatus', 'Datenquelle'
+    );
+
+    public function __construct() {
+        $this->audit_logger = new CAH_Audit_Logger();
+        $this->court_manager = new CAH_Court_Manager();
+        $this->case_id_allocator = new CAH_Case_ID_Allocator();
+    }
+
+    /**
+     * Required columns missing in a CSV header
+     */
+    public function get_missing_required_fields($header) {
+        return array_values(array_diff(self::REQUIRED_FIELDS, $header));
+    }
+
+    /**
+     * Header looks like a Forderungen.com export (at least 3 known columns)
+     */
+    public function is_forderungen_export($header) {
+        return count(array_intersect(self::FORDERUNGEN_FIELDS, $header)) >= 3;
+    }
+
+    /**
+     * Reserve case IDs for rows without Fall-ID in one counter update
+     */
+    public function prefetch_case_ids($count) {
+        if ($count > 0) {
+            $this->case_id_allocator->prefetch($count);
+        }
+    }
+
+    /**
+     * Resolve the responsible courts of all rows in one pass
+     */
+    public function resolve_courts($postal_codes) {
+        $this->resolved_courts = $this->court_manager->resolve_courts($postal_codes);
+    }
+
+    /**
+     * Import one row (header => value) as case with debtor and financial record
+     * $import_mode: create_new, update_existing or create_and_update
+     */
+    public function import_row($data, $import_mode, $is_forderungen_export) {
+        global $wpdb;
+
+        try {
+            // Check if tables exist
+            $tables = $this->get_tables();
+            if (!isset($tables['klage_cases'])) {
+                return array('success' => false, 'error' => 'Datenbank-Tabellen fehlen');
+            }
+
+            // Extract data with Forderungen.com 17-field mapping
+            $case_id = sanitize_text_field($data['Fall-ID (CSV)'] ?? $data['Fall-ID'] ?? '');
+            $case_status = sanitize_text_field($data['Fall-Status'] ?? 'draft');
+            $brief_status = sanitize_text_field($data['Brief-Status'] ?? 'pending');
+            $briefe = intval($data['Briefe'] ?? 1);
+            $mandant = sanitize_text_field($data['Mandant'] ?? '');
+            $schuldner = sanitize_text_field($data['Schuldner'] ?? '');
+            $submission_date = sanitize_text_field($data['Einreichungsdatum'] ?? '');
+            $beweise = sanitize_textarea_field($data['Beweise'] ?? '');
+            $dokumente = sanitize_text_field($data['Dokumente'] ?? '');
+            $document_links = sanitize_text_field($data['links zu Dokumenten'] ?? '');
+
+            // Debtor information from Forderungen.com (17 fields)
+            $company_name = sanitize_text_field($data['Firmenname'] ?? '');
+            $first_name = sanitize_text_field($data['Vorname'] ?? '');
+            $last_name = sanitize_text_field($data['Nachname'] ?? '');
+            $address = sanitize_text_field($data['Adresse'] ?? '');
+            $postal_code = sanitize_text_field($data['Postleitzahl'] ?? '');
+            $city = sanitize_text_field($data['Stadt'] ?? '');
+            $country = sanitize_text_field($data['Land'] ?? 'Deutschland');
+
+            // Responsible court: PLZ directory first, CSV value as fallback
+            if (!array_key_exists($postal_code, $this->resolved_courts)) {
+                $this->resolved_courts += $this->court_manager->resolve_courts(array($postal_code));
+            }
+            $court = $this->resolved_courts[$postal_code];
+            $gericht_zustaendig = $court ? $court->court_name : sanitize_text_field($data['Gericht zuständig'] ?? '');
+
+            // Validation
+            if (empty($last_name)) {
+                return array('success' => false, 'error' => 'Nachname ist erforderlich');
+            }
+
+            // Rows without Fall-ID get the next ID from the reserved block
+            $allocated_case_id = empty($case_id);
+            if ($allocated_case_id) {
+                if ($import_mode === 'update_existing') {
+                    return array('success' => false, 'error' => 'Fall-ID ist für Aktualisierungen erforderlich');
+                }
+                $case_id = $this->case_id_allocator->next_case_id();
+                if (is_wp_error($case_id)) {
+                    return array('success' => false, 'error' => $case_id->get_error_message());
+                }
+            }
+
+            // Check if case exists (an allocated ID never updates another case)
+            $existing_case = $allocated_case_id ? null : $wpdb->get_row($wpdb->prepare("
+                SELECT id FROM {$wpdb->prefix}klage_cases WHERE case_id = %s
+            ", $case_id));
+
+            if ($existing_case && $import_mode === 'create_new') {
+                return array('success' => false, 'error' => 'Fall existiert bereits');
+            }
+
+            if (!$existing_case && $import_mode === 'update_existing') {
+                return array('success' => false, 'error' => 'Fall existiert nicht');
+            }
+
+            // Create debtor entry (map 17 fields to comprehensive structure)
+            $debtor_name = trim($first_name . ' ' . $last_name);
+            if (!empty($company_name)) {
+                $debtor_name = $company_name . ' (' . $debtor_name . ')';
+            }
+
+            $debtor_id = null;
+            if (isset($tables['klage_debtors'])) {
+                $wpdb->insert(
+                    $wpdb->prefix . 'klage_debtors',
+                    array(
+                        'debtors_name' => $debtor_name,
+                        'debtors_company' => $company_name,
+                        'debtors_first_name' => $first_name,
+                        'debtors_last_name' => $last_name,
+                        'debtors_address' => $address,
+                        'debtors_postal_code' => $postal_code,
+                        'debtors_city' => $city,
+                        'debtors_country' => $country,
+                        // Set defaults for fields not provided by Forderungen.com
+                        'rechtsform' => !empty($company_name) ? 'unternehmen' : 'natuerliche_person',
+                        'datenquelle' => 'forderungen_com',
+                        'letzte_aktualisierung' => current_time('mysql')
+                    ),
+                    array('%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s', '%s')
+                );
+                $debtor_id = $wpdb->insert_id;
+            }
+
+            // Prepare date
+            $submission_date_mysql = $this->parse_date($submission_date);
+
+            // Case data - map Forderungen.com fields to comprehensive structure
+            $case_data = array(
+                'case_status' => $case_status,
+                'brief_status' => $brief_status,
+                'briefe' => $briefe,
+                'mandant' => $mandant,
+                'schuldner' => $schuldner,
+                'submission_date' => $submission_date_mysql,
+                'beweise' => $beweise,
+                'dokumente' => $dokumente,
+                'links_zu_dokumenten' => $document_links,
+                'debtor_id' => $debtor_id,
+                'case_updated_date' => current_time('mysql'),
+                'import_source' => 'forderungen_com',
+                // Set defaults for internal fields not provided by Forderungen.com
+                'verfahrensart' => 'mahnverfahren',
+                'rechtsgrundlage' => 'DSGVO Art. 82',
+                'kategorie' => 'GDPR_SPAM',
+                'schadenhoehe' => 350.00,
+                'total_amount' => 548.11,
+                'verfahrenswert' => 548.11,
+                'erfolgsaussicht' => 'hoch',
+                'risiko_bewertung' => 'niedrig',
+                'komplexitaet' => 'standard',
+                'prioritaet_intern' => 'normal',
+                'bearbeitungsstatus' => 'neu',
+                'kommunikation_sprache' => 'de',
+                'gericht_zustaendig' => $gericht_zustaendig
+            );
+
+            if ($existing_case) {
+                // Update existing case
+                $wpdb->update(
+                    $wpdb->prefix . 'klage_cases',
+                    $case_data,
+                    array('id' => $existing_case->id),
+                    $this->get_formats($case_data),
+                    array('%d')
+                );
+                $case_internal_id = intval($existing_case->id);
+            } else {
+                // Create new case
+                $case_data['case_id'] = $case_id;
+                $case_data['case_creation_date'] = current_time('mysql');
+                $case_data['case_priority'] = 'medium';
+
+                $inserted = $this->case_id_allocator->insert_case(
+                    $case_data,
+                    $this->get_formats($case_data),
+                    $allocated_case_id
+                );
+                if (is_wp_error($inserted)) {
+                    return array('success' => false, 'error' => $inserted->get_error_message());
+                }
+                // Allocated IDs may have been replaced after a collision
+                $case_id = $inserted;
+                $case_internal_id = $wpdb->insert_id;
+            }
+
+            // Create standard GDPR financial record
+            if (isset($tables['klage_financial'])) {
+                // Check if financial record exists
+                $existing_financial = $wpdb->get_var($wpdb->prepare("
+                    SELECT id FROM {$wpdb->prefix}klage_financial WHERE case_id = %d
+                ", $case_internal_id));
+
+                $financial_data = array(
+                    'streitwert' => 548.11,
+                    'schadenersatz' => 350.00,
+                    'anwaltskosten' => 96.90,
+                    'gerichtskosten' => 32.00,
+                    'nebenkosten' => 13.36,
+                    'total' => 548.11,
+                    'damages_loss' => 350.00,
+                    'partner_fees' => 96.90,
+                    'communication_fees' => 13.36,
+                    'vat' => 87.85,
+                    'court_fees' => 32.00
+                );
+
+                if ($existing_financial) {
+                    // Update existing financial record
+                    $wpdb->update(
+                        $wpdb->prefix . 'klage_financial',
+                        $financial_data,
+                        array('id' => $existing_financial),
+                        array('%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f', '%f'),
+                        array('%d')
+                    );
+                } else {
+                    // Create new financial record
+                    $financial_data['case_id'] = $case_internal_id;
+                    $wpdb->insert(
+                        $wpdb->prefix . 'klage_financial',
+                        $financial_data,
+                        $this->get_formats($financial_data)
+                    );
+                }
+            }
+
+            CAH_Case_Repository::invalidate_case($case_internal_id, $case_id);
+
+            // Create audit trail entry
+            $this->audit_logger->log_action($case_internal_id, $existing_case ? 'case_updated' : 'case_created', 'Imported from Forderungen.com (17 fields) with automatic defaults');
+
+            return array('success' => true, 'case_id' => $case_internal_id, 'created' => !$existing_case);
+
+        } catch (Exception $e) {
+            return array('success' => false, 'error' => 'Import-Fehler: ' . $e->getMessage());
+        }
+    }
+
+    /**
+     * Plugin tables of this site (name without prefix => true), one
+     * SHOW TABLES for the lifetime of the importer
+     */
+    private function get_tables() {
+        global $wpdb;
+
+        if ($this->tables === null) {
+            $names = $wpdb->get_col($wpdb->prepare("SHOW TABLES LIKE %s", $wpdb->esc_like($wpdb->prefix . 'klage_') . '%'));
+            $this->tables = array();
+            foreach ($names as $name) {
+                $this->tables[substr($name, strlen($wpdb->prefix))] = true;
+            }
+        }
+
+        return $this->tables;
+    }
+
+    /**
+     * $wpdb formats in the key order of a row, from the value types
+     * (int %d, float %f, everything else %s)
+     */
+    private function get_formats($data) {
+        $formats = array();
+        foreach ($data as $value) {
+            $formats[] = is_int($value) ? '%d' : (is_float($value) ? '%f' : '%s');
+        }
+
+        return $formats;
+    }
+
+    /**
+     * Submission date in Y-m-d (accepts Y-m-d, d.m.Y and d/m/Y)
+     */
+    private function parse_date($date_string) {
+        if (empty($date_string)) {
+            return null;
+        }
+
+        // Try Y-m-d format first
+        $date = DateTime::createFromFormat('Y-m-d', $date_string);
+        if (!$date) {
+            // Try d.m.Y format
+            $date = DateTime::createFromFormat('d.m.Y', $date_string);
+        }
+        if (!$date) {
+            // Try d/m/Y format
+            $date = DateTime::createFromFormat('d/m/Y', $date_string);
+        }
+
+        return $date ? $date->format('Y-m-d') : null;
+    }
+}
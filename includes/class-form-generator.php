@@ -1,6 +1,9 @@
 <?php
 /**
  * Dynamic Form Generator - Creates forms based on database schema
+ * Forms are compiled once per schema version into segments (static HTML and
+ * value slots), cached in the object cache or on disk and invalidated on
+ * cah_schema_updated. Rendering only fills the values in.
  */
 
 if (!defined('ABSPATH')) {
@@ -9,35 +12,159 @@ if (!defined('ABSPATH')) {
 
 class CAH_Form_Generator {
     
-    private $schema_manager;
+    const CACHE_GROUP = 'cah_forms';
+    const CACHE_VERSION_OPTION = 'cah_form_cache_version';
     
-    public function __construct() {
-        $this->schema_manager = new CAH_Schema_Manager();
-    }
+    private $schema_manager = null;
+    
+    // Request-local memo (cache key => compiled form)
+    private static $compiled = array();
     
     /**
      * Generate form based on table schema
      */
     public function generate_form($table_name, $data = array(), $exclude_fields = array()) {
+        $compiled = $this->get_compiled_form($table_name, $exclude_fields);
+        
+        if (!$compiled) {
+            return '<div class="error">Table schema not found</div>';
+        }
+        
+        return $this->fill_form($compiled, $data);
+    }
+    
+    /**
+     * Fill the value slots of a compiled form
+     */
+    private function fill_form($compiled, $data) {
+        $html = '';
+        
+        foreach ($compiled['segments'] as $segment) {
+            if (is_string($segment)) {
+                $html .= $segment;
+                continue;
+            }
+            
+            $field_name = $segment[0];
+            $value = $data[$field_name] ?? $compiled['defaults'][$field_name] ?? '';
+            
+            switch ($segment[1]) {
+                case 'value':
+                    $html .= esc_attr($value);
+                    break;
+                case 'text':
+                    $html .= esc_textarea($value);
+                    break;
+                case 'selected':
+                    $html .= ($segment[2] == $value) ? ' selected' : '';
+                    break;
+                case 'checked':
+                    $html .= $value ? ' checked="checked"' : '';
+                    break;
+            }
+        }
+        
+        return $html;
+    }
+    
+    /**
+     * Compiled form (request memo -> object cache -> disk -> compile)
+     * Returns null if the table has no schema
+     */
+    private function get_compiled_form($table_name, $exclude_fields) {
+        $exclude_fields = array_values(array_unique(array_map('strval', (array) $exclude_fields)));
+        sort($exclude_fields);
+        
+        $cache_key = $table_name . '_' . md5(implode(',', $exclude_fields)) . '_' . self::get_cache_version();
+        
+        if (array_key_exists($cache_key, self::$compiled)) {
+            return self::$compiled[$cache_key];
+        }
+        
+        $compiled = wp_cache_get($cache_key, self::CACHE_GROUP);
+        
+        if ($compiled === false && !wp_using_ext_object_cache()) {
+            $compiled = $this->read_cache_file($cache_key);
+        }
+        
+        if ($compiled === false) {
+            $compiled = $this->compile_form($table_name, $exclude_fields);
+            
+            // Unknown tables are cached as well (stored as 0, the cache can't hold false)
+            wp_cache_set($cache_key, $compiled ?: 0, self::CACHE_GROUP, DAY_IN_SECONDS);
+            
+            if ($compiled && !wp_using_ext_object_cache()) {
+                $this->write_cache_file($cache_key, $compiled);
+            }
+        }
+        
+        $compiled = $compiled ?: null;
+        self::$compiled[$cache_key] = $compiled;
+        
+        return $compiled;
+    }
+    
+    /**
+     * Walk the schema once and compile the form into segments
+     * Segments are HTML strings or value slots: array(field, 'value'|'text'|'checked')
+     * and array(field, 'selected', option value).
+     */
+    private function compile_form($table_name, $exclude_fields) {
+        if ($this->schema_manager === null) {
+            $this->schema_manager = new CAH_Schema_Manager();
+        }
+        
         $schema = $this->schema_manager->get_complete_schema_definition()[$table_name] ?? null;
         
         if (!$schema) {
-            return '<div class="error">Table schema not found</div>';
+            return null;
         }
         
-        $form_html = '';
-        $form_html .= '<div class="dynamic-form" data-table="' . esc_attr($table_name) . '">';
+        $segments = array();
+        $defaults = array();
+        
+        $segments[] = '<div class="dynamic-form" data-table="' . esc_attr($table_name) . '">';
         
         // Group fields by category
         $field_groups = $this->group_fields_by_category($table_name, $schema['columns']);
         
         foreach ($field_groups as $group_name => $fields) {
-            $form_html .= $this->render_field_group($group_name, $fields, $data, $exclude_fields);
+            $segments = array_merge($segments, $this->render_field_group($group_name, $fields, $exclude_fields, $defaults));
         }
         
-        $form_html .= '</div>';
+        $segments[] = '</div>';
         
-        return $form_html;
+        return array(
+            'segments' => $this->merge_segments($segments),
+            'defaults' => $defaults
+        );
+    }
+    
+    /**
+     * Join adjacent HTML strings so filling only touches the slots
+     */
+    private function merge_segments($segments) {
+        $merged = array();
+        $buffer = '';
+        
+        foreach ($segments as $segment) {
+            if (is_string($segment)) {
+                $buffer .= $segment;
+                continue;
+            }
+            
+            if ($buffer !== '') {
+                $merged[] = $buffer;
+                $buffer = '';
+            }
+            $merged[] = $segment;
+        }
+        
+        if ($buffer !== '') {
+            $merged[] = $buffer;
+        }
+        
+        return $merged;
     }
     
     /**
@@ -114,33 +241,37 @@ class CAH_Form_Generator {
     /**
      * Render a field group
      */
-    private function render_field_group($group_name, $fields, $data, $exclude_fields) {
-        $html = '<div class="postbox">';
-        $html .= '<h2 class="hndle">' . esc_html($group_name) . '</h2>';
-        $html .= '<div class="inside" style="padding: 20px;">';
-        $html .= '<table class="form-table">';
+    private function render_field_group($group_name, $fields, $exclude_fields, &$defaults) {
+        $segments = array();
+        $segments[] = '<div class="postbox">';
+        $segments[] = '<h2 class="hndle">' . esc_html($group_name) . '</h2>';
+        $segments[] = '<div class="inside" style="padding: 20px;">';
+        $segments[] = '<table class="form-table">';
         
         foreach ($fields as $field_name) {
             if (in_array($field_name, $exclude_fields)) {
                 continue;
             }
             
-            $html .= $this->render_field_row($field_name, $data);
+            $segments = array_merge($segments, $this->render_field_row($field_name, $defaults));
         }
         
-        $html .= '</table>';
-        $html .= '</div>';
-        $html .= '</div>';
+        $segments[] = '</table>';
+        $segments[] = '</div>';
+        $segments[] = '</div>';
         
-        return $html;
+        return $segments;
     }
     
     /**
      * Render individual field row
      */
-    private function render_field_row($field_name, $data) {
+    private function render_field_row($field_name, &$defaults) {
         $field_config = $this->get_field_config($field_name);
-        $value = $data[$field_name] ?? $field_config['default'] ?? '';
+        
+        if (isset($field_config['default'])) {
+            $defaults[$field_name] = $field_config['default'];
+        }
         
         $html = '<tr>';
         $html .= '<th scope="row">';
@@ -151,22 +282,22 @@ class CAH_Form_Generator {
         $html .= '</th>';
         $html .= '<td>';
         
-        $html .= $this->render_field_input($field_name, $field_config, $value);
+        $segments = array_merge(array($html), $this->render_field_input($field_name, $field_config));
         
         if (!empty($field_config['description'])) {
-            $html .= '<p class="description">' . esc_html($field_config['description']) . '</p>';
+            $segments[] = '<p class="description">' . esc_html($field_config['description']) . '</p>';
         }
         
-        $html .= '</td>';
-        $html .= '</tr>';
+        $segments[] = '</td>';
+        $segments[] = '</tr>';
         
-        return $html;
+        return $segments;
     }
     
     /**
-     * Render field input based on type
+     * Render field input based on type (value left as slot)
      */
-    private function render_field_input($field_name, $config, $value) {
+    private function render_field_input($field_name, $config) {
         $attributes = array(
             'id' => $field_name,
             'name' => $field_name,
@@ -179,70 +310,65 @@ class CAH_Form_Generator {
         
         switch ($config['type']) {
             case 'text':
-                $attributes['type'] = 'text';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
-                
             case 'email':
-                $attributes['type'] = 'email';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
-                
             case 'tel':
-                $attributes['type'] = 'tel';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
+            case 'date':
+                $attributes['type'] = $config['type'];
+                break;
                 
             case 'number':
                 $attributes['type'] = 'number';
-                $attributes['value'] = esc_attr($value);
                 if (isset($config['min'])) $attributes['min'] = $config['min'];
                 if (isset($config['max'])) $attributes['max'] = $config['max'];
                 if (isset($config['step'])) $attributes['step'] = $config['step'];
-                return '<input ' . $this->build_attributes($attributes) . '>';
-                
-            case 'date':
-                $attributes['type'] = 'date';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
+                break;
                 
             case 'datetime':
                 $attributes['type'] = 'datetime-local';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
+                break;
                 
             case 'textarea':
-                unset($attributes['type']);
                 $attributes['rows'] = $config['rows'] ?? 4;
-                return '<textarea ' . $this->build_attributes($attributes) . '>' . esc_textarea($value) . '</textarea>';
+                return array(
+                    '<textarea ' . $this->build_attributes($attributes) . '>',
+                    array($field_name, 'text'),
+                    '</textarea>'
+                );
                 
             case 'select':
-                unset($attributes['type']);
-                $html = '<select ' . $this->build_attributes($attributes) . '>';
+                $segments = array('<select ' . $this->build_attributes($attributes) . '>');
                 foreach ($config['options'] as $option_value => $option_label) {
-                    $selected = ($option_value == $value) ? ' selected' : '';
-                    $html .= '<option value="' . esc_attr($option_value) . '"' . $selected . '>' . esc_html($option_label) . '</option>';
+                    $segments[] = '<option value="' . esc_attr($option_value) . '"';
+                    $segments[] = array($field_name, 'selected', $option_value);
+                    $segments[] = '>' . esc_html($option_label) . '</option>';
                 }
-                $html .= '</select>';
-                return $html;
+                $segments[] = '</select>';
+                return $segments;
                 
             case 'checkbox':
                 $attributes['type'] = 'checkbox';
                 $attributes['value'] = '1';
-                if ($value) $attributes['checked'] = 'checked';
-                return '<input ' . $this->build_attributes($attributes) . '>';
+                return array(
+                    '<input ' . $this->build_attributes($attributes),
+                    array($field_name, 'checked'),
+                    '>'
+                );
                 
             case 'decimal':
                 $attributes['type'] = 'number';
                 $attributes['step'] = '0.01';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
+                break;
                 
             default:
                 $attributes['type'] = 'text';
-                $attributes['value'] = esc_attr($value);
-                return '<input ' . $this->build_attributes($attributes) . '>';
+                break;
         }
+        
+        return array(
+            '<input ' . $this->build_attributes($attributes) . ' value="',
+            array($field_name, 'value'),
+            '">'
+        );
     }
     
     /**
@@ -418,6 +544,62 @@ class CAH_Form_Generator {
         return implode(' ', $attr_strings);
     }
     
+    /**
+     * Cache version: plugin version (field configs) + schema version
+     */
+    private static function get_cache_version() {
+        return (defined('CAH_PLUGIN_VERSION') ? CAH_PLUGIN_VERSION : '0') . '-' . intval(get_option(self::CACHE_VERSION_OPTION, 0));
+    }
+    
+    /**
+     * Directory of the disk cache (used without persistent object cache)
+     */
+    private static function get_cache_dir() {
+        $upload_dir = wp_upload_dir(null, false);
+        return trailingslashit($upload_dir['basedir']) . 'cah-form-cache';
+    }
+    
+    private function read_cache_file($cache_key) {
+        $file = self::get_cache_dir() . '/' . $cache_key . '.json';
+        
+        if (!is_readable($file)) {
+            return false;
+        }
+        
+        $compiled = json_decode(file_get_contents($file), true);
+        
+        return is_array($compiled) && isset($compiled['segments']) ? $compiled : false;
+    }
+    
+    private function write_cache_file($cache_key, $compiled) {
+        $directory = self::get_cache_dir();
+        
+        if (!wp_mkdir_p($directory)) {
+            return;
+        }
+        
+        // Write to a temporary file first so concurrent requests never read half a form
+        $file = $directory . '/' . $cache_key . '.json';
+        $temp_file = $file . '.' . uniqid('', true);
+        
+        if (file_put_contents($temp_file, wp_json_encode($compiled)) === false || !@rename($temp_file, $file)) {
+            @unlink($temp_file);
+        }
+    }
+    
+    /**
+     * Invalidate all compiled forms (hooked to cah_schema_updated)
+     */
+    public static function flush_cache() {
+        update_option(self::CACHE_VERSION_OPTION, intval(get_option(self::CACHE_VERSION_OPTION, 0)) + 1);
+        self::$compiled = array();
+        
+        // Old versions are never read again; remove them from disk
+        foreach (glob(self::get_cache_dir() . '/*.json') ?: array() as $file) {
+            @unlink($file);
+        }
+    }
+    
     /**
      * Generate JavaScript for form validation
      */
@@ -215,6 +215,7 @@ class CAH_Import_Export_Manager {
         
         // Get header
         $header = str_getcsv($lines[0], ';');
+        $created_case_ids = array();
         
         // Process each row
         for ($i = 1; $i < count($lines); $i++) {
@@ -250,6 +251,9 @@ class CAH_Import_Export_Manager {
                 
                 if ($insert_result['success']) {
                     $results['success']++;
+                    if ($table_name === 'klage_cases') {
+                        $created_case_ids[] = $insert_result['id'];
+                    }
                 } else {
                     $results['errors']++;
                     $results['messages'][] = "Row $i: " . $insert_result['message'];
@@ -260,6 +264,14 @@ class CAH_Import_Export_Manager {
             }
         }
         
+        // One cache version bump for the whole import (insert_data only marks it)
+        CAH_Case_Repository::flush_pending();
+        
+        // Follow-up work for all new cases at once (e.g. financial templates)
+        if ($created_case_ids) {
+            do_action('cah_cases_imported', $created_case_ids);
+        }
+        
         return $results;
     }
     
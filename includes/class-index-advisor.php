@@ -0,0 +1,791 @@
+<?php
+/**
+ * Index Advisor - Workload-driven index recommendations
+ * Collects query fingerprints (SAVEQUERIES or MySQL query log), runs EXPLAIN
+ * against them and recommends composite indexes for klage_* and cah_* tables
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Index_Advisor {
+
+    private $wpdb;
+    private $table_prefix;
+    private $schema_manager;
+
+    // Option holding the captured workload (fingerprint => stats)
+    const WORKLOAD_OPTION = 'cah_index_advisor_workload';
+
+    // Option toggling SAVEQUERIES capture at shutdown
+    const CAPTURE_OPTION = 'cah_index_advisor_capture';
+
+    // Upper bound of distinct fingerprints kept in the workload
+    const MAX_FINGERPRINTS = 250;
+
+    // Rows sampled when estimating column selectivity
+    const SELECTIVITY_SAMPLE = 10000;
+
+    // One request in n is captured (counts are scaled back up)
+    const CAPTURE_SAMPLE_RATE = 10;
+
+    // Captured requests collect here and are merged into the workload option
+    // once FLUSH_REQUESTS requests or FLUSH_SECONDS have passed
+    const BUFFER_TRANSIENT = 'cah_index_advisor_buffer';
+    const FLUSH_REQUESTS = 20;
+    const FLUSH_SECONDS = 300;
+
+    // Cached result of analyze()
+    const ANALYSIS_TRANSIENT = 'cah_index_advisor_analysis';
+
+    private static $hooks_registered = false;
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->table_prefix = $wpdb->prefix;
+        $this->schema_manager = new CAH_Schema_Manager();
+    }
+
+    /**
+     * Capture queries of every request (front end, REST, cron, admin) while
+     * capture is enabled - the advisor itself is only loaded in the admin
+     */
+    public static function register_hooks() {
+        if (self::$hooks_registered || !defined('SAVEQUERIES') || !SAVEQUERIES || !get_option(self::CAPTURE_OPTION)) {
+            return;
+        }
+        self::$hooks_registered = true;
+
+        if (mt_rand(1, self::CAPTURE_SAMPLE_RATE) !== 1) {
+            return;
+        }
+
+        add_action('shutdown', function() {
+            $advisor = new self();
+            $advisor->capture_saved_queries();
+        });
+    }
+
+    /**
+     * Capture plugin queries recorded by SAVEQUERIES for the current (sampled) request
+     * Buffered in a transient; the workload option is written by flush_buffer()
+     */
+    public function capture_saved_queries() {
+        if (!defined('SAVEQUERIES') || !SAVEQUERIES || empty($this->wpdb->queries)) {
+            return;
+        }
+
+        $queries = array();
+        foreach ($this->wpdb->queries as $query_info) {
+            $queries[] = array(
+                'sql' => $query_info[0],
+                'time' => floatval($query_info[1] ?? 0)
+            );
+        }
+
+        $entries = $this->aggregate_queries($queries, self::CAPTURE_SAMPLE_RATE);
+        if (empty($entries)) {
+            return;
+        }
+
+        $buffer = get_transient(self::BUFFER_TRANSIENT);
+        if (!is_array($buffer)) {
+            $buffer = array('started' => time(), 'requests' => 0, 'entries' => array());
+        }
+
+        $buffer['entries'] = $this->merge_entries($buffer['entries'], $entries);
+        $buffer['requests']++;
+
+        if ($buffer['requests'] >= self::FLUSH_REQUESTS || time() - $buffer['started'] >= self::FLUSH_SECONDS) {
+            delete_transient(self::BUFFER_TRANSIENT);
+            $this->store_entries($buffer['entries']);
+        } else {
+            set_transient(self::BUFFER_TRANSIENT, $buffer, DAY_IN_SECONDS);
+        }
+    }
+
+    /**
+     * Merge buffered captures into the workload (before it is shown or analyzed)
+     */
+    public function flush_buffer() {
+        $buffer = get_transient(self::BUFFER_TRANSIENT);
+
+        if (is_array($buffer)) {
+            delete_transient(self::BUFFER_TRANSIENT);
+            $this->store_entries($buffer['entries']);
+        }
+    }
+
+    /**
+     * Import queries from a MySQL general or slow query log file
+     * Only files below the uploads directory are read (copy the log there first)
+     */
+    public function import_query_log($file_path) {
+        $upload_dir = wp_upload_dir(null, false);
+        $base_dir = realpath($upload_dir['basedir']);
+        // Relative paths are relative to the uploads directory
+        $real_path = realpath(path_join($upload_dir['basedir'], trim($file_path)));
+
+        // Reject paths that resolve outside the uploads directory (../, symlinks)
+        if ($real_path === false || $base_dir === false
+            || strpos($real_path, trailingslashit($base_dir)) !== 0 || !is_file($real_path)) {
+            return array('success' => false, 'message' => 'Query log must be a file inside the uploads directory: ' . $file_path);
+        }
+
+        $file_path = $real_path;
+
+        if (!is_readable($file_path)) {
+            return array('success' => false, 'message' => 'Query log is not readable: ' . $file_path);
+        }
+
+        $handle = fopen($file_path, 'r');
+        if (!$handle) {
+            return array('success' => false, 'message' => 'Failed to open query log');
+        }
+
+        $queries = array();
+        $statement = '';
+
+        // Read line by line - logs can be several gigabytes
+        while (($line = fgets($handle)) !== false) {
+            $line = rtrim($line);
+
+            // Skip slow log headers and session statements
+            if ($line === '' || strpos($line, '#') === 0 || preg_match('/^(SET timestamp|use )/i', $line)) {
+                continue;
+            }
+
+            // Strip general log prefix: "<time> <thread id> Query <sql>"
+            if (preg_match('/^(?:\S+\s+)?\d+\s+Query\s+(.*)$/', $line, $matches)) {
+                $this->append_log_statement($queries, $statement);
+                $statement = $matches[1];
+            } else {
+                $statement .= ' ' . $line;
+            }
+
+            if (substr($statement, -1) === ';') {
+                $this->append_log_statement($queries, $statement);
+                $statement = '';
+            }
+
+            // Flush in chunks to keep memory bounded
+            if (count($queries) >= 1000) {
+                $this->record_queries($queries);
+                $queries = array();
+            }
+        }
+
+        $this->append_log_statement($queries, $statement);
+        fclose($handle);
+
+        $this->record_queries($queries);
+
+        return array('success' => true, 'message' => 'Query log imported successfully');
+    }
+
+    /**
+     * Append a finished log statement to the import buffer
+     */
+    private function append_log_statement(&$queries, $statement) {
+        $statement = trim(rtrim(trim($statement), ';'));
+        if ($statement !== '') {
+            $queries[] = array('sql' => $statement, 'time' => 0);
+        }
+    }
+
+    /**
+     * Merge queries into the stored workload
+     */
+    public function record_queries($queries) {
+        $this->store_entries($this->aggregate_queries($queries));
+    }
+
+    /**
+     * Plugin queries by fingerprint (md5 => fingerprint, sample, count, total_time)
+     * $weight scales counts and times of sampled requests
+     */
+    private function aggregate_queries($queries, $weight = 1) {
+        $entries = array();
+
+        foreach ($queries as $query) {
+            $sql = trim($query['sql']);
+
+            if (!$this->is_plugin_query($sql)) {
+                continue;
+            }
+
+            $fingerprint = $this->fingerprint_query($sql);
+            $key = md5($fingerprint);
+
+            if (!isset($entries[$key])) {
+                $entries[$key] = array(
+                    'fingerprint' => $fingerprint,
+                    'sample' => $sql,
+                    'count' => 0,
+                    'total_time' => 0
+                );
+            }
+
+            $entries[$key]['count'] += $weight;
+            $entries[$key]['total_time'] += $query['time'] * $weight;
+        }
+
+        return $entries;
+    }
+
+    /**
+     * Add aggregated entries to a workload (new fingerprints up to MAX_FINGERPRINTS)
+     */
+    private function merge_entries($workload, $entries) {
+        foreach ($entries as $key => $entry) {
+            if (isset($workload[$key])) {
+                $workload[$key]['count'] += $entry['count'];
+                $workload[$key]['total_time'] += $entry['total_time'];
+            } elseif (count($workload) < self::MAX_FINGERPRINTS) {
+                $workload[$key] = $entry;
+            }
+        }
+
+        return $workload;
+    }
+
+    /**
+     * Write aggregated entries to the workload option (one write)
+     */
+    private function store_entries($entries) {
+        if (empty($entries)) {
+            return;
+        }
+
+        update_option(self::WORKLOAD_OPTION, $this->merge_entries(get_option(self::WORKLOAD_OPTION, array()), $entries), false);
+        $this->invalidate_analysis();
+    }
+
+    /**
+     * Drop the cached analysis (workload or indexes changed)
+     */
+    public function invalidate_analysis() {
+        delete_transient(self::ANALYSIS_TRANSIENT);
+    }
+
+    /**
+     * Get captured workload sorted by frequency
+     */
+    public function get_workload() {
+        $this->flush_buffer();
+
+        $workload = get_option(self::WORKLOAD_OPTION, array());
+
+        uasort($workload, function($a, $b) {
+            return $b['count'] - $a['count'];
+        });
+
+        return $workload;
+    }
+
+    /**
+     * Clear captured workload
+     */
+    public function clear_workload() {
+        delete_option(self::WORKLOAD_OPTION);
+        delete_transient(self::BUFFER_TRANSIENT);
+        $this->invalidate_analysis();
+
+        return array('success' => true, 'message' => 'Captured workload cleared');
+    }
+
+    /**
+     * Enable or disable SAVEQUERIES capture
+     */
+    public function set_capture_enabled($enabled) {
+        update_option(self::CAPTURE_OPTION, $enabled ? 1 : 0);
+    }
+
+    /**
+     * Check whether SAVEQUERIES capture is enabled
+     */
+    public function is_capture_enabled() {
+        return (bool) get_option(self::CAPTURE_OPTION);
+    }
+
+    /**
+     * Check whether a statement touches plugin tables and can be explained
+     */
+    private function is_plugin_query($sql) {
+        if (!preg_match('/^\s*(SELECT|UPDATE|DELETE)\b/i', $sql)) {
+            return false;
+        }
+
+        // Never explain multi-statement input
+        if (strpos(rtrim($sql, "; \n\t"), ';') !== false) {
+            return false;
+        }
+
+        return (bool) preg_match('/\b' . preg_quote($this->table_prefix, '/') . '(klage_|cah_)\w+/', $sql);
+    }
+
+    /**
+     * Normalize a query to its fingerprint (literals replaced by ?)
+     */
+    public function fingerprint_query($sql) {
+        $fingerprint = preg_replace("/'(?:[^'\\\\]|\\\\.)*'/", '?', $sql);
+        $fingerprint = preg_replace('/"(?:[^"\\\\]|\\\\.)*"/', '?', $fingerprint);
+        $fingerprint = preg_replace('/\b\d+(\.\d+)?\b/', '?', $fingerprint);
+        $fingerprint = preg_replace('/\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)/i', 'IN (?)', $fingerprint);
+        $fingerprint = preg_replace('/\s+/', ' ', $fingerprint);
+
+        return trim($fingerprint);
+    }
+
+    /**
+     * Analysis of the captured workload, limited to one table if given
+     * The full analysis (EXPLAIN of every fingerprint) is cached until the
+     * workload or an index changes.
+     */
+    public function analyze($table_name = null) {
+        $analysis = get_transient(self::ANALYSIS_TRANSIENT);
+
+        if (!is_array($analysis)) {
+            $analysis = $this->run_analysis();
+            set_transient(self::ANALYSIS_TRANSIENT, $analysis, HOUR_IN_SECONDS);
+        }
+
+        if ($table_name === null) {
+            return $analysis;
+        }
+
+        foreach (array('recommendations', 'redundant_indexes', 'unused_indexes') as $list) {
+            $analysis[$list] = array_values(array_filter($analysis[$list], function($entry) use ($table_name) {
+                return $entry['table'] === $table_name;
+            }));
+        }
+
+        return $analysis;
+    }
+
+    /**
+     * Analyze the captured workload (EXPLAIN every fingerprint)
+     */
+    private function run_analysis() {
+        $workload = $this->get_workload();
+
+        $candidates = array();
+        $used_indexes = array();
+        $explain_errors = array();
+
+        foreach ($workload as $key => $entry) {
+            $explain = $this->wpdb->get_results('EXPLAIN ' . $entry['sample'], ARRAY_A);
+
+            if (empty($explain)) {
+                $explain_errors[$key] = $this->wpdb->last_error ?: 'EXPLAIN returned no rows';
+                continue;
+            }
+
+            $tables = $this->extract_tables($entry['sample']);
+
+            foreach ($explain as $row) {
+                $table_name = $this->resolve_explain_table($row['table'] ?? '', $tables);
+                if (!$table_name) {
+                    continue;
+                }
+
+                if (!empty($row['key'])) {
+                    $used_indexes[$table_name][$row['key']] = true;
+                }
+
+                $rows_examined = intval($row['rows'] ?? 0);
+                $full_scan = ($row['type'] ?? '') === 'ALL' || ($row['type'] ?? '') === 'index' || empty($row['key']);
+
+                if (!$full_scan || $rows_examined < 2) {
+                    continue;
+                }
+
+                $columns = $this->extract_index_columns($entry['sample'], $table_name, $tables);
+                if (empty($columns)) {
+                    continue;
+                }
+
+                $candidate_key = $table_name . ':' . implode(',', $columns);
+
+                if (!isset($candidates[$candidate_key])) {
+                    $candidates[$candidate_key] = array(
+                        'table' => $table_name,
+                        'columns' => $columns,
+                        'fingerprints' => array(),
+                        'rows_before' => 0,
+                        'executions' => 0
+                    );
+                }
+
+                $candidates[$candidate_key]['fingerprints'][] = $entry['fingerprint'];
+                $candidates[$candidate_key]['rows_before'] += $rows_examined * $entry['count'];
+                $candidates[$candidate_key]['executions'] += $entry['count'];
+            }
+        }
+
+        return array(
+            'recommendations' => $this->build_recommendations($candidates),
+            'redundant_indexes' => $this->find_redundant_indexes(),
+            'unused_indexes' => $this->find_unused_indexes($used_indexes, !empty($workload)),
+            'explain_errors' => $explain_errors,
+            'fingerprint_count' => count($workload)
+        );
+    }
+
+    /**
+     * Turn index candidates into recommendations with savings estimates
+     */
+    private function build_recommendations($candidates) {
+        $recommendations = array();
+
+        foreach ($candidates as $candidate) {
+            $indexes = $this->schema_manager->get_table_indexes($candidate['table']);
+            if (isset($indexes['error']) || $this->is_covered_by_existing_index($candidate['columns'], $indexes)) {
+                continue;
+            }
+
+            $rows_per_lookup = $this->estimate_rows_per_lookup($candidate['table'], $candidate['columns']);
+            $rows_after = $rows_per_lookup * $candidate['executions'];
+            $savings = max(0, $candidate['rows_before'] - $rows_after);
+
+            if ($savings <= 0) {
+                continue;
+            }
+
+            $recommendations[] = array(
+                'table' => $candidate['table'],
+                'index_name' => $this->build_index_name($candidate['columns']),
+                'columns' => $candidate['columns'],
+                'sql' => 'ALTER TABLE ' . $this->table_prefix . $candidate['table'] . ' ADD INDEX ' . $this->build_index_name($candidate['columns']) . ' (' . implode(', ', $candidate['columns']) . ')',
+                'fingerprints' => array_values(array_unique($candidate['fingerprints'])),
+                'executions' => $candidate['executions'],
+                'rows_examined_before' => $candidate['rows_before'],
+                'rows_examined_after' => $rows_after,
+                'estimated_savings' => $savings
+            );
+        }
+
+        usort($recommendations, function($a, $b) {
+            return $b['estimated_savings'] <=> $a['estimated_savings'];
+        });
+
+        return $recommendations;
+    }
+
+    /**
+     * Extract plugin tables and their aliases from a statement
+     */
+    private function extract_tables($sql) {
+        $tables = array();
+        $pattern = '/\b(?:FROM|JOIN|UPDATE|INTO)\s+`?' . preg_quote($this->table_prefix, '/') . '((?:klage_|cah_)\w+)`?(?:\s+(?:AS\s+)?(?!WHERE|SET|ON|LEFT|RIGHT|INNER|JOIN|ORDER|GROUP|LIMIT|USING)(\w+))?/i';
+
+        if (preg_match_all($pattern, $sql, $matches, PREG_SET_ORDER)) {
+            foreach ($matches as $match) {
+                $table_name = $match[1];
+                $alias = !empty($match[2]) ? $match[2] : $this->table_prefix . $table_name;
+                $tables[$alias] = $table_name;
+                $tables[$this->table_prefix . $table_name] = $table_name;
+            }
+        }
+
+        return $tables;
+    }
+
+    /**
+     * Map the table column of an EXPLAIN row back to a plugin table
+     */
+    private function resolve_explain_table($explain_table, $tables) {
+        return $tables[$explain_table] ?? null;
+    }
+
+    /**
+     * Derive composite index columns: equality columns first, then one range or ORDER BY column
+     */
+    private function extract_index_columns($sql, $table_name, $tables) {
+        $schema = $this->schema_manager->get_current_table_schema($table_name);
+        if (!$schema) {
+            return array();
+        }
+
+        $aliases = array_keys($tables, $table_name, true);
+        $single_table = count(array_unique(array_values($tables))) === 1;
+
+        $equality = array();
+        $range = array();
+
+        // JOIN ... ON conditions act as equality lookups on the joined table
+        if (preg_match_all('/\bON\s+(.+?)(?=\b(?:LEFT|RIGHT|INNER|JOIN|WHERE|GROUP|ORDER|LIMIT)\b|$)/is', $sql, $on_matches)) {
+            foreach ($on_matches[1] as $on_clause) {
+                $this->collect_conditions($on_clause, $aliases, $single_table, $schema, $equality, $range);
+            }
+        }
+
+        if (preg_match('/\bWHERE\s+(.+?)(?=\b(?:GROUP\s+BY|ORDER\s+BY|LIMIT|HAVING)\b|$)/is', $sql, $where_match)) {
+            $this->collect_conditions($where_match[1], $aliases, $single_table, $schema, $equality, $range);
+        }
+
+        $columns = array_values(array_unique($equality));
+
+        if (!empty($range)) {
+            $columns[] = $range[0];
+        } elseif (preg_match('/\bORDER\s+BY\s+(.+?)(?=\bLIMIT\b|$)/is', $sql, $order_match)) {
+            // ORDER BY columns can only use the index after a full equality prefix
+            foreach (explode(',', $order_match[1]) as $order_part) {
+                if (preg_match('/^\s*(?:(\w+)\.)?`?(\w+)`?/', $order_part, $col_match)) {
+                    if ($this->column_belongs_to_table($col_match[1], $col_match[2], $aliases, $single_table, $schema)) {
+                        $columns[] = $col_match[2];
+                    }
+                }
+            }
+        }
+
+        $columns = array_values(array_unique($columns));
+
+        // Primary key lookups never need a secondary index
+        if ($columns === array('id')) {
+            return array();
+        }
+
+        return array_slice($columns, 0, 4);
+    }
+
+    /**
+     * Collect equality and range columns from a condition list
+     */
+    private function collect_conditions($clause, $aliases, $single_table, $schema, &$equality, &$range) {
+        $pattern = '/(?:(\w+)\.)?`?(\w+)`?\s*(<=>|=|IN\s*\(|IS\s+NULL|BETWEEN|>=|<=|>|<|LIKE\s+\'[^%])/i';
+
+        if (!preg_match_all($pattern, $clause, $matches, PREG_SET_ORDER)) {
+            return;
+        }
+
+        foreach ($matches as $match) {
+            $alias = $match[1];
+            $column = $match[2];
+            $operator = strtoupper(preg_replace('/\s+/', ' ', $match[3]));
+
+            if (!$this->column_belongs_to_table($alias, $column, $aliases, $single_table, $schema)) {
+                continue;
+            }
+
+            if ($operator === '=' || $operator === '<=>' || strpos($operator, 'IN') === 0 || strpos($operator, 'IS NULL') === 0) {
+                $equality[] = $column;
+            } else {
+                $range[] = $column;
+            }
+        }
+    }
+
+    /**
+     * Check whether a (possibly aliased) column reference belongs to the table
+     */
+    private function column_belongs_to_table($alias, $column, $aliases, $single_table, $schema) {
+        if (!isset($schema['columns'][$column])) {
+            return false;
+        }
+
+        if ($alias === '' || $alias === null) {
+            return $single_table;
+        }
+
+        return in_array($alias, $aliases, true);
+    }
+
+    /**
+     * Check whether an existing index already starts with the candidate columns
+     */
+    private function is_covered_by_existing_index($columns, $indexes) {
+        foreach ($indexes as $index) {
+            if (array_slice($index['columns'], 0, count($columns)) === $columns) {
+                return true;
+            }
+        }
+
+        return false;
+    }
+
+    /**
+     * Estimate rows examined per lookup once the index exists
+     */
+    private function estimate_rows_per_lookup($table_name, $columns) {
+        $full_table_name = $this->table_prefix . $table_name;
+
+        $status = $this->wpdb->get_row("SHOW TABLE STATUS LIKE '$full_table_name'", ARRAY_A);
+        $table_rows = max(1, intval($status['Rows'] ?? 0));
+
+        $column_list = implode(', ', $columns);
+        $sample_size = self::SELECTIVITY_SAMPLE;
+
+        $sample_rows = intval($this->wpdb->get_var(
+            "SELECT COUNT(*) FROM (SELECT $column_list FROM $full_table_name LIMIT $sample_size) s"
+        ));
+        $distinct = intval($this->wpdb->get_var(
+            "SELECT COUNT(DISTINCT $column_list) FROM (SELECT $column_list FROM $full_table_name LIMIT $sample_size) s"
+        ));
+
+        if ($sample_rows === 0 || $distinct === 0) {
+            return 1;
+        }
+
+        return max(1, (int) ceil($table_rows * ($sample_rows / $distinct) / $sample_rows));
+    }
+
+    /**
+     * Build an index name from its columns
+     */
+    private function build_index_name($columns) {
+        return substr('idx_' . implode('_', $columns), 0, 64);
+    }
+
+    /**
+     * Find indexes that are a left prefix of another index on the same table
+     */
+    public function find_redundant_indexes() {
+        $redundant = array();
+
+        foreach ($this->get_plugin_tables() as $table_name) {
+            $indexes = $this->schema_manager->get_table_indexes($table_name);
+            if (isset($indexes['error'])) {
+                continue;
+            }
+
+            foreach ($indexes as $index_name => $index) {
+                if ($index['primary'] || $index['unique']) {
+                    continue;
+                }
+
+                foreach ($indexes as $other_name => $other) {
+                    if ($other_name === $index_name || count($other['columns']) < count($index['columns'])) {
+                        continue;
+                    }
+
+                    // Identical indexes: only flag one of the pair
+                    if ($other['columns'] === $index['columns'] && strcmp($other_name, $index_name) > 0 && !$other['primary'] && !$other['unique']) {
+                        continue;
+                    }
+
+                    if (array_slice($other['columns'], 0, count($index['columns'])) === $index['columns']) {
+                        $redundant[] = array(
+                            'table' => $table_name,
+                            'index_name' => $index_name,
+                            'columns' => $index['columns'],
+                            'covered_by' => $other_name
+                        );
+                        break;
+                    }
+                }
+            }
+        }
+
+        return $redundant;
+    }
+
+    /**
+     * Find indexes not used by the captured workload or server statistics
+     */
+    private function find_unused_indexes($used_indexes, $has_workload) {
+        if (!$has_workload) {
+            return array();
+        }
+
+        // MariaDB with userstat / MySQL performance_schema provide real usage data
+        $server_usage = $this->get_server_index_usage();
+
+        $unused = array();
+
+        foreach ($this->get_plugin_tables() as $table_name) {
+            $indexes = $this->schema_manager->get_table_indexes($table_name);
+            if (isset($indexes['error'])) {
+                continue;
+            }
+
+            foreach ($indexes as $index_name => $index) {
+                if ($index['primary'] || $index['unique']) {
+                    continue;
+                }
+
+                if (isset($used_indexes[$table_name][$index_name]) || isset($server_usage[$table_name][$index_name])) {
+                    continue;
+                }
+
+                $unused[] = array(
+                    'table' => $table_name,
+                    'index_name' => $index_name,
+                    'columns' => $index['columns'],
+                    'source' => $server_usage === null ? 'workload' : 'server_statistics'
+                );
+            }
+        }
+
+        return $unused;
+    }
+
+    /**
+     * Read index usage from the server, null if unavailable
+     */
+    private function get_server_index_usage() {
+        $schema_name = DB_NAME;
+
+        $this->wpdb->suppress_errors(true);
+
+        $rows = $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name FROM information_schema.INDEX_STATISTICS WHERE TABLE_SCHEMA = %s AND ROWS_READ > 0",
+            $schema_name
+        ), ARRAY_A);
+
+        if (empty($rows) && $this->wpdb->last_error) {
+            $rows = $this->wpdb->get_results($this->wpdb->prepare(
+                "SELECT OBJECT_NAME AS table_name, INDEX_NAME AS index_name FROM performance_schema.table_io_waits_summary_by_index_usage WHERE OBJECT_SCHEMA = %s AND INDEX_NAME IS NOT NULL AND COUNT_STAR > 0",
+                $schema_name
+            ), ARRAY_A);
+        }
+
+        $has_error = !empty($this->wpdb->last_error);
+        $this->wpdb->suppress_errors(false);
+
+        if ($has_error) {
+            return null;
+        }
+
+        $usage = array();
+        foreach ($rows as $row) {
+            $table_name = substr($row['table_name'], strlen($this->table_prefix));
+            $usage[$table_name][$row['index_name']] = true;
+        }
+
+        return $usage;
+    }
+
+    /**
+     * List existing klage_* and cah_* tables (without prefix)
+     */
+    public function get_plugin_tables() {
+        $tables = array();
+
+        foreach (array('klage_', 'cah_') as $table_group) {
+            $like = $this->wpdb->esc_like($this->table_prefix . $table_group) . '%';
+            $found = $this->wpdb->get_col($this->wpdb->prepare('SHOW TABLES LIKE %s', $like));
+
+            foreach ($found as $full_table_name) {
+                $tables[] = substr($full_table_name, strlen($this->table_prefix));
+            }
+        }
+
+        return $tables;
+    }
+
+    /**
+     * Apply a recommendation through the schema manager
+     */
+    public function apply_recommendation($table_name, $index_name, $columns) {
+        if (!preg_match('/^(klage_|cah_)\w+$/', $table_name)) {
+            return array('success' => false, 'message' => 'Index advisor only manages klage_* and cah_* tables');
+        }
+
+        $this->invalidate_analysis();
+
+        return $this->schema_manager->add_index($table_name, $index_name, $columns);
+    }
+}
@@ -0,0 +1,422 @@
+<?php
+/**
+ * Mail Stream Parser - Incremental mbox/EML/ZIP parser for evidence imports
+ * Archives are read line by line; every MIME leaf part is decoded on the fly
+ * into a php://temp stream (spills to disk above MEMORY_LIMIT) and hashed
+ * while it is written, so no message or attachment is held in memory as a whole.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Mail_Stream_Parser {
+
+    const READ_LENGTH = 8192;
+    const MAX_HEADER_BYTES = 262144;
+    const MEMORY_LIMIT = 1048576;
+
+    // Message callback and name of the file being parsed
+    private $callback;
+    private $source = '';
+
+    // State of the current message (null = between messages)
+    private $state = null;
+    private $header_buffer = '';
+    private $headers = array();
+    private $boundaries = array();
+    private $parts = array();
+    private $part = null;
+
+    /**
+     * Parse a mbox file, an EML file or a ZIP archive containing those
+     * $callback receives each message: array('source', 'headers', 'parts'),
+     * see open_part() for the part fields. Returns the number of messages.
+     */
+    public function parse_file($path, $callback, $name = '') {
+        $name = $name ?: basename($path);
+
+        if (strtolower(pathinfo($name, PATHINFO_EXTENSION)) === 'zip') {
+            return $this->parse_zip($path, $callback, $name);
+        }
+
+        $handle = @fopen($path, 'rb');
+        if (!$handle) {
+            return new WP_Error('evidence_unreadable', 'Datei konnte nicht gelesen werden: ' . $name);
+        }
+
+        $count = $this->parse_stream($handle, $callback, $name);
+        fclose($handle);
+
+        return $count;
+    }
+
+    /**
+     * Parse .eml/.mbox entries of a ZIP archive (entries are streamed, not extracted)
+     */
+    private function parse_zip($path, $callback, $name) {
+        if (!class_exists('ZipArchive')) {
+            return new WP_Error('evidence_zip_unavailable', 'ZIP-Archive benötigen die PHP-Erweiterung zip');
+        }
+
+        $zip = new ZipArchive();
+        if ($zip->open($path) !== true) {
+            return new WP_Error('evidence_zip_invalid', 'ZIP-Archiv konnte nicht geöffnet werden: ' . $name);
+        }
+
+        $count = 0;
+
+        for ($index = 0; $index < $zip->numFiles; $index++) {
+            $entry = $zip->getNameIndex($index);
+            if (!preg_match('/\.(eml|mbox|mbx)$/i', $entry)) {
+                continue;
+            }
+
+            $stream = $zip->getStream($entry);
+            if ($stream) {
+                $count += $this->parse_stream($stream, $callback, $name . '/' . $entry);
+                fclose($stream);
+            }
+        }
+
+        $zip->close();
+
+        return $count;
+    }
+
+    /**
+     * Parse an open stream: mbox if it starts with a "From " line, otherwise one message
+     */
+    public function parse_stream($handle, $callback, $source = '') {
+        $this->callback = $callback;
+        $this->source = $source;
+
+        $count = 0;
+        $is_mbox = null;
+        $at_line_start = true;
+        $previous_blank = true;
+
+        while (($line = fgets($handle, self::READ_LENGTH)) !== false) {
+            $complete = substr($line, -1) === "\n";
+
+            if ($at_line_start) {
+                if ($is_mbox === null) {
+                    $is_mbox = strncmp($line, 'From ', 5) === 0;
+                }
+
+                if ($is_mbox) {
+                    // Envelope line: starts the next message
+                    if ($previous_blank && strncmp($line, 'From ', 5) === 0) {
+                        $count += $this->finish_message();
+                        $this->start_message();
+                        $at_line_start = $complete;
+                        $previous_blank = false;
+                        continue;
+                    }
+
+                    // mboxrd escaping of body lines starting with "From "
+                    if (preg_match('/^>+From /', $line)) {
+                        $line = substr($line, 1);
+                    }
+                }
+
+                $previous_blank = $complete && trim($line) === '';
+            }
+
+            if ($this->state === null) {
+                $this->start_message();
+            }
+
+            $this->process_line($line, $at_line_start, $complete);
+            $at_line_start = $complete;
+        }
+
+        $count += $this->finish_message();
+
+        return $count;
+    }
+
+    private function start_message() {
+        $this->state = 'headers';
+        $this->header_buffer = '';
+        $this->headers = array();
+        $this->boundaries = array();
+        $this->parts = array();
+        $this->part = null;
+    }
+
+    /**
+     * Hand the parsed message to the callback and release its part streams
+     * Returns 1 if a message was emitted
+     */
+    private function finish_message() {
+        if ($this->state === null) {
+            return 0;
+        }
+
+        if ($this->state === 'headers') {
+            $this->headers = $this->parse_headers($this->header_buffer);
+        }
+        $this->close_part();
+
+        $message = array(
+            'source' => $this->source,
+            'headers' => $this->headers,
+            'parts' => $this->parts
+        );
+
+        $this->state = null;
+        $this->parts = array();
+
+        // Blank lines before the first message of a file
+        if (empty($message['headers']) && empty($message['parts'])) {
+            return 0;
+        }
+
+        try {
+            call_user_func($this->callback, $message);
+        } finally {
+            foreach ($message['parts'] as $part) {
+                fclose($part['stream']);
+            }
+        }
+
+        return 1;
+    }
+
+    private function process_line($line, $at_line_start, $complete) {
+        if ($this->state === 'headers' || $this->state === 'part_headers') {
+            if ($at_line_start && $complete && rtrim($line, "\r\n") === '') {
+                $headers = $this->parse_headers($this->header_buffer);
+                $this->header_buffer = '';
+
+                if ($this->state === 'headers') {
+                    $this->headers = $headers;
+                }
+                $this->begin_entity($headers);
+            } elseif (strlen($this->header_buffer) < self::MAX_HEADER_BYTES) {
+                $this->header_buffer .= $line;
+            }
+            return;
+        }
+
+        // Boundary lines close the current part (innermost multipart first)
+        if ($at_line_start && $this->boundaries && strncmp($line, '--', 2) === 0) {
+            $marker = rtrim($line);
+
+            for ($level = count($this->boundaries) - 1; $level >= 0; $level--) {
+                $boundary = '--' . $this->boundaries[$level];
+
+                if ($marker === $boundary) {
+                    $this->close_part();
+                    array_splice($this->boundaries, $level + 1);
+                    $this->state = 'part_headers';
+                    return;
+                }
+
+                if ($marker === $boundary . '--') {
+                    $this->close_part();
+                    array_splice($this->boundaries, $level);
+                    $this->state = 'epilogue';
+                    return;
+                }
+            }
+        }
+
+        if ($this->state === 'body' && $this->part) {
+            $this->write_part($line, $complete);
+        }
+    }
+
+    /**
+     * Start a message or part body: multipart container or leaf part
+     */
+    private function begin_entity($headers) {
+        $content_type = self::parse_header_value($headers['content-type'] ?? 'text/plain');
+
+        if (strpos($content_type['value'], 'multipart/') === 0 && !empty($content_type['params']['boundary'])) {
+            $this->boundaries[] = $content_type['params']['boundary'];
+            $this->state = 'preamble';
+            return;
+        }
+
+        $this->open_part($headers, $content_type);
+        $this->state = 'body';
+    }
+
+    private function open_part($headers, $content_type) {
+        $disposition = self::parse_header_value($headers['content-disposition'] ?? '');
+        $filename = $disposition['params']['filename'] ?? ($content_type['params']['name'] ?? '');
+
+        $this->part = array(
+            'content_type' => $content_type['value'] ?: 'text/plain',
+            'charset' => strtolower($content_type['params']['charset'] ?? ''),
+            'filename' => sanitize_file_name(self::decode_header($filename)),
+            'attachment' => $disposition['value'] === 'attachment' || $filename !== '',
+            'encoding' => strtolower(trim($headers['content-transfer-encoding'] ?? '7bit')),
+            'stream' => fopen('php://temp/maxmemory:' . self::MEMORY_LIMIT, 'w+b'),
+            'hash' => hash_init('sha256'),
+            'size' => 0,
+            'sha256' => '',
+            'base64_buffer' => '',
+            'pending_eols' => 0,
+            'pending_eol' => ''
+        );
+    }
+
+    /**
+     * Decode one line (or chunk of a long line) into the part stream
+     */
+    private function write_part($line, $complete) {
+        $part = &$this->part;
+
+        if ($part['encoding'] === 'base64') {
+            $part['base64_buffer'] .= preg_replace('/[^A-Za-z0-9+\/]/', '', $line);
+            $usable = strlen($part['base64_buffer']) - strlen($part['base64_buffer']) % 4;
+
+            if ($usable > 0) {
+                $this->write_data(base64_decode(substr($part['base64_buffer'], 0, $usable)));
+                $part['base64_buffer'] = (string) substr($part['base64_buffer'], $usable);
+            }
+            return;
+        }
+
+        $content = rtrim($line, "\r\n");
+        $line_ending = (string) substr($line, strlen($content));
+        $eol = $complete;
+
+        if ($part['encoding'] === 'quoted-printable') {
+            // Soft line break
+            if (substr($content, -1) === '=') {
+                $content = substr($content, 0, -1);
+                $eol = false;
+            }
+            $content = quoted_printable_decode($content);
+        }
+
+        // Other parts are kept byte for byte; the line break before the
+        // boundary belongs to the boundary and is never written
+        if (strpos($part['content_type'], 'text/') !== 0) {
+            $this->write_data($part['pending_eol'] . $content);
+            $part['pending_eol'] = $eol ? $line_ending : '';
+            return;
+        }
+
+        // Text line endings are normalized to \n and trailing blank lines dropped,
+        // so the same text hashes equally in mbox (LF) and EML (CRLF) files
+        if ($content !== '') {
+            if ($part['pending_eols']) {
+                $this->write_data(str_repeat("\n", $part['pending_eols']));
+                $part['pending_eols'] = 0;
+            }
+            $this->write_data($content);
+        }
+
+        if ($eol) {
+            $part['pending_eols']++;
+        }
+    }
+
+    private function write_data($data) {
+        hash_update($this->part['hash'], $data);
+        fwrite($this->part['stream'], $data);
+        $this->part['size'] += strlen($data);
+    }
+
+    private function close_part() {
+        if (!$this->part) {
+            return;
+        }
+
+        if ($this->part['base64_buffer'] !== '') {
+            $this->write_data((string) base64_decode($this->part['base64_buffer']));
+        }
+
+        $this->part['sha256'] = hash_final($this->part['hash']);
+        unset($this->part['hash'], $this->part['base64_buffer'], $this->part['pending_eols'], $this->part['pending_eol']);
+        rewind($this->part['stream']);
+
+        $this->parts[] = $this->part;
+        $this->part = null;
+    }
+
+    /**
+     * Header block -> array(lowercase name => value), first occurrence wins
+     */
+    private function parse_headers($buffer) {
+        $headers = array();
+
+        // Unfold continuation lines
+        $buffer = preg_replace('/\r?\n[ \t]+/', ' ', $buffer);
+
+        foreach (preg_split('/\r?\n/', $buffer) as $line) {
+            $separator = strpos($line, ':');
+            if ($separator === false) {
+                continue;
+            }
+
+            $name = strtolower(trim(substr($line, 0, $separator)));
+            if ($name !== '' && !isset($headers[$name])) {
+                $headers[$name] = trim(substr($line, $separator + 1));
+            }
+        }
+
+        return $headers;
+    }
+
+    /**
+     * 'text/plain; charset="utf-8"' -> array('value' => 'text/plain', 'params' => array('charset' => 'utf-8'))
+     * Supports RFC 2231 parameters (filename*=UTF-8''..., filename*0=...)
+     */
+    public static function parse_header_value($value) {
+        $segments = explode(';', $value, 2);
+        $params = array();
+        $continued = array();
+
+        if (isset($segments[1]) && preg_match_all('/([\w\-]+)(\*\d+)?(\*)?\s*=\s*("(?:[^"\\\\]|\\\\.)*"|[^;]*)/', $segments[1], $matches, PREG_SET_ORDER)) {
+            foreach ($matches as $match) {
+                $name = strtolower($match[1]);
+                $param = trim($match[4]);
+
+                if (strlen($param) > 1 && $param[0] === '"') {
+                    $param = stripslashes(substr($param, 1, -1));
+                }
+
+                // Extended value: charset'language'percent-encoded
+                if ($match[3] !== '') {
+                    $pieces = explode("'", $param, 3);
+                    $param = rawurldecode(end($pieces));
+                }
+
+                if ($match[2] !== '') {
+                    $continued[$name][intval(substr($match[2], 1))] = $param;
+                } elseif (!isset($params[$name])) {
+                    $params[$name] = $param;
+                }
+            }
+        }
+
+        foreach ($continued as $name => $pieces) {
+            ksort($pieces);
+            $params[$name] = implode('', $pieces);
+        }
+
+        return array(
+            'value' => strtolower(trim($segments[0])),
+            'params' => $params
+        );
+    }
+
+    /**
+     * Decode MIME encoded words (=?UTF-8?B?...?=) to UTF-8
+     */
+    public static function decode_header($value) {
+        if (strpos($value, '=?') === false || !function_exists('iconv_mime_decode')) {
+            return $value;
+        }
+
+        $decoded = iconv_mime_decode($value, ICONV_MIME_DECODE_CONTINUE_ON_ERROR, 'UTF-8');
+
+        return $decoded === false ? $value : $decoded;
+    }
+}
@@ -1,6 +1,10 @@
 <?php
 /**
- * N8N Connector class - Simplified version
+ * N8N Connector class - Asynchronous outbound delivery queue
+ * Case payloads are written to klage_n8n_outbox and delivered in batches by
+ * a WP-Cron worker with exponential backoff. Admin requests never block on N8N.
+ * Only the newest pending payload of a case/event is delivered; the worker
+ * also maintains the backlog size used for backpressure and purges old rows.
  */
 
 if (!defined('ABSPATH')) {
@@ -8,32 +12,527 @@ if (!defined('ABSPATH')) {
 }
 
 class CAH_N8N_Connector {
-    
+
     private $n8n_url;
     private $n8n_key;
-    
+    private $wpdb;
+    private $table_name;
+
+    // Reused cURL handle (keeps the connection alive between batches)
+    private $curl_handle = null;
+
+    // Whether the outbox table is known to be current in this request
+    private static $table_checked = false;
+
+    // Whether worker and case hooks are registered
+    private static $hooks_registered = false;
+
+    const WORKER_HOOK = 'cah_n8n_process_queue';
+    const LOCK_TIMEOUT = 600;
+
+    // Outbox layout version (1.1: dedup against pending rows, no unique version key)
+    const TABLE_VERSION = '1.1';
+
+    // Sent and superseded rows deleted per worker run
+    const PURGE_CHUNK = 5000;
+
     public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->table_name = $wpdb->prefix . 'klage_n8n_outbox';
+
         $this->n8n_url = get_option('klage_click_n8n_url');
         $this->n8n_key = get_option('klage_click_n8n_key');
+
+        if (self::$hooks_registered) {
+            return;
+        }
+        self::$hooks_registered = true;
+
+        add_filter('cron_schedules', array($this, 'add_cron_schedule'));
+        add_action(self::WORKER_HOOK, array($this, 'process_queue'));
+        add_action('cah_case_created', array($this, 'on_case_created'), 10, 2);
+        add_action('cah_case_updated', array($this, 'on_case_updated'), 10, 2);
+
+        if (!empty($this->n8n_url) && !wp_next_scheduled(self::WORKER_HOOK)) {
+            wp_schedule_event(time(), 'cah_every_minute', self::WORKER_HOOK);
+        }
     }
-    
+
     /**
-     * Send case data to N8N
+     * Register one-minute cron schedule for the worker
      */
-    public function send_case_data($case_data) {
+    public function add_cron_schedule($schedules) {
+        $schedules['cah_every_minute'] = array(
+            'interval' => MINUTE_IN_SECONDS,
+            'display' => 'Jede Minute'
+        );
+
+        return $schedules;
+    }
+
+    /**
+     * Send case data to N8N (queued, delivered asynchronously)
+     */
+    public function send_case_data($case_data, $event = 'case_data') {
         if (empty($this->n8n_url) || empty($this->n8n_key)) {
             return new WP_Error('n8n_not_configured', 'N8N ist nicht konfiguriert');
         }
-        
-        // For now, just log that we would send to N8N
-        error_log('Klage.Click: Would send case data to N8N: ' . json_encode($case_data));
-        
+
+        return $this->enqueue(intval($case_data['id'] ?? 0), $event, $case_data);
+    }
+
+    /**
+     * Queue case creation event
+     */
+    public function on_case_created($case_id, $case_data) {
+        if (!empty($this->n8n_url)) {
+            $this->enqueue($case_id, 'case_created', array_merge(array('id' => $case_id), (array) $case_data));
+        }
+    }
+
+    /**
+     * Queue case update event
+     */
+    public function on_case_updated($case_id, $case_data) {
+        if (!empty($this->n8n_url)) {
+            $this->enqueue($case_id, 'case_updated', array_merge(array('id' => $case_id), (array) $case_data));
+        }
+    }
+
+    /**
+     * Add payload to the outbox
+     * Identical payloads are only skipped while one is still pending, so a
+     * case going A -> B -> A delivers A again after B was queued or sent.
+     */
+    public function enqueue($case_id, $event, $payload) {
+        $this->ensure_table();
+
+        // Backpressure: refuse new work while the backlog (counted by the worker) is above the limit
+        $pending = intval(get_option('cah_n8n_pending_count', 0));
+        $max_pending = intval(get_option('cah_n8n_max_pending', 10000));
+
+        if ($pending >= $max_pending) {
+            update_option('cah_n8n_rejected_count', intval(get_option('cah_n8n_rejected_count', 0)) + 1, false);
+            return new WP_Error('n8n_queue_full', 'N8N-Warteschlange ist voll (' . $pending . ' ausstehend)');
+        }
+
+        $body = wp_json_encode($payload);
+        $version = md5($event . '|' . $body);
+
+        $queued = $this->wpdb->get_var($this->wpdb->prepare(
+            "SELECT id FROM {$this->table_name} WHERE case_id = %d AND event = %s AND status = 'pending' AND version = %s LIMIT 1",
+            $case_id,
+            $event,
+            $version
+        ));
+
+        if ($queued) {
+            return array(
+                'success' => true,
+                'message' => 'Bereits in N8N-Warteschlange',
+                'queued' => false
+            );
+        }
+
+        $inserted = $this->wpdb->insert(
+            $this->table_name,
+            array(
+                'case_id' => $case_id,
+                'event' => $event,
+                'version' => $version,
+                'payload' => $body,
+                'status' => 'pending',
+                'attempts' => 0,
+                'next_attempt_at' => current_time('mysql'),
+                'created_at' => current_time('mysql')
+            ),
+            array('%d', '%s', '%s', '%s', '%s', '%d', '%s', '%s')
+        );
+
+        if ($inserted === false) {
+            return new WP_Error('n8n_enqueue_failed', 'N8N-Nachricht konnte nicht gespeichert werden: ' . $this->wpdb->last_error);
+        }
+
+        if ($case_id > 0) {
+            // Older undelivered payloads of the same case/event are obsolete
+            $this->wpdb->query($this->wpdb->prepare(
+                "UPDATE {$this->table_name} SET status = 'superseded' WHERE case_id = %d AND event = %s AND status = 'pending' AND id < %d",
+                $case_id,
+                $event,
+                $this->wpdb->insert_id
+            ));
+        }
+
         return array(
             'success' => true,
-            'message' => 'N8N Integration bereit (Test-Modus)'
+            'message' => 'An N8N-Warteschlange übergeben',
+            'queued' => true
         );
     }
-    
+
+    /**
+     * Worker: deliver due payloads in batches
+     */
+    public function process_queue($max_batches = 20) {
+        if (empty($this->n8n_url)) {
+            return array('sent' => 0, 'retried' => 0, 'failed' => 0);
+        }
+
+        $this->ensure_table();
+
+        $batch_size = max(1, intval(get_option('cah_n8n_batch_size', 50)));
+        $token = wp_generate_uuid4();
+        $totals = array('sent' => 0, 'retried' => 0, 'failed' => 0);
+
+        // Release rows of crashed workers
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->table_name} SET status = 'pending', locked_by = NULL WHERE status = 'processing' AND locked_at < %s",
+            date('Y-m-d H:i:s', strtotime(current_time('mysql')) - self::LOCK_TIMEOUT)
+        ));
+
+        for ($i = 0; $i < $max_batches; $i++) {
+            $batch = $this->claim_batch($token, $batch_size);
+            if (empty($batch)) {
+                break;
+            }
+
+            $result = $this->deliver_batch($batch);
+
+            foreach ($result as $key => $count) {
+                $totals[$key] += $count;
+            }
+
+            // Server asked us to slow down
+            if ($result['retried'] > 0) {
+                break;
+            }
+        }
+
+        $this->close_connection();
+
+        $totals['purged'] = $this->purge_delivered();
+
+        // Backlog size for the backpressure check in enqueue()
+        update_option('cah_n8n_pending_count', intval($this->wpdb->get_var("SELECT COUNT(*) FROM {$this->table_name} WHERE status = 'pending'")));
+
+        update_option('cah_n8n_last_run', array_merge($totals, array('run_at' => current_time('mysql'))), false);
+
+        return $totals;
+    }
+
+    /**
+     * Delete sent and superseded rows past cah_n8n_retention_days (default 7)
+     */
+    private function purge_delivered() {
+        $retention_days = max(1, intval(get_option('cah_n8n_retention_days', 7)));
+
+        $purged = $this->wpdb->query($this->wpdb->prepare(
+            "DELETE FROM {$this->table_name} WHERE status IN ('sent', 'superseded') AND created_at < %s LIMIT %d",
+            date('Y-m-d H:i:s', strtotime(current_time('mysql')) - $retention_days * DAY_IN_SECONDS),
+            self::PURGE_CHUNK
+        ));
+
+        return intval($purged);
+    }
+
+    /**
+     * Claim due rows for this worker
+     */
+    private function claim_batch($token, $batch_size) {
+        $now = current_time('mysql');
+
+        $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->table_name} SET status = 'processing', locked_by = %s, locked_at = %s
+             WHERE status = 'pending' AND next_attempt_at <= %s ORDER BY id LIMIT %d",
+            $token,
+            $now,
+            $now,
+            $batch_size
+        ));
+
+        return $this->wpdb->get_results($this->wpdb->prepare(
+            "SELECT id, case_id, event, version, payload, attempts FROM {$this->table_name} WHERE locked_by = %s AND status = 'processing' ORDER BY id",
+            $token
+        ));
+    }
+
+    /**
+     * Deliver one batch as a single webhook request
+     */
+    private function deliver_batch($batch) {
+        $events = array();
+        foreach ($batch as $row) {
+            $events[] = array(
+                'id' => intval($row->id),
+                'case_id' => intval($row->case_id),
+                'event' => $row->event,
+                'version' => $row->version,
+                'data' => json_decode($row->payload, true)
+            );
+        }
+
+        $response = $this->http_post(wp_json_encode(array(
+            'source' => 'klage-click',
+            'sent_at' => current_time('c'),
+            'events' => $events
+        )));
+
+        $ids = wp_list_pluck($batch, 'id');
+        $id_list = implode(',', array_map('intval', $ids));
+
+        if ($response['status'] >= 200 && $response['status'] < 300) {
+            $this->wpdb->query($this->wpdb->prepare(
+                "UPDATE {$this->table_name} SET status = 'sent', sent_at = %s, locked_by = NULL, last_error = NULL, attempts = attempts + 1 WHERE id IN ($id_list)",
+                current_time('mysql')
+            ));
+
+            return array('sent' => count($batch), 'retried' => 0, 'failed' => 0);
+        }
+
+        $error = $response['error'] ?: 'HTTP ' . $response['status'];
+
+        // 4xx other than 408/429 will not succeed on retry
+        $retryable = $response['status'] === 0 || $response['status'] === 408 || $response['status'] === 429 || $response['status'] >= 500;
+        $max_attempts = intval(get_option('cah_n8n_max_attempts', 8));
+
+        $retried = 0;
+        $failed = 0;
+
+        foreach ($batch as $row) {
+            $attempts = intval($row->attempts) + 1;
+
+            if (!$retryable || $attempts >= $max_attempts) {
+                $this->wpdb->update(
+                    $this->table_name,
+                    array('status' => 'failed', 'attempts' => $attempts, 'last_error' => $error, 'locked_by' => null),
+                    array('id' => $row->id),
+                    array('%s', '%d', '%s', '%s'),
+                    array('%d')
+                );
+                $failed++;
+                continue;
+            }
+
+            $this->wpdb->update(
+                $this->table_name,
+                array(
+                    'status' => 'pending',
+                    'attempts' => $attempts,
+                    'last_error' => $error,
+                    'locked_by' => null,
+                    'next_attempt_at' => date('Y-m-d H:i:s', strtotime(current_time('mysql')) + $this->get_backoff_delay($attempts, $response['retry_after']))
+                ),
+                array('id' => $row->id),
+                array('%s', '%d', '%s', '%s', '%s'),
+                array('%d')
+            );
+            $retried++;
+        }
+
+        return array('sent' => 0, 'retried' => $retried, 'failed' => $failed);
+    }
+
+    /**
+     * Exponential backoff with jitter (seconds)
+     */
+    private function get_backoff_delay($attempts, $retry_after = 0) {
+        $delay = min(3600, 30 * pow(2, $attempts - 1));
+        $delay += wp_rand(0, (int) ($delay / 4));
+
+        return max($delay, intval($retry_after));
+    }
+
+    /**
+     * POST JSON to the webhook, reusing one connection per worker run
+     */
+    private function http_post($body) {
+        $headers = array(
+            'Content-Type: application/json',
+            'X-N8N-API-KEY: ' . $this->n8n_key,
+            'Connection: keep-alive'
+        );
+
+        if (!function_exists('curl_init')) {
+            $response = wp_remote_post($this->n8n_url, array(
+                'headers' => array(
+                    'Content-Type' => 'application/json',
+                    'X-N8N-API-KEY' => $this->n8n_key
+                ),
+                'body' => $body,
+                'timeout' => 15
+            ));
+
+            if (is_wp_error($response)) {
+                return array('status' => 0, 'error' => $response->get_error_message(), 'retry_after' => 0);
+            }
+
+            return array(
+                'status' => intval(wp_remote_retrieve_response_code($response)),
+                'error' => '',
+                'retry_after' => intval(wp_remote_retrieve_header($response, 'retry-after'))
+            );
+        }
+
+        if ($this->curl_handle === null) {
+            $this->curl_handle = curl_init();
+        }
+
+        $retry_after = 0;
+
+        curl_setopt_array($this->curl_handle, array(
+            CURLOPT_URL => $this->n8n_url,
+            CURLOPT_POST => true,
+            CURLOPT_POSTFIELDS => $body,
+            CURLOPT_HTTPHEADER => $headers,
+            CURLOPT_RETURNTRANSFER => true,
+            CURLOPT_TIMEOUT => 15,
+            CURLOPT_CONNECTTIMEOUT => 5,
+            CURLOPT_TCP_KEEPALIVE => 1,
+            CURLOPT_HEADERFUNCTION => function($handle, $header_line) use (&$retry_after) {
+                if (stripos($header_line, 'Retry-After:') === 0) {
+                    $retry_after = intval(trim(substr($header_line, 12)));
+                }
+                return strlen($header_line);
+            }
+        ));
+
+        $result = curl_exec($this->curl_handle);
+
+        if ($result === false) {
+            $error = curl_error($this->curl_handle);
+            $this->close_connection();
+            return array('status' => 0, 'error' => $error, 'retry_after' => 0);
+        }
+
+        return array(
+            'status' => intval(curl_getinfo($this->curl_handle, CURLINFO_RESPONSE_CODE)),
+            'error' => '',
+            'retry_after' => $retry_after
+        );
+    }
+
+    /**
+     * Close reused connection
+     */
+    private function close_connection() {
+        if ($this->curl_handle !== null) {
+            curl_close($this->curl_handle);
+            $this->curl_handle = null;
+        }
+    }
+
+    /**
+     * Queue metrics for monitoring and backpressure
+     */
+    public function get_queue_metrics() {
+        $metrics = array(
+            'pending' => 0,
+            'processing' => 0,
+            'sent' => 0,
+            'failed' => 0,
+            'superseded' => 0,
+            'oldest_pending_seconds' => 0,
+            'sent_last_hour' => 0,
+            'rejected' => intval(get_option('cah_n8n_rejected_count', 0))
+        );
+
+        $this->ensure_table();
+
+        $counts = $this->wpdb->get_results("SELECT status, COUNT(*) AS total FROM {$this->table_name} GROUP BY status");
+
+        foreach ($counts as $row) {
+            $metrics[$row->status] = intval($row->total);
+        }
+
+        $oldest = $this->wpdb->get_var("SELECT MIN(created_at) FROM {$this->table_name} WHERE status = 'pending'");
+        if ($oldest) {
+            $metrics['oldest_pending_seconds'] = max(0, strtotime(current_time('mysql')) - strtotime($oldest));
+        }
+
+        $metrics['sent_last_hour'] = intval($this->wpdb->get_var($this->wpdb->prepare(
+            "SELECT COUNT(*) FROM {$this->table_name} WHERE status = 'sent' AND sent_at >= %s",
+            date('Y-m-d H:i:s', strtotime(current_time('mysql')) - HOUR_IN_SECONDS)
+        )));
+
+        return $metrics;
+    }
+
+    /**
+     * Reset failed rows for another delivery attempt (settings page)
+     * Failed rows already replaced by a newer payload of the case are superseded instead.
+     */
+    public function retry_failed() {
+        $this->ensure_table();
+
+        $this->wpdb->query(
+            "UPDATE {$this->table_name} f
+             JOIN {$this->table_name} n ON n.case_id = f.case_id AND n.event = f.event AND n.id > f.id
+             SET f.status = 'superseded'
+             WHERE f.status = 'failed' AND f.case_id > 0"
+        );
+
+        $updated = $this->wpdb->query($this->wpdb->prepare(
+            "UPDATE {$this->table_name} SET status = 'pending', attempts = 0, next_attempt_at = %s WHERE status = 'failed'",
+            current_time('mysql')
+        ));
+
+        return array(
+            'success' => $updated !== false,
+            'message' => intval($updated) . ' Nachrichten erneut eingeplant'
+        );
+    }
+
+    /**
+     * Create or upgrade outbox table on installs that predate the current layout
+     */
+    private function ensure_table() {
+        if (self::$table_checked) {
+            return;
+        }
+        self::$table_checked = true;
+
+        if (get_option('cah_n8n_outbox_version') === self::TABLE_VERSION) {
+            return;
+        }
+
+        $this->create_table();
+
+        // 1.0 skipped every payload that had ever been queued for the case (A -> B -> A)
+        if ($this->wpdb->get_var("SHOW INDEX FROM {$this->table_name} WHERE Key_name = 'case_version'")) {
+            $this->wpdb->query("ALTER TABLE {$this->table_name} DROP INDEX case_version, ADD INDEX case_event (case_id, event, status)");
+        }
+
+        update_option('cah_n8n_outbox_version', self::TABLE_VERSION);
+    }
+
+    /**
+     * Create outbox table
+     */
+    public function create_table() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$this->table_name} (
+            id bigint(20) unsigned NOT NULL AUTO_INCREMENT,
+            case_id bigint(20) unsigned NOT NULL DEFAULT 0,
+            event varchar(50) NOT NULL,
+            version char(32) NOT NULL,
+            payload longtext NOT NULL,
+            status varchar(20) NOT NULL DEFAULT 'pending',
+            attempts int(5) NOT NULL DEFAULT 0,
+            next_attempt_at datetime NOT NULL,
+            locked_by char(36) DEFAULT NULL,
+            locked_at datetime DEFAULT NULL,
+            last_error text,
+            created_at datetime NOT NULL,
+            sent_at datetime DEFAULT NULL,
+            PRIMARY KEY (id),
+            KEY case_event (case_id, event, status),
+            KEY status_next (status, next_attempt_at),
+            KEY locked_by (locked_by)
+        ) $charset_collate");
+    }
+
     /**
      * Test N8N connection
      */
@@ -41,10 +540,24 @@ class CAH_N8N_Connector {
         if (empty($this->n8n_url)) {
             return new WP_Error('n8n_not_configured', 'N8N URL nicht konfiguriert');
         }
-        
+
+        $response = $this->http_post(wp_json_encode(array('source' => 'klage-click', 'events' => array())));
+        $this->close_connection();
+
+        if ($response['status'] < 200 || $response['status'] >= 300) {
+            return new WP_Error('n8n_connection_failed', 'N8N nicht erreichbar: ' . ($response['error'] ?: 'HTTP ' . $response['status']));
+        }
+
         return array(
             'success' => true,
-            'message' => 'N8N Verbindung konfiguriert'
+            'message' => 'N8N Verbindung erfolgreich'
         );
     }
-}
\ No newline at end of file
+
+    /**
+     * Unschedule worker (plugin deactivation)
+     */
+    public static function unschedule_worker() {
+        wp_clear_scheduled_hook(self::WORKER_HOOK);
+    }
+}
@@ -0,0 +1,233 @@
+<?php
+/**
+ * Parallel Runner - Runs a job in forked worker processes (WP-CLI only)
+ * Every worker gets its own database (and replica/object cache) connection,
+ * handles one shard and hands its result back through a temp file; the
+ * parent collects all results. Workers of a run coordinate through the
+ * klage_worker_locks table (e.g. one worker per case ID). Without pcntl the
+ * shards run one after another in the current process.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Parallel_Runner {
+
+    private $wpdb;
+
+    // Identifies this run in the lock table
+    private $run_id;
+
+    // Shard handled by the current process
+    private $worker = 0;
+
+    private static $tables_checked = false;
+
+    const MAX_WORKERS = 32;
+
+    public function __construct() {
+        global $wpdb;
+        $this->wpdb = $wpdb;
+        $this->run_id = wp_generate_uuid4();
+    }
+
+    public static function can_fork() {
+        return function_exists('pcntl_fork') && function_exists('pcntl_waitpid');
+    }
+
+    /**
+     * Run $callback($shard, $shards) for every shard, returns shard => result
+     * Results must be serializable. A worker that dies returns a WP_Error.
+     */
+    public function run($shards, $callback) {
+        $this->ensure_tables();
+        $this->release_stale_locks();
+
+        $shards = max(1, min(self::MAX_WORKERS, intval($shards)));
+        $results = array();
+
+        if ($shards > 1 && !self::can_fork()) {
+            WP_CLI::warning('PHP-Erweiterung pcntl fehlt, die ' . $shards . ' Shards laufen nacheinander');
+        }
+
+        if ($shards === 1 || !self::can_fork()) {
+            for ($shard = 0; $shard < $shards; $shard++) {
+                $this->worker = $shard;
+                $results[$shard] = call_user_func($callback, $shard, $shards);
+            }
+
+            $this->release_locks();
+            return $results;
+        }
+
+        // Children must not share the parent's connections
+        $this->disconnect();
+
+        $children = array();
+
+        for ($shard = 0; $shard < $shards; $shard++) {
+            $result_file = tempnam(get_temp_dir(), 'cah-worker-');
+            $pid = pcntl_fork();
+
+            if ($pid === 0) {
+                $this->run_child($shard, $shards, $callback, $result_file);
+            }
+
+            if ($pid === -1) {
+                $results[$shard] = new WP_Error('worker_fork_failed', 'Worker ' . $shard . ' konnte nicht gestartet werden');
+                @unlink($result_file);
+                continue;
+            }
+
+            $children[$pid] = array('shard' => $shard, 'file' => $result_file);
+        }
+
+        while ($children) {
+            $pid = pcntl_waitpid(-1, $status);
+            if ($pid <= 0) {
+                break;
+            }
+            if (!isset($children[$pid])) {
+                continue;
+            }
+
+            $child = $children[$pid];
+            unset($children[$pid]);
+
+            $result = @unserialize((string) @file_get_contents($child['file']));
+            @unlink($child['file']);
+
+            $results[$child['shard']] = $result !== false ? $result : new WP_Error(
+                'worker_died',
+                'Worker ' . $child['shard'] . ' wurde abgebrochen (Status ' . pcntl_wexitstatus($status) . ')'
+            );
+        }
+
+        $this->connect();
+        $this->release_locks();
+
+        ksort($results);
+
+        return $results;
+    }
+
+    /**
+     * Body of a forked worker (never returns)
+     */
+    private function run_child($shard, $shards, $callback, $result_file) {
+        $this->worker = $shard;
+        $this->connect();
+
+        // A persistent object cache would otherwise share the parent's socket
+        if (wp_using_ext_object_cache()) {
+            wp_cache_init();
+        }
+
+        // Entries the parent buffered before the fork are written by the parent
+        CAH_Audit_Logger::discard_buffer();
+
+        $status = 0;
+
+        try {
+            $result = call_user_func($callback, $shard, $shards);
+        } catch (Throwable $e) {
+            $result = new WP_Error('worker_failed', 'Worker ' . $shard . ': ' . $e->getMessage());
+            $status = 1;
+        }
+
+        // Shutdown hooks belong to the parent request, so the worker's audit entries are written here
+        $audit_logger = new CAH_Audit_Logger();
+        $audit_logger->flush();
+
+        file_put_contents($result_file, serialize($result));
+
+        remove_all_actions('shutdown');
+        $this->disconnect();
+
+        exit($status);
+    }
+
+    private function disconnect() {
+        $this->wpdb->close();
+        CAH_Query_Router::reset_connection();
+    }
+
+    private function connect() {
+        $this->wpdb->db_connect(false);
+    }
+
+    public function get_worker() {
+        return $this->worker;
+    }
+
+    /**
+     * Claim a key for the current worker of this run
+     * True if the key is free or already ours, false if another worker (or run) has it
+     */
+    public function claim($key) {
+        $table_name = $this->wpdb->prefix . 'klage_worker_locks';
+
+        $inserted = $this->wpdb->query($this->wpdb->prepare(
+            "INSERT IGNORE INTO $table_name (lock_key, run_id, worker, created_at) VALUES (%s, %s, %d, %s)",
+            $key,
+            $this->run_id,
+            $this->worker,
+            current_time('mysql')
+        ));
+
+        if ($inserted) {
+            return true;
+        }
+
+        $owner = $this->wpdb->get_row($this->wpdb->prepare(
+            "SELECT run_id, worker FROM $table_name WHERE lock_key = %s",
+            $key
+        ));
+
+        return $owner && $owner->run_id === $this->run_id && intval($owner->worker) === $this->worker;
+    }
+
+    private function release_locks() {
+        $this->wpdb->delete($this->wpdb->prefix . 'klage_worker_locks', array('run_id' => $this->run_id), array('%s'));
+    }
+
+    /**
+     * Locks left behind by runs that were killed
+     */
+    private function release_stale_locks() {
+        $this->wpdb->query($this->wpdb->prepare(
+            "DELETE FROM {$this->wpdb->prefix}klage_worker_locks WHERE created_at < %s",
+            date('Y-m-d H:i:s', strtotime(current_time('mysql')) - DAY_IN_SECONDS)
+        ));
+    }
+
+    /**
+     * Create lock table on installs that predate the runner
+     */
+    private function ensure_tables() {
+        if (!self::$tables_checked) {
+            if (!$this->wpdb->get_var("SHOW TABLES LIKE '{$this->wpdb->prefix}klage_worker_locks'")) {
+                $this->create_tables();
+            }
+            self::$tables_checked = true;
+        }
+    }
+
+    /**
+     * Create lock table
+     */
+    public function create_tables() {
+        $charset_collate = $this->wpdb->get_charset_collate();
+
+        $this->wpdb->query("CREATE TABLE IF NOT EXISTS {$this->wpdb->prefix}klage_worker_locks (
+            lock_key varchar(191) NOT NULL,
+            run_id char(36) NOT NULL,
+            worker smallint(5) unsigned NOT NULL DEFAULT 0,
+            created_at datetime NOT NULL,
+            PRIMARY KEY (lock_key),
+            KEY run_id (run_id),
+            KEY created_at (created_at)
+        ) $charset_collate");
+    }
+}
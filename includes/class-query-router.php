@@ -0,0 +1,277 @@
+<?php
+/**
+ * Query Router - Sends designated read-only queries to a read replica
+ * Configured in wp-config.php:
+ *   define('CAH_REPLICA_DB_HOST', '127.0.0.1:3307');
+ *   define('CAH_REPLICA_DB_USER', ...);      // default DB_USER
+ *   define('CAH_REPLICA_DB_PASSWORD', ...);  // default DB_PASSWORD
+ *   define('CAH_REPLICA_DB_NAME', ...);      // default DB_NAME
+ *   define('CAH_REPLICA_MAX_LAG', 5);        // seconds
+ * The replica user needs REPLICATION CLIENT (MariaDB 10.5+: SLAVE MONITOR)
+ * for the lag check; without it all reads stay on the primary.
+ *
+ * Read-your-writes: after a user wrote to a plugin table, that user's reads
+ * stay on the primary until the replica has applied the write (GTID position,
+ * MariaDB or MySQL) or, without GTIDs, for CAH_REPLICA_STICKY_SECONDS. Lagging,
+ * stopped or unreachable replicas fall back to the primary.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Query_Router {
+
+    const DEFAULT_MAX_LAG = 5;
+    const DEFAULT_STICKY_SECONDS = 10;
+    const CACHE_GROUP = 'cah_replica';
+
+    // Replica connection (false = not configured or not reachable)
+    private static $replica = null;
+
+    // Replica lag in seconds (null = not replicating), checked once per request
+    private static $lag = false;
+
+    // A plugin table was written in this request
+    private static $wrote = false;
+
+    // Per user decision for this request
+    private static $sticky = null;
+
+    // 'mariadb' or 'mysql' (GTID variables and functions differ)
+    private static $server_type = null;
+
+    // Context => number of reads routed to replica / primary (diagnostics)
+    private static $routed = array();
+
+    private static $hooks_registered = false;
+
+    public static function is_configured() {
+        return defined('CAH_REPLICA_DB_HOST') && CAH_REPLICA_DB_HOST;
+    }
+
+    public static function register_hooks() {
+        if (self::$hooks_registered || !self::is_configured()) {
+            return;
+        }
+        self::$hooks_registered = true;
+
+        add_filter('query', array(__CLASS__, 'track_write'));
+        add_action('shutdown', array(__CLASS__, 'remember_write'));
+    }
+
+    /**
+     * Database for a read-only query: the replica when it is safe, else $wpdb
+     * $context names the call site (filter cah_replica_allowed, diagnostics)
+     */
+    public static function reader($context = '') {
+        global $wpdb;
+
+        $use_replica = self::is_configured()
+            && !self::$wrote
+            && apply_filters('cah_replica_allowed', true, $context)
+            && self::get_replica()
+            && !self::is_sticky()
+            && self::is_lag_acceptable();
+
+        $target = $use_replica ? 'replica' : 'primary';
+        self::$routed[$context][$target] = (self::$routed[$context][$target] ?? 0) + 1;
+
+        return $use_replica ? self::$replica : $wpdb;
+    }
+
+    /**
+     * Mark writes to plugin tables (filter on every query)
+     */
+    public static function track_write($query) {
+        global $wpdb;
+
+        if (!self::$wrote
+            && preg_match('/^\s*(INSERT|UPDATE|DELETE|REPLACE|ALTER|TRUNCATE|DROP|CREATE|LOAD)\b/i', $query)
+            && preg_match('/`?' . preg_quote($wpdb->prefix, '/') . '(klage|cah)_/i', $query)) {
+            self::$wrote = true;
+        }
+
+        return $query;
+    }
+
+    /**
+     * Store the write position for the user's following requests
+     */
+    public static function remember_write() {
+        global $wpdb;
+
+        $user_id = get_current_user_id();
+        if (!self::$wrote || !$user_id) {
+            return;
+        }
+
+        $server_type = self::get_server_type();
+
+        // GTID position of the primary, empty without GTIDs
+        $suppress = $wpdb->suppress_errors();
+        $position = (string) $wpdb->get_var($server_type === 'mariadb' ? 'SELECT @@GLOBAL.gtid_binlog_pos' : 'SELECT @@GLOBAL.gtid_executed');
+        $wpdb->suppress_errors($suppress);
+
+        set_transient('cah_replica_write_' . $user_id, array(
+            'server_type' => $server_type,
+            'position' => $position,
+            'time' => time()
+        ), self::get_sticky_seconds() + self::get_max_lag());
+    }
+
+    /**
+     * Reads of the current user must stay on the primary
+     */
+    private static function is_sticky() {
+        if (self::$sticky !== null) {
+            return self::$sticky;
+        }
+
+        $user_id = get_current_user_id();
+        $write = $user_id ? get_transient('cah_replica_write_' . $user_id) : false;
+
+        if (!$write) {
+            self::$sticky = false;
+        } elseif ($write['position'] !== '' && ($write['server_type'] ?? 'mariadb') === 'mariadb') {
+            // Returns 0 when the replica has applied the position, -1 on timeout
+            $applied = self::$replica->get_var(self::$replica->prepare('SELECT MASTER_GTID_WAIT(%s, 0)', $write['position']));
+            self::$sticky = $applied === null || intval($applied) !== 0;
+        } elseif ($write['position'] !== '') {
+            // MySQL: 1 when the replica's executed GTID set contains the position (doesn't wait)
+            $applied = self::$replica->get_var(self::$replica->prepare('SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed)', $write['position']));
+            self::$sticky = $applied === null || intval($applied) !== 1;
+        } else {
+            self::$sticky = time() - $write['time'] < self::get_sticky_seconds();
+        }
+
+        return self::$sticky;
+    }
+
+    /**
+     * Server type of the primary (MariaDB reports itself in the version string)
+     */
+    private static function get_server_type() {
+        global $wpdb;
+
+        if (self::$server_type === null) {
+            self::$server_type = stripos((string) $wpdb->db_server_info(), 'MariaDB') !== false ? 'mariadb' : 'mysql';
+        }
+
+        return self::$server_type;
+    }
+
+    private static function is_lag_acceptable() {
+        $lag = self::get_lag();
+        return $lag !== null && $lag <= self::get_max_lag();
+    }
+
+    /**
+     * Replica lag in seconds, null if replication is stopped or unknown
+     */
+    public static function get_lag() {
+        if (self::$lag !== false) {
+            return self::$lag;
+        }
+
+        $lag = wp_cache_get('lag', self::CACHE_GROUP);
+
+        if ($lag === false) {
+            $lag = null;
+            $replica = self::get_replica();
+
+            if ($replica) {
+                $status = $replica->get_row('SHOW SLAVE STATUS', ARRAY_A);
+                if ($status && $status['Seconds_Behind_Master'] !== null && $status['Slave_SQL_Running'] === 'Yes') {
+                    $lag = intval($status['Seconds_Behind_Master']);
+                }
+            }
+
+            // Stored as -1 when unknown (the cache can't hold null)
+            wp_cache_set('lag', $lag === null ? -1 : $lag, self::CACHE_GROUP, 5);
+        } else {
+            $lag = intval($lag) < 0 ? null : intval($lag);
+        }
+
+        self::$lag = $lag;
+
+        return $lag;
+    }
+
+    /**
+     * Replica connection, created on first use
+     */
+    private static function get_replica() {
+        global $wpdb;
+
+        if (self::$replica !== null) {
+            return self::$replica;
+        }
+
+        self::$replica = false;
+
+        // Unreachable replicas are not retried on every request
+        if (!self::is_configured() || wp_cache_get('down', self::CACHE_GROUP)) {
+            return false;
+        }
+
+        $replica = new CAH_Replica_Database(
+            defined('CAH_REPLICA_DB_USER') ? CAH_REPLICA_DB_USER : DB_USER,
+            defined('CAH_REPLICA_DB_PASSWORD') ? CAH_REPLICA_DB_PASSWORD : DB_PASSWORD,
+            defined('CAH_REPLICA_DB_NAME') ? CAH_REPLICA_DB_NAME : DB_NAME,
+            CAH_REPLICA_DB_HOST
+        );
+
+        if (!$replica->ready) {
+            wp_cache_set('down', 1, self::CACHE_GROUP, 30);
+            if (get_option('klage_click_debug_mode')) {
+                error_log('Klage.Click replica ' . CAH_REPLICA_DB_HOST . ' not reachable, using primary');
+            }
+            return false;
+        }
+
+        $replica->set_prefix($wpdb->base_prefix);
+        if (is_multisite()) {
+            $replica->set_blog_id(get_current_blog_id());
+        }
+
+        self::$replica = $replica;
+
+        return $replica;
+    }
+
+    /**
+     * Drop the replica connection (forked CLI workers open their own)
+     */
+    public static function reset_connection() {
+        if (self::$replica) {
+            self::$replica->close();
+        }
+
+        self::$replica = null;
+        self::$lag = false;
+    }
+
+    private static function get_max_lag() {
+        return defined('CAH_REPLICA_MAX_LAG') ? intval(CAH_REPLICA_MAX_LAG) : self::DEFAULT_MAX_LAG;
+    }
+
+    private static function get_sticky_seconds() {
+        return defined('CAH_REPLICA_STICKY_SECONDS') ? intval(CAH_REPLICA_STICKY_SECONDS) : self::DEFAULT_STICKY_SECONDS;
+    }
+
+    /**
+     * Routing state of this request (replica_routing_test.py, debugging)
+     */
+    public static function get_status() {
+        return array(
+            'configured' => self::is_configured(),
+            'connected' => (bool) self::get_replica(),
+            'lag' => self::is_configured() ? self::get_lag() : null,
+            'max_lag' => self::get_max_lag(),
+            'wrote' => self::$wrote,
+            'sticky' => self::get_replica() ? self::is_sticky() : null,
+            'routed' => self::$routed
+        );
+    }
+}
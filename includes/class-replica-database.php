@@ -0,0 +1,34 @@
+<?php
+/**
+ * Replica Database - wpdb connection to a read replica
+ * Unlike wpdb it never bails (wp_die) when the server is unreachable or
+ * the connection drops; CAH_Query_Router then falls back to the primary.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Replica_Database extends wpdb {
+
+    public function __construct($dbuser, $dbpassword, $dbname, $dbhost) {
+        $this->dbuser = $dbuser;
+        $this->dbpassword = $dbpassword;
+        $this->dbname = $dbname;
+        $this->dbhost = $dbhost;
+
+        // Errors of the replica are not shown; the router checks $this->ready
+        $this->show_errors = false;
+        $this->suppress_errors = true;
+
+        $this->init_charset();
+        $this->db_connect(false);
+    }
+
+    /**
+     * Reconnect without bailing (wpdb dies after failed retries)
+     */
+    public function check_connection($allow_bail = true) {
+        return parent::check_connection(false);
+    }
+}
@@ -13,6 +13,9 @@ class CAH_Schema_Manager {
     private $wpdb;
     private $table_prefix;
     
+    // Online DDL support of the server (see get_online_ddl_support)
+    private static $ddl_support = null;
+    
     public function __construct() {
         global $wpdb;
         $this->wpdb = $wpdb;
@@ -161,7 +164,9 @@ class CAH_Schema_Manager {
                     'case_id' => array('case_id'),
                     'case_status' => array('case_status'),
                     'debtor_id' => array('debtor_id'),
-                    'submission_date' => array('submission_date')
+                    'submission_date' => array('submission_date'),
+                    'creation_cursor' => array('case_creation_date', 'id'),
+                    'case_updated_date' => array('case_updated_date')
                 )
             ),
             
@@ -225,7 +230,7 @@ class CAH_Schema_Manager {
                 ),
                 'primary_key' => 'id',
                 'indexes' => array(
-                    'case_id' => array('case_id'),
+                    'case_created' => array('case_id', 'created_at'),
                     'action' => array('action'),
                     'user_id' => array('user_id')
                 )
@@ -300,13 +305,24 @@ class CAH_Schema_Manager {
             }
         }
         
+        // Compare indexes (by name)
+        foreach ($expected['indexes'] ?? array() as $index_name => $index_columns) {
+            if (!isset($current['indexes'][$index_name])) {
+                $differences['missing_indexes'][] = $index_name;
+            }
+        }
+        
         return $differences;
     }
     
     /**
      * Synchronize database schema with expected schema
+     * All differences of the table are applied as combined ALTERs (see plan_alter);
+     * $dry_run only returns the plan. Missing indexes are built only in a
+     * $maintenance run (database admin, wp cah sync-schema), otherwise they are
+     * returned as 'pending_indexes'.
      */
-    public function synchronize_schema($table_name) {
+    public function synchronize_schema($table_name, $dry_run = false, $maintenance = false) {
         $differences = $this->compare_schemas($table_name);
         
         if (isset($differences['error'])) {
@@ -314,26 +330,247 @@ class CAH_Schema_Manager {
         }
         
         if (isset($differences['status']) && $differences['status'] === 'table_missing') {
+            if ($dry_run) {
+                return array('success' => true, 'message' => 'Table would be created', 'plan' => array('create_table' => true));
+            }
+            
             return $this->create_table($table_name);
         }
         
-        $full_table_name = $this->table_prefix . $table_name;
         $expected = $this->get_complete_schema_definition()[$table_name];
+        $clauses = array();
+        
+        foreach ($differences['missing_columns'] ?? array() as $col_name) {
+            $clauses[] = "ADD COLUMN $col_name {$expected['columns'][$col_name]}";
+        }
+        
+        $pending_indexes = array();
+        foreach ($differences['missing_indexes'] ?? array() as $index_name) {
+            if ($maintenance || $dry_run) {
+                $clauses[] = "ADD INDEX $index_name (" . implode(', ', $expected['indexes'][$index_name]) . ")";
+            } else {
+                $pending_indexes[] = $index_name;
+            }
+        }
+        
+        $result = empty($clauses)
+            ? array('success' => true, 'message' => 'Schema synchronized successfully')
+            : $this->alter_table($table_name, $clauses, $dry_run, $maintenance);
         
-        // Add missing columns
-        if (isset($differences['missing_columns'])) {
-            foreach ($differences['missing_columns'] as $col_name) {
-                $col_def = $expected['columns'][$col_name];
-                $sql = "ALTER TABLE $full_table_name ADD COLUMN $col_name $col_def";
-                $result = $this->wpdb->query($sql);
+        $result['pending_indexes'] = $pending_indexes;
+        
+        return $result;
+    }
+    
+    /**
+     * Apply ALTER clauses to a table with as few rebuilds as possible
+     * $clauses like "ADD COLUMN name varchar(20)" or "ADD INDEX name (col)"
+     * A statement the server refuses as INSTANT/INPLACE (LOCK=NONE) falls back
+     * to the blocking default algorithm only in a $maintenance run; otherwise
+     * it fails and is left for maintenance. Fallbacks are always logged.
+     */
+    public function alter_table($table_name, $clauses, $dry_run = false, $maintenance = false) {
+        $plan = $this->plan_alter($table_name, $clauses);
+        
+        if (isset($plan['error'])) {
+            return array('success' => false, 'message' => $plan['error']);
+        }
+        
+        if ($dry_run) {
+            return array('success' => true, 'message' => 'Dry run - no changes made', 'plan' => $plan);
+        }
+        
+        $full_table_name = $this->table_prefix . $table_name;
+        
+        foreach ($plan['statements'] as $index => $statement) {
+            $applied = false;
+            $message = '';
+            
+            // Weaker algorithm if the server refuses the requested one
+            foreach ($this->get_algorithm_fallbacks($statement['algorithm']) as $algorithm) {
+                $refused = $this->wpdb->last_error;
+                
+                // Without LOCK=NONE writes to the table block for the whole ALTER
+                if ($algorithm === 'DEFAULT' && !$maintenance) {
+                    $message = 'ALTER TABLE ' . $full_table_name . ' is not possible online, left for a maintenance run (database admin or wp cah sync-schema)';
+                    error_log('Klage.Click: ' . $message . ($algorithm !== $statement['algorithm'] ? ': ' . $refused : ''));
+                    break;
+                }
+                
+                if ($algorithm !== $statement['algorithm']) {
+                    error_log('Klage.Click: ALTER TABLE ' . $full_table_name . ' falls back from ' . $statement['algorithm'] . ' to ' . $algorithm . ($algorithm === 'DEFAULT' ? ' (writes blocked)' : '') . ': ' . $refused);
+                }
+                
+                $sql = "ALTER TABLE $full_table_name " . implode(', ', $statement['clauses']) . $this->get_algorithm_suffix($algorithm);
                 
-                if ($result === false) {
-                    return array('success' => false, 'message' => 'Failed to add column: ' . $col_name);
+                if ($this->wpdb->query($sql) !== false) {
+                    $plan['statements'][$index]['applied_algorithm'] = $algorithm;
+                    $applied = true;
+                    break;
                 }
             }
+            
+            if (!$applied) {
+                if ($index > 0) {
+                    $this->refresh_schema_cache();
+                }
+                
+                return array(
+                    'success' => false,
+                    'message' => $message !== '' ? $message : 'Failed to alter table: ' . $this->wpdb->last_error,
+                    'plan' => $plan
+                );
+            }
         }
         
-        return array('success' => true, 'message' => 'Schema synchronized successfully');
+        $this->refresh_schema_cache();
+        
+        return array('success' => true, 'message' => 'Schema synchronized successfully', 'plan' => $plan);
+    }
+    
+    /**
+     * Group ALTER clauses into one statement per algorithm and estimate the cost
+     * INSTANT: metadata only. INPLACE/LOCK=NONE: concurrent DML allowed, column
+     * adds rebuild the table, index adds only build the index. COPY: table copy
+     * with writes blocked.
+     */
+    public function plan_alter($table_name, $clauses) {
+        $full_table_name = $this->table_prefix . $table_name;
+        
+        $stats = $this->wpdb->get_row($this->wpdb->prepare(
+            "SELECT TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES
+             WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            $full_table_name
+        ), ARRAY_A);
+        
+        if (!$stats) {
+            return array('error' => 'Table does not exist');
+        }
+        
+        $support = $this->get_online_ddl_support();
+        $groups = array('INSTANT' => array(), 'INPLACE' => array(), 'COPY' => array());
+        $rebuild = false;
+        
+        foreach ($clauses as $clause) {
+            $clause = trim($clause);
+            
+            if (preg_match('/^ADD\s+COLUMN\s/i', $clause)) {
+                // Keys and auto increment in the column definition need a rebuild
+                $instant = $support['instant_add_column'] && !preg_match('/AUTO_INCREMENT|PRIMARY|UNIQUE|\bAFTER\b|\bFIRST\b/i', $clause);
+                
+                if ($instant) {
+                    $groups['INSTANT'][] = $clause;
+                } elseif ($support['online_ddl']) {
+                    $groups['INPLACE'][] = $clause;
+                    $rebuild = true;
+                } else {
+                    $groups['COPY'][] = $clause;
+                }
+            } elseif (preg_match('/^(ADD\s+(UNIQUE\s+)?(INDEX|KEY)|DROP\s+(INDEX|KEY))\s/i', $clause) && $support['online_ddl']) {
+                $groups['INPLACE'][] = $clause;
+            } else {
+                // Column type changes and everything else
+                $groups['COPY'][] = $clause;
+            }
+        }
+        
+        $data_bytes = intval($stats['DATA_LENGTH']);
+        $index_bytes = intval($stats['INDEX_LENGTH']);
+        $statements = array();
+        
+        foreach ($groups as $algorithm => $group_clauses) {
+            if (empty($group_clauses)) {
+                continue;
+            }
+            
+            if ($algorithm === 'INSTANT') {
+                $cost = 'metadata';
+                $bytes = 0;
+            } elseif ($algorithm === 'INPLACE') {
+                $cost = $rebuild ? 'table rebuild' : 'index build';
+                $bytes = $rebuild ? $data_bytes + $index_bytes : $data_bytes;
+            } else {
+                $cost = 'table copy (writes blocked)';
+                $bytes = $data_bytes + $index_bytes;
+            }
+            
+            $statements[] = array(
+                'algorithm' => $algorithm,
+                'lock' => $algorithm === 'INPLACE' ? 'NONE' : 'DEFAULT',
+                'clauses' => $group_clauses,
+                'sql' => "ALTER TABLE $full_table_name " . implode(', ', $group_clauses) . $this->get_algorithm_suffix($algorithm),
+                'cost' => $cost,
+                'estimated_bytes' => $bytes
+            );
+        }
+        
+        return array(
+            'table' => $table_name,
+            'server' => $support['server'],
+            'rows' => intval($stats['TABLE_ROWS']),
+            'data_bytes' => $data_bytes,
+            'index_bytes' => $index_bytes,
+            'rebuilds' => count(array_filter($statements, function($statement) {
+                return in_array($statement['cost'], array('table rebuild', 'table copy (writes blocked)'), true);
+            })),
+            'statements' => $statements
+        );
+    }
+    
+    /**
+     * Which online DDL variants the server supports
+     */
+    public function get_online_ddl_support() {
+        if (self::$ddl_support !== null) {
+            return self::$ddl_support;
+        }
+        
+        $server = (string) $this->wpdb->get_var('SELECT VERSION()');
+        preg_match('/^(\d+\.\d+\.\d+)/', $server, $matches);
+        $version = $matches[1] ?? '0.0.0';
+        
+        if (stripos($server, 'mariadb') !== false) {
+            // Instant ADD COLUMN since MariaDB 10.3.2
+            $instant = version_compare($version, '10.3.2', '>=');
+            $online = version_compare($version, '10.0.0', '>=');
+        } else {
+            // Instant ADD COLUMN (last position) since MySQL 8.0.12
+            $instant = version_compare($version, '8.0.12', '>=');
+            $online = version_compare($version, '5.6.0', '>=');
+        }
+        
+        self::$ddl_support = array(
+            'server' => $server,
+            'instant_add_column' => $instant,
+            'online_ddl' => $online
+        );
+        
+        return self::$ddl_support;
+    }
+    
+    /**
+     * Algorithms to try for a planned statement, strongest first
+     */
+    private function get_algorithm_fallbacks($algorithm) {
+        switch ($algorithm) {
+            case 'INSTANT':
+                return array('INSTANT', 'INPLACE', 'DEFAULT');
+            case 'INPLACE':
+                return array('INPLACE', 'DEFAULT');
+            default:
+                return array('DEFAULT');
+        }
+    }
+    
+    private function get_algorithm_suffix($algorithm) {
+        switch ($algorithm) {
+            case 'INSTANT':
+                return ', ALGORITHM=INSTANT';
+            case 'INPLACE':
+                return ', ALGORITHM=INPLACE, LOCK=NONE';
+            default:
+                return '';
+        }
     }
     
     /**
@@ -381,13 +618,27 @@ class CAH_Schema_Manager {
     
     /**
      * Synchronize all plugin tables
+     * Indexes skipped outside maintenance are remembered for the database admin
      */
-    public function synchronize_all_tables() {
+    public function synchronize_all_tables($dry_run = false, $maintenance = false) {
         $results = array();
+        $pending_indexes = array();
         $schema_definition = $this->get_complete_schema_definition();
         
         foreach ($schema_definition as $table_name => $schema) {
-            $results[$table_name] = $this->synchronize_schema($table_name);
+            $results[$table_name] = $this->synchronize_schema($table_name, $dry_run, $maintenance);
+            
+            if (!empty($results[$table_name]['pending_indexes'])) {
+                $pending_indexes[$table_name] = $results[$table_name]['pending_indexes'];
+            }
+        }
+        
+        if (!$dry_run) {
+            if ($pending_indexes) {
+                update_option('cah_schema_pending_indexes', $pending_indexes, false);
+            } else {
+                delete_option('cah_schema_pending_indexes');
+            }
         }
         
         return $results;
@@ -405,11 +656,13 @@ class CAH_Schema_Manager {
             return array('error' => 'Table does not exist');
         }
         
+        $db = CAH_Query_Router::reader('table_data');
+        
         $sql = "SELECT * FROM $full_table_name LIMIT $limit OFFSET $offset";
-        $data = $this->wpdb->get_results($sql, ARRAY_A);
+        $data = $db->get_results($sql, ARRAY_A);
         
         $count_sql = "SELECT COUNT(*) FROM $full_table_name";
-        $total_count = $this->wpdb->get_var($count_sql);
+        $total_count = $db->get_var($count_sql);
         
         return array(
             'data' => $data,
@@ -431,6 +684,8 @@ class CAH_Schema_Manager {
             return array('success' => false, 'message' => $this->wpdb->last_error);
         }
         
+        CAH_Case_Repository::table_changed($table_name);
+        
         return array('success' => true, 'id' => $this->wpdb->insert_id);
     }
     
@@ -446,6 +701,8 @@ class CAH_Schema_Manager {
             return array('success' => false, 'message' => $this->wpdb->last_error);
         }
         
+        CAH_Case_Repository::table_changed($table_name);
+        
         return array('success' => true, 'rows_affected' => $result);
     }
     
@@ -461,6 +718,8 @@ class CAH_Schema_Manager {
             return array('success' => false, 'message' => $this->wpdb->last_error);
         }
         
+        CAH_Case_Repository::table_changed($table_name);
+        
         return array('success' => true, 'rows_affected' => $result);
     }
     
@@ -482,17 +741,14 @@ class CAH_Schema_Manager {
             return array('success' => false, 'message' => 'Column already exists');
         }
         
-        // Add column
-        $sql = "ALTER TABLE $full_table_name ADD COLUMN $column_name $column_definition";
-        $result = $this->wpdb->query($sql);
+        // Add column (instant / online where supported, refreshes schema cache);
+        // an explicit admin action, so a blocking ALTER is acceptable
+        $result = $this->alter_table($table_name, array("ADD COLUMN $column_name $column_definition"), false, true);
         
-        if ($result === false) {
-            return array('success' => false, 'message' => 'Failed to add column: ' . $this->wpdb->last_error);
+        if (!$result['success']) {
+            return array('success' => false, 'message' => 'Failed to add column: ' . $result['message']);
         }
         
-        // Clear schema cache and refresh
-        $this->refresh_schema_cache();
-        
         return array('success' => true, 'message' => 'Column added successfully');
     }
     
@@ -754,9 +1010,10 @@ class CAH_Schema_Manager {
             } else {
                 $missing = count($differences['missing_columns'] ?? array());
                 $extra = count($differences['extra_columns'] ?? array());
+                $missing_indexes = count($differences['missing_indexes'] ?? array());
                 $status[$table_name] = array(
                     'status' => 'out_of_sync',
-                    'message' => "Missing columns: $missing, Extra columns: $extra",
+                    'message' => "Missing columns: $missing, Extra columns: $extra, Missing indexes: $missing_indexes",
                     'details' => $differences
                 );
             }
@@ -0,0 +1,170 @@
+<?php
+/**
+ * Service Container - Lazily created plugin components
+ * Components are registered as factories and created on first get(), or
+ * when one of the hooks they handle fires (load_on). Creation time and
+ * memory are recorded for the bootstrap profile (CAH_PROFILE_BOOTSTRAP).
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Service_Container {
+
+    // Runs before the component's own callbacks (priority 10 etc.)
+    const LOAD_PRIORITY = -1000;
+
+    // Name used in the bootstrap profile ('core', 'financial')
+    private $name;
+
+    // Service id => callable returning the instance
+    private $factories = array();
+
+    // Service id => instance
+    private $services = array();
+
+    // Services being created (guards re-entry through their hooks)
+    private $loading = array();
+
+    // Service id => array('time', 'memory', 'lazy')
+    private $profile = array();
+
+    // Time and memory spent in the plugin's init()
+    private $init_started;
+    private $init_memory;
+    private $init_profile = null;
+
+    // All containers of this request (bootstrap profile)
+    private static $containers = array();
+
+    public function __construct($name) {
+        $this->name = $name;
+        $this->init_started = microtime(true);
+        $this->init_memory = memory_get_usage();
+
+        self::$containers[$name] = $this;
+    }
+
+    /**
+     * Register a service factory
+     */
+    public function set($id, $factory) {
+        $this->factories[$id] = $factory;
+        unset($this->services[$id]);
+    }
+
+    public function has($id) {
+        return isset($this->factories[$id]);
+    }
+
+    /**
+     * Service instance, created on first call (null for unknown ids)
+     */
+    public function get($id) {
+        if (isset($this->services[$id])) {
+            return $this->services[$id];
+        }
+
+        if (!isset($this->factories[$id]) || isset($this->loading[$id])) {
+            return null;
+        }
+
+        $this->loading[$id] = true;
+        $started = microtime(true);
+        $memory = memory_get_usage();
+
+        $this->services[$id] = call_user_func($this->factories[$id], $this);
+
+        unset($this->loading[$id]);
+        $this->profile[$id] = array(
+            'time' => microtime(true) - $started,
+            'memory' => memory_get_usage() - $memory,
+            'lazy' => $this->init_profile !== null
+        );
+
+        return $this->services[$id];
+    }
+
+    public function is_loaded($id) {
+        return isset($this->services[$id]);
+    }
+
+    /**
+     * Create a service when one of the hooks fires
+     * The service registers its own callbacks in its constructor; they run
+     * in the same hook run as they have a later priority.
+     */
+    public function load_on($hooks, $id) {
+        $container = $this;
+
+        foreach ((array) $hooks as $hook) {
+            // Filter signature so it also works for filters like cron_schedules
+            add_filter($hook, function($value = null) use ($container, $id) {
+                $container->get($id);
+                return $value;
+            }, self::LOAD_PRIORITY);
+        }
+    }
+
+    /**
+     * Mark the end of the plugin's init() (later creations count as lazy)
+     */
+    public function finish_init() {
+        $this->init_profile = array(
+            'time' => microtime(true) - $this->init_started,
+            'memory' => memory_get_usage() - $this->init_memory
+        );
+    }
+
+    /**
+     * Bootstrap profile of this container
+     */
+    public function get_profile() {
+        $lazy_time = 0;
+        $lazy_memory = 0;
+
+        foreach ($this->profile as $entry) {
+            if ($entry['lazy']) {
+                $lazy_time += $entry['time'];
+                $lazy_memory += $entry['memory'];
+            }
+        }
+
+        $init = $this->init_profile ?: array('time' => 0, 'memory' => 0);
+
+        return array(
+            'init_ms' => round($init['time'] * 1000, 3),
+            'lazy_ms' => round($lazy_time * 1000, 3),
+            'memory_kb' => intval(round(($init['memory'] + $lazy_memory) / 1024)),
+            'services' => array_keys($this->services)
+        );
+    }
+
+    /**
+     * Profile of all containers as header lines
+     */
+    public static function get_profile_headers() {
+        $headers = array();
+
+        foreach (self::$containers as $name => $container) {
+            $profile = $container->get_profile();
+            $headers[] = sprintf(
+                'X-CAH-Bootstrap: %s; init_ms=%.3f; lazy_ms=%.3f; memory_kb=%d; services=%s',
+                $name,
+                $profile['init_ms'],
+                $profile['lazy_ms'],
+                $profile['memory_kb'],
+                implode(',', $profile['services'])
+            );
+        }
+
+        $headers[] = sprintf(
+            'X-CAH-Bootstrap-Request: files=%d; peak_kb=%d',
+            count(CAH_Autoloader::get_loaded_files()),
+            intval(round(memory_get_peak_usage() / 1024))
+        );
+
+        return $headers;
+    }
+}
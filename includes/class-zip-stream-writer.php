@@ -0,0 +1,170 @@
+<?php
+/**
+ * ZIP Stream Writer - Writes a ZIP archive sequentially to any stream
+ * Entries are written as soon as they are added (nothing is buffered until
+ * close, unlike ZipArchive), so archives can go straight to php://output.
+ * Entries of another archive written by this class can be copied without
+ * recompression (add_raw_entry). No ZIP64: max. 65535 entries and 4 GB.
+ */
+
+if (!defined('ABSPATH')) {
+    exit;
+}
+
+class CAH_Zip_Stream_Writer {
+
+    const MAX_ENTRIES = 65535;
+
+    // Flag bit 11: file names are UTF-8
+    const FLAG_UTF8 = 0x0800;
+    const METHOD_DEFLATE = 8;
+
+    private $stream;
+    private $offset = 0;
+    private $central_directory = array();
+    private $dos_time;
+    private $dos_date;
+
+    public function __construct($stream) {
+        $this->stream = $stream;
+
+        $now = getdate();
+        $this->dos_time = ($now['hours'] << 11) | ($now['minutes'] << 5) | ($now['seconds'] >> 1);
+        $this->dos_date = (($now['year'] - 1980) << 9) | ($now['mon'] << 5) | $now['mday'];
+    }
+
+    /**
+     * Compress and write one file
+     * Returns the entry (crc, sizes and data offset, see add_raw_entry)
+     */
+    public function add_file($name, $data) {
+        $compressed = gzdeflate($data, 6);
+
+        $entry = array(
+            'name' => $name,
+            'method' => self::METHOD_DEFLATE,
+            'crc' => crc32($data),
+            'compressed_size' => strlen($compressed),
+            'size' => strlen($data)
+        );
+
+        $header_offset = $this->offset;
+        $entry['data_offset'] = $this->write_local_header($entry);
+        $this->write($compressed);
+        $this->add_central_record($entry, $header_offset);
+
+        return $entry;
+    }
+
+    /**
+     * Copy an entry written by add_file() from another archive without recompressing
+     * $source is positioned anywhere; the data is read at $entry['data_offset']
+     * A short copy returns false and leaves the entry out of the central
+     * directory (the bytes already written are skipped by readers).
+     */
+    public function add_raw_entry($entry, $source, $name = null) {
+        if ($name !== null) {
+            $entry['name'] = $name;
+        }
+
+        $header_offset = $this->offset;
+        $data_offset = $this->write_local_header($entry);
+
+        fseek($source, $entry['data_offset']);
+        $copied = stream_copy_to_stream($source, $this->stream, $entry['compressed_size']);
+        $this->offset += intval($copied);
+
+        if ($copied !== $entry['compressed_size']) {
+            return false;
+        }
+
+        $entry['data_offset'] = $data_offset;
+        $this->add_central_record($entry, $header_offset);
+
+        return $entry;
+    }
+
+    /**
+     * Write the central directory (the archive is complete afterwards)
+     */
+    public function finish() {
+        $directory_offset = $this->offset;
+
+        foreach ($this->central_directory as $record) {
+            $this->write($record);
+        }
+
+        $this->write(pack('VvvvvVVv',
+            0x06054b50,
+            0,
+            0,
+            count($this->central_directory),
+            count($this->central_directory),
+            $this->offset - $directory_offset,
+            $directory_offset,
+            0
+        ));
+
+        return $this->offset;
+    }
+
+    public function get_entry_count() {
+        return count($this->central_directory);
+    }
+
+    /**
+     * Local file header (sizes are known up front, no data descriptor needed)
+     * Returns the offset of the entry data
+     */
+    private function write_local_header($entry) {
+        if (count($this->central_directory) >= self::MAX_ENTRIES) {
+            throw new RuntimeException('ZIP archive is limited to ' . self::MAX_ENTRIES . ' entries');
+        }
+
+        $this->write(pack('VvvvvvVVVvv',
+            0x04034b50,
+            20,
+            self::FLAG_UTF8,
+            $entry['method'],
+            $this->dos_time,
+            $this->dos_date,
+            $entry['crc'],
+            $entry['compressed_size'],
+            $entry['size'],
+            strlen($entry['name']),
+            0
+        ) . $entry['name']);
+
+        return $this->offset;
+    }
+
+    /**
+     * Central directory record, added once the entry data is completely written
+     */
+    private function add_central_record($entry, $header_offset) {
+        $this->central_directory[] = pack('VvvvvvvVVVvvvvvVV',
+            0x02014b50,
+            20,
+            20,
+            self::FLAG_UTF8,
+            $entry['method'],
+            $this->dos_time,
+            $this->dos_date,
+            $entry['crc'],
+            $entry['compressed_size'],
+            $entry['size'],
+            strlen($entry['name']),
+            0,
+            0,
+            0,
+            0,
+            0,
+            $header_offset
+        ) . $entry['name'];
+    }
+
+    private function write($data) {
+        fwrite($this->stream, $data);
+        $this->offset += strlen($data);
+    }
+}
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Mock N8N Webhook Server for Court Automation Hub
+Receives batched outbox deliveries from CAH_N8N_Connector and can simulate
+failures (HTTP 5xx / 429 with Retry-After) to exercise retry and backoff.
+
+Usage:
+    python3 mock_n8n_webhook.py --port 5678 --fail-rate 0.3
+    # then set klage_click_n8n_url to http://localhost:5678/webhook/klage-click
+"""
+
+import argparse
+import json
+import random
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockWebhookState:
+    def __init__(self, fail_rate, fail_status, retry_after, api_key):
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed_requests = 0
+        self.events = 0
+        self.seen_versions = set()
+        # (case_id, event) => versions in delivery order
+        self.deliveries = {}
+        self.duplicates = 0
+
+    def record_batch(self, events):
+        with self.lock:
+            self.requests += 1
+            self.events += len(events)
+            for event in events:
+                key = (event.get('case_id'), event.get('event'))
+                versions = self.deliveries.setdefault(key, [])
+                # The same state twice in a row; A -> B -> A is a real change
+                if versions and versions[-1] == event.get('version'):
+                    self.duplicates += 1
+                versions.append(event.get('version'))
+                self.seen_versions.add(key + (event.get('version'),))
+
+    def summary(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'failed_requests': self.failed_requests,
+                'events': self.events,
+                'unique_events': len(self.seen_versions),
+                'duplicates': self.duplicates,
+                'deliveries': {'%s:%s' % key: list(versions) for key, versions in self.deliveries.items()}
+            }
+
+
+def make_handler(state):
+    class MockWebhookHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections alive between batches
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            # Stats endpoint for test scripts
+            self.send_json(200, state.summary())
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            raw = self.rfile.read(length)
+
+            if state.api_key and self.headers.get('X-N8N-API-KEY') != state.api_key:
+                self.send_json(401, {'error': 'invalid api key'})
+                return
+
+            try:
+                payload = json.loads(raw or b'{}')
+            except json.JSONDecodeError:
+                self.send_json(400, {'error': 'invalid json'})
+                return
+
+            if random.random() < state.fail_rate:
+                with state.lock:
+                    state.failed_requests += 1
+                headers = {'Retry-After': str(state.retry_after)} if state.fail_status == 429 else None
+                self.send_json(state.fail_status, {'error': 'simulated failure'}, headers)
+                return
+
+            events = payload.get('events', [])
+            state.record_batch(events)
+            print(f"[{datetime.now().isoformat()}] batch of {len(events)} events "
+                  f"(keep-alive: {not self.close_connection})")
+            self.send_json(200, {'received': len(events)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockWebhookHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock N8N webhook for outbox delivery tests')
+    parser.add_argument('--port', type=int, default=5678)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests that fail (0..1)')
+    parser.add_argument('--fail-status', type=int, default=503, help='HTTP status used for simulated failures')
+    parser.add_argument('--retry-after', type=int, default=30, help='Retry-After seconds sent with 429')
+    parser.add_argument('--api-key', default='', help='Expected X-N8N-API-KEY header (optional)')
+    args = parser.parse_args()
+
+    state = MockWebhookState(args.fail_rate, args.fail_status, args.retry_after, args.api_key)
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), make_handler(state))
+
+    print(f"Mock N8N webhook listening on http://localhost:{args.port}/ (fail rate {args.fail_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(state.summary(), indent=2))
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
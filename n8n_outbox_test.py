@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+N8N Outbox Test for Court Automation Hub
+Runs mock_n8n_webhook.py in-process, points a test WordPress site at it and
+drives CAH_N8N_Connector through WP-CLI:
+
+    1. an identical payload is skipped while it is still pending
+    2. a newer payload supersedes the pending one (only B is delivered)
+    3. A -> B -> A across deliveries delivers A again (case does not stay on B)
+    4. A -> B -> A before the worker runs delivers only the final A
+    5. the worker maintains the backlog count used for backpressure
+
+Usage:
+    python3 n8n_outbox_test.py --wp-path /var/www/bench --port 5678
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import subprocess
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+from mock_n8n_webhook import MockWebhookState, make_handler
+
+SETUP_PHP = """
+echo wp_json_encode(array(
+    'url' => get_option('klage_click_n8n_url'),
+    'key' => get_option('klage_click_n8n_key')
+));
+update_option('klage_click_n8n_url', '%s');
+update_option('klage_click_n8n_key', 'outbox-test');
+"""
+
+RESTORE_PHP = """
+global $wpdb;
+$wpdb->query("DELETE FROM {$wpdb->prefix}klage_n8n_outbox WHERE case_id >= %d");
+update_option('klage_click_n8n_url', '%s');
+update_option('klage_click_n8n_key', '%s');
+"""
+
+ENQUEUE_PHP = """
+$connector = new CAH_N8N_Connector();
+echo wp_json_encode($connector->enqueue(%d, 'case_updated', array('id' => %d, 'case_status' => '%s')));
+"""
+
+PROCESS_PHP = """
+$connector = new CAH_N8N_Connector();
+$totals = $connector->process_queue();
+$totals['pending_count'] = intval(get_option('cah_n8n_pending_count'));
+echo wp_json_encode($totals);
+"""
+
+
+class OutboxTester:
+    def __init__(self, wp_cli, wp_path, port):
+        self.wp = [wp_cli, '--path=' + wp_path]
+        self.port = port
+        self.failures = 0
+        # Outbox rows of real cases are never touched
+        self.case_base = 900000000 + random.randint(0, 999) * 1000
+        self.state = MockWebhookState(0.0, 503, 30, 'outbox-test')
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(self.state))
+
+    def php(self, code):
+        output = subprocess.run(self.wp + ['eval', code], capture_output=True, text=True)
+        if output.returncode != 0:
+            raise RuntimeError(output.stderr.strip() or output.stdout.strip())
+        return json.loads(output.stdout.strip().splitlines()[-1]) if output.stdout.strip() else None
+
+    def check(self, name, condition, details):
+        print(f"[{'PASS' if condition else 'FAIL'}] {name}: {details}")
+        if not condition:
+            self.failures += 1
+
+    def enqueue(self, case_id, status):
+        return self.php(ENQUEUE_PHP % (case_id, case_id, status))
+
+    def process(self):
+        return self.php(PROCESS_PHP)
+
+    def delivered(self, case_id):
+        return self.state.summary()['deliveries'].get('%d:case_updated' % case_id, [])
+
+    @staticmethod
+    def version(case_id, status):
+        # Same as md5($event . '|' . wp_json_encode($payload)) in enqueue()
+        body = json.dumps({'id': case_id, 'case_status': status}, separators=(',', ':'))
+        return hashlib.md5(('case_updated|' + body).encode('utf-8')).hexdigest()
+
+    def run(self):
+        a, b = 'open', 'paid'
+
+        # 1 + 2: pending dedup, newer payload supersedes
+        case_id = self.case_base + 1
+        first = self.enqueue(case_id, a)
+        again = self.enqueue(case_id, a)
+        self.check('identical pending payload skipped', first['queued'] and not again['queued'],
+                   'first=%s again=%s' % (first['queued'], again['queued']))
+        self.enqueue(case_id, b)
+        self.process()
+        self.check('pending payload superseded', self.delivered(case_id) == [self.version(case_id, b)],
+                   'delivered=%s' % self.delivered(case_id))
+
+        # 3: A -> B -> A with a worker run after every change
+        case_id = self.case_base + 2
+        for status in (a, b, a):
+            self.enqueue(case_id, status)
+            self.process()
+        expected = [self.version(case_id, a), self.version(case_id, b), self.version(case_id, a)]
+        self.check('A -> B -> A delivered', self.delivered(case_id) == expected,
+                   'delivered=%s' % self.delivered(case_id))
+
+        # 4: A -> B -> A before the worker runs
+        case_id = self.case_base + 3
+        for status in (a, b, a):
+            result = self.enqueue(case_id, status)
+        totals = self.process()
+        self.check('A -> B -> A queued last change', result['queued'], result['message'])
+        self.check('only final A delivered', self.delivered(case_id) == [self.version(case_id, a)],
+                   'delivered=%s' % self.delivered(case_id))
+
+        # 5: backlog count written by the worker
+        self.check('worker updates backlog count', totals['pending_count'] == 0,
+                   'pending_count=%s' % totals['pending_count'])
+
+        summary = self.state.summary()
+        self.check('no duplicate deliveries', summary['duplicates'] == 0, 'duplicates=%d' % summary['duplicates'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check N8N outbox deduplication against the mock webhook')
+    parser.add_argument('--wp-path', required=True)
+    parser.add_argument('--wp-cli', default='wp')
+    parser.add_argument('--port', type=int, default=5678)
+    args = parser.parse_args()
+
+    tester = OutboxTester(args.wp_cli, args.wp_path, args.port)
+    threading.Thread(target=tester.server.serve_forever, daemon=True).start()
+
+    previous = tester.php(SETUP_PHP % ('http://127.0.0.1:%d/webhook/klage-click' % args.port))
+    try:
+        tester.run()
+    finally:
+        tester.php(RESTORE_PHP % (tester.case_base, previous['url'] or '', previous['key'] or ''))
+        tester.server.shutdown()
+
+    print('\nAll checks passed' if tester.failures == 0 else f"\n{tester.failures} check(s) failed")
+    return 1 if tester.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Read Replica Routing Test for Court Automation Hub
+Checks CAH_Query_Router against two local MariaDB instances (primary with
+binary log, replica replicating from it) behind a test WordPress site whose
+wp-config.php defines CAH_REPLICA_DB_HOST etc.
+
+    1. reads go to the replica while it is caught up
+    2. read-your-writes: a user's write is visible to that user's next
+       request, also while the replica's SQL thread is stopped
+    3. a stopped replica (no lag value) falls back to the primary
+    4. reads return to the replica after it has caught up again
+
+The replica is controlled through the mysql client (STOP/START SLAVE).
+
+Usage:
+    python3 replica_routing_test.py --wp-path /var/www/bench --user admin \\
+        --replica-mysql "--host=127.0.0.1 --port=3307 --user=root --password=secret"
+"""
+
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+import time
+import uuid
+
+STATUS_PHP = """
+$db = CAH_Query_Router::reader('test');
+$status = CAH_Query_Router::get_status();
+$status['target'] = $db === $GLOBALS['wpdb'] ? 'primary' : 'replica';
+echo wp_json_encode($status);
+"""
+
+WRITE_PHP = """
+global $wpdb;
+$wpdb->insert($wpdb->prefix . 'klage_cases', array(
+    'case_id' => '%s',
+    'case_creation_date' => current_time('mysql'),
+    'case_status' => 'draft'
+));
+echo wp_json_encode(array('target' => CAH_Query_Router::reader('test') === $wpdb ? 'primary' : 'replica'));
+"""
+
+READ_PHP = """
+$db = CAH_Query_Router::reader('test');
+echo wp_json_encode(array(
+    'target' => $db === $GLOBALS['wpdb'] ? 'primary' : 'replica',
+    'found' => (bool) $db->get_var($db->prepare("SELECT id FROM {$db->prefix}klage_cases WHERE case_id = %%s", '%s'))
+));
+"""
+
+CLEANUP_PHP = """
+global $wpdb;
+$wpdb->query("DELETE FROM {$wpdb->prefix}klage_cases WHERE case_id LIKE 'RYW-%'");
+"""
+
+
+class RoutingTester:
+    def __init__(self, wp_cli, wp_path, user, replica_mysql):
+        self.wp = [wp_cli, '--path=' + wp_path]
+        self.user = user
+        self.replica_mysql = ['mysql'] + shlex.split(replica_mysql)
+        self.failures = 0
+
+    def php(self, code, user=True):
+        command = self.wp + ['eval', code] + (['--user=' + self.user] if user else [])
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            raise RuntimeError(output.stderr.strip() or output.stdout.strip())
+        return json.loads(output.stdout.strip().splitlines()[-1]) if output.stdout.strip() else None
+
+    def replica(self, sql):
+        subprocess.run(self.replica_mysql + ['-e', sql], check=True, capture_output=True, text=True)
+
+    def check(self, name, condition, details):
+        print(f"[{'PASS' if condition else 'FAIL'}] {name}: {details}")
+        if not condition:
+            self.failures += 1
+
+    def wait_for_replica(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self.php(STATUS_PHP)
+            if status['target'] == 'replica':
+                return status
+            time.sleep(1)
+        return status
+
+    def run(self):
+        status = self.php(STATUS_PHP, user=False)
+        self.check('configured', status['configured'] and status['connected'],
+                   'connected=%s lag=%s' % (status['connected'], status['lag']))
+        if not status['connected']:
+            return
+
+        status = self.wait_for_replica()
+        self.check('reads use replica', status['target'] == 'replica', 'lag=%s' % status['lag'])
+
+        # Write while the replica does not apply anything
+        self.replica('STOP SLAVE SQL_THREAD')
+        try:
+            case_id = 'RYW-' + uuid.uuid4().hex[:12]
+            result = self.php(WRITE_PHP % case_id)
+            self.check('same request after write', result['target'] == 'primary', 'target=%s' % result['target'])
+
+            result = self.php(READ_PHP % case_id)
+            self.check('read-your-writes (next request)', result['found'],
+                       'target=%s found=%s' % (result['target'], result['found']))
+
+            result = self.php(READ_PHP % case_id, user=False)
+            self.check('stopped replica falls back to primary', result['target'] == 'primary',
+                       'target=%s' % result['target'])
+        finally:
+            self.replica('START SLAVE SQL_THREAD')
+
+        status = self.wait_for_replica()
+        self.check('back on replica after catch-up', status['target'] == 'replica', 'lag=%s' % status['lag'])
+
+        result = self.php(READ_PHP % case_id)
+        self.check('replica has the write', result['found'] and result['target'] == 'replica',
+                   'target=%s found=%s' % (result['target'], result['found']))
+
+        self.php(CLEANUP_PHP)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check read replica routing with two MariaDB instances')
+    parser.add_argument('--wp-path', required=True)
+    parser.add_argument('--wp-cli', default='wp')
+    parser.add_argument('--user', default='admin', help='User whose writes must stay visible')
+    parser.add_argument('--replica-mysql', required=True, help='mysql client options for the replica')
+    args = parser.parse_args()
+
+    tester = RoutingTester(args.wp_cli, args.wp_path, args.user, args.replica_mysql)
+    tester.run()
+
+    print('\nAll checks passed' if tester.failures == 0 else f"\n{tester.failures} check(s) failed")
+    return 1 if tester.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,7 +20,18 @@ $tables = array(
     $wpdb->prefix . 'klage_financial',
     $wpdb->prefix . 'klage_legal',
     $wpdb->prefix . 'klage_courts',
-    $wpdb->prefix . 'klage_audit'
+    $wpdb->prefix . 'klage_court_postal_ranges',
+    $wpdb->prefix . 'klage_sequences',
+    $wpdb->prefix . 'klage_n8n_outbox',
+    $wpdb->prefix . 'klage_evidence_blobs',
+    $wpdb->prefix . 'klage_evidence_messages',
+    $wpdb->prefix . 'klage_evidence_attachments',
+    $wpdb->prefix . 'klage_evidence_links',
+    $wpdb->prefix . 'klage_document_batches',
+    $wpdb->prefix . 'klage_document_items',
+    $wpdb->prefix . 'klage_worker_locks',
+    $wpdb->prefix . 'klage_audit',
+    $wpdb->prefix . 'klage_audit_archive'
 );
 
 foreach ($tables as $table) {
@@ -35,13 +46,78 @@ $options = array(
     'klage_click_egvp_key',
     'klage_click_debug_mode',
     'klage_click_api_key',
-    'klage_click_webhook_secret'
+    'klage_click_webhook_secret',
+    'cah_audit_storage_version',
+    'cah_audit_retention_months',
+    'cah_audit_archive_retention_months',
+    'cah_audit_last_maintenance',
+    'cah_postal_ranges_version',
+    'cah_n8n_batch_size',
+    'cah_n8n_max_attempts',
+    'cah_n8n_max_pending',
+    'cah_n8n_rejected_count',
+    'cah_n8n_last_run',
+    'cah_n8n_pending_count',
+    'cah_n8n_retention_days',
+    'cah_n8n_outbox_version',
+    'cah_evidence_tables_version',
+    'cah_schema_sync_version',
+    'cah_form_cache_version',
+    'cah_case_cache_version',
+    'cah_cases_state_version',
+    'cah_case_id_duplicates',
+    'cah_schema_pending_indexes',
+    'cah_document_workers',
+    'cah_index_advisor_workload',
+    'cah_index_advisor_capture'
 );
 
 foreach ($options as $option) {
     delete_option($option);
 }
 
+delete_transient('cah_index_advisor_buffer');
+delete_transient('cah_index_advisor_analysis');
+
+// Delete compiled form cache
+$upload_dir = wp_upload_dir(null, false);
+$form_cache_dir = trailingslashit($upload_dir['basedir']) . 'cah-form-cache';
+foreach (glob($form_cache_dir . '/*.json') ?: array() as $file) {
+    @unlink($file);
+}
+@rmdir($form_cache_dir);
+
+// Evidence payload files in the default location (CAH_EVIDENCE_DIR is left alone)
+$evidence_dir = trailingslashit($upload_dir['basedir']) . 'cah-evidence';
+foreach (glob($evidence_dir . '/*/*/*') ?: array() as $file) {
+    @unlink($file);
+}
+foreach (glob($evidence_dir . '/*/*', GLOB_ONLYDIR) ?: array() as $directory) {
+    @rmdir($directory);
+}
+foreach (glob($evidence_dir . '/*', GLOB_ONLYDIR) ?: array() as $directory) {
+    @rmdir($directory);
+}
+@unlink($evidence_dir . '/.htaccess');
+@unlink($evidence_dir . '/index.php');
+@rmdir($evidence_dir);
+
+// Generated court documents (ZIP parts per batch)
+$documents_dir = trailingslashit($upload_dir['basedir']) . 'cah-documents';
+foreach (glob($documents_dir . '/batch-*/*.zip') ?: array() as $file) {
+    @unlink($file);
+}
+foreach (glob($documents_dir . '/batch-*', GLOB_ONLYDIR) ?: array() as $directory) {
+    @rmdir($directory);
+}
+@unlink($documents_dir . '/.htaccess');
+@unlink($documents_dir . '/index.php');
+@rmdir($documents_dir);
+
+wp_clear_scheduled_hook('cah_audit_maintenance');
+wp_clear_scheduled_hook('cah_n8n_process_queue');
+wp_unschedule_hook('cah_document_worker');
+
 // Remove capabilities from all roles
 $roles = wp_roles()->roles;
 $capabilities = array(